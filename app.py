@@ -1,26 +1,33 @@
 import streamlit as st
-from openai import OpenAI
+import streamlit.components.v1 as components
 import dotenv
 import os
 from PIL import Image
 from audio_recorder_streamlit import audio_recorder
 import base64
-from io import BytesIO
-import json
+from io import BytesIO, TextIOWrapper
 import datetime
-import random
-import hashlib
-import requests
-import time
-import re 
 
-dotenv.load_dotenv()
+from family_assistant import (admission, fulltext, ical, llm, records, recurrence, reminders, resilience, schedule,
+                              suggestions, telemetry)
+from family_assistant.assistant import Assistant
+from family_assistant.context import text_message
+from family_assistant.runtime import iterate_sync, run_sync
+from family_assistant.search import search_and_summarize
+from family_assistant.households import get_registry
+from family_assistant.router import router
+from family_assistant.store import DEFAULT_HOUSEHOLD
+from family_assistant.usage_ledger import CALL_SITES
+from family_assistant.tts import (
+    AUDIO_MIME_TYPES,
+    AVAILABLE_VOICES,
+    DEFAULT_VOICE,
+    TTS_FORMAT,
+    StreamingSpeaker,
+    speak_along,
+)
 
-# Đường dẫn file lưu trữ dữ liệu
-FAMILY_DATA_FILE = "family_data.json"
-EVENTS_DATA_FILE = "events_data.json"
-NOTES_DATA_FILE = "notes_data.json"
-CHAT_HISTORY_FILE = "chat_history.json"
+dotenv.load_dotenv()
 
 # Thiết lập log để debug
 import logging
@@ -29,652 +36,16 @@ logging.basicConfig(level=logging.INFO,
                    handlers=[logging.StreamHandler()])
 logger = logging.getLogger('family_assistant')
 
-# Chỉ sử dụng một mô hình duy nhất
-openai_model = "gpt-4o-mini"
-
-# ------ TAVILY API INTEGRATION ------
-def tavily_extract(api_key, urls, include_images=False, extract_depth="advanced"):
-    """
-    Trích xuất nội dung từ URL sử dụng Tavily Extract API
-    
-    Args:
-        api_key (str): Tavily API Key
-        urls (str/list): URL hoặc danh sách URL cần trích xuất
-        include_images (bool): Có bao gồm hình ảnh hay không
-        extract_depth (str): Độ sâu trích xuất ('basic' hoặc 'advanced')
-        
-    Returns:
-        dict: Kết quả trích xuất hoặc None nếu có lỗi
-    """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "urls": urls,
-        "include_images": include_images,
-        "extract_depth": extract_depth
-    }
-    
-    try:
-        response = requests.post(
-            "https://api.tavily.com/extract",
-            headers=headers,
-            json=data
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Lỗi Tavily Extract: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"Lỗi khi gọi Tavily API: {e}")
-        return None
-
-def tavily_search(api_key, query, search_depth="advanced", max_results=5, include_domains=None, exclude_domains=None):
-    """
-    Thực hiện tìm kiếm thời gian thực sử dụng Tavily Search API
-    
-    Args:
-        api_key (str): Tavily API Key
-        query (str): Câu truy vấn tìm kiếm
-        search_depth (str): Độ sâu tìm kiếm ('basic' hoặc 'advanced')
-        max_results (int): Số lượng kết quả tối đa
-        include_domains (list): Danh sách domain muốn bao gồm
-        exclude_domains (list): Danh sách domain muốn loại trừ
-        
-    Returns:
-        dict: Kết quả tìm kiếm hoặc None nếu có lỗi
-    """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "query": query,
-        "search_depth": search_depth,
-        "max_results": max_results
-    }
-    
-    if include_domains:
-        data["include_domains"] = include_domains
-    
-    if exclude_domains:
-        data["exclude_domains"] = exclude_domains
-    
-    try:
-        response = requests.post(
-            "https://api.tavily.com/search",
-            headers=headers,
-            json=data
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Lỗi Tavily Search: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"Lỗi khi gọi Tavily Search API: {e}")
-        return None
-
-def search_and_summarize(tavily_api_key, query, openai_api_key):
-    """
-    Tìm kiếm và tổng hợp thông tin từ kết quả tìm kiếm
-    
-    Args:
-        tavily_api_key (str): Tavily API Key
-        query (str): Câu truy vấn tìm kiếm
-        openai_api_key (str): OpenAI API Key
-        
-    Returns:
-        str: Thông tin đã được tổng hợp
-    """
-    if not tavily_api_key or not openai_api_key or not query:
-        return "Thiếu thông tin để thực hiện tìm kiếm hoặc tổng hợp."
-    
-    try:
-        # Thực hiện tìm kiếm với Tavily
-        search_results = tavily_search(tavily_api_key, query)
-        
-        if not search_results or "results" not in search_results:
-            return "Không tìm thấy kết quả nào."
-        
-        # Trích xuất thông tin từ top kết quả
-        urls_to_extract = [result["url"] for result in search_results["results"][:3]]
-        extracted_contents = []
-        
-        for url in urls_to_extract:
-            extract_result = tavily_extract(tavily_api_key, url)
-            if extract_result and "results" in extract_result and len(extract_result["results"]) > 0:
-                content = extract_result["results"][0].get("raw_content", "")
-                # Giới hạn độ dài nội dung để tránh token quá nhiều
-                if len(content) > 8000:
-                    content = content[:8000] + "..."
-                extracted_contents.append({
-                    "url": url,
-                    "content": content
-                })
-        
-        if not extracted_contents:
-            return "Không thể trích xuất nội dung từ các kết quả tìm kiếm."
-        
-        # Tổng hợp thông tin sử dụng OpenAI
-        client = OpenAI(api_key=openai_api_key)
-        
-        # Chuẩn bị prompt cho việc tổng hợp
-        prompt = f"""
-        Dưới đây là các nội dung trích xuất từ internet liên quan đến câu hỏi: "{query}"
-        
-        {json.dumps(extracted_contents, ensure_ascii=False)}
-        
-        Hãy tổng hợp thông tin từ các nguồn trên để trả lời câu hỏi một cách đầy đủ và chính xác.
-        Hãy trình bày thông tin một cách rõ ràng, có cấu trúc.
-        Nếu thông tin từ các nguồn khác nhau mâu thuẫn, hãy đề cập đến điều đó.
-        Hãy ghi rõ nguồn thông tin (URL) ở cuối mỗi phần thông tin.
-        """
-        
-        response = client.chat.completions.create(
-            model=openai_model,
-            messages=[
-                {"role": "system", "content": "Bạn là trợ lý tổng hợp thông tin. Nhiệm vụ của bạn là tổng hợp thông tin từ nhiều nguồn để cung cấp câu trả lời đầy đủ, chính xác và có cấu trúc."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1500
-        )
-        
-        summarized_info = response.choices[0].message.content
-        
-        # Thêm thông báo về nguồn
-        sources_info = "\n\n**Nguồn thông tin:**\n" + "\n".join([f"- {result['url']}" for result in search_results["results"][:3]])
-        
-        return f"{summarized_info}\n{sources_info}"
-    
-    except Exception as e:
-        logger.error(f"Lỗi trong quá trình tìm kiếm và tổng hợp: {e}")
-        return f"Có lỗi xảy ra trong quá trình tìm kiếm và tổng hợp thông tin: {str(e)}"
-
-# Thêm hàm tạo câu hỏi gợi ý động
-def generate_dynamic_suggested_questions(api_key, member_id=None, max_questions=5):
-    """
-    Tạo câu hỏi gợi ý cá nhân hóa và linh động dựa trên thông tin thành viên, 
-    lịch sử trò chuyện và thời điểm hiện tại
-    """
-    # Kiểm tra cache để tránh tạo câu hỏi mới quá thường xuyên
-    cache_key = f"suggested_questions_{member_id}_{datetime.datetime.now().strftime('%Y-%m-%d_%H')}"
-    if "question_cache" in st.session_state and cache_key in st.session_state.question_cache:
-        return st.session_state.question_cache[cache_key]
-    
-    # Xác định trạng thái người dùng hiện tại
-    member_info = {}
-    if member_id and member_id in family_data:
-        member = family_data[member_id]
-        member_info = {
-            "name": member.get("name", ""),
-            "age": member.get("age", ""),
-            "preferences": member.get("preferences", {})
-        }
-    
-    # Thu thập dữ liệu về các sự kiện sắp tới
-    upcoming_events = []
-    today = datetime.datetime.now().date()
-    
-    for event_id, event in events_data.items():
-        try:
-            event_date = datetime.datetime.strptime(event.get("date", ""), "%Y-%m-%d").date()
-            if event_date >= today:
-                date_diff = (event_date - today).days
-                if date_diff <= 14:  # Chỉ quan tâm sự kiện trong 2 tuần tới
-                    upcoming_events.append({
-                        "title": event.get("title", ""),
-                        "date": event.get("date", ""),
-                        "days_away": date_diff
-                    })
-        except Exception as e:
-            logger.error(f"Lỗi khi xử lý ngày sự kiện: {e}")
-            continue
-    
-    # Lấy dữ liệu về chủ đề từ lịch sử trò chuyện gần đây
-    recent_topics = []
-    if member_id and member_id in chat_history and chat_history[member_id]:
-        # Lấy tối đa 3 cuộc trò chuyện gần nhất
-        recent_chats = chat_history[member_id][:3]
-        
-        for chat in recent_chats:
-            summary = chat.get("summary", "")
-            if summary:
-                recent_topics.append(summary)
-    
-    questions = []
-    
-    # Phương thức 1: Sử dụng OpenAI API để sinh câu hỏi thông minh nếu có API key
-    if api_key and api_key.startswith("sk-"):
-        try:
-            # Tạo nội dung prompt cho OpenAI
-            context = {
-                "member": member_info,
-                "upcoming_events": upcoming_events,
-                "recent_topics": recent_topics,
-                "current_time": datetime.datetime.now().strftime("%H:%M"),
-                "current_day": datetime.datetime.now().strftime("%A"),
-                "current_date": datetime.datetime.now().strftime("%Y-%m-%d")
-            }
-            
-            prompt = f"""
-            Hãy tạo {max_questions} câu gợi ý đa dạng và cá nhân hóa cho người dùng trợ lý gia đình dựa trên thông tin sau:
-            
-            Thông tin người dùng: {json.dumps(member_info, ensure_ascii=False)}
-                        
-            
-            Yêu cầu:
-            1. Mỗi câu gợi ý nên tập trung vào MỘT sở thích cụ thể, không kết hợp nhiều sở thích
-            2. KHÔNG kết thúc câu gợi ý bằng bất kỳ cụm từ nào như "bạn có biết không?", "bạn có muốn không?", v.v.
-            3. Đưa ra thông tin cụ thể, chi tiết và chính xác như thể bạn đang viết một bài đăng trên mạng xã hội
-            4. Mục đích là cung cấp thông tin hữu ích, không phải bắt đầu cuộc trò chuyện
-            5. Chỉ trả về danh sách các câu gợi ý, mỗi câu trên một dòng
-            6. Không thêm đánh số hoặc dấu gạch đầu dòng
-            
-            Ví dụ tốt:
-            - "Top 5 phim hành động hay nhất 2023?"
-            - "Công thức bánh mì nguyên cám giảm cân?"
-            - "Kết quả Champions League?"
-            - "5 bài tập cardio giảm mỡ bụng hiệu quả?"
-            
-            Ví dụ không tốt:
-            - "Bạn đã biết bộ phim 'The Goal' vừa được phát hành và nhận nhiều phản hồi tích cực từ khán giả chưa?" (Kết hợp phim + bóng đá)
-            - "Kết quả trận đấu Champions League: Man City 3-1 Real Madrid, bạn có theo dõi không?" (Kết thúc bằng câu hỏi)
-            - "Bạn có muốn xem những phát hiện mới về dinh dưỡng không?" (Không cung cấp thông tin cụ thể)
-            
-            Trả về chính xác {max_questions} câu gợi ý.
-            """
-            
-            client = OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model=openai_model,
-                messages=[
-                    {"role": "system", "content": "Bạn là trợ lý tạo câu hỏi gợi ý cá nhân hóa."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                max_tokens=300
-            )
-            
-            # Xử lý phản hồi từ OpenAI
-            generated_content = response.choices[0].message.content.strip()
-            questions = [q.strip() for q in generated_content.split('\n') if q.strip()]
-            
-            # Lấy số lượng câu hỏi theo yêu cầu
-            questions = questions[:max_questions]
-            
-            logger.info(f"Đã tạo {len(questions)} câu hỏi gợi ý bằng OpenAI API")
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi tạo câu hỏi với OpenAI: {e}")
-            # Tiếp tục với phương thức 2 (dự phòng)
-    
-            # Phương thức 2: Dùng mẫu câu + thông tin cá nhân nếu không thể sử dụng OpenAI API
-    if not questions:
-        logger.info("Sử dụng phương pháp mẫu câu để tạo câu hỏi gợi ý")
-        
-        # Tạo seed dựa trên ngày và ID thành viên để tạo sự đa dạng
-        random_seed = int(hashlib.md5(f"{datetime.datetime.now().strftime('%Y-%m-%d_%H')}_{member_id or 'guest'}".encode()).hexdigest(), 16) % 10000
-        random.seed(random_seed)
-        
-        # Mẫu câu thông tin cụ thể theo nhiều chủ đề khác nhau (không có câu hỏi cuối câu)
-        question_templates = {
-            "food": [
-                "Top 10 món {food} ngon nhất Việt Nam?",
-                "Công thức làm món {food} ngon tại nhà?",
-                "5 biến tấu món {food} cho bữa {meal}?",
-                "Bí quyết làm món {food} ngon như nhà hàng 5 sao?",
-                "Cách làm món {food} chuẩn vị {season}?",
-                "3 cách chế biến món {food} giảm 50% calo?"
-            ],
-            "movies": [
-                "Top 5 phim chiếu rạp tuần này: {movie1}, {movie2}, {movie3} - Đặt vé ngay để nhận ưu đãi.",
-                "Phim mới ra mắt {movie1}?",
-                "Đánh giá phim {movie1}?",
-                "{actor} vừa giành giải Oscar cho vai diễn trong phim {movie1}, đánh bại 4 đối thủ nặng ký khác.",
-                "5 bộ phim kinh điển mọi thời đại?",
-                "Lịch chiếu phim {movie1} cuối tuần này?"
-            ],
-            "football": [
-                "Kết quả Champions League?",
-                "BXH Ngoại hạng Anh sau vòng 30?",
-                "Chuyển nhượng bóng đá?",
-                "Lịch thi đấu vòng tứ kết World Cup?",
-                "Tổng hợp bàn thắng đẹp nhất tuần?",
-                "Thống kê {player1} mùa này?"
-            ],
-            "technology": [
-                "So sánh iPhone 16 Pro và Samsung S24 Ultra?",
-                "5 tính năng AI mới trên smartphone 2024?",
-                "Đánh giá laptop gaming {laptop_model}?",
-                "Cách tối ưu hóa pin điện thoại tăng 30% thời lượng?",
-                "3 ứng dụng quản lý công việc tốt nhất 2024?",
-                "Tin công nghệ?"
-            ],
-            "health": [
-                "5 loại thực phẩm tăng cường miễn dịch mùa {season}?",
-                "Chế độ ăn Địa Trung Hải giúp giảm 30% nguy cơ bệnh tim mạch?",
-                "3 bài tập cardio đốt mỡ bụng hiệu quả trong 15 phút?",
-                "Nghiên cứu mới?",
-                "Cách phòng tránh cảm cúm mùa {season}?",
-                "Thực đơn 7 ngày giàu protein?"
-            ],
-            "family": [
-                "10 hoạt động cuối tuần gắn kết gia đình?",
-                "5 trò chơi phát triển IQ cho trẻ 3-6 tuổi?.",
-                "Bí quyết dạy trẻ quản lý tài chính?",
-                "Lịch trình khoa học cho trẻ?",
-                "Cách giải quyết mâu thuẫn anh chị em?",
-                "5 dấu hiệu trẻ gặp khó khăn tâm lý cần hỗ trợ?"
-            ],
-            "travel": [
-                "Top 5 điểm du lịch Việt Nam mùa {season}?",
-                "Kinh nghiệm du lịch tiết kiệm?",
-                "Lịch trình du lịch Đà Nẵng 3 ngày?",
-                "5 món đặc sản không thể bỏ qua khi đến Huế?",
-                "Cách chuẩn bị hành lý cho chuyến du lịch 5 ngày?",
-                "Kinh nghiệm đặt phòng khách sạn?"
-            ],
-            "news": [
-                "Tin kinh tế?",
-                "Tin thời tiết?",
-                "Tin giáo dục?",
-                "Tin giao thông?",
-                "Tin y tế?",
-                "Tin văn hóa?"
-            ]
-        }
-        
-        # Các biến thay thế trong mẫu câu
-        replacements = {
-            "food": ["phở", "bánh mì", "cơm rang", "gỏi cuốn", "bún chả", "bánh xèo", "mì Ý", "sushi", "pizza", "món Hàn Quốc"],
-            "meal": ["sáng", "trưa", "tối", "xế"],
-            "event": ["sinh nhật", "họp gia đình", "dã ngoại", "tiệc", "kỳ nghỉ"],
-            "days": ["vài", "2", "3", "7", "10"],
-            "hobby": ["đọc sách", "nấu ăn", "thể thao", "làm vườn", "vẽ", "âm nhạc", "nhiếp ảnh"],
-            "time_of_day": ["sáng", "trưa", "chiều", "tối"],
-            "day": ["thứ Hai", "thứ Ba", "thứ Tư", "thứ Năm", "thứ Sáu", "thứ Bảy", "Chủ Nhật", "cuối tuần"],
-            "season": ["xuân", "hạ", "thu", "đông"],
-            "weather": ["nóng", "lạnh", "mưa", "nắng", "gió"],
-            "music_artist": ["Sơn Tùng M-TP", "Mỹ Tâm", "BTS", "Taylor Swift", "Adele", "Coldplay", "BlackPink"],
-            "actor": ["Ngô Thanh Vân", "Trấn Thành", "Tom Cruise", "Song Joong Ki", "Scarlett Johansson", "Leonardo DiCaprio"],
-            "movie1": ["The Beekeeper", "Dune 2", "Godzilla x Kong", "Deadpool 3", "Inside Out 2", "Twisters", "Bad Boys 4"],
-            "movie2": ["The Fall Guy", "Kingdom of the Planet of the Apes", "Furiosa", "Borderlands", "Alien: Romulus"],
-            "movie3": ["Gladiator 2", "Wicked", "Sonic the Hedgehog 3", "Mufasa", "Moana 2", "Venom 3"],
-            "team1": ["Manchester City", "Arsenal", "Liverpool", "Real Madrid", "Barcelona", "Bayern Munich", "PSG", "Việt Nam"],
-            "team2": ["Chelsea", "Tottenham", "Inter Milan", "Juventus", "Atletico Madrid", "Dortmund", "Thái Lan"],
-            "team3": ["Manchester United", "Newcastle", "AC Milan", "Napoli", "Porto", "Ajax", "Indonesia"],
-            "team4": ["West Ham", "Aston Villa", "Roma", "Lazio", "Sevilla", "Leipzig", "Malaysia"],
-            "player1": ["Haaland", "Salah", "Saka", "Bellingham", "Mbappe", "Martinez", "Quang Hải", "Tiến Linh"],
-            "player2": ["De Bruyne", "Odegaard", "Kane", "Vinicius", "Lewandowski", "Griezmann", "Công Phượng"],
-            "player3": ["Rodri", "Rice", "Son", "Kroos", "Pedri", "Messi", "Văn Hậu", "Văn Lâm"],
-            "score1": ["1", "2", "3", "4", "5"],
-            "score2": ["0", "1", "2", "3"],
-            "minute1": ["12", "23", "45+2", "56", "67", "78", "89+1"],
-            "minute2": ["34", "45", "59", "69", "80", "90+3"],
-            "gameday": ["thứ Bảy", "Chủ nhật", "20/4", "27/4", "4/5", "11/5", "18/5"],
-            "laptop_model": ["Asus ROG Zephyrus G14", "Lenovo Legion Pro 7", "MSI Titan GT77", "Acer Predator Helios", "Alienware m18"]
-        }
-        
-        # Thay thế các biến bằng thông tin cá nhân nếu có
-        if member_id and member_id in family_data:
-            preferences = family_data[member_id].get("preferences", {})
-            
-            if preferences.get("food"):
-                replacements["food"].insert(0, preferences["food"])
-            
-            if preferences.get("hobby"):
-                replacements["hobby"].insert(0, preferences["hobby"])
-        
-        # Thêm thông tin từ sự kiện sắp tới
-        if upcoming_events:
-            for event in upcoming_events:
-                replacements["event"].insert(0, event["title"])
-                replacements["days"].insert(0, str(event["days_away"]))
-        
-        # Xác định mùa hiện tại (đơn giản hóa)
-        current_month = datetime.datetime.now().month
-        if 3 <= current_month <= 5:
-            current_season = "xuân"
-        elif 6 <= current_month <= 8:
-            current_season = "hạ"
-        elif 9 <= current_month <= 11:
-            current_season = "thu"
-        else:
-            current_season = "đông"
-        
-        replacements["season"].insert(0, current_season)
-        
-        # Thêm ngày hiện tại
-        current_day_name = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"][datetime.datetime.now().weekday()]
-        replacements["day"].insert(0, current_day_name)
-        
-        # Thêm bữa ăn phù hợp với thời điểm hiện tại
-        current_hour = datetime.datetime.now().hour
-        if 5 <= current_hour < 10:
-            current_meal = "sáng"
-        elif 10 <= current_hour < 14:
-            current_meal = "trưa"
-        elif 14 <= current_hour < 17:
-            current_meal = "xế"
-        else:
-            current_meal = "tối"
-        
-        replacements["meal"].insert(0, current_meal)
-        replacements["time_of_day"].insert(0, current_meal)
-        
-        # Tạo danh sách các chủ đề ưu tiên theo sở thích người dùng
-        priority_categories = []
-        user_preferences = {}
-        
-        # Phân tích sở thích người dùng
-        if member_id and member_id in family_data:
-            preferences = family_data[member_id].get("preferences", {})
-            user_preferences = preferences
-            
-            # Ưu tiên các chủ đề dựa trên sở thích
-            if preferences.get("food"):
-                priority_categories.append("food")
-            
-            if preferences.get("hobby"):
-                hobby = preferences["hobby"].lower()
-                if any(keyword in hobby for keyword in ["đọc", "sách", "học", "nghiên cứu"]):
-                    priority_categories.append("education")
-                elif any(keyword in hobby for keyword in ["du lịch", "đi", "khám phá", "phiêu lưu"]):
-                    priority_categories.append("travel")
-                elif any(keyword in hobby for keyword in ["âm nhạc", "nghe", "hát", "nhạc"]):
-                    priority_categories.append("entertainment")
-                elif any(keyword in hobby for keyword in ["phim", "xem", "điện ảnh", "movie"]):
-                    priority_categories.append("movies")
-                elif any(keyword in hobby for keyword in ["bóng đá", "thể thao", "bóng rổ", "thể hình", "gym", "bóng", "đá", "tennis"]):
-                    priority_categories.append("football")
-                elif any(keyword in hobby for keyword in ["công nghệ", "máy tính", "điện thoại", "game", "tech"]):
-                    priority_categories.append("technology")
-                
-        # Luôn đảm bảo có tin tức trong các gợi ý
-        priority_categories.append("news")
-        
-        # Thêm các chủ đề còn lại
-        remaining_categories = [cat for cat in question_templates.keys() if cat not in priority_categories]
-        
-        # Đảm bảo tách riêng phim và bóng đá nếu người dùng thích cả hai
-        if "movies" not in priority_categories and "football" not in priority_categories:
-            # Nếu cả hai chưa được thêm, thêm cả hai
-            remaining_categories = ["movies", "football"] + [cat for cat in remaining_categories if cat not in ["movies", "football"]]
-        
-        # Kết hợp để có tất cả chủ đề
-        all_categories = priority_categories + remaining_categories
-        
-        # Chọn tối đa max_questions chủ đề, đảm bảo ưu tiên các sở thích
-        selected_categories = all_categories[:max_questions]
-        
-        # Tạo câu gợi ý cho mỗi chủ đề
-        for category in selected_categories:
-            if len(questions) >= max_questions:
-                break
-                
-            # Chọn một mẫu câu ngẫu nhiên từ chủ đề
-            template = random.choice(question_templates[category])
-            
-            # Điều chỉnh mẫu câu dựa trên sở thích người dùng
-            if category == "food" and user_preferences.get("food"):
-                # Nếu người dùng có món ăn yêu thích, thay thế biến {food} bằng sở thích
-                template = template.replace("{food}", user_preferences["food"])
-            elif category == "football" and "hobby" in user_preferences and any(keyword in user_preferences["hobby"].lower() for keyword in ["bóng đá", "thể thao"]):
-                # Nếu người dùng thích bóng đá, ưu tiên thông tin cụ thể hơn
-                pass  # Giữ nguyên template vì đã đủ cụ thể
-            
-            # Thay thế các biến còn lại trong mẫu câu
-            question = template
-            for key in replacements:
-                if "{" + key + "}" in question:
-                    replacement = random.choice(replacements[key])
-                    question = question.replace("{" + key + "}", replacement)
-            
-            questions.append(question)
-        
-        # Đảm bảo đủ số lượng câu hỏi
-        if len(questions) < max_questions:
-            # Ưu tiên thêm từ tin tức và thông tin giải trí
-            more_templates = []
-            more_templates.extend(question_templates["news"])
-            more_templates.extend(question_templates["movies"])
-            more_templates.extend(question_templates["football"])
-            
-            random.shuffle(more_templates)
-            
-            while len(questions) < max_questions and more_templates:
-                template = more_templates.pop(0)
-                
-                # Thay thế các biến trong mẫu câu
-                question = template
-                for key in replacements:
-                    if "{" + key + "}" in question:
-                        replacement = random.choice(replacements[key])
-                        question = question.replace("{" + key + "}", replacement)
-                
-                # Tránh trùng lặp
-                if question not in questions:
-                    questions.append(question)
-    
-    # Lưu câu hỏi vào cache
-    if "question_cache" not in st.session_state:
-        st.session_state.question_cache = {}
-    
-    st.session_state.question_cache[cache_key] = questions
-    
-    return questions
+# Toàn bộ logic trò chuyện, tìm kiếm và thực thi lệnh nằm trong gói family_assistant;
+# file này chỉ lo phần giao diện. Dữ liệu của từng hộ gia đình được tải khi cần
+# qua registry dùng chung (xem main()).
+usage_ledger = llm.get_usage_ledger()  # Sổ ghi nhận token và chi phí
 
 def handle_suggested_question(question):
     """Xử lý khi người dùng chọn câu hỏi gợi ý"""
     st.session_state.suggested_question = question
     st.session_state.process_suggested = True
 
-# Thêm các hàm tiện ích cho việc tính toán ngày tháng
-def get_date_from_relative_term(term):
-    """Chuyển đổi từ mô tả tương đối về ngày thành ngày thực tế"""
-    today = datetime.datetime.now().date()
-    
-    if term in ["hôm nay", "today"]:
-        return today
-    elif term in ["ngày mai", "mai", "tomorrow"]:
-        return today + datetime.timedelta(days=1)
-    elif term in ["ngày kia", "day after tomorrow"]:
-        return today + datetime.timedelta(days=2)
-    elif term in ["hôm qua", "yesterday"]:
-        return today - datetime.timedelta(days=1)
-    elif "tuần tới" in term or "tuần sau" in term or "next week" in term:
-        return today + datetime.timedelta(days=7)
-    elif "tuần trước" in term or "last week" in term:
-        return today - datetime.timedelta(days=7)
-    elif "tháng tới" in term or "tháng sau" in term or "next month" in term:
-        # Đơn giản hóa bằng cách thêm 30 ngày
-        return today + datetime.timedelta(days=30)
-    
-    return None
-
-# Tải dữ liệu ban đầu
-def load_data(file_path):
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # Đảm bảo dữ liệu là một từ điển
-                if not isinstance(data, dict):
-                    print(f"Dữ liệu trong {file_path} không phải từ điển. Khởi tạo lại.")
-                    return {}
-                return data
-        except Exception as e:
-            print(f"Lỗi khi đọc {file_path}: {e}")
-            return {}
-    return {}
-
-def save_data(file_path, data):
-    try:
-        # Đảm bảo thư mục tồn tại
-        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        logger.info(f"Đã lưu dữ liệu vào {file_path}: {len(data)} mục")
-        return True
-    except Exception as e:
-        logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {e}")
-        st.error(f"Không thể lưu dữ liệu: {e}")
-        return False
-
-# Kiểm tra và đảm bảo cấu trúc dữ liệu đúng
-def verify_data_structure():
-    global family_data, events_data, notes_data, chat_history
-    
-    # Đảm bảo tất cả dữ liệu là từ điển
-    if not isinstance(family_data, dict):
-        print("family_data không phải từ điển. Khởi tạo lại.")
-        family_data = {}
-        
-    if not isinstance(events_data, dict):
-        print("events_data không phải từ điển. Khởi tạo lại.")
-        events_data = {}
-        
-    if not isinstance(notes_data, dict):
-        print("notes_data không phải từ điển. Khởi tạo lại.")
-        notes_data = {}
-        
-    if not isinstance(chat_history, dict):
-        print("chat_history không phải từ điển. Khởi tạo lại.")
-        chat_history = {}
-    
-    # Kiểm tra và sửa các dữ liệu thành viên
-    members_to_fix = []
-    for member_id, member in family_data.items():
-        if not isinstance(member, dict):
-            members_to_fix.append(member_id)
-    
-    # Xóa các mục không hợp lệ
-    for member_id in members_to_fix:
-        del family_data[member_id]
-        
-    # Lưu lại dữ liệu đã sửa
-    save_data(FAMILY_DATA_FILE, family_data)
-    save_data(EVENTS_DATA_FILE, events_data)
-    save_data(NOTES_DATA_FILE, notes_data)
-    save_data(CHAT_HISTORY_FILE, chat_history)
-
-# Tải dữ liệu ban đầu
-family_data = load_data(FAMILY_DATA_FILE)
-events_data = load_data(EVENTS_DATA_FILE)
-notes_data = load_data(NOTES_DATA_FILE)
-chat_history = load_data(CHAT_HISTORY_FILE)  # Tải lịch sử chat
-
-# Kiểm tra và sửa cấu trúc dữ liệu
-verify_data_structure()
-
 # Hàm chuyển đổi hình ảnh sang base64
 def get_image_base64(image_raw):
     buffered = BytesIO()
@@ -682,479 +53,110 @@ def get_image_base64(image_raw):
     img_byte = buffered.getvalue()
     return base64.b64encode(img_byte).decode('utf-8')
 
-# Hàm tạo tóm tắt lịch sử chat
-def generate_chat_summary(messages, api_key):
-    """Tạo tóm tắt từ lịch sử trò chuyện"""
-    if not messages or len(messages) < 3:  # Cần ít nhất một vài tin nhắn để tạo tóm tắt
-        return "Chưa có đủ tin nhắn để tạo tóm tắt."
-    
-    # Chuẩn bị dữ liệu cho API
-    content_texts = []
-    for message in messages:
-        if "content" in message:
-            # Xử lý cả tin nhắn văn bản và hình ảnh
-            if isinstance(message["content"], list):
-                for content in message["content"]:
-                    if content["type"] == "text":
-                        content_texts.append(f"{message['role'].upper()}: {content['text']}")
-            else:
-                content_texts.append(f"{message['role'].upper()}: {message['content']}")
-    
-    # Ghép tất cả nội dung lại
-    full_content = "\n".join(content_texts)
-    
-    # Gọi API để tạo tóm tắt
-    try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model=openai_model,
-            messages=[
-                {"role": "system", "content": "Bạn là trợ lý tạo tóm tắt. Hãy tóm tắt cuộc trò chuyện dưới đây thành 1-3 câu ngắn gọn, tập trung vào các thông tin và yêu cầu chính."},
-                {"role": "user", "content": f"Tóm tắt cuộc trò chuyện sau:\n\n{full_content}"}
-            ],
-            temperature=0.3,
-            max_tokens=150
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"Lỗi khi tạo tóm tắt: {e}")
-        return "Không thể tạo tóm tắt vào lúc này."
-
-# Hàm lưu lịch sử trò chuyện cho người dùng hiện tại
-def save_chat_history(member_id, messages, summary=None):
-    """Lưu lịch sử chat cho một thành viên cụ thể"""
-    if member_id not in chat_history:
-        chat_history[member_id] = []
-    
-    # Tạo bản ghi mới
-    history_entry = {
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": messages,
-        "summary": summary if summary else ""
-    }
+def stream_assistant_reply(store, api_key, tavily_api_key, current_member=None):
+    """
+    Chạy một lượt trò chuyện qua lõi trợ lý và trả về generator văn bản cho st.write_stream
     
-    # Thêm vào lịch sử và giới hạn số lượng
-    chat_history[member_id].insert(0, history_entry)  # Thêm vào đầu danh sách
+    Trạng thái trung gian hiển thị trong placeholder, các lệnh đã thực thi được
+    thông báo sau khi stream xong, phản hồi được thêm vào session state.
+    """
+    placeholder = st.empty()
+    actions = []
+    assistant = Assistant(store, api_key, tavily_api_key)
     
-    # Giới hạn lưu tối đa 10 cuộc trò chuyện gần nhất
-    if len(chat_history[member_id]) > 10:
-        chat_history[member_id] = chat_history[member_id][:10]
+    for event in iterate_sync(assistant.stream_reply(list(st.session_state.messages), current_member)):
+        if event["type"] == "status":
+            placeholder.info(event["message"])
+        elif event["type"] == "token":
+            placeholder.empty()
+            yield event["text"]
+        elif event["type"] == "action":
+            actions.append(event)
+        elif event["type"] == "error":
+            placeholder.empty()
+            yield event["message"]
+        elif event["type"] == "done":
+            st.session_state.messages.append(text_message("assistant", event["text"]))
+            st.session_state.last_turn_trace = event["trace"]
     
-    # Lưu vào file
-    save_data(CHAT_HISTORY_FILE, chat_history)
-
-# Phát hiện câu hỏi cần search thông tin thực tế
-def detect_search_intent(query, api_key):
-    """
-    Phát hiện xem câu hỏi có cần tìm kiếm thông tin thực tế hay không
-    và tinh chỉnh câu truy vấn để bao gồm các yếu tố thời gian.
-
-    Args:
-        query (str): Câu hỏi của người dùng
-        api_key (str): OpenAI API key
-
-    Returns:
-        tuple: (need_search, search_query)
-               need_search: True/False
-               search_query: Câu truy vấn đã được tinh chỉnh (có thể bao gồm yếu tố thời gian)
-    """
-    try:
-        client = OpenAI(api_key=api_key)
-        current_date_str = datetime.datetime.now().strftime("%Y-%m-%d") # Lấy ngày hiện tại
-
-        system_prompt = f"""
-Bạn là một hệ thống phân loại và tinh chỉnh câu hỏi thông minh. Nhiệm vụ của bạn là:
-1. Xác định xem câu hỏi có cần tìm kiếm thông tin thực tế, tin tức mới hoặc dữ liệu cập nhật không.
-2. Nếu cần tìm kiếm, hãy tinh chỉnh câu hỏi thành một truy vấn tìm kiếm tối ưu cho search engine. ĐẶC BIỆT CHÚ Ý đến các yếu tố thời gian (ví dụ: hôm nay, hôm qua, tuần này, tháng trước, năm 2023, tối qua, sáng nay...).
-3. Hãy kết hợp các yếu tố thời gian này vào `search_query` để kết quả tìm kiếm được chính xác hơn về mặt thời gian.
-
-Hôm nay là ngày: {current_date_str}.
-
-Câu hỏi cần search khi:
-- Liên quan đến tin tức, sự kiện hiện tại hoặc gần đây (ví dụ: "tin tức hôm nay", "kết quả bóng đá tối qua").
-- Yêu cầu dữ liệu thực tế, số liệu thống kê cập nhật (ví dụ: "giá vàng tuần này").
-- Hỏi về kết quả thể thao, giải đấu đang diễn ra hoặc vừa kết thúc.
-- Cần thông tin về giá cả, sản phẩm mới ra mắt.
-- Liên quan đến thời tiết, tình hình giao thông hiện tại.
-
-Câu hỏi KHÔNG cần search khi:
-- Liên quan đến quản lý gia đình trong ứng dụng này (thêm thành viên, sự kiện, ghi chú).
-- Hỏi ý kiến, lời khuyên cá nhân không dựa trên dữ liệu thực tế.
-- Yêu cầu công thức nấu ăn phổ biến, kiến thức phổ thông không thay đổi nhanh.
-- Yêu cầu hỗ trợ sử dụng ứng dụng.
-
-Ví dụ tinh chỉnh truy vấn:
-- User: "tin tức covid hôm nay" -> search_query: "tin tức covid mới nhất ngày {current_date_str}" hoặc "tin tức covid hôm nay"
-- User: "kết quả trận MU tối qua" -> search_query: "kết quả trận MU tối qua" hoặc "kết quả Manchester United ngày [ngày hôm qua]"
-- User: "có phim gì hay tuần này?" -> search_query: "phim chiếu rạp hay tuần này"
-- User: "giá bitcoin" -> search_query: "giá bitcoin mới nhất"
-- User: "thủ đô nước Pháp là gì?" -> need_search: false (kiến thức phổ thông)
+    for action in actions:
+        if action["ok"]:
+            st.success(action["message"])
+        else:
+            st.warning(action["message"])
 
-Trả lời DƯỚI DẠNG JSON với 2 trường:
-- need_search (boolean: true hoặc false)
-- search_query (string: câu truy vấn tìm kiếm đã được tối ưu, bao gồm cả yếu tố thời gian nếu có và cần thiết). Nếu need_search là false, trường này có thể là chuỗi rỗng hoặc câu truy vấn gốc.
+# Script phát các đoạn âm thanh TTS nối tiếp nhau trên trình duyệt.
+# Hàng đợi và hàm phát được tạo trong cửa sổ cha để vẫn tiếp tục phát
+# khi Streamlit chạy lại script và xóa iframe của component.
+TTS_PLAYER_SCRIPT = """
+<script>
+const w = window.parent;
+w.__ttsQueue = w.__ttsQueue || [];
+w.__ttsQueue.push("__AUDIO_SRC__");
+if (!w.__ttsPlayNext) {
+    w.__ttsPlayNext = new w.Function(`
+        const src = window.__ttsQueue.shift();
+        if (!src) { window.__ttsPlaying = false; return; }
+        window.__ttsPlaying = true;
+        const player = new Audio(src);
+        player.onended = window.__ttsPlayNext;
+        player.onerror = window.__ttsPlayNext;
+        player.play().catch(window.__ttsPlayNext);
+    `);
+}
+if (!w.__ttsPlaying) { w.__ttsPlayNext(); }
+</script>
 """
 
-        response = client.chat.completions.create(
-            model=openai_model, # Đảm bảo sử dụng model hỗ trợ JSON mode tốt
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\"\n\nHãy phân tích và trả về JSON theo yêu cầu."}
-            ],
-            temperature=0.1,
-            max_tokens=250, # Tăng nhẹ để đủ chỗ cho prompt và JSON
-            response_format={"type": "json_object"}
-        )
-
-        result_str = response.choices[0].message.content
-        logger.info(f"Kết quả detect_search_intent (raw): {result_str}") # Log kết quả thô
-
-        try:
-            result = json.loads(result_str)
-            need_search = result.get("need_search", False)
-            # Nếu cần search mà search_query rỗng, dùng query gốc
-            search_query = result.get("search_query", query) if need_search else query
-            if need_search and not search_query:
-                 search_query = query # Đảm bảo có query nếu cần search
+# Lựa chọn lặp lại trong form sự kiện
+REPEAT_OPTIONS = {
+    "Không lặp lại": None,
+    "Hàng ngày": "daily",
+    "Hàng tuần": "weekly",
+    "Hàng tháng": "monthly",
+    "Hàng năm": "yearly",
+}
 
-            logger.info(f"Phân tích truy vấn: need_search={need_search}, search_query='{search_query}'")
-            return need_search, search_query
-
-        except json.JSONDecodeError as json_err:
-            logger.error(f"Lỗi giải mã JSON từ detect_search_intent: {json_err}")
-            logger.error(f"Chuỗi JSON không hợp lệ: {result_str}")
-            # Fallback: Mặc định không search nếu không parse được JSON
-            return False, query
-        except Exception as e:
-            logger.error(f"Lỗi không xác định trong detect_search_intent: {e}")
-            return False, query # Fallback
+def recurrence_inputs(key_prefix, current=None):
+    """Các trường chọn quy tắc lặp trong form sự kiện, trả về quy tắc hoặc None"""
+    current = current or {}
+    frequencies = list(REPEAT_OPTIONS.values())
+    repeat = st.selectbox("Lặp lại", list(REPEAT_OPTIONS),
+                          index=frequencies.index(current.get("freq")) if current.get("freq") in frequencies else 0,
+                          key=f"{key_prefix}_repeat")
+    interval = st.number_input("Mỗi (số chu kỳ)", min_value=1, value=int(current.get("interval", 1)),
+                               key=f"{key_prefix}_interval")
+    has_until = st.checkbox("Có ngày kết thúc", value=bool(current.get("until")), key=f"{key_prefix}_has_until")
+    until = st.date_input("Kết thúc vào", datetime.date.fromisoformat(current["until"]) if current.get("until")
+                          else datetime.date.today(), key=f"{key_prefix}_until")
+    if REPEAT_OPTIONS[repeat] is None:
+        return None
+    rule = {**current, "freq": REPEAT_OPTIONS[repeat], "interval": int(interval)}
+    rule.pop("until", None)
+    if has_until:
+        rule["until"] = until.strftime("%Y-%m-%d")
+    return rule
 
-    except Exception as e:
-        logger.error(f"Lỗi khi gọi OpenAI trong detect_search_intent: {e}")
-        # Fallback: Nếu có lỗi API, giả sử không cần search
-        return False, query
+def play_audio_clip(audio):
+    """Đưa một đoạn âm thanh vào hàng đợi phát tuần tự trên trình duyệt"""
+    mime_type = AUDIO_MIME_TYPES.get(TTS_FORMAT, "audio/mpeg")
+    audio_src = f"data:{mime_type};base64,{base64.b64encode(audio).decode('utf-8')}"
+    components.html(TTS_PLAYER_SCRIPT.replace("__AUDIO_SRC__", audio_src), height=0)
 
-# Hàm stream phản hồi từ GPT-4o-mini
-def stream_llm_response(api_key, system_prompt="", current_member=None):
-    """Hàm tạo và xử lý phản hồi từ mô hình AI"""
-    response_message = ""
-    
-    # Tạo tin nhắn với system prompt
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    # Thêm tất cả tin nhắn trước đó vào cuộc trò chuyện
-    for message in st.session_state.messages:
-        # Xử lý các tin nhắn hình ảnh
-        if any(content["type"] == "image_url" for content in message["content"]):
-            # Đối với tin nhắn có hình ảnh, chúng ta cần tạo tin nhắn theo định dạng của OpenAI
-            images = [content for content in message["content"] if content["type"] == "image_url"]
-            texts = [content for content in message["content"] if content["type"] == "text"]
-            
-            # Thêm hình ảnh và văn bản vào tin nhắn
-            message_content = []
-            for image in images:
-                message_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": image["image_url"]["url"]}
-                })
-            
-            if texts:
-                text_content = "\n".join([text["text"] for text in texts])
-                message_content.append({
-                    "type": "text",
-                    "text": text_content
-                })
-            
-            messages.append({
-                "role": message["role"],
-                "content": message_content
-            })
-        else:
-            # Đối với tin nhắn chỉ có văn bản
-            text_content = message["content"][0]["text"] if message["content"] else ""
-            messages.append({
-                "role": message["role"],
-                "content": text_content
-            })
+def write_assistant_stream(stream, api_key):
+    """Hiển thị phản hồi đang stream, đọc thành tiếng từng câu nếu bật chế độ giọng nói"""
+    if not st.session_state.get("tts_enabled"):
+        return st.write_stream(stream)
     
-    try:
-        # Lấy tin nhắn người dùng mới nhất
-        last_user_message = ""
-        for message in reversed(st.session_state.messages):
-            if message["role"] == "user" and message["content"][0]["type"] == "text":
-                last_user_message = message["content"][0]["text"]
-                break
-        
-        # Phát hiện ý định tìm kiếm
-        need_search = False
-        search_query = ""
-        
-        if last_user_message:
-            tavily_api_key = st.session_state.get("tavily_api_key", "")
-            if tavily_api_key:
-                # Hiển thị placeholder để người dùng biết trợ lý đang tìm kiếm
-                placeholder = st.empty()
-                placeholder.info("🔍 Đang phân tích câu hỏi của bạn...")
-                
-                need_search, search_query = detect_search_intent(last_user_message, api_key)
-                
-                if need_search:
-                    placeholder.info(f"🔍 Đang tìm kiếm thông tin về: '{search_query}'...")
-                    search_result = search_and_summarize(tavily_api_key, search_query, api_key)
-                    
-                    # Thêm kết quả tìm kiếm vào hệ thống prompt
-                    search_info = f"""
-                    THÔNG TIN TÌM KIẾM:
-                    Câu hỏi: {search_query}
-                    
-                    Kết quả:
-                    {search_result}
-                    
-                    Hãy sử dụng thông tin này để trả lời câu hỏi của người dùng. Đảm bảo đề cập đến nguồn thông tin.
-                    """
-                    
-                    messages[0]["content"] = system_prompt + "\n\n" + search_info
-                    placeholder.empty()
-        
-        client = OpenAI(api_key=api_key)
-        for chunk in client.chat.completions.create(
-            model=openai_model,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=2048,
-            stream=True,
-        ):
-            chunk_text = chunk.choices[0].delta.content or ""
-            response_message += chunk_text
-            yield chunk_text
-
-        # Hiển thị phản hồi đầy đủ trong log để debug
-        logger.info(f"Phản hồi đầy đủ từ trợ lý: {response_message[:200]}...")
-        
-        # Xử lý phản hồi để trích xuất lệnh
-        process_assistant_response(response_message, current_member)
-        
-        # Thêm phản hồi vào session state
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": [
-                {
-                    "type": "text",
-                    "text": response_message,
-                }
-            ]})
-        
-        # Nếu đang chat với một thành viên cụ thể, lưu lịch sử
-        if current_member:
-            # Tạo tóm tắt cuộc trò chuyện
-            summary = generate_chat_summary(st.session_state.messages, api_key)
-            # Lưu lịch sử
-            save_chat_history(current_member, st.session_state.messages, summary)
-            
-    except Exception as e:
-        logger.error(f"Lỗi khi tạo phản hồi từ OpenAI: {e}")
-        error_message = f"Có lỗi xảy ra: {str(e)}"
-        yield error_message
-
-def process_assistant_response(response, current_member=None):
-    """Hàm xử lý lệnh từ phản hồi của trợ lý"""
-    try:
-        logger.info(f"Xử lý phản hồi của trợ lý, độ dài: {len(response)}")
-        
-        # Xử lý lệnh thêm sự kiện
-        if "##ADD_EVENT:" in response:
-            logger.info("Tìm thấy lệnh ADD_EVENT")
-            cmd_start = response.index("##ADD_EVENT:") + len("##ADD_EVENT:")
-            cmd_end = response.index("##", cmd_start)
-            cmd = response[cmd_start:cmd_end].strip()
-            
-            logger.info(f"Nội dung lệnh ADD_EVENT: {cmd}")
-            
-            try:
-                details = json.loads(cmd)
-                if isinstance(details, dict):
-                    # Xử lý các từ ngữ tương đối về thời gian
-                    logger.info(f"Đang xử lý ngày: {details.get('date', '')}")
-                    if details.get('date') and not details['date'][0].isdigit():
-                        # Nếu ngày không bắt đầu bằng số, có thể là mô tả tương đối
-                        relative_date = get_date_from_relative_term(details['date'].lower())
-                        if relative_date:
-                            details['date'] = relative_date.strftime("%Y-%m-%d")
-                            logger.info(f"Đã chuyển đổi ngày thành: {details['date']}")
-                    
-                    # Thêm thông tin về người tạo sự kiện
-                    if current_member:
-                        details['created_by'] = current_member
-                    
-                    logger.info(f"Thêm sự kiện: {details.get('title', 'Không tiêu đề')}")
-                    success = add_event(details)
-                    if success:
-                        st.success(f"Đã thêm sự kiện: {details.get('title', '')}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Lỗi khi phân tích JSON cho ADD_EVENT: {e}")
-                logger.error(f"Chuỗi JSON gốc: {cmd}")
-        
-        # Xử lý lệnh UPDATE_EVENT
-        if "##UPDATE_EVENT:" in response:
-            logger.info("Tìm thấy lệnh UPDATE_EVENT")
-            cmd_start = response.index("##UPDATE_EVENT:") + len("##UPDATE_EVENT:")
-            cmd_end = response.index("##", cmd_start)
-            cmd = response[cmd_start:cmd_end].strip()
-            
-            logger.info(f"Nội dung lệnh UPDATE_EVENT: {cmd}")
-            
-            try:
-                details = json.loads(cmd)
-                if isinstance(details, dict):
-                    # Xử lý các từ ngữ tương đối về thời gian
-                    if details.get('date') and not details['date'][0].isdigit():
-                        # Nếu ngày không bắt đầu bằng số, có thể là mô tả tương đối
-                        relative_date = get_date_from_relative_term(details['date'].lower())
-                        if relative_date:
-                            details['date'] = relative_date.strftime("%Y-%m-%d")
-                    
-                    logger.info(f"Cập nhật sự kiện: {details.get('title', 'Không tiêu đề')}")
-                    success = update_event(details)
-                    if success:
-                        st.success(f"Đã cập nhật sự kiện: {details.get('title', '')}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Lỗi khi phân tích JSON cho UPDATE_EVENT: {e}")
-        
-        # Các lệnh xử lý khác tương tự
-        for cmd_type in ["ADD_FAMILY_MEMBER", "UPDATE_PREFERENCE", "DELETE_EVENT", "ADD_NOTE"]:
-            cmd_pattern = f"##{cmd_type}:"
-            if cmd_pattern in response:
-                logger.info(f"Tìm thấy lệnh {cmd_type}")
-                try:
-                    cmd_start = response.index(cmd_pattern) + len(cmd_pattern)
-                    cmd_end = response.index("##", cmd_start)
-                    cmd = response[cmd_start:cmd_end].strip()
-                    
-                    if cmd_type == "DELETE_EVENT":
-                        event_id = cmd.strip()
-                        delete_event(event_id)
-                        st.success(f"Đã xóa sự kiện!")
-                    else:
-                        details = json.loads(cmd)
-                        if isinstance(details, dict):
-                            if cmd_type == "ADD_FAMILY_MEMBER":
-                                add_family_member(details)
-                                st.success(f"Đã thêm thành viên: {details.get('name', '')}")
-                            elif cmd_type == "UPDATE_PREFERENCE":
-                                update_preference(details)
-                                st.success(f"Đã cập nhật sở thích!")
-                            elif cmd_type == "ADD_NOTE":
-                                # Thêm thông tin về người tạo ghi chú
-                                if current_member:
-                                    details['created_by'] = current_member
-                                add_note(details)
-                                st.success(f"Đã thêm ghi chú!")
-                except Exception as e:
-                    logger.error(f"Lỗi khi xử lý lệnh {cmd_type}: {e}")
+    speaker = StreamingSpeaker(api_key, voice=st.session_state.get("tts_voice", DEFAULT_VOICE))
+    audio_container = st.container()
     
-    except Exception as e:
-        logger.error(f"Lỗi khi xử lý phản hồi của trợ lý: {e}")
-        logger.error(f"Phản hồi gốc: {response[:100]}...")
-
-# Các hàm quản lý thông tin gia đình
-def add_family_member(details):
-    member_id = details.get("id") or str(len(family_data) + 1)
-    family_data[member_id] = {
-        "name": details.get("name", ""),
-        "age": details.get("age", ""),
-        "preferences": details.get("preferences", {}),
-        "added_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_data(FAMILY_DATA_FILE, family_data)
-
-def update_preference(details):
-    member_id = details.get("id")
-    preference_key = details.get("key")
-    preference_value = details.get("value")
+    def on_audio(audio):
+        with audio_container:
+            play_audio_clip(audio)
     
-    if member_id in family_data and preference_key:
-        if "preferences" not in family_data[member_id]:
-            family_data[member_id]["preferences"] = {}
-        family_data[member_id]["preferences"][preference_key] = preference_value
-        save_data(FAMILY_DATA_FILE, family_data)
-
-def add_event(details):
-    """Thêm một sự kiện mới vào danh sách sự kiện"""
-    try:
-        event_id = str(len(events_data) + 1)
-        events_data[event_id] = {
-            "title": details.get("title", ""),
-            "date": details.get("date", ""),
-            "time": details.get("time", ""),
-            "description": details.get("description", ""),
-            "participants": details.get("participants", []),
-            "created_by": details.get("created_by", ""),  # Thêm người tạo sự kiện
-            "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        save_data(EVENTS_DATA_FILE, events_data)
-        print(f"Đã thêm sự kiện: {details.get('title', '')} vào {EVENTS_DATA_FILE}")
-        print(f"Tổng số sự kiện hiện tại: {len(events_data)}")
-        return True
-    except Exception as e:
-        print(f"Lỗi khi thêm sự kiện: {e}")
-        return False
-
-def update_event(details):
-    """Cập nhật thông tin về một sự kiện"""
-    try:
-        event_id = details.get("id")
-        if event_id in events_data:
-            # Cập nhật các trường được cung cấp
-            for key, value in details.items():
-                if key != "id" and value is not None:
-                    events_data[event_id][key] = value
-            
-            # Đảm bảo trường created_on được giữ nguyên
-            if "created_on" not in events_data[event_id]:
-                events_data[event_id]["created_on"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            save_data(EVENTS_DATA_FILE, events_data)
-            logger.info(f"Đã cập nhật sự kiện ID={event_id}: {details}")
-            return True
-        else:
-            logger.warning(f"Không tìm thấy sự kiện ID={event_id}")
-            return False
-    except Exception as e:
-        logger.error(f"Lỗi khi cập nhật sự kiện: {e}")
-        return False
+    return st.write_stream(speak_along(stream, speaker, on_audio))
 
-def delete_event(event_id):
-    if event_id in events_data:
-        del events_data[event_id]
-        save_data(EVENTS_DATA_FILE, events_data)
-
-# Các hàm quản lý ghi chú
-def add_note(details):
-    note_id = str(len(notes_data) + 1)
-    notes_data[note_id] = {
-        "title": details.get("title", ""),
-        "content": details.get("content", ""),
-        "tags": details.get("tags", []),
-        "created_by": details.get("created_by", ""),  # Thêm người tạo ghi chú
-        "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_data(NOTES_DATA_FILE, notes_data)
-
-# Lọc sự kiện theo người dùng
-def filter_events_by_member(member_id=None):
-    """Lọc sự kiện theo thành viên cụ thể"""
-    if not member_id:
-        return events_data  # Trả về tất cả sự kiện nếu không có ID
-    
-    filtered_events = {}
-    for event_id, event in events_data.items():
-        # Lọc những sự kiện mà thành viên tạo hoặc tham gia
-        if (event.get("created_by") == member_id or 
-            (member_id in family_data and 
-             family_data[member_id].get("name") in event.get("participants", []))):
-            filtered_events[event_id] = event
-    
-    return filtered_events
 
 def main():
     # --- Cấu hình trang ---
@@ -1165,6 +167,17 @@ def main():
         initial_sidebar_state="expanded",
     )
 
+    # Endpoint /metrics cho Prometheus (chỉ khởi động một lần mỗi tiến trình)
+    telemetry.start_metrics_server()
+
+    # --- Hộ gia đình (chọn qua ?household=<id> trên URL) ---
+    try:
+        household_id = st.query_params.get("household") or DEFAULT_HOUSEHOLD
+        store = get_registry().get(household_id)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
     # --- Tiêu đề ---
     st.html("""<h1 style="text-align: center; color: #6ca395;">👨‍👩‍👧‍👦 <i>Trợ lý Gia đình</i> 💬</h1>""")
     
@@ -1177,10 +190,17 @@ def main():
         st.session_state.suggested_question = None
     if "process_suggested" not in st.session_state:
         st.session_state.process_suggested = False
-    if "question_cache" not in st.session_state:
-        st.session_state.question_cache = {}
     if "tavily_api_key" not in st.session_state:
         st.session_state.tavily_api_key = ""
+    if "tts_enabled" not in st.session_state:
+        st.session_state.tts_enabled = False
+    if "tts_voice" not in st.session_state:
+        st.session_state.tts_voice = DEFAULT_VOICE
+    # Đổi hộ gia đình thì bắt đầu lại cuộc trò chuyện, tránh lẫn dữ liệu giữa các gia đình
+    if st.session_state.get("household_id") != store.household_id:
+        st.session_state.household_id = store.household_id
+        st.session_state.current_member = None
+        st.session_state.messages = []
 
     # --- Thanh bên ---
     with st.sidebar:
@@ -1197,12 +217,14 @@ def main():
             else:
                 st.warning("⚠️ Vui lòng nhập Tavily API Key để kích hoạt tính năng tìm kiếm thông tin thời gian thực.")
         
+        st.caption(f"🏠 Hộ gia đình: {store.household_id}")
+        
         # Chọn người dùng hiện tại
         st.write("## 👤 Chọn người dùng")
         
         # Tạo danh sách tên thành viên và ID
         member_options = {"Chung (Không cá nhân hóa)": None}
-        for member_id, member in family_data.items():
+        for member_id, member in store.family_data.items():
             if isinstance(member, dict) and "name" in member:
                 member_options[member["name"]] = member_id
         
@@ -1223,24 +245,63 @@ def main():
                 st.session_state.pop("messages", None)
                 st.rerun()
         
+        # Nhắc lịch mới từ luồng nền (chỉ hiện một lần trong mỗi phiên)
+        if reminders.REMINDERS_ENABLED:
+            current = store.get_member(st.session_state.current_member) if st.session_state.current_member else None
+            member_filter = {"id": st.session_state.current_member, **current} if current else None
+            new_reminders = reminders.get_scheduler().inbox.recent(
+                store.household_id, st.session_state.get("reminder_seen", 0), member_filter)
+            for notification in new_reminders:
+                st.toast(notification["message"])
+            if new_reminders:
+                st.session_state.reminder_seen = new_reminders[-1]["id"]
+        
         # Hiển thị thông tin người dùng hiện tại
         if st.session_state.current_member:
-            member = family_data[st.session_state.current_member]
+            member = store.family_data[st.session_state.current_member]
             st.info(f"Đang trò chuyện với tư cách: **{member.get('name')}**")
             
             # Hiển thị lịch sử trò chuyện trước đó
-            if st.session_state.current_member in chat_history and chat_history[st.session_state.current_member]:
+            if st.session_state.current_member in store.chat_history and store.chat_history[st.session_state.current_member]:
                 with st.expander("📜 Lịch sử trò chuyện trước đó"):
-                    for idx, history in enumerate(chat_history[st.session_state.current_member]):
+                    for idx, history in enumerate(store.chat_history[st.session_state.current_member]):
                         st.write(f"**{history.get('timestamp')}**")
                         st.write(f"*{history.get('summary', 'Không có tóm tắt')}*")
+                        if history.get("message_count"):
+                            st.caption(f"{history['message_count']} tin nhắn · {history.get('size', 0) / 1024:.0f} KB")
                         
-                        # Nút để tải lại cuộc trò chuyện cũ
+                        # Nút để tải lại cuộc trò chuyện cũ (nội dung chỉ được đọc lúc này)
                         if st.button(f"Tải lại cuộc trò chuyện này", key=f"load_chat_{idx}"):
-                            st.session_state.messages = history.get('messages', [])
-                            st.rerun()
+                            messages = store.load_conversation(history)
+                            if messages is None:
+                                st.error("❌ Không thể tải nội dung cuộc trò chuyện này")
+                            else:
+                                st.session_state.messages = messages
+                                st.rerun()
                         st.divider()
         
+        # Tìm kiếm toàn văn (không dấu, theo tiền tố) trong ghi chú, sự kiện và lịch sử trò chuyện
+        search_text = st.text_input("🔎 Tìm trong ghi chú, sự kiện, trò chuyện:", key="fulltext_query")
+        if search_text.strip():
+            hits = fulltext.search(store, search_text, st.session_state.current_member)
+            if not hits:
+                st.caption("Không tìm thấy kết quả nào")
+            kind_icons = {"event": "📅", "note": "📝", "chat": "💬"}
+            for idx, hit in enumerate(hits):
+                st.write(f"{kind_icons[hit['kind']]} **{hit['title'] or 'Không tiêu đề'}** · {hit['date']}")
+                if hit["snippet"]:
+                    st.caption(hit["snippet"])
+                if hit["kind"] == "chat":
+                    entry = next((history for history in store.chat_history.get(st.session_state.current_member, [])
+                                  if history.get("id") == hit["id"]), None)
+                    if entry is not None and st.button("Tải lại cuộc trò chuyện này", key=f"search_chat_{idx}"):
+                        messages = store.load_conversation(entry)
+                        if messages is None:
+                            st.error("❌ Không thể tải nội dung cuộc trò chuyện này")
+                        else:
+                            st.session_state.messages = messages
+                            st.rerun()
+        
         st.write("## Thông tin Gia đình")
         
         # Phần thêm thành viên gia đình
@@ -1256,26 +317,26 @@ def main():
                 add_member_submitted = st.form_submit_button("Thêm")
                 
                 if add_member_submitted and member_name:
-                    member_id = str(len(family_data) + 1)
-                    family_data[member_id] = {
-                        "name": member_name,
-                        "age": member_age,
-                        "preferences": {
-                            "food": food_pref,
-                            "hobby": hobby_pref,
-                            "color": color_pref
-                        },
-                        "added_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    save_data(FAMILY_DATA_FILE, family_data)
-                    st.success(f"Đã thêm {member_name} vào gia đình!")
+                    try:
+                        store.add_family_member({
+                            "name": member_name,
+                            "age": member_age,
+                            "preferences": {
+                                "food": food_pref,
+                                "hobby": hobby_pref,
+                                "color": color_pref
+                            }
+                        })
+                        st.success(f"Đã thêm {member_name} vào gia đình!")
+                    except records.ValidationError as e:
+                        st.error(f"❌ {e}")
         
         # Xem và chỉnh sửa thành viên gia đình
         with st.expander("👥 Thành viên gia đình"):
-            if not family_data:
+            if not store.family_data:
                 st.write("Chưa có thành viên nào trong gia đình")
             else:
-                for member_id, member in family_data.items():
+                for member_id, member in store.family_data.items():
                     # Kiểm tra kiểu dữ liệu của member
                     if isinstance(member, dict):
                         # Sử dụng get() khi member là dict
@@ -1300,8 +361,8 @@ def main():
         # Form chỉnh sửa thành viên (xuất hiện khi đang chỉnh sửa)
         if "editing_member" in st.session_state and st.session_state.editing_member:
             member_id = st.session_state.editing_member
-            if member_id in family_data and isinstance(family_data[member_id], dict):
-                member = family_data[member_id]
+            if member_id in store.family_data and isinstance(store.family_data[member_id], dict):
+                member = store.family_data[member_id]
                 
                 with st.form(f"edit_member_{member_id}"):
                     st.write(f"Chỉnh sửa: {member.get('name', 'Không tên')}")
@@ -1321,17 +382,17 @@ def main():
                     cancel_edits = st.form_submit_button("Hủy")
                     
                     if save_edits:
-                        family_data[member_id]["name"] = new_name
-                        family_data[member_id]["age"] = new_age
-                        family_data[member_id]["preferences"] = {
-                            "food": new_food,
-                            "hobby": new_hobby,
-                            "color": new_color
-                        }
-                        save_data(FAMILY_DATA_FILE, family_data)
-                        st.session_state.editing_member = None
-                        st.success("Đã cập nhật thông tin!")
-                        st.rerun()
+                        try:
+                            store.update_family_member(member_id, new_name, new_age, {
+                                "food": new_food,
+                                "hobby": new_hobby,
+                                "color": new_color
+                            })
+                            st.session_state.editing_member = None
+                            st.success("Đã cập nhật thông tin!")
+                            st.rerun()
+                        except records.ValidationError as e:
+                            st.error(f"❌ {e}")
                     
                     if cancel_edits:
                         st.session_state.editing_member = None
@@ -1352,10 +413,11 @@ def main():
                 event_date = st.date_input("Ngày")
                 event_time = st.time_input("Giờ")
                 event_desc = st.text_area("Mô tả")
+                event_recurrence = recurrence_inputs("add_event")
                 
                 # Multi-select cho người tham gia
                 try:
-                    member_names = [member.get("name", "") for member_id, member in family_data.items() 
+                    member_names = [member.get("name", "") for member_id, member in store.family_data.items() 
                                    if isinstance(member, dict) and member.get("name")]
                     participants = st.multiselect("Người tham gia", member_names)
                 except Exception as e:
@@ -1365,26 +427,36 @@ def main():
                 add_event_submitted = st.form_submit_button("Thêm sự kiện")
                 
                 if add_event_submitted and event_title:
-                    event_id = str(len(events_data) + 1)
-                    events_data[event_id] = {
-                        "title": event_title,
-                        "date": event_date.strftime("%Y-%m-%d"),
-                        "time": event_time.strftime("%H:%M"),
-                        "description": event_desc,
-                        "participants": participants,
-                        "created_by": st.session_state.current_member,  # Lưu người tạo
-                        "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    save_data(EVENTS_DATA_FILE, events_data)
-                    st.success(f"Đã thêm sự kiện: {event_title}!")
+                    conflicts = []
+                    try:
+                        event_id = store.add_event({
+                            "title": event_title,
+                            "date": event_date.strftime("%Y-%m-%d"),
+                            "time": event_time.strftime("%H:%M"),
+                            "description": event_desc,
+                            "participants": participants,
+                            "created_by": st.session_state.current_member,  # Lưu người tạo
+                            "recurrence": event_recurrence,
+                        }, conflicts)
+                        if event_id is None:
+                            st.error("❌ Không thể thêm sự kiện, vui lòng thử lại")
+                        else:
+                            st.success(f"Đã thêm sự kiện: {event_title}!")
+                            if conflicts:
+                                st.warning(f"⚠️ Trùng lịch với: {schedule.describe_conflicts(conflicts)}")
+                    except records.ValidationError as e:
+                        st.error(f"❌ {e}")
+        
+        if st.session_state.get("event_conflict_warning"):
+            st.warning(f"⚠️ Trùng lịch với: {st.session_state.pop('event_conflict_warning')}")
         
         # Xem sự kiện sắp tới - đã được lọc theo người dùng
         with st.expander("📆 Sự kiện"):
             # Lọc sự kiện theo người dùng hiện tại
             filtered_events = (
-                filter_events_by_member(st.session_state.current_member) 
+                store.filter_events_by_member(st.session_state.current_member) 
                 if st.session_state.current_member 
-                else events_data
+                else store.events_data
             )
             
             # Phần hiển thị chế độ lọc
@@ -1399,7 +471,7 @@ def main():
             display_events = {}
             current_member_name = ""
             if st.session_state.current_member:
-                current_member_name = family_data[st.session_state.current_member].get("name", "")
+                current_member_name = store.family_data[st.session_state.current_member].get("name", "")
             
             if mode == "Sự kiện của tôi" and st.session_state.current_member:
                 for event_id, event in filtered_events.items():
@@ -1412,11 +484,15 @@ def main():
             else:
                 display_events = filtered_events
             
-            # Sắp xếp sự kiện theo ngày (với xử lý lỗi)
+            # Sắp xếp sự kiện theo ngày (sự kiện lặp lại theo lần diễn ra kế tiếp, với xử lý lỗi)
+            today = datetime.date.today()
+            next_dates = {event_id: recurrence.next_occurrence(event, today)
+                          for event_id, event in display_events.items() if event.get("recurrence")}
             try:
                 sorted_events = sorted(
                     display_events.items(),
-                    key=lambda x: (x[1].get("date", ""), x[1].get("time", ""))
+                    key=lambda x: (next_dates[x[0]].isoformat() if next_dates.get(x[0]) else x[1].get("date", ""),
+                                   x[1].get("time", ""))
                 )
             except Exception as e:
                 st.error(f"Lỗi khi sắp xếp sự kiện: {e}")
@@ -1428,6 +504,10 @@ def main():
             for event_id, event in sorted_events:
                 st.write(f"**{event.get('title', 'Sự kiện không tiêu đề')}**")
                 st.write(f"📅 {event.get('date', 'Chưa đặt ngày')} | ⏰ {event.get('time', 'Chưa đặt giờ')}")
+                if event.get('recurrence'):
+                    next_date = next_dates.get(event_id)
+                    st.write(f"🔁 {recurrence.describe(event['recurrence'])} | Lần tới: "
+                             f"{next_date.strftime('%d/%m/%Y') if next_date else 'Đã kết thúc'}")
                 
                 if event.get('description'):
                     st.write(event.get('description', ''))
@@ -1436,8 +516,8 @@ def main():
                     st.write(f"👥 {', '.join(event.get('participants', []))}")
                 
                 # Hiển thị người tạo
-                if event.get('created_by') and event.get('created_by') in family_data:
-                    creator_name = family_data[event.get('created_by')].get("name", "")
+                if event.get('created_by') and event.get('created_by') in store.family_data:
+                    creator_name = store.family_data[event.get('created_by')].get("name", "")
                     st.write(f"👤 Tạo bởi: {creator_name}")
                 
                 col1, col2 = st.columns(2)
@@ -1446,15 +526,54 @@ def main():
                         st.session_state.editing_event = event_id
                 with col2:
                     if st.button(f"Xóa", key=f"delete_event_{event_id}"):
-                        delete_event(event_id)
+                        store.delete_event(event_id)
                         st.success(f"Đã xóa sự kiện!")
                         st.rerun()
+                if event.get('recurrence') and next_dates.get(event_id):
+                    if st.button("Bỏ qua lần tới", key=f"skip_event_{event_id}"):
+                        store.skip_occurrence(event_id, next_dates[event_id].strftime("%Y-%m-%d"))
+                        st.rerun()
                 st.divider()
+
+        # Lịch các ngày tới: sự kiện lặp lại được tính từng lần diễn ra
+        with st.expander("🗓️ Lịch 14 ngày tới"):
+            today = datetime.date.today()
+            upcoming = list(store.occurrences(today, today + datetime.timedelta(days=14),
+                                              st.session_state.current_member))
+            if not upcoming:
+                st.write("Không có sự kiện nào")
+            for event_id, event in upcoming:
+                icon = "🔁" if event.get("recurrence") else "📅"
+                st.write(f"{icon} **{datetime.date.fromisoformat(event['date']).strftime('%d/%m')}** "
+                         f"{event.get('time', '')} {event.get('title', 'Sự kiện không tiêu đề')}")
+        
+        # Nhập/xuất lịch iCalendar (Google Calendar, Outlook, iPhone...)
+        with st.expander("🔄 Nhập/Xuất lịch (.ics)"):
+            calendar_file = st.file_uploader("Chọn file .ics:", type=["ics"], key="calendar_file")
+            if calendar_file is not None and st.button("📥 Nhập lịch"):
+                with st.spinner("Đang nhập lịch..."):
+                    result = ical.import_ics(store, TextIOWrapper(calendar_file, encoding="utf-8-sig", newline=""),
+                                             st.session_state.current_member)
+                st.success(f"Đã thêm {result['added']} sự kiện, bỏ qua {result['skipped']} sự kiện đã có"
+                           + (f", {result['invalid']} sự kiện lỗi" if result["invalid"] else ""))
+            
+            # File xuất chỉ được tạo khi bấm nút, không tạo lại ở mỗi lần chạy lại trang
+            if st.button("📤 Tạo file lịch"):
+                st.session_state.calendar_export = "".join(ical.iter_ics(
+                    store.filter_events_by_member(st.session_state.current_member),
+                    store.household_id, store.family_data))
+            if st.session_state.get("calendar_export"):
+                st.download_button(
+                    "⬇️ Tải file .ics",
+                    data=st.session_state.calendar_export,
+                    file_name="lich_gia_dinh.ics",
+                    mime="text/calendar"
+                )
         
         # Form chỉnh sửa sự kiện (xuất hiện khi đang chỉnh sửa)
         if "editing_event" in st.session_state and st.session_state.editing_event:
             event_id = st.session_state.editing_event
-            event = events_data[event_id]
+            event = store.events_data[event_id]
             
             with st.form(f"edit_event_{event_id}"):
                 st.write(f"Chỉnh sửa sự kiện: {event['title']}")
@@ -1476,10 +595,11 @@ def main():
                 new_date = st.date_input("Ngày", event_date_obj)
                 new_time = st.time_input("Giờ", event_time_obj)
                 new_desc = st.text_area("Mô tả", event["description"])
+                new_recurrence = recurrence_inputs(f"edit_event_{event_id}", event.get("recurrence"))
                 
                 # Multi-select cho người tham gia
                 try:
-                    member_names = [member.get("name", "") for member_id, member in family_data.items() 
+                    member_names = [member.get("name", "") for member_id, member in store.family_data.items() 
                                    if isinstance(member, dict) and member.get("name")]
                     new_participants = st.multiselect("Người tham gia", member_names, default=event.get("participants", []))
                 except Exception as e:
@@ -1490,15 +610,28 @@ def main():
                 cancel_event_edits = st.form_submit_button("Hủy")
                 
                 if save_event_edits:
-                    events_data[event_id]["title"] = new_title
-                    events_data[event_id]["date"] = new_date.strftime("%Y-%m-%d")
-                    events_data[event_id]["time"] = new_time.strftime("%H:%M")
-                    events_data[event_id]["description"] = new_desc
-                    events_data[event_id]["participants"] = new_participants
-                    save_data(EVENTS_DATA_FILE, events_data)
-                    st.session_state.editing_event = None
-                    st.success("Đã cập nhật sự kiện!")
-                    st.rerun()
+                    conflicts = []
+                    try:
+                        updated = store.update_event({
+                            "id": event_id,
+                            "title": new_title,
+                            "date": new_date.strftime("%Y-%m-%d"),
+                            "time": new_time.strftime("%H:%M"),
+                            "description": new_desc,
+                            "participants": new_participants,
+                            "recurrence": new_recurrence,
+                        }, conflicts)
+                        if not updated:
+                            st.error("❌ Không thể cập nhật sự kiện, vui lòng thử lại")
+                        else:
+                            st.session_state.editing_event = None
+                            if conflicts:
+                                # Cảnh báo cần hiển thị sau khi tải lại trang
+                                st.session_state.event_conflict_warning = schedule.describe_conflicts(conflicts)
+                            st.success("Đã cập nhật sự kiện!")
+                            st.rerun()
+                    except records.ValidationError as e:
+                        st.error(f"❌ {e}")
                 
                 if cancel_event_edits:
                     st.session_state.editing_event = None
@@ -1513,10 +646,10 @@ def main():
         with st.expander("📝 Ghi chú"):
             # Lọc ghi chú theo người dùng hiện tại
             if st.session_state.current_member:
-                filtered_notes = {note_id: note for note_id, note in notes_data.items() 
+                filtered_notes = {note_id: note for note_id, note in store.notes_data.items() 
                                if note.get("created_by") == st.session_state.current_member}
             else:
-                filtered_notes = notes_data
+                filtered_notes = store.notes_data
             
             # Sắp xếp ghi chú theo ngày tạo (với xử lý lỗi)
             try:
@@ -1541,15 +674,14 @@ def main():
                     st.write(f"🏷️ {tags}")
                 
                 # Hiển thị người tạo
-                if note.get('created_by') and note.get('created_by') in family_data:
-                    creator_name = family_data[note.get('created_by')].get("name", "")
+                if note.get('created_by') and note.get('created_by') in store.family_data:
+                    creator_name = store.family_data[note.get('created_by')].get("name", "")
                     st.write(f"👤 Tạo bởi: {creator_name}")
                 
                 col1, col2 = st.columns(2)
                 with col2:
                     if st.button(f"Xóa", key=f"delete_note_{note_id}"):
-                        del notes_data[note_id]
-                        save_data(NOTES_DATA_FILE, notes_data)
+                        store.delete_note(note_id)
                         st.success(f"Đã xóa ghi chú!")
                         st.rerun()
                 st.divider()
@@ -1571,23 +703,29 @@ def main():
                     
                     if search_button and search_query:
                         with st.spinner("Đang tìm kiếm..."):
-                            search_result = search_and_summarize(tavily_api_key, search_query, openai_api_key)
+                            search_result = run_sync(search_and_summarize(
+                                tavily_api_key, search_query, openai_api_key, store.household_id))
                             st.write("### Kết quả tìm kiếm")
                             st.write(search_result)
         
+        # Tùy chọn trả lời bằng giọng nói
+        with st.expander("🔊 Trả lời bằng giọng nói"):
+            st.toggle("Đọc phản hồi của trợ lý", key="tts_enabled")
+            st.selectbox("Giọng đọc", AVAILABLE_VOICES, key="tts_voice")
+            st.caption("Từng câu sẽ được đọc ngay khi trợ lý viết xong, không cần chờ hết phản hồi.")
+        
         # Nút làm mới câu hỏi gợi ý
         if st.button("🔄 Làm mới câu hỏi gợi ý"):
             # Xóa cache để tạo câu hỏi mới
-            if "question_cache" in st.session_state:
-                st.session_state.question_cache = {}
+            suggestions.clear_cache(store)
             st.rerun()
         
         def reset_conversation():
             if "messages" in st.session_state and len(st.session_state.messages) > 0:
                 # Trước khi xóa, lưu lịch sử trò chuyện nếu đang trò chuyện với một thành viên
                 if st.session_state.current_member and openai_api_key:
-                    summary = generate_chat_summary(st.session_state.messages, openai_api_key)
-                    save_chat_history(st.session_state.current_member, st.session_state.messages, summary)
+                    assistant = Assistant(store, openai_api_key)
+                    run_sync(assistant.summarize_and_save(st.session_state.messages, st.session_state.current_member))
                 # Xóa tin nhắn
                 st.session_state.pop("messages", None)
 
@@ -1596,6 +734,77 @@ def main():
             on_click=reset_conversation,
         )
 
+        # Báo cáo token và chi phí theo vị trí gọi, thành viên
+        with st.expander("💰 Token & chi phí"):
+            report_days = st.selectbox(
+                "Khoảng thời gian",
+                [1, 7, 30],
+                index=1,
+                format_func=lambda days: f"{days} ngày gần nhất"
+            )
+            since_day = (datetime.date.today() - datetime.timedelta(days=report_days - 1)).strftime("%Y-%m-%d")
+            usage_by_site = usage_ledger.summarize(("call_site",), since_day, store.household_id)
+            
+            if not usage_by_site:
+                st.write("Chưa có dữ liệu sử dụng token")
+            else:
+                total_cost = sum(row["cost_usd"] for row in usage_by_site)
+                st.write(f"**Tổng chi phí ước tính:** ${total_cost:.4f}")
+                
+                st.write("Theo vị trí gọi:")
+                for row in usage_by_site:
+                    row["call_site"] = CALL_SITES.get(row["call_site"], row["call_site"])
+                st.dataframe(usage_by_site, use_container_width=True)
+                
+                st.write("Theo thành viên:")
+                usage_by_member = usage_ledger.summarize(("member_id",), since_day, store.household_id)
+                for row in usage_by_member:
+                    if row["member_id"] in store.family_data:
+                        row["member_id"] = store.family_data[row["member_id"]].get("name", row["member_id"])
+                st.dataframe(usage_by_member, use_container_width=True)
+                
+                st.download_button(
+                    "⬇️ Tải CSV",
+                    data=usage_ledger.to_csv(since_day, store.household_id),
+                    file_name="usage_ledger.csv",
+                    mime="text/csv"
+                )
+        
+        # Bảng phân tích độ trễ dành cho nhà phát triển
+        with st.expander("🛠️ Độ trễ (nhà phát triển)"):
+            last_trace = st.session_state.get("last_turn_trace")
+            if last_trace:
+                st.write(f"**Lượt gần nhất:** {last_trace['total_ms']} ms")
+                st.dataframe(last_trace["spans"], use_container_width=True)
+                if last_trace["tokens"]:
+                    st.write(f"Token: {last_trace['tokens']}")
+                if last_trace["cache"]:
+                    st.write(f"Cache: {last_trace['cache']}")
+            else:
+                st.write("Chưa có lượt trò chuyện nào được ghi nhận")
+            
+            st.write("**Tổng hợp theo giai đoạn (ms)**")
+            stage_summary = telemetry.registry.stage_summary()
+            if stage_summary:
+                st.dataframe(stage_summary, use_container_width=True)
+            singleflight_summary = telemetry.registry.singleflight_summary()
+            if singleflight_summary:
+                st.write("**Lời gọi trùng được gộp**")
+                st.dataframe(singleflight_summary, use_container_width=True)
+            route_summary = router.summary()
+            if route_summary:
+                st.write("**Mô hình theo vị trí gọi**")
+                st.dataframe(route_summary, use_container_width=True)
+            breaker_summary = resilience.breaker_summary()
+            if breaker_summary:
+                st.write("**Ngắt mạch theo endpoint**")
+                st.dataframe(breaker_summary, use_container_width=True)
+            load = admission.get_controller().snapshot()
+            st.caption(f"Lời gọi API đang chạy: {load['active']}/{load['max_concurrent']}, "
+                       f"đang chờ: {load['waiting']}, bị từ chối do quá tải: {load['shed']}")
+            if telemetry.METRICS_PORT:
+                st.caption(f"Prometheus: http://localhost:{telemetry.METRICS_PORT}/metrics")
+
     # --- Nội dung chính ---
     # Kiểm tra nếu người dùng đã nhập OpenAI API Key, nếu không thì hiển thị cảnh báo
     if openai_api_key == "" or openai_api_key is None or "sk-" not in openai_api_key:
@@ -1619,8 +828,6 @@ def main():
         """)
 
     else:
-        client = OpenAI(api_key=openai_api_key)
-
         if "messages" not in st.session_state:
             st.session_state.messages = []
 
@@ -1634,8 +841,8 @@ def main():
                         st.image(content["image_url"]["url"])
 
         # Hiển thị banner thông tin người dùng hiện tại
-        if st.session_state.current_member and st.session_state.current_member in family_data:
-            member_name = family_data[st.session_state.current_member].get("name", "")
+        if st.session_state.current_member and st.session_state.current_member in store.family_data:
+            member_name = store.family_data[st.session_state.current_member].get("name", "")
             st.info(f"👤 Đang trò chuyện với tư cách: **{member_name}**")
         elif st.session_state.current_member is None:
             st.info("👨‍👩‍👧‍👦 Đang trò chuyện trong chế độ chung")
@@ -1644,80 +851,6 @@ def main():
         if tavily_api_key:
             st.success("🔍 Trợ lý có khả năng tìm kiếm thông tin thời gian thực! Hỏi về tin tức, thể thao, thời tiết, v.v.")
         
-        # System prompt cho trợ lý
-        system_prompt = f"""
-        Bạn là trợ lý gia đình thông minh. Nhiệm vụ của bạn là giúp quản lý thông tin về các thành viên trong gia đình, 
-        sở thích của họ, các sự kiện, ghi chú, và phân tích hình ảnh liên quan đến gia đình. Khi người dùng yêu cầu, bạn phải thực hiện ngay các hành động sau:
-        
-        1. Thêm thông tin về thành viên gia đình (tên, tuổi, sở thích)
-        2. Cập nhật sở thích của thành viên gia đình
-        3. Thêm, cập nhật, hoặc xóa sự kiện
-        4. Thêm ghi chú
-        5. Phân tích hình ảnh người dùng đưa ra (món ăn, hoạt động gia đình, v.v.)
-        6. Tìm kiếm thông tin thực tế khi được hỏi về tin tức, thời tiết, thể thao, và sự kiện hiện tại
-        
-        QUAN TRỌNG: Khi cần thực hiện các hành động trên, bạn PHẢI sử dụng đúng cú pháp lệnh đặc biệt này (người dùng sẽ không nhìn thấy):
-        
-        - Thêm thành viên: ##ADD_FAMILY_MEMBER:{{"name":"Tên","age":"Tuổi","preferences":{{"food":"Món ăn","hobby":"Sở thích","color":"Màu sắc"}}}}##
-        - Cập nhật sở thích: ##UPDATE_PREFERENCE:{{"id":"id_thành_viên","key":"loại_sở_thích","value":"giá_trị"}}##
-        - Thêm sự kiện: ##ADD_EVENT:{{"title":"Tiêu đề","date":"YYYY-MM-DD","time":"HH:MM","description":"Mô tả","participants":["Tên1","Tên2"]}}##
-        - Cập nhật sự kiện: ##UPDATE_EVENT:{{"id":"id_sự_kiện","title":"Tiêu đề mới","date":"YYYY-MM-DD","time":"HH:MM","description":"Mô tả mới","participants":["Tên1","Tên2"]}}##
-        - Xóa sự kiện: ##DELETE_EVENT:id_sự_kiện##
-        - Thêm ghi chú: ##ADD_NOTE:{{"title":"Tiêu đề","content":"Nội dung","tags":["tag1","tag2"]}}##
-        
-        QUY TẮC THÊM SỰ KIỆN ĐƠN GIẢN:
-        1. Khi được yêu cầu thêm sự kiện, hãy thực hiện NGAY LẬP TỨC mà không cần hỏi thêm thông tin không cần thiết.
-        2. Khi người dùng nói "ngày mai" hoặc "tuần sau", hãy tự động tính toán ngày trong cú pháp YYYY-MM-DD.
-        3. Nếu không có thời gian cụ thể, sử dụng thời gian mặc định là 8:00.
-        4. Sử dụng mô tả ngắn gọn từ yêu cầu của người dùng.
-        5. Chỉ hỏi thông tin nếu thực sự cần thiết, tránh nhiều bước xác nhận.
-        6. Sau khi thêm/cập nhật/xóa sự kiện, tóm tắt ngắn gọn hành động đã thực hiện.
-        
-        TÌM KIẾM THÔNG TIN THỜI GIAN THỰC:
-        1. Khi người dùng hỏi về tin tức, thời tiết, thể thao, sự kiện hiện tại, thông tin sản phẩm mới, hoặc bất kỳ dữ liệu cập nhật nào, hệ thống đã tự động tìm kiếm thông tin thực tế cho bạn.
-        2. Hãy sử dụng thông tin tìm kiếm này để trả lời người dùng một cách chính xác và đầy đủ.
-        3. Luôn đề cập đến nguồn thông tin khi sử dụng kết quả tìm kiếm.
-        4. Nếu không có thông tin tìm kiếm, hãy trả lời dựa trên kiến thức của bạn và lưu ý rằng thông tin có thể không cập nhật.
-        
-        Hôm nay là {datetime.datetime.now().strftime("%d/%m/%Y")}.
-        
-        CẤU TRÚC JSON PHẢI CHÍNH XÁC như trên. Đảm bảo dùng dấu ngoặc kép cho cả keys và values. Đảm bảo các dấu ngoặc nhọn và vuông được đóng đúng cách.
-        
-        QUAN TRỌNG: Khi người dùng yêu cầu tạo sự kiện mới, hãy luôn sử dụng lệnh ##ADD_EVENT:...## trong phản hồi của bạn mà không cần quá nhiều bước xác nhận.
-        
-        Đối với hình ảnh:
-        - Nếu người dùng gửi hình ảnh món ăn, hãy mô tả món ăn, và đề xuất cách nấu hoặc thông tin dinh dưỡng nếu phù hợp
-        - Nếu là hình ảnh hoạt động gia đình, hãy mô tả hoạt động và đề xuất cách ghi nhớ khoảnh khắc đó
-        - Với bất kỳ hình ảnh nào, hãy giúp người dùng liên kết nó với thành viên gia đình hoặc sự kiện nếu phù hợp
-        """
-        
-        # Thêm thông tin về người dùng hiện tại
-        if st.session_state.current_member and st.session_state.current_member in family_data:
-            current_member = family_data[st.session_state.current_member]
-            system_prompt += f"""
-            THÔNG TIN NGƯỜI DÙNG HIỆN TẠI:
-            Bạn đang trò chuyện với: {current_member.get('name')}
-            Tuổi: {current_member.get('age', '')}
-            Sở thích: {json.dumps(current_member.get('preferences', {}), ensure_ascii=False)}
-            
-            QUAN TRỌNG: Hãy điều chỉnh cách giao tiếp và đề xuất phù hợp với người dùng này. Các sự kiện và ghi chú sẽ được ghi danh nghĩa người này tạo.
-            """
-        
-        # Thêm thông tin dữ liệu
-        system_prompt += f"""
-        Thông tin hiện tại về gia đình:
-        {json.dumps(family_data, ensure_ascii=False, indent=2)}
-        
-        Sự kiện sắp tới:
-        {json.dumps(events_data, ensure_ascii=False, indent=2)}
-        
-        Ghi chú:
-        {json.dumps(notes_data, ensure_ascii=False, indent=2)}
-        
-        Hãy hiểu và đáp ứng nhu cầu của người dùng một cách tự nhiên và hữu ích. Không hiển thị các lệnh đặc biệt
-        trong phản hồi của bạn, chỉ sử dụng chúng để thực hiện các hành động được yêu cầu.
-        """
-        
         # Kiểm tra và xử lý câu hỏi gợi ý đã chọn
         if st.session_state.process_suggested and st.session_state.suggested_question:
             question = st.session_state.suggested_question
@@ -1741,11 +874,12 @@ def main():
             
             # Xử lý phản hồi từ trợ lý
             with st.chat_message("assistant"):
-                st.write_stream(stream_llm_response(
-                    api_key=openai_api_key, 
-                    system_prompt=system_prompt,
+                write_assistant_stream(stream_assistant_reply(
+                    store,
+                    api_key=openai_api_key,
+                    tavily_api_key=tavily_api_key,
                     current_member=st.session_state.current_member
-                ))
+                ), openai_api_key)
             
             # Rerun để cập nhật giao diện và tránh xử lý trùng lặp
             st.rerun()
@@ -1778,11 +912,12 @@ def main():
             st.markdown('<div class="suggestion-title">💡 Câu hỏi gợi ý cho bạn:</div>', unsafe_allow_html=True)
             
             # Tạo câu hỏi gợi ý động
-            suggested_questions = generate_dynamic_suggested_questions(
+            suggested_questions = run_sync(suggestions.generate_suggested_questions(
+                store,
                 api_key=openai_api_key,
                 member_id=st.session_state.current_member,
                 max_questions=5
-            )
+            ))
             
             # Hiển thị các nút cho câu hỏi gợi ý
             st.markdown('<div class="suggestion-box">', unsafe_allow_html=True)
@@ -1864,12 +999,7 @@ def main():
         if speech_input and st.session_state.prev_speech_hash != hash(speech_input):
             st.session_state.prev_speech_hash = hash(speech_input)
             
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=("audio.wav", speech_input),
-            )
-
-            audio_prompt = transcript.text
+            audio_prompt = run_sync(llm.transcribe(openai_api_key, speech_input))
 
         # Chat input
         if prompt := st.chat_input("Xin chào! Tôi có thể giúp gì cho gia đình bạn?") or audio_prompt:
@@ -1888,11 +1018,12 @@ def main():
                 st.markdown(prompt or audio_prompt)
 
             with st.chat_message("assistant"):
-                st.write_stream(stream_llm_response(
-                    api_key=openai_api_key, 
-                    system_prompt=system_prompt,
+                write_assistant_stream(stream_assistant_reply(
+                    store,
+                    api_key=openai_api_key,
+                    tavily_api_key=tavily_api_key,
                     current_member=st.session_state.current_member
-                ))
+                ), openai_api_key)
 
 if __name__=="__main__":
     main()
\ No newline at end of file
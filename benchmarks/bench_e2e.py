@@ -0,0 +1,192 @@
+"""
+Benchmark độ trễ và thông lượng đầu-cuối của một lượt trò chuyện, chạy với
+server giả lập OpenAI/Tavily cục bộ (không cần mạng, kết quả tái lập được).
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_e2e --turns 40 --concurrency 4 \\
+        --latency chat=lognormal:-1.5,0.4 --latency search=uniform:0.3,0.8
+
+Hoặc dùng một server giả lập đang chạy sẵn:
+    python -m benchmarks.bench_e2e --openai-base-url http://127.0.0.1:8765/v1 \\
+        --tavily-base-url http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_hot_paths import make_store
+from benchmarks.synthetic import make_household
+from family_assistant.fake_server import (
+    FakeServerConfig,
+    LatencyModel,
+    parse_group_options,
+    start_in_thread,
+)
+
+QUERIES = [
+    "Tin tức công nghệ hôm nay?",
+    "Giá vàng hôm nay bao nhiêu?",
+    "Thêm sự kiện đi khám răng vào ngày mai lúc 9 giờ",
+    "Gợi ý món ăn tối nay cho cả nhà",
+    "Kết quả bóng đá tối qua?",
+    "Cuối tuần này cả nhà nên làm gì?",
+]
+
+FAKE_OPENAI_KEY = "sk-fake-benchmark"
+FAKE_TAVILY_KEY = "tvly-fake-benchmark"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 2)
+
+
+async def run_turn(assistant, query, member_id):
+    """Chạy một lượt trò chuyện hoàn chỉnh, đo thời gian tới token đầu tiên và tổng thời gian"""
+    chat_messages = [{"role": "user", "content": [{"type": "text", "text": query}]}]
+    start = time.perf_counter()
+    first_token_at = None
+    error = False
+
+    async for event in assistant.stream_reply(chat_messages, member_id):
+        if event["type"] == "token" and first_token_at is None:
+            first_token_at = time.perf_counter()
+        elif event["type"] == "error":
+            error = True
+    end = time.perf_counter()
+
+    return {
+        "query": query,
+        "ttft_ms": round(((first_token_at or end) - start) * 1000, 2),
+        "total_ms": round((end - start) * 1000, 2),
+        "error": error,
+    }
+
+
+async def run_turns(assistant, queries, member_id, concurrency):
+    """Chạy các lượt trò chuyện trên một event loop, tối đa ``concurrency`` lượt cùng lúc"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(query):
+        async with semaphore:
+            return await run_turn(assistant, query, member_id)
+
+    return await asyncio.gather(*(limited(query) for query in queries))
+
+
+def summarize(turns, wall_seconds):
+    ttft = [turn["ttft_ms"] for turn in turns if not turn["error"]]
+    total = [turn["total_ms"] for turn in turns if not turn["error"]]
+    return {
+        "turns": len(turns),
+        "errors": sum(1 for turn in turns if turn["error"]),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_turns_per_s": round(len(turns) / wall_seconds, 3) if wall_seconds else None,
+        "ttft_ms": {f"p{pct}": percentile(ttft, pct) for pct in (50, 95, 99)},
+        "total_ms": {f"p{pct}": percentile(total, pct) for pct in (50, 95, 99)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark đầu-cuối với server giả lập")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--events", type=int, default=100, help="Số sự kiện trong hộ gia đình giả lập")
+    parser.add_argument("--output", default="bench_e2e_report.json")
+    parser.add_argument("--openai-base-url", help="Dùng server giả lập có sẵn thay vì tự khởi động")
+    parser.add_argument("--tavily-base-url")
+    parser.add_argument("--latency", action="append", metavar="GROUP=SPEC")
+    parser.add_argument("--error-rate", action="append", metavar="GROUP=RATE")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="Tắt cache phản hồi để đo toàn bộ pipeline ở mọi lượt")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="Giữ giới hạn tốc độ theo thành viên/hộ gia đình (mặc định tắt khi đo thông lượng)")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.openai_base_url:
+        openai_base_url = args.openai_base_url
+        tavily_base_url = args.tavily_base_url or openai_base_url.rsplit("/v1", 1)[0]
+    else:
+        config = FakeServerConfig(
+            latency=parse_group_options(args.latency, LatencyModel),
+            error_rate=parse_group_options(args.error_rate, float),
+            tokens_per_second=args.tokens_per_second,
+            seed=args.seed,
+        )
+        server, openai_base_url, tavily_base_url = start_in_thread(config)
+
+    # Lõi trợ lý đọc cấu hình endpoint khi import nên phải đặt biến môi trường trước
+    os.environ["OPENAI_BASE_URL"] = openai_base_url
+    os.environ["TAVILY_BASE_URL"] = tavily_base_url
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    from family_assistant.assistant import Assistant
+    if not args.rate_limits:
+        # admission đã được import (qua suggestions) nên tắt giới hạn trực tiếp trên module
+        from family_assistant import admission
+        admission.RATE_LIMIT_MEMBER_RPM = admission.RATE_LIMIT_MEMBER_TPM = 0
+        admission.RATE_LIMIT_HOUSEHOLD_RPM = admission.RATE_LIMIT_HOUSEHOLD_TPM = 0
+
+    output_path = os.path.abspath(args.output)
+    original_cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="family_bench_e2e_") as workdir:
+        logging.disable(logging.CRITICAL)
+        try:
+            # Sổ ghi nhận token được ghi vào thư mục làm việc hiện tại
+            os.chdir(workdir)
+            household = make_household(num_events=args.events, num_notes=100, seed=args.seed)
+            assistant = Assistant(make_store(workdir, household), FAKE_OPENAI_KEY, FAKE_TAVILY_KEY)
+            member_id = next(iter(household["family_data"]))
+
+            queries = [QUERIES[idx % len(QUERIES)] for idx in range(args.turns)]
+            start = time.perf_counter()
+            turns = asyncio.run(run_turns(assistant, queries, member_id, args.concurrency))
+            wall_seconds = time.perf_counter() - start
+        finally:
+            logging.disable(logging.NOTSET)
+            os.chdir(original_cwd)
+            if server:
+                server.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "openai_base_url": openai_base_url,
+            "tavily_base_url": tavily_base_url,
+            "concurrency": args.concurrency,
+            "latency": args.latency or [],
+            "error_rate": args.error_rate or [],
+            "tokens_per_second": args.tokens_per_second,
+            "seed": args.seed,
+            "response_cache": not args.no_response_cache,
+            "rate_limits": args.rate_limits,
+        },
+        "summary": summarize(turns, wall_seconds),
+        "turns": turns,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    print(json.dumps(report["summary"], indent=2, ensure_ascii=False))
+    print(f"Đã ghi báo cáo vào {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
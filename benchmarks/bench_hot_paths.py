@@ -0,0 +1,251 @@
+"""
+Benchmark ngoại tuyến cho các đường xử lý dữ liệu và phân tích lệnh của lõi trợ lý
+(gói family_assistant, không cần Streamlit hay mạng).
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_hot_paths --output bench_report.json
+
+Kết quả được ghi ra file JSON và so sánh với ngưỡng trong
+benchmarks/thresholds.json (và/hoặc một báo cáo cũ qua --baseline).
+Trả về mã thoát 1 nếu có benchmark vượt ngưỡng.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_household
+from family_assistant import commands, context, suggestions
+from family_assistant.store import HouseholdStore, load_data, save_data
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_THRESHOLDS = os.path.join(REPO_ROOT, "benchmarks", "thresholds.json")
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+SAMPLE_RESPONSE = (
+    "Mình đã thêm lịch khám răng cho bạn vào ngày mai lúc 9 giờ sáng nhé! "
+    '##ADD_EVENT:{"title":"Khám răng","date":"ngày mai","time":"09:00",'
+    '"description":"Khám răng định kỳ","participants":["Minh","Lan"]}##'
+)
+
+
+def make_store(workdir, household):
+    """Tạo kho dữ liệu trong thư mục tạm (không đụng tới dữ liệu thật) và nạp dữ liệu giả lập"""
+    store = HouseholdStore(workdir, replicated=False)
+    store.family_data = household["family_data"]
+    store.events_data = household["events_data"]
+    store.notes_data = household["notes_data"]
+    store.chat_history = household["chat_history"]
+    return store
+
+
+def time_call(fn, setup=None, repeat=5, min_sample_seconds=0.005):
+    """
+    Đo thời gian một hàm, trả về thống kê (ms) trên mỗi lần gọi.
+
+    Hàm chạy quá nhanh được lặp nhiều lần trong một mẫu (giống timeit.autorange);
+    khi có ``setup`` thì mỗi mẫu chỉ gọi một lần, ``setup`` không được tính giờ.
+    """
+    number = 1
+    if setup is None:
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - start >= min_sample_seconds or number >= 10_000:
+                break
+            number *= 10
+
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+
+    samples.sort()
+    return {
+        "min_ms": round(samples[0], 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def run_suite(workdir, sizes, repeat):
+    """Chạy toàn bộ benchmark cho từng kích thước sự kiện"""
+    results = []
+
+    def record(name, params, stats):
+        results.append({"name": f"{name}[{_format_params(params)}]", "function": name,
+                        "params": params, **stats})
+        print(f"  {results[-1]['name']:<60} median={stats['median_ms']:.3f}ms", file=sys.stderr)
+
+    for num_events in sizes:
+        household = make_household(num_events=num_events, num_notes=1000)
+        params = {"events": num_events, "notes": 1000}
+        member_id = next(iter(household["family_data"]))
+        events_file = os.path.join(workdir, f"events_{num_events}.json")
+        save_data(events_file, household["events_data"])
+
+        record("load_data", params, time_call(lambda: load_data(events_file), repeat=repeat))
+        record("save_data", params,
+               time_call(lambda: save_data(events_file, household["events_data"]), repeat=repeat))
+
+        store = make_store(workdir, household)
+        record("verify_data_structure", params, time_call(store.verify_data_structure, repeat=repeat))
+        record("filter_events_by_member", params,
+               time_call(lambda: store.filter_events_by_member(member_id), repeat=repeat))
+
+        base_events = household["events_data"]
+
+        def reset_events():
+            store.events_data = dict(base_events)
+
+        record("process_assistant_response", params,
+               time_call(lambda: commands.process_assistant_response(store, SAMPLE_RESPONSE, member_id),
+                         setup=reset_events, repeat=repeat))
+        store.events_data = base_events
+
+        record("suggestions_fallback", params,
+               time_call(lambda: suggestions.generate_fallback_questions(store, member_id), repeat=repeat))
+        record("build_system_prompt", params,
+               time_call(lambda: context.build_system_prompt(store, member_id), repeat=repeat))
+        # Ghi nốt các thay đổi trước khi thư mục tạm bị xóa
+        store.flush()
+
+    # Lịch sử chat có hình ảnh: kích thước không phụ thuộc số sự kiện
+    household = make_household(num_events=10, num_notes=10)
+    params = {"conversations": 10, "images": 1}
+    history_file = os.path.join(workdir, "chat_history_bench.json")
+    save_data(history_file, household["chat_history"])
+    record("load_data_chat_history", params, time_call(lambda: load_data(history_file), repeat=repeat))
+    record("save_data_chat_history", params,
+           time_call(lambda: save_data(history_file, household["chat_history"]), repeat=repeat))
+
+    # Bố cục hai tầng: chỉ mục nhỏ được tải cùng dữ liệu, nội dung nén chỉ đọc khi mở lại
+    store = make_store(os.path.join(workdir, "archive_bench"), household)
+    store.verify_data_structure()
+    store.flush()
+    index_file = store.path("chat_history")
+    record("load_chat_index", params, time_call(lambda: load_data(index_file), repeat=repeat))
+    entry = next(iter(store.chat_history.values()))[0]
+    record("load_conversation", params, time_call(lambda: store.load_conversation(entry), repeat=repeat))
+
+    return results
+
+
+def _format_params(params):
+    return ",".join(f"{key}={value}" for key, value in params.items())
+
+
+def check_regressions(results, thresholds, baseline=None):
+    """
+    So sánh kết quả với ngưỡng tuyệt đối và (nếu có) với báo cáo cũ
+
+    Returns:
+        list: Danh sách benchmark vượt ngưỡng
+    """
+    regressions = []
+    limits = thresholds.get("max_median_ms", {})
+    tolerance = thresholds.get("max_regression_ratio", 0.25)
+    baseline_by_name = {item["name"]: item for item in (baseline or {}).get("results", [])}
+
+    for item in results:
+        limit = limits.get(item["name"])
+        if limit is not None and item["median_ms"] > limit:
+            regressions.append({"name": item["name"], "kind": "threshold",
+                                "median_ms": item["median_ms"], "limit_ms": limit})
+
+        previous = baseline_by_name.get(item["name"])
+        if previous and item["median_ms"] > previous["median_ms"] * (1 + tolerance):
+            regressions.append({"name": item["name"], "kind": "baseline",
+                                "median_ms": item["median_ms"], "baseline_ms": previous["median_ms"],
+                                "ratio": round(item["median_ms"] / previous["median_ms"], 3)})
+    return regressions
+
+
+def write_thresholds(path, results, headroom, tolerance):
+    thresholds = {
+        "max_regression_ratio": tolerance,
+        "max_median_ms": {item["name"]: round(item["median_ms"] * (1 + headroom), 3) for item in results},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(thresholds, f, indent=4, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các đường xử lý dữ liệu của Trợ lý Gia đình")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Danh sách số sự kiện, phân tách bằng dấu phẩy")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--baseline", help="Báo cáo JSON cũ để so sánh tương đối")
+    parser.add_argument("--write-thresholds", action="store_true",
+                        help="Ghi lại file ngưỡng từ kết quả lần chạy này")
+    parser.add_argument("--headroom", type=float, default=1.0,
+                        help="Biên an toàn khi ghi ngưỡng (1.0 = gấp đôi median hiện tại)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    output_path = os.path.abspath(args.output)
+    thresholds_path = os.path.abspath(args.thresholds)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="family_bench_") as workdir:
+        # Tắt log để không đo cả chi phí ghi ra console
+        logging.disable(logging.CRITICAL)
+        try:
+            print(f"Chạy benchmark với số sự kiện: {sizes}")
+            results = run_suite(workdir, sizes, args.repeat)
+        finally:
+            logging.disable(logging.NOTSET)
+
+    thresholds = {}
+    if os.path.exists(thresholds_path):
+        with open(thresholds_path, "r", encoding="utf-8") as f:
+            thresholds = json.load(f)
+    regressions = check_regressions(results, thresholds, baseline)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"Đã ghi báo cáo vào {output_path}")
+
+    if args.write_thresholds:
+        write_thresholds(thresholds_path, results, args.headroom,
+                         thresholds.get("max_regression_ratio", 0.25))
+        print(f"Đã cập nhật ngưỡng trong {thresholds_path}")
+        return 0
+
+    for item in regressions:
+        print(f"REGRESSION {item['name']}: {item}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
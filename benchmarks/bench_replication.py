@@ -0,0 +1,103 @@
+"""
+Kiểm tra lan truyền thay đổi giữa nhiều tiến trình cùng mở một thư mục dữ liệu.
+
+Mỗi tiến trình con thêm sự kiện, cùng sửa một sự kiện và một thành viên dùng
+chung, ghi lại thời điểm nhìn thấy sự kiện đầu tiên của các tiến trình khác.
+Kết thúc, mọi tiến trình phải có cùng dữ liệu và không thay đổi nào bị mất.
+
+Chạy từ thư mục gốc của repo:
+    python -m benchmarks.bench_replication --processes 3 --events 40
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from family_assistant.store import HouseholdStore
+
+
+def _worker(data_dir, worker_id, num_events, start_at, results):
+    store = HouseholdStore(data_dir)
+    while time.time() < start_at:
+        time.sleep(0.001)
+
+    first_seen = {}
+    for i in range(num_events):
+        store.add_event({"title": f"p{worker_id}-{i}", "description": str(time.time())})
+        if i % 10 == 0:
+            store.update_event({"id": "1", f"field{worker_id}": i})
+            store.update_preference({"id": "1", "key": f"k{worker_id}", "value": i})
+        # Lần đầu thấy sự kiện của tiến trình khác: độ trễ lan truyền tính từ lúc nó được tạo
+        for event in store.events_data.values():
+            title = event.get("title", "")
+            if title.endswith("-0") and not title.startswith(f"p{worker_id}-") and title not in first_seen:
+                first_seen[title] = time.time() - float(event["description"])
+        time.sleep(0.01)
+
+    store.flush()
+    # Chờ các tiến trình khác ghi xong rồi đồng bộ lần cuối
+    deadline = time.time() + 10
+    expected = 1 + num_events * int(os.environ["BENCH_REPLICATION_PROCESSES"])
+    while len(store.events_data) < expected and time.time() < deadline:
+        time.sleep(0.05)
+    store.sync()
+
+    state = {collection: store.collection(collection) for collection in store.COLLECTIONS}
+    results.put({
+        "worker": worker_id,
+        "events": len(store.events_data),
+        "titles": len({event.get("title") for event in store.events_data.values()}),
+        "shared_fields": sorted(key for key in store.events_data["1"] if key.startswith("field")),
+        "shared_preferences": sorted(store.family_data["1"].get("preferences", {})),
+        "conflicts": store.conflicts,
+        "propagation_ms": [round(seconds * 1000, 1) for seconds in first_seen.values()],
+        "state_hash": hashlib.md5(json.dumps(state, sort_keys=True).encode()).hexdigest(),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra lan truyền thay đổi giữa nhiều tiến trình")
+    parser.add_argument("--processes", type=int, default=3)
+    parser.add_argument("--events", type=int, default=40, help="Số sự kiện mỗi tiến trình thêm vào")
+    args = parser.parse_args(argv)
+    os.environ["BENCH_REPLICATION_PROCESSES"] = str(args.processes)
+
+    with tempfile.TemporaryDirectory(prefix="family_assistant_repl_") as data_dir:
+        seed = HouseholdStore(data_dir)
+        seed.add_family_member({"name": "An"})
+        seed.add_event({"title": "Sự kiện dùng chung"})
+        seed.flush()
+
+        results = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        workers = [multiprocessing.Process(target=_worker, args=(data_dir, worker_id, args.events, start_at, results))
+                   for worker_id in range(1, args.processes + 1)]
+        for worker in workers:
+            worker.start()
+        reports = [results.get(timeout=60) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+    expected_events = 1 + args.processes * args.events
+    propagation = [ms for report in reports for ms in report["propagation_ms"]]
+    ok = (len({report["state_hash"] for report in reports}) == 1 and
+          all(report["events"] == report["titles"] == expected_events for report in reports) and
+          all(len(report["shared_fields"]) == args.processes for report in reports) and
+          all(len(report["shared_preferences"]) == args.processes for report in reports))
+
+    for report in sorted(reports, key=lambda report: report["worker"]):
+        print(f"  tiến trình {report['worker']}: {report['events']} sự kiện, "
+              f"{report['conflicts']} xung đột đã rebase, hash={report['state_hash'][:8]}")
+    if propagation:
+        print(f"  độ trễ lan truyền: median={statistics.median(propagation):.0f}ms max={max(propagation):.0f}ms")
+    print("Dữ liệu hội tụ" if ok else "LỖI: dữ liệu các tiến trình không khớp")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Sinh dữ liệu hộ gia đình giả lập (thành viên, sự kiện, ghi chú, lịch sử chat có
+hình ảnh) với kích thước tùy ý, theo đúng định dạng các file JSON của ứng dụng.
+"""
+import base64
+import datetime
+import random
+
+MEMBER_NAMES = ["Minh", "Lan", "Hùng", "Mai", "Tuấn", "Hoa", "Nam", "Linh", "Phúc", "Trang"]
+FOODS = ["phở", "bún chả", "bánh xèo", "cơm tấm", "gỏi cuốn", "pizza", "sushi"]
+HOBBIES = ["đọc sách", "bóng đá", "du lịch", "âm nhạc", "xem phim", "công nghệ", "nấu ăn"]
+COLORS = ["xanh", "đỏ", "vàng", "tím", "trắng"]
+EVENT_TITLES = ["Khám răng", "Họp phụ huynh", "Sinh nhật", "Đi siêu thị", "Học bơi",
+                "Đá bóng", "Ăn tối gia đình", "Đóng tiền điện", "Dã ngoại", "Học piano"]
+NOTE_TAGS = ["mua sắm", "sức khỏe", "học tập", "công việc", "nhà cửa", "du lịch"]
+WORDS = ("gia đình cuối tuần nhớ mua thêm sữa rau trái cây chuẩn bị đồ dùng học tập "
+         "lịch khám định kỳ thanh toán hóa đơn tiền nhà đặt vé máy bay kiểm tra xe").split()
+
+# Mốc thời gian cố định để dữ liệu sinh ra ổn định giữa các lần chạy
+EPOCH = datetime.datetime(2024, 6, 1, 8, 0, 0)
+
+
+def _sentence(rng, num_words):
+    return " ".join(rng.choice(WORDS) for _ in range(num_words)).capitalize()
+
+
+def _timestamp(rng, days_range=180):
+    moment = EPOCH + datetime.timedelta(minutes=rng.randint(-days_range * 1440, days_range * 1440))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def make_family(num_members, rng):
+    family_data = {}
+    for idx in range(num_members):
+        member_id = str(idx + 1)
+        family_data[member_id] = {
+            "name": MEMBER_NAMES[idx % len(MEMBER_NAMES)] + ("" if idx < len(MEMBER_NAMES) else f" {idx}"),
+            "age": str(rng.randint(5, 70)),
+            "preferences": {
+                "food": rng.choice(FOODS),
+                "hobby": rng.choice(HOBBIES),
+                "color": rng.choice(COLORS),
+            },
+            "added_on": _timestamp(rng),
+        }
+    return family_data
+
+
+def make_events(num_events, family_data, rng, today=None):
+    today = today or datetime.date.today()
+    member_ids = list(family_data.keys())
+    names = [member["name"] for member in family_data.values()]
+    events_data = {}
+    for idx in range(num_events):
+        event_date = today + datetime.timedelta(days=rng.randint(-60, 120))
+        events_data[str(idx + 1)] = {
+            "title": f"{rng.choice(EVENT_TITLES)} {idx + 1}",
+            "date": event_date.strftime("%Y-%m-%d"),
+            "time": f"{rng.randint(6, 21):02d}:{rng.choice([0, 15, 30, 45]):02d}",
+            "description": _sentence(rng, rng.randint(4, 16)),
+            "participants": rng.sample(names, k=rng.randint(0, min(3, len(names)))),
+            "created_by": rng.choice(member_ids) if member_ids else "",
+            "created_on": _timestamp(rng),
+        }
+    return events_data
+
+
+def make_notes(num_notes, family_data, rng):
+    member_ids = list(family_data.keys())
+    notes_data = {}
+    for idx in range(num_notes):
+        notes_data[str(idx + 1)] = {
+            "title": _sentence(rng, rng.randint(2, 5)),
+            "content": _sentence(rng, rng.randint(10, 60)),
+            "tags": rng.sample(NOTE_TAGS, k=rng.randint(0, 3)),
+            "created_by": rng.choice(member_ids) if member_ids else "",
+            "created_on": _timestamp(rng),
+        }
+    return notes_data
+
+
+def make_image_url(num_bytes, rng):
+    raw = bytes(rng.getrandbits(8) for _ in range(num_bytes))
+    return f"data:image/jpeg;base64,{base64.b64encode(raw).decode('utf-8')}"
+
+
+def make_chat_history(family_data, rng, conversations_per_member=10,
+                      messages_per_conversation=12, images_per_conversation=1,
+                      image_bytes=40_000):
+    # Dùng lại cùng một ảnh để việc sinh dữ liệu không chiếm phần lớn thời gian chạy
+    image_url = make_image_url(image_bytes, rng) if images_per_conversation else None
+    chat_history = {}
+    for member_id in family_data:
+        conversations = []
+        for _ in range(conversations_per_member):
+            messages = []
+            for _ in range(images_per_conversation):
+                messages.append({
+                    "role": "user",
+                    "content": [{"type": "image_url", "image_url": {"url": image_url}}],
+                })
+            for msg_idx in range(messages_per_conversation):
+                role = "user" if msg_idx % 2 == 0 else "assistant"
+                messages.append({
+                    "role": role,
+                    "content": [{"type": "text", "text": _sentence(rng, rng.randint(5, 80))}],
+                })
+            conversations.append({
+                "timestamp": _timestamp(rng),
+                "messages": messages,
+                "summary": _sentence(rng, 15),
+            })
+        chat_history[member_id] = conversations
+    return chat_history
+
+
+def make_household(num_members=5, num_events=100, num_notes=1000,
+                   conversations_per_member=10, messages_per_conversation=12,
+                   images_per_conversation=1, image_bytes=40_000, seed=42):
+    """
+    Sinh một hộ gia đình giả lập hoàn chỉnh
+
+    Returns:
+        dict: Gồm family_data, events_data, notes_data, chat_history
+    """
+    rng = random.Random(seed)
+    family_data = make_family(num_members, rng)
+    return {
+        "family_data": family_data,
+        "events_data": make_events(num_events, family_data, rng),
+        "notes_data": make_notes(num_notes, family_data, rng),
+        "chat_history": make_chat_history(
+            family_data, rng,
+            conversations_per_member=conversations_per_member,
+            messages_per_conversation=messages_per_conversation,
+            images_per_conversation=images_per_conversation,
+            image_bytes=image_bytes,
+        ),
+    }
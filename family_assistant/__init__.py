@@ -0,0 +1 @@
+"""Các thành phần dùng chung cho Trợ lý Gia đình (tách khỏi giao diện Streamlit)."""
@@ -0,0 +1,320 @@
+"""
+Giới hạn tốc độ theo thành viên/hộ gia đình và kiểm soát số lời gọi API đồng thời.
+
+Mỗi lời gọi ra ngoài (mô hình, Tavily) phải qua ``slot``:
+
+1. Token bucket theo thành viên và theo hộ gia đình, cho số yêu cầu mỗi phút
+   (``RATE_LIMIT_*_RPM``) và số token mỗi phút (``RATE_LIMIT_*_TPM``, ước lượng trước
+   từ độ dài prompt + ``max_tokens``, điều chỉnh lại theo số token thực tế). Vượt giới hạn
+   thì lời gọi bị từ chối ngay với ``RateLimited`` (kèm số giây nên chờ). Giá trị 0 để tắt.
+2. Một semaphore chung của tiến trình (``MAX_CONCURRENT_API_CALLS``) với hàng đợi ưu tiên:
+   lời gọi tương tác (câu trả lời chính, hình ảnh, phân loại ý định, tìm kiếm) luôn được
+   cấp chỗ trước công việc nền (tóm tắt cuộc trò chuyện, câu hỏi gợi ý).
+3. Giảm tải: hàng đợi đầy (``ADMISSION_MAX_QUEUE``), hoặc đã đầy một nửa với công việc nền,
+   hoặc chờ quá ``ADMISSION_QUEUE_TIMEOUT`` giây thì lời gọi bị từ chối với ``Overloaded``.
+
+Các lỗi này mang thông điệp tiếng Việt để hiển thị thẳng cho người dùng. Công việc nền đã
+có phương án dự phòng (câu hỏi gợi ý từ mẫu, bỏ qua tóm tắt/tìm kiếm) nên chỉ câu trả lời
+chính mới báo lỗi cho người dùng.
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from family_assistant import telemetry
+
+logger = logging.getLogger('family_assistant.admission')
+
+MAX_CONCURRENT_API_CALLS = int(os.getenv("MAX_CONCURRENT_API_CALLS", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+
+# Một lượt trò chuyện có tìm kiếm dùng tới 6 yêu cầu (ý định, tìm kiếm, 3 trích xuất, trả lời)
+RATE_LIMIT_MEMBER_RPM = int(os.getenv("RATE_LIMIT_MEMBER_RPM", "60"))
+RATE_LIMIT_MEMBER_TPM = int(os.getenv("RATE_LIMIT_MEMBER_TPM", "100000"))
+RATE_LIMIT_HOUSEHOLD_RPM = int(os.getenv("RATE_LIMIT_HOUSEHOLD_RPM", "200"))
+RATE_LIMIT_HOUSEHOLD_TPM = int(os.getenv("RATE_LIMIT_HOUSEHOLD_TPM", "400000"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Độ ưu tiên theo vị trí gọi; vị trí không có trong bảng được coi là tương tác
+CALL_PRIORITIES = {
+    "generate_chat_summary": BACKGROUND,
+    "suggestions": BACKGROUND,
+}
+
+
+class Overloaded(Exception):
+    """Lời gọi bị từ chối để giảm tải; ``str(error)`` là thông điệp cho người dùng"""
+
+    def __init__(self, message="Hệ thống đang quá tải, vui lòng thử lại sau ít phút.", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(Overloaded):
+    """Thành viên hoặc hộ gia đình đã vượt giới hạn tốc độ"""
+
+
+class TokenBucket:
+    """Token bucket nạp đều ``per_minute`` mỗi phút, chứa tối đa ``per_minute``, an toàn đa luồng"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Số giây cần chờ để có ``amount`` (0 nếu có ngay)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = min(amount, self.capacity) - self.tokens
+            return max(0.0, missing / self.rate) if self.rate else 0.0
+
+    def take(self, amount):
+        """Lấy ``amount`` (có thể làm bucket âm, khi đó các lần sau phải chờ lâu hơn)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+
+    def give_back(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Các bucket số yêu cầu và số token theo thành viên và theo hộ gia đình"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, per_minute):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(per_minute)
+            return bucket
+
+    def _buckets_for(self, household_id, member_id):
+        """[(bucket, loại, phạm vi)] áp dụng cho một lời gọi"""
+        buckets = []
+        scopes = [("household", household_id, RATE_LIMIT_HOUSEHOLD_RPM, RATE_LIMIT_HOUSEHOLD_TPM)]
+        if member_id:
+            scopes.append(("member", member_id, RATE_LIMIT_MEMBER_RPM, RATE_LIMIT_MEMBER_TPM))
+        for scope, scope_id, rpm, tpm in scopes:
+            if scope_id is None:
+                continue
+            if rpm:
+                buckets.append((self._bucket((scope, household_id, scope_id, "requests"), rpm), "requests", scope))
+            if tpm:
+                buckets.append((self._bucket((scope, household_id, scope_id, "tokens"), tpm), "tokens", scope))
+        return buckets
+
+    def acquire(self, household_id, member_id, tokens):
+        """
+        Trừ một yêu cầu và ``tokens`` token khỏi các bucket, hoặc ném ``RateLimited``
+
+        Returns:
+            tuple: (các bucket số yêu cầu, các bucket token) đã trừ, để trả lại khi lời gọi
+            không được gửi và điều chỉnh theo số token thực tế
+        """
+        buckets = self._buckets_for(household_id, member_id)
+        amounts = {"requests": 1, "tokens": tokens}
+        waits = [(bucket.wait_time(amounts[kind]), scope) for bucket, kind, scope in buckets if amounts[kind]]
+        wait, scope = max(waits, default=(0.0, None))
+        if wait > 0:
+            telemetry.record_resilience(f"rate_limit:{scope}", "rejected")
+            seconds = max(1, round(wait))
+            if scope == "member":
+                message = f"Bạn đang gửi quá nhiều yêu cầu, vui lòng thử lại sau {seconds} giây."
+            else:
+                message = f"Gia đình bạn đang gửi quá nhiều yêu cầu, vui lòng thử lại sau {seconds} giây."
+            raise RateLimited(message, retry_after=wait)
+        for bucket, kind, _ in buckets:
+            bucket.take(amounts[kind])
+        return ([bucket for bucket, kind, _ in buckets if kind == "requests"],
+                [bucket for bucket, kind, _ in buckets if kind == "tokens"])
+
+
+class AdmissionController:
+    """
+    Semaphore có hàng đợi ưu tiên, dùng được từ nhiều event loop ở các luồng khác nhau
+
+    Chỗ trống được chuyển thẳng cho bên chờ có độ ưu tiên cao nhất (rồi tới trước) khi trả.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_API_CALLS, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._heap = []  # [độ ưu tiên, thứ tự, loop, future, trạng thái]
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    async def acquire(self, priority=INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue or (priority >= BACKGROUND and self.waiting >= self.max_queue // 2):
+                self.shed += 1
+                shed = True
+            else:
+                shed = False
+                entry = [priority, next(self._sequence), loop, loop.create_future(), "waiting"]
+                heapq.heappush(self._heap, entry)
+                self.waiting += 1
+        if shed:
+            telemetry.record_resilience("admission", "shed")
+            raise Overloaded()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(entry[3], self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = entry[4] == "granted"
+                if not granted:
+                    entry[4] = "cancelled"
+                    self.waiting -= 1
+            if granted:
+                # Chỗ đã được cấp đúng lúc hết giờ chờ: chuyển tiếp cho bên khác
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                with self._lock:
+                    self.shed += 1
+                telemetry.record_resilience("admission", "timeout")
+                raise Overloaded() from None
+            raise
+        telemetry.record_stage("admission_wait", time.perf_counter() - started, started)
+
+    def release(self):
+        with self._lock:
+            grant = None
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if entry[4] == "waiting":
+                    entry[4] = "granted"
+                    self.waiting -= 1
+                    grant = entry
+                    break
+            if grant is None:
+                self.active -= 1
+                return
+        try:
+            grant[2].call_soon_threadsafe(_wake, grant[3])
+        except RuntimeError:
+            # Event loop của bên chờ đã đóng: trả lại chỗ
+            self.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {"active": self.active, "waiting": self.waiting, "max_concurrent": self.max_concurrent,
+                    "shed": self.shed}
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Ước lượng số token của một lời gọi mô hình (khoảng 4 ký tự một token, hình ảnh tính 1000)"""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    images += 1
+    return chars // 4 + 1000 * images + (max_tokens or 0)
+
+
+_limiter = RateLimiter()
+_controller = AdmissionController()
+
+
+def _reset_after_fork():
+    global _limiter, _controller
+    _limiter = RateLimiter()
+    _controller = AdmissionController()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_controller():
+    return _controller
+
+
+class Admission:
+    """Chỗ đã được cấp cho một lời gọi; ``settle`` điều chỉnh bucket token theo số token thực tế"""
+
+    def __init__(self, buckets, estimated_tokens):
+        self._request_buckets, self._token_buckets = buckets
+        self._estimated_tokens = estimated_tokens
+
+    def settle(self, actual_tokens):
+        difference = self._estimated_tokens - actual_tokens
+        for bucket in self._token_buckets:
+            if difference > 0:
+                bucket.give_back(difference)
+            elif difference < 0:
+                bucket.take(-difference)
+        self._estimated_tokens = actual_tokens
+
+    def cancel(self):
+        """Lời gọi không được gửi (bị giảm tải, hết thời gian chờ): trả lại yêu cầu và token đã trừ"""
+        for bucket in self._request_buckets:
+            bucket.give_back(1)
+        self.settle(0)
+
+
+@contextlib.asynccontextmanager
+async def slot(call_site, member_id=None, household_id=None, tokens=0):
+    """
+    Xin phép gửi một lời gọi ra ngoài (giới hạn tốc độ rồi chờ chỗ trong semaphore chung)
+
+    ``member_id``/``household_id`` mặc định lấy từ lượt trò chuyện hiện tại (nếu có).
+    """
+    trace = telemetry.current_turn()
+    if member_id is None and trace is not None:
+        member_id = trace.member_id
+    if household_id is None and trace is not None:
+        household_id = trace.household_id
+    admitted = Admission(_limiter.acquire(household_id, member_id, tokens), tokens)
+    controller = _controller
+    try:
+        await controller.acquire(CALL_PRIORITIES.get(call_site, INTERACTIVE))
+    except BaseException:
+        admitted.cancel()
+        raise
+    try:
+        yield admitted
+    finally:
+        controller.release()
@@ -0,0 +1,207 @@
+"""
+Lõi trò chuyện không phụ thuộc giao diện.
+
+Một lượt trò chuyện là một async generator phát ra các sự kiện (dict):
+    {"type": "status", "message": ...}   trạng thái trung gian (đang tìm kiếm...)
+    {"type": "token", "text": ...}       một đoạn phản hồi
+    {"type": "action", "command": ..., "ok": ..., "message": ...}
+                                         lệnh đã thực thi (thêm sự kiện, ghi chú...)
+    {"type": "error", "message": ...}    lỗi khi tạo phản hồi
+    {"type": "done", "text": ..., "trace": {...}}
+                                         phản hồi đầy đủ và phân tích độ trễ
+
+Streamlit (app.py) và dịch vụ HTTP/SSE (server.py) đều là lớp hiển thị của
+luồng sự kiện này.
+"""
+import logging
+
+from family_assistant import admission, commands, context, llm, response_cache, schedule, search, telemetry
+
+logger = logging.getLogger('family_assistant.assistant')
+
+SUMMARY_SYSTEM_PROMPT = "Bạn là trợ lý tạo tóm tắt. Hãy tóm tắt cuộc trò chuyện dưới đây thành 1-3 câu ngắn gọn, tập trung vào các thông tin và yêu cầu chính."
+
+
+def trace_to_dict(trace):
+    """Phân tích độ trễ của một lượt trò chuyện ở dạng JSON được"""
+    return {
+        "member_id": trace.member_id,
+        "household_id": trace.household_id,
+        "total_ms": trace.total_ms,
+        "spans": trace.spans,
+        "tokens": trace.tokens,
+        "cache": trace.cache,
+    }
+
+
+async def generate_chat_summary(messages, api_key, member_id=None, household_id=None):
+    """Tạo tóm tắt từ lịch sử trò chuyện"""
+    if not messages or len(messages) < 3:  # Cần ít nhất một vài tin nhắn để tạo tóm tắt
+        return "Chưa có đủ tin nhắn để tạo tóm tắt."
+
+    try:
+        return await llm.complete(
+            api_key,
+            "generate_chat_summary",
+            [
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Tóm tắt cuộc trò chuyện sau:\n\n{context.conversation_text(messages)}"}
+            ],
+            member_id=member_id,
+            household_id=household_id,
+            temperature=0.3,
+            max_tokens=150
+        )
+    except Exception as e:
+        logger.error(f"Lỗi khi tạo tóm tắt: {e}")
+        return "Không thể tạo tóm tắt vào lúc này."
+
+
+class Assistant:
+    """Trợ lý gia đình gắn với một kho dữ liệu và cặp API key"""
+
+    def __init__(self, store, openai_api_key, tavily_api_key=None):
+        self.store = store
+        self.openai_api_key = openai_api_key
+        self.tavily_api_key = tavily_api_key
+
+    async def summarize_and_save(self, chat_messages, member_id):
+        """Tạo tóm tắt và lưu cuộc trò chuyện vào lịch sử của thành viên"""
+        summary = await generate_chat_summary(chat_messages, self.openai_api_key, member_id,
+                                              self.store.household_id)
+        return self.store.save_chat_history(member_id, chat_messages, summary)
+
+    async def _stream_answer(self, chat_messages, member_id, last_user_message):
+        """Dựng system prompt (kèm lịch trống, kết quả tìm kiếm) và stream câu trả lời của mô hình"""
+        # Câu hỏi tìm lịch trống được tính sẵn từ chỉ mục, mô hình chỉ cần diễn đạt lại
+        # (prompt khi đó không kèm danh sách sự kiện đầy đủ)
+        free_slot_answer = None
+        if last_user_message:
+            with telemetry.span("free_slots"):
+                free_slot_answer = schedule.answer_free_slot_query(self.store, last_user_message, member_id)
+        system_prompt = context.build_system_prompt(self.store, member_id, last_user_message, free_slot_answer)
+
+        if last_user_message and self.tavily_api_key:
+            yield {"type": "status", "message": "🔍 Đang phân tích câu hỏi của bạn..."}
+            need_search, search_query = await search.detect_search_intent(last_user_message, self.openai_api_key)
+            if need_search and search.SEARCH_MODE == "single_pass":
+                # Các đoạn nguồn đi thẳng vào lời gọi trả lời chính, không qua bước tóm tắt riêng
+                yield {"type": "status", "message": f"🔍 Đang tìm kiếm thông tin về: '{search_query}'..."}
+                sources = await search.search_passages(self.tavily_api_key, search_query)
+                if sources:
+                    system_prompt += f"""
+
+                NGUỒN THAM KHẢO (kết quả tìm kiếm cho: {search_query}):
+                {search.format_sources(sources)}
+
+                Hãy trả lời câu hỏi của người dùng dựa trên các nguồn trên. Ghi số nguồn trong ngoặc vuông, ví dụ [1] hoặc [1][2],
+                ngay sau thông tin lấy từ nguồn đó, và liệt kê các nguồn đã dùng (tiêu đề và URL) ở cuối câu trả lời.
+                Nếu các nguồn mâu thuẫn hoặc không đủ thông tin, hãy nói rõ.
+                """
+                else:
+                    system_prompt += """
+
+                THÔNG TIN TÌM KIẾM: Không tìm được kết quả phù hợp. Hãy trả lời dựa trên kiến thức của bạn và lưu ý rằng thông tin có thể không cập nhật.
+                """
+            elif need_search:
+                yield {"type": "status", "message": f"🔍 Đang tìm kiếm thông tin về: '{search_query}'..."}
+                search_result = await search.search_and_summarize(
+                    self.tavily_api_key, search_query, self.openai_api_key)
+                system_prompt += f"""
+
+                THÔNG TIN TÌM KIẾM:
+                Câu hỏi: {search_query}
+
+                Kết quả:
+                {search_result}
+
+                Hãy sử dụng thông tin này để trả lời câu hỏi của người dùng. Đảm bảo đề cập đến nguồn thông tin.
+                """
+
+        # Lời gọi có hình ảnh được tính riêng vào vị trí "vision"
+        call_site = "vision" if any(context.message_has_images(m) for m in chat_messages) else "main_answer"
+        messages = context.to_openai_messages(chat_messages, system_prompt)
+
+        async for chunk_text in llm.stream_text(self.openai_api_key, call_site, messages, member_id,
+                                                household_id=self.store.household_id,
+                                                temperature=0.7, max_tokens=2048):
+            yield {"type": "token", "text": chunk_text}
+
+    async def stream_reply(self, chat_messages, member_id=None):
+        """
+        Chạy một lượt trò chuyện cho danh sách tin nhắn (tin nhắn cuối là của người dùng)
+
+        ``chat_messages`` không bị thay đổi; phản hồi đầy đủ nằm trong sự kiện "done".
+        """
+        trace, trace_token = telemetry.start_turn(member_id, self.store.household_id)
+        response_message = ""
+        try:
+            last_user_message = context.last_user_text(chat_messages)
+
+            # Lệnh thêm sự kiện đơn giản được thực hiện tại chỗ, không cần gọi mô hình
+            quick = None
+            last_message = chat_messages[-1] if chat_messages else {}
+            if last_user_message and last_message.get("role") == "user" and not context.message_has_images(last_message):
+                with telemetry.span("quick_add"):
+                    quick = commands.quick_add(self.store, last_user_message, member_id)
+            if quick is not None:
+                action, response_message = quick
+                yield {"type": "token", "text": response_message}
+                yield {"type": "action", **action}
+                if member_id:
+                    conversation = list(chat_messages) + [context.text_message("assistant", response_message)]
+                    self.store.save_chat_history(member_id, conversation, response_message)
+                telemetry.finish_turn(trace, trace_token)
+                yield {"type": "done", "text": response_message, "trace": trace_to_dict(trace)}
+                return
+
+            # Lượt đầu của cuộc trò chuyện: câu hỏi lặp lại nguyên văn được trả lời ngay từ cache
+            cache_key = cache_category = cached = None
+            if (response_cache.RESPONSE_CACHE_ENABLED and len(chat_messages) == 1 and last_user_message
+                    and not context.message_has_images(last_message)):
+                cache_key, cache_category = response_cache.response_cache.make_key(
+                    self.store, last_user_message, member_id, bool(self.tavily_api_key))
+                if cache_key is not None:
+                    cached = response_cache.response_cache.get(cache_key)
+                    telemetry.record_cache("response", cached is not None)
+
+            if cached is not None:
+                response_message = cached
+                yield {"type": "token", "text": cached}
+            else:
+                async for event in self._stream_answer(chat_messages, member_id, last_user_message):
+                    if event["type"] == "token":
+                        response_message += event["text"]
+                    yield event
+                # Phản hồi có lệnh không được lưu: dùng lại sẽ thực thi lệnh (thêm sự kiện, ghi chú...) thêm lần nữa
+                if cache_key is not None and not commands.has_commands(response_message):
+                    response_cache.response_cache.put(cache_key, cache_category, response_message)
+
+            logger.info(f"Phản hồi đầy đủ từ trợ lý: {response_message[:200]}...")
+
+            # Thực thi các lệnh trong phản hồi (phản hồi lấy từ cache không có lệnh)
+            if cached is None:
+                with telemetry.span("process_assistant_response"):
+                    actions = commands.process_assistant_response(self.store, response_message, member_id)
+                for action in actions:
+                    yield {"type": "action", **action}
+
+            # Nếu đang chat với một thành viên cụ thể, lưu lịch sử kèm tóm tắt
+            if member_id:
+                conversation = list(chat_messages) + [context.text_message("assistant", response_message)]
+                await self.summarize_and_save(conversation, member_id)
+
+        except admission.Overloaded as e:
+            # Bị giới hạn tốc độ hoặc giảm tải: báo rõ cho người dùng thay vì lỗi chung chung
+            logger.warning(f"Từ chối lượt trò chuyện của thành viên {member_id}: {e}")
+            yield {"type": "error", "message": f"⏳ {e}"}
+            return
+        except Exception as e:
+            logger.error(f"Lỗi khi tạo phản hồi từ OpenAI: {e}")
+            yield {"type": "error", "message": f"Có lỗi xảy ra: {str(e)}"}
+            return
+        finally:
+            if trace.total_ms is None:
+                telemetry.finish_turn(trace, trace_token)
+
+        yield {"type": "done", "text": response_message, "trace": trace_to_dict(trace)}
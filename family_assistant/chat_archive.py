@@ -0,0 +1,81 @@
+"""
+Kho lưu nội dung các cuộc trò chuyện đã lưu, nén và chỉ đọc khi cần.
+
+``chat_history.json`` chỉ còn là chỉ mục nhỏ (thời gian, tóm tắt, kích thước)
+được tải cùng các dữ liệu khác; tin nhắn (kể cả hình ảnh) của từng cuộc trò
+chuyện nằm trong ``chat_archive/<id>.json.gz`` và chỉ được đọc khi người dùng
+mở lại cuộc trò chuyện đó.
+"""
+import contextlib
+import gzip
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+logger = logging.getLogger('family_assistant.chat_archive')
+
+ARCHIVE_DIR = "chat_archive"
+# Mức nén vừa phải: ảnh base64 nén tốt và vẫn nhanh
+COMPRESS_LEVEL = 6
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+def compress_messages(messages):
+    """Nén danh sách tin nhắn thành bytes (gzip JSON)"""
+    return gzip.compress(json.dumps(messages, ensure_ascii=False).encode("utf-8"), COMPRESS_LEVEL)
+
+
+def decompress_messages(body):
+    return json.loads(gzip.decompress(body).decode("utf-8"))
+
+
+class ChatArchive:
+    """Các file nội dung cuộc trò chuyện trong một thư mục; mỗi file chỉ ghi một lần"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, conversation_id):
+        return os.path.join(self.directory, f"{conversation_id}.json.gz")
+
+    def write(self, conversation_id, body):
+        """Ghi nguyên tử nội dung đã nén, trả về False nếu có lỗi"""
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{conversation_id}.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path(conversation_id))
+            tmp_path = None
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu cuộc trò chuyện {conversation_id}: {e}")
+            return False
+        finally:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+    def read(self, conversation_id):
+        """Đọc và giải nén tin nhắn, trả về None nếu không đọc được"""
+        try:
+            with open(self.path(conversation_id), "rb") as f:
+                return decompress_messages(f.read())
+        except FileNotFoundError:
+            logger.warning(f"Không tìm thấy nội dung cuộc trò chuyện {conversation_id}")
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc cuộc trò chuyện {conversation_id}: {e}")
+        return None
+
+    def delete(self, conversation_id):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(conversation_id))
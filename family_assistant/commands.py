@@ -0,0 +1,269 @@
+"""
+Thực thi các lệnh mà trợ lý nhúng trong phản hồi (##ADD_EVENT:{...}## ...).
+
+Kết quả được trả về dưới dạng danh sách hành động để lớp giao diện tự hiển thị.
+"""
+import datetime
+import json
+import logging
+import re
+import unicodedata
+
+from family_assistant import dates, records, recurrence, schedule
+
+logger = logging.getLogger('family_assistant.commands')
+
+COMMAND_TYPES = ["ADD_EVENT", "UPDATE_EVENT", "ADD_FAMILY_MEMBER", "UPDATE_PREFERENCE", "DELETE_EVENT", "ADD_NOTE"]
+
+
+def _extract_command(response, cmd_type):
+    cmd_pattern = f"##{cmd_type}:"
+    cmd_start = response.index(cmd_pattern) + len(cmd_pattern)
+    cmd_end = response.index("##", cmd_start)
+    return response[cmd_start:cmd_end].strip()
+
+
+# Tin nhắn thêm sự kiện đơn giản được xử lý tại chỗ, không cần gọi mô hình
+_QUICK_ADD_PATTERN = re.compile(
+    r"^\s*(?:(?:hay|giup (?:toi|minh|em)|nho)\s+)?(?:them|tao|dat|len|ghi)\s+(?:mot\s+|1\s+)?"
+    r"(?:su kien|lich hen|cuoc hen|lich)(?![\w])\s*:?\s*"
+    r"|^\s*(?:please\s+)?(?:add|create|schedule)\s+(?:an?\s+)?(?:event|appointment)(?![\w])\s*:?\s*")
+# Từ nối quanh biểu thức ngày giờ, bỏ đi khi lấy tiêu đề ("đi khám răng vào lúc ...");
+# buổi trong ngày chỉ bỏ khi đã được tính vào giờ ("9h ... sáng thứ Hai")
+_FILLERS = r"vao luc|vao|luc|ngay|hom|buoi|at|on"
+_PERIOD_FILLERS = _FILLERS + r"|sang|trua|chieu|toi|dem"
+
+
+def _filler_patterns(fillers):
+    return (re.compile(r"(?:[\s,.;:-]*(?:" + fillers + r")(?![\w]))*[\s,.;:-]*"),
+            re.compile(r"(?:(?<![\w])(?:" + fillers + r")[\s,.;:-]*|[\s,.;:-]+)*$"))
+
+
+_FILLER_PATTERNS = {False: _filler_patterns(_FILLERS), True: _filler_patterns(_PERIOD_FILLERS)}
+_PERIOD_IN_TIME = re.compile(r"(?<![\w])(?:sang|trua|chieu|toi|dem|am|pm)(?![\w])")
+QUICK_ADD_MAX_LENGTH = 160
+
+
+def _normalize_date(details):
+    """Chuẩn hóa ngày về YYYY-MM-DD và giờ về HH:MM khi mô hình viết dạng tự do ("thứ Bảy tuần sau", "8h tối")"""
+    date_text = details.get('date')
+    if isinstance(date_text, str) and date_text.strip() and not dates.is_iso_date(date_text):
+        parsed_date = dates.parse_date(date_text)
+        if parsed_date:
+            details['date'] = parsed_date.strftime("%Y-%m-%d")
+            logger.info(f"Đã chuyển đổi ngày thành: {details['date']}")
+        # "8h tối mai" trong trường ngày: lấy luôn giờ nếu chưa có
+        if not details.get('time'):
+            parsed_time = dates.parse_time(date_text)
+            if parsed_time:
+                details['time'] = parsed_time
+    time_text = details.get('time')
+    if isinstance(time_text, str) and time_text.strip() and not dates.is_hhmm(time_text):
+        parsed_time = dates.parse_time(time_text)
+        if parsed_time:
+            details['time'] = parsed_time
+            logger.info(f"Đã chuyển đổi giờ thành: {details['time']}")
+
+
+def _strip_spans(text, spans, strip_periods=False):
+    """Bỏ các đoạn ngày giờ khỏi văn bản cùng từ nối quanh chúng, trả về phần còn lại"""
+    folded = dates.fold(text)
+    leading, trailing = _FILLER_PATTERNS[strip_periods]
+    segments, position = [], 0
+    for start, end in sorted(spans):
+        if start >= position:
+            segments.append((position, start))
+        position = max(position, end)
+    segments.append((position, len(text)))
+    parts = []
+    for index, (start, end) in enumerate(segments):
+        if index > 0:
+            start = leading.match(folded, start, end).end()
+        if index < len(segments) - 1:
+            end = trailing.search(folded, start, end).start()
+        parts.append(text[start:end])
+    return re.sub(r"\s+", " ", " ".join(parts)).strip(" ,.;:-")
+
+
+def parse_quick_add(text, members=(), now=None):
+    """
+    Nhận diện tin nhắn thêm sự kiện đơn giản ("thêm sự kiện đi khám răng 9h sáng thứ Hai")
+
+    Args:
+        text: Tin nhắn của người dùng
+        members: Tên các thành viên, để điền người tham gia khi tên xuất hiện trong tin nhắn
+        now: Thời điểm hiện tại (datetime), mặc định là bây giờ
+
+    Returns:
+        dict: Thông tin sự kiện (title, date, time, description, participants, có thể kèm recurrence) hoặc None
+    """
+    if not text or len(text) > QUICK_ADD_MAX_LENGTH or "?" in text or "\n" in text.strip():
+        return None
+    prefix = _QUICK_ADD_PATTERN.match(dates.fold(text))
+    if not prefix:
+        return None
+
+    now = now or datetime.datetime.now()
+    body = text[prefix.end():]
+    found_date = dates.find_date(body, now.date())
+    found_time = dates.find_time(body)
+    if not found_date and not found_time:
+        # Không có ngày giờ thì để mô hình hỏi lại
+        return None
+
+    found_rule = recurrence.find_recurrence(body)
+    spans = [found[1] for found in (found_date, found_time, found_rule) if found]
+    # Buổi đứng tách khỏi giờ 12 tiếng ("sáng thứ Hai 9h") đã được tính vào giờ, không thuộc tiêu đề
+    strip_periods = False
+    if found_time:
+        time_text = dates.fold(body[slice(*found_time[1])])
+        strip_periods = not _PERIOD_IN_TIME.search(time_text) and int(re.match(r"\D*(\d+)", time_text).group(1)) <= 12
+    title = _strip_spans(body, spans, strip_periods)
+    if not title:
+        return None
+
+    if found_date:
+        day = found_date[0]
+    else:
+        # Chỉ có giờ: hôm nay, hoặc ngày mai nếu giờ đó đã qua
+        day = now.date()
+        if found_time[0] <= now.strftime("%H:%M"):
+            day += datetime.timedelta(days=1)
+
+    # So khớp tên giữ nguyên dấu để "ăn" không thành "An"
+    lowered_title = unicodedata.normalize("NFC", title).lower()
+    participants = [name for name in members if name and re.search(
+        r"(?<![\w])" + re.escape(unicodedata.normalize("NFC", name).lower()) + r"(?![\w])", lowered_title)]
+    details = {
+        "title": title[0].upper() + title[1:],
+        "date": day.strftime("%Y-%m-%d"),
+        "time": found_time[0] if found_time else "",
+        "description": "",
+        "participants": participants,
+    }
+    if found_rule:
+        details["recurrence"] = found_rule[0]
+    return details
+
+
+def quick_add(store, text, current_member=None, now=None):
+    """
+    Thêm sự kiện từ tin nhắn đơn giản mà không gọi mô hình
+
+    Returns:
+        tuple: (hành động, câu trả lời cho người dùng) hoặc None nếu tin nhắn không phải lệnh thêm sự kiện đơn giản
+    """
+    with store.read():
+        members = [member.get("name") for member in store.family_data.values() if isinstance(member, dict)]
+    details = parse_quick_add(text, members, now)
+    if details is None:
+        return None
+    if current_member:
+        details['created_by'] = current_member
+    logger.info(f"Thêm nhanh sự kiện: {details['title']} ({details['date']} {details['time']})")
+    conflicts = []
+    ok = store.add_event(details, conflicts) is not None
+    action = _action("ADD_EVENT", ok, f"Đã thêm sự kiện: {details['title']}" + _conflict_note(conflicts))
+    if not ok:
+        return action, "Không thể thêm sự kiện vào lúc này."
+    when = dates.format_date(datetime.date.fromisoformat(details['date']))
+    if details['time']:
+        when += f" lúc {details['time']}"
+    if details.get('recurrence'):
+        when += f" ({recurrence.describe(recurrence.normalize_rule(details['recurrence'])).lower()})"
+    with_whom = f" cùng {', '.join(details['participants'])}" if details['participants'] else ""
+    reply = f"✅ Đã thêm sự kiện **{details['title']}** vào {when}{with_whom}."
+    if conflicts:
+        reply += f"\n\n⚠️ Trùng lịch với: {schedule.describe_conflicts(conflicts)}."
+    return action, reply
+
+
+def _conflict_note(conflicts):
+    return f" (⚠️ trùng lịch với: {schedule.describe_conflicts(conflicts)})" if conflicts else ""
+
+
+def _action(command, ok, message):
+    return {"command": command, "ok": bool(ok), "message": message}
+
+
+def _execute(store, cmd_type, cmd, current_member):
+    if cmd_type == "DELETE_EVENT":
+        ok = store.delete_event(cmd.strip())
+        return _action(cmd_type, ok, "Đã xóa sự kiện!" if ok else "Không tìm thấy sự kiện để xóa")
+
+    details = json.loads(cmd)
+    if not isinstance(details, dict):
+        raise records.ValidationError("Dữ liệu lệnh phải là một đối tượng JSON")
+
+    if cmd_type == "ADD_EVENT":
+        _normalize_date(details)
+        # Thêm thông tin về người tạo sự kiện
+        if current_member:
+            details['created_by'] = current_member
+        logger.info(f"Thêm sự kiện: {details.get('title', 'Không tiêu đề')}")
+        conflicts = []
+        ok = store.add_event(details, conflicts) is not None
+        return _action(cmd_type, ok, f"Đã thêm sự kiện: {details.get('title', '')}" + _conflict_note(conflicts))
+    if cmd_type == "UPDATE_EVENT":
+        _normalize_date(details)
+        logger.info(f"Cập nhật sự kiện: {details.get('title', 'Không tiêu đề')}")
+        conflicts = []
+        ok = store.update_event(details, conflicts)
+        return _action(cmd_type, ok, f"Đã cập nhật sự kiện: {details.get('title', '')}" + _conflict_note(conflicts))
+    if cmd_type == "ADD_FAMILY_MEMBER":
+        ok = store.add_family_member(details) is not None
+        return _action(cmd_type, ok, f"Đã thêm thành viên: {details.get('name', '')}")
+    if cmd_type == "UPDATE_PREFERENCE":
+        ok = store.update_preference(details)
+        return _action(cmd_type, ok, "Đã cập nhật sở thích!")
+    if cmd_type == "ADD_NOTE":
+        # Thêm thông tin về người tạo ghi chú
+        if current_member:
+            details['created_by'] = current_member
+        ok = store.add_note(details) is not None
+        return _action(cmd_type, ok, "Đã thêm ghi chú!")
+    return None
+
+
+def has_commands(response):
+    """Phản hồi có chứa lệnh (##ADD_EVENT:...## ...) không"""
+    return any(f"##{cmd_type}:" in response for cmd_type in COMMAND_TYPES)
+
+
+def process_assistant_response(store, response, current_member=None):
+    """
+    Thực thi các lệnh trong phản hồi của trợ lý
+
+    Returns:
+        list: Các hành động đã thực hiện, mỗi hành động gồm ``command``, ``ok`` và ``message``
+    """
+    actions = []
+    try:
+        logger.info(f"Xử lý phản hồi của trợ lý, độ dài: {len(response)}")
+
+        for cmd_type in COMMAND_TYPES:
+            if f"##{cmd_type}:" not in response:
+                continue
+            logger.info(f"Tìm thấy lệnh {cmd_type}")
+            cmd = None
+            try:
+                cmd = _extract_command(response, cmd_type)
+                logger.info(f"Nội dung lệnh {cmd_type}: {cmd}")
+                action = _execute(store, cmd_type, cmd, current_member)
+                if action is not None:
+                    actions.append(action)
+            except json.JSONDecodeError as e:
+                logger.error(f"Lỗi khi phân tích JSON cho {cmd_type}: {e}")
+                logger.error(f"Chuỗi JSON gốc: {cmd}")
+            except records.ValidationError as e:
+                # Dữ liệu sai không được lưu; báo lại để người dùng biết lệnh không được thực hiện
+                logger.warning(f"Dữ liệu không hợp lệ trong lệnh {cmd_type}: {e}")
+                actions.append(_action(cmd_type, False, f"Dữ liệu không hợp lệ: {e}"))
+            except Exception as e:
+                logger.error(f"Lỗi khi xử lý lệnh {cmd_type}: {e}")
+
+    except Exception as e:
+        logger.error(f"Lỗi khi xử lý phản hồi của trợ lý: {e}")
+        logger.error(f"Phản hồi gốc: {response[:100]}...")
+
+    return actions
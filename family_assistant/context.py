@@ -0,0 +1,233 @@
+"""
+Xây dựng ngữ cảnh cho mô hình: system prompt, chuyển đổi tin nhắn và ngày tương đối.
+"""
+import datetime
+import itertools
+import json
+
+from family_assistant import dates, fulltext, schedule
+
+# Số ngày tới được liệt kê lịch (đã tính các lần của sự kiện lặp lại) trong system prompt
+PROMPT_SCHEDULE_DAYS = 30
+PROMPT_SCHEDULE_MAX_LINES = 50
+# Tập sự kiện/ghi chú lớn hơn mức này không được đưa hết vào prompt: chỉ các mục
+# liên quan tới câu hỏi (tìm bằng fulltext) được đưa vào
+PROMPT_FULL_DATA_MAX_RECORDS = 200
+PROMPT_RETRIEVED_RECORDS = 20
+PROMPT_RETRIEVED_CHATS = 3
+
+
+def get_date_from_relative_term(term):
+    """Chuyển đổi từ mô tả tương đối về ngày thành ngày thực tế (xem ``family_assistant.dates``)"""
+    return dates.parse_date(term)
+
+
+def _schedule_text(store, start=None, end=None):
+    """
+    Các lần diễn ra sự kiện từ ``start`` tới ``end`` (mặc định PROMPT_SCHEDULE_DAYS ngày tới),
+    mỗi lần một dòng (tối đa PROMPT_SCHEDULE_MAX_LINES)
+    """
+    start = start or datetime.date.today()
+    window = store.occurrences(start, end or start + datetime.timedelta(days=PROMPT_SCHEDULE_DAYS))
+    lines = [f"- {dates.format_date(datetime.date.fromisoformat(event['date']))} {event.get('time', '')}: "
+             f"{event.get('title', '')} (ID {event_id})"
+             for event_id, event in itertools.islice(window, PROMPT_SCHEDULE_MAX_LINES)]
+    if next(window, None) is not None:
+        lines.append("- ...")
+    return "\n    ".join(lines) or "Không có sự kiện nào"
+
+
+def _records_text(store, data, kind, query):
+    """JSON của cả tập dữ liệu, hoặc chỉ các mục liên quan tới câu hỏi nếu tập quá lớn"""
+    if len(data) <= PROMPT_FULL_DATA_MAX_RECORDS:
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    hits = fulltext.search(store, query, kinds=(kind,), limit=PROMPT_RETRIEVED_RECORDS) if query else []
+    records = {hit["id"]: data[hit["id"]] for hit in hits if hit["id"] in data}
+    return (f"(Có {len(data)} mục, quá nhiều để liệt kê hết; dưới đây là các mục liên quan tới câu hỏi, "
+            f"tìm bằng tìm kiếm toàn văn)\n    {json.dumps(records, ensure_ascii=False, indent=2)}")
+
+
+def _related_chats_text(store, member_id, query):
+    """Các cuộc trò chuyện trước của thành viên có liên quan tới câu hỏi, mỗi cuộc một dòng"""
+    if not query or not member_id:
+        return ""
+    hits = fulltext.search(store, query, member_id, kinds=("chat",), limit=PROMPT_RETRIEVED_CHATS)
+    return "\n    ".join(f"- {hit['date']}: {hit['title']} — {hit['snippet']}" for hit in hits)
+
+
+def build_system_prompt(store, member_id=None, query=None, free_slot_answer=None):
+    """
+    Tạo system prompt gồm hướng dẫn, thông tin người dùng hiện tại và dữ liệu gia đình
+
+    ``query`` (tin nhắn mới nhất của người dùng) dùng để chọn các sự kiện/ghi chú liên quan
+    khi dữ liệu quá lớn, và các cuộc trò chuyện trước có liên quan.
+
+    ``free_slot_answer`` (xem ``schedule.answer_free_slot_query``): câu hỏi tìm lịch trống đã
+    được trả lời sẵn, nên thay cho danh sách sự kiện đầy đủ chỉ có kết quả đó và lịch của
+    khoảng ngày được hỏi.
+    """
+    system_prompt = f"""
+    Bạn là trợ lý gia đình thông minh. Nhiệm vụ của bạn là giúp quản lý thông tin về các thành viên trong gia đình,
+    sở thích của họ, các sự kiện, ghi chú, và phân tích hình ảnh liên quan đến gia đình. Khi người dùng yêu cầu, bạn phải thực hiện ngay các hành động sau:
+
+    1. Thêm thông tin về thành viên gia đình (tên, tuổi, sở thích)
+    2. Cập nhật sở thích của thành viên gia đình
+    3. Thêm, cập nhật, hoặc xóa sự kiện
+    4. Thêm ghi chú
+    5. Phân tích hình ảnh người dùng đưa ra (món ăn, hoạt động gia đình, v.v.)
+    6. Tìm kiếm thông tin thực tế khi được hỏi về tin tức, thời tiết, thể thao, và sự kiện hiện tại
+
+    QUAN TRỌNG: Khi cần thực hiện các hành động trên, bạn PHẢI sử dụng đúng cú pháp lệnh đặc biệt này (người dùng sẽ không nhìn thấy):
+
+    - Thêm thành viên: ##ADD_FAMILY_MEMBER:{{"name":"Tên","age":"Tuổi","preferences":{{"food":"Món ăn","hobby":"Sở thích","color":"Màu sắc"}}}}##
+    - Cập nhật sở thích: ##UPDATE_PREFERENCE:{{"id":"id_thành_viên","key":"loại_sở_thích","value":"giá_trị"}}##
+    - Thêm sự kiện: ##ADD_EVENT:{{"title":"Tiêu đề","date":"YYYY-MM-DD","time":"HH:MM","description":"Mô tả","participants":["Tên1","Tên2"]}}##
+    - Cập nhật sự kiện: ##UPDATE_EVENT:{{"id":"id_sự_kiện","title":"Tiêu đề mới","date":"YYYY-MM-DD","time":"HH:MM","description":"Mô tả mới","participants":["Tên1","Tên2"]}}##
+    - Xóa sự kiện: ##DELETE_EVENT:id_sự_kiện##
+    - Thêm ghi chú: ##ADD_NOTE:{{"title":"Tiêu đề","content":"Nội dung","tags":["tag1","tag2"]}}##
+
+    QUY TẮC THÊM SỰ KIỆN ĐƠN GIẢN:
+    1. Khi được yêu cầu thêm sự kiện, hãy thực hiện NGAY LẬP TỨC mà không cần hỏi thêm thông tin không cần thiết.
+    2. Khi người dùng nói "ngày mai" hoặc "tuần sau", hãy tự động tính toán ngày trong cú pháp YYYY-MM-DD.
+    3. Nếu không có thời gian cụ thể, sử dụng thời gian mặc định là 8:00.
+    4. Sử dụng mô tả ngắn gọn từ yêu cầu của người dùng.
+    5. Chỉ hỏi thông tin nếu thực sự cần thiết, tránh nhiều bước xác nhận.
+    6. Sau khi thêm/cập nhật/xóa sự kiện, tóm tắt ngắn gọn hành động đã thực hiện.
+    7. Sự kiện lặp lại (sinh nhật, lớp học hằng tuần, hóa đơn hằng tháng) chỉ thêm MỘT lần với trường
+       "recurrence":{{"freq":"daily|weekly|monthly|yearly","interval":1,"byweekday":[0],"until":"YYYY-MM-DD","count":10}}
+       ("byweekday": các thứ trong tuần, 0 là thứ Hai; "until"/"count" không bắt buộc), không tạo nhiều sự kiện riêng lẻ.
+    8. Nếu biết sự kiện kéo dài bao lâu, thêm trường "duration" (số phút) để kiểm tra trùng lịch chính xác.
+    9. Nếu người dùng muốn được nhắc trước, thêm trường "reminders" là danh sách số phút nhắc trước (ví dụ [30] hoặc [1440, 60]).
+
+    TÌM KIẾM THÔNG TIN THỜI GIAN THỰC:
+    1. Khi người dùng hỏi về tin tức, thời tiết, thể thao, sự kiện hiện tại, thông tin sản phẩm mới, hoặc bất kỳ dữ liệu cập nhật nào, hệ thống đã tự động tìm kiếm thông tin thực tế cho bạn.
+    2. Hãy sử dụng thông tin tìm kiếm này để trả lời người dùng một cách chính xác và đầy đủ.
+    3. Luôn đề cập đến nguồn thông tin khi sử dụng kết quả tìm kiếm.
+    4. Nếu không có thông tin tìm kiếm, hãy trả lời dựa trên kiến thức của bạn và lưu ý rằng thông tin có thể không cập nhật.
+
+    Hôm nay là {datetime.datetime.now().strftime("%d/%m/%Y")}.
+
+    CẤU TRÚC JSON PHẢI CHÍNH XÁC như trên. Đảm bảo dùng dấu ngoặc kép cho cả keys và values. Đảm bảo các dấu ngoặc nhọn và vuông được đóng đúng cách.
+
+    QUAN TRỌNG: Khi người dùng yêu cầu tạo sự kiện mới, hãy luôn sử dụng lệnh ##ADD_EVENT:...## trong phản hồi của bạn mà không cần quá nhiều bước xác nhận.
+
+    Đối với hình ảnh:
+    - Nếu người dùng gửi hình ảnh món ăn, hãy mô tả món ăn, và đề xuất cách nấu hoặc thông tin dinh dưỡng nếu phù hợp
+    - Nếu là hình ảnh hoạt động gia đình, hãy mô tả hoạt động và đề xuất cách ghi nhớ khoảnh khắc đó
+    - Với bất kỳ hình ảnh nào, hãy giúp người dùng liên kết nó với thành viên gia đình hoặc sự kiện nếu phù hợp
+    """
+
+    # Lấy bản chụp nhất quán của các tập dữ liệu
+    with store.read():
+        family_data, events_data, notes_data = store.family_data, store.events_data, store.notes_data
+
+    # Thêm thông tin về người dùng hiện tại
+    current_member = family_data.get(member_id) if member_id else None
+    if not isinstance(current_member, dict):
+        current_member = None
+    if current_member is not None:
+        system_prompt += f"""
+        THÔNG TIN NGƯỜI DÙNG HIỆN TẠI:
+        Bạn đang trò chuyện với: {current_member.get('name')}
+        Tuổi: {current_member.get('age', '')}
+        Sở thích: {json.dumps(current_member.get('preferences', {}), ensure_ascii=False)}
+
+        QUAN TRỌNG: Hãy điều chỉnh cách giao tiếp và đề xuất phù hợp với người dùng này. Các sự kiện và ghi chú sẽ được ghi danh nghĩa người này tạo.
+        """
+
+    # Thêm thông tin dữ liệu
+    if free_slot_answer:
+        start, end = schedule.find_window(query or "")
+        events_text = f"""
+    LỊCH TRỐNG (đã tính sẵn từ dữ liệu sự kiện, dùng kết quả này thay vì tự dò danh sách sự kiện):
+    {free_slot_answer}
+
+    Lịch từ {start.strftime("%d/%m")} đến {end.strftime("%d/%m")}:
+    {_schedule_text(store, start, end)}
+"""
+    else:
+        events_text = f"""
+    Danh sách sự kiện (sự kiện lặp lại chỉ ghi một lần, kèm quy tắc "recurrence"):
+    {_records_text(store, events_data, "event", query)}
+
+    Lịch {PROMPT_SCHEDULE_DAYS} ngày tới:
+    {_schedule_text(store)}
+"""
+    system_prompt += f"""
+    Thông tin hiện tại về gia đình:
+    {json.dumps(family_data, ensure_ascii=False, indent=2)}
+{events_text}
+    Ghi chú:
+    {_records_text(store, notes_data, "note", query)}
+
+    Hãy hiểu và đáp ứng nhu cầu của người dùng một cách tự nhiên và hữu ích. Không hiển thị các lệnh đặc biệt
+    trong phản hồi của bạn, chỉ sử dụng chúng để thực hiện các hành động được yêu cầu.
+    """
+
+    related_chats = _related_chats_text(store, member_id, query)
+    if related_chats:
+        system_prompt += f"""
+    Các cuộc trò chuyện trước có liên quan (tóm tắt và đoạn trích):
+    {related_chats}
+    """
+
+    return system_prompt
+
+
+def message_has_images(message):
+    content = message.get("content")
+    return isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+
+
+def to_openai_messages(chat_messages, system_prompt):
+    """
+    Chuyển tin nhắn đã lưu (mỗi tin nhắn là danh sách phần văn bản/hình ảnh)
+    sang định dạng của OpenAI, thêm system prompt ở đầu
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+
+    for message in chat_messages:
+        if message_has_images(message):
+            # Tin nhắn có hình ảnh: hình ảnh trước, văn bản gộp lại ở cuối
+            message_content = [
+                {"type": "image_url", "image_url": {"url": content["image_url"]["url"]}}
+                for content in message["content"] if content["type"] == "image_url"
+            ]
+            texts = [content["text"] for content in message["content"] if content["type"] == "text"]
+            if texts:
+                message_content.append({"type": "text", "text": "\n".join(texts)})
+            messages.append({"role": message["role"], "content": message_content})
+        else:
+            # Tin nhắn chỉ có văn bản
+            text_content = message["content"][0]["text"] if message["content"] else ""
+            messages.append({"role": message["role"], "content": text_content})
+
+    return messages
+
+
+def last_user_text(chat_messages):
+    """Nội dung văn bản của tin nhắn người dùng mới nhất (bỏ qua tin nhắn chỉ có hình ảnh)"""
+    for message in reversed(chat_messages):
+        if message["role"] == "user" and message["content"] and message["content"][0]["type"] == "text":
+            return message["content"][0]["text"]
+    return ""
+
+
+def conversation_text(chat_messages):
+    """Ghép phần văn bản của cuộc trò chuyện, dùng để tạo tóm tắt"""
+    content_texts = []
+    for message in chat_messages:
+        if "content" not in message:
+            continue
+        if isinstance(message["content"], list):
+            for content in message["content"]:
+                if content["type"] == "text":
+                    content_texts.append(f"{message['role'].upper()}: {content['text']}")
+        else:
+            content_texts.append(f"{message['role'].upper()}: {message['content']}")
+    return "\n".join(content_texts)
+
+
+def text_message(role, text):
+    """Tạo một tin nhắn văn bản theo định dạng lưu trữ"""
+    return {"role": role, "content": [{"type": "text", "text": text}]}
@@ -0,0 +1,384 @@
+"""
+Phân tích biểu thức ngày giờ tiếng Việt/tiếng Anh, không cần gọi mô hình.
+
+Hỗ trợ:
+    - Ngày tuyệt đối: "2024-05-03", "3/5", "03/05/2024", "ngày 3 tháng 5", "mùng 3"
+    - Ngày tương đối: "hôm nay", "mai", "ngày kia", "mốt", "hôm qua", "3 ngày nữa",
+      "sau 2 tuần", "1 tháng nữa", "in 3 days", "2 weeks ago"
+    - Thứ trong tuần: "thứ Bảy tuần sau", "thứ 2 tới", "chủ nhật này", "T7", "next friday"
+    - Tuần/tháng/năm: "tuần sau", "tháng sau" (cùng ngày tháng sau, không phải +30 ngày),
+      "cuối tuần", "cuối tháng", "đầu tháng sau", "giữa tháng", "cuối năm", "end of month"
+    - Giờ: "9h", "9h30", "9 giờ rưỡi", "9 giờ kém 15", "8h tối", "3 giờ chiều", "21:00", "8:30pm", "noon"
+
+Người dùng hay gõ không dấu, nên biểu thức được so khớp trên văn bản đã bỏ dấu
+(mỗi ký tự giữ nguyên vị trí, để vị trí khớp dùng được trên văn bản gốc). Các từ
+trùng nhau khi bỏ dấu ("mốt"/"một", "tối"/"tới", tên "Mai"/"mai") được phân biệt
+theo văn bản gốc hoặc ngữ cảnh.
+
+Tuần bắt đầu từ thứ Hai. Thứ không kèm "tuần này/sau" là lần tới (không tính
+hôm nay); ngày/tháng không kèm năm đã qua thì hiểu là năm sau.
+"""
+import calendar
+import datetime
+import re
+import unicodedata
+
+WEEKDAY_NAMES = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+
+_NUMBER_WORDS = {
+    "mot": 1, "hai": 2, "ba": 3, "bon": 4, "tu": 4, "nam": 5, "sau": 6, "bay": 7, "tam": 8, "chin": 9, "muoi": 10,
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "a": 1, "an": 1,
+}
+_VI_WEEKDAYS = {"hai": 0, "ba": 1, "tu": 2, "nam": 3, "sau": 4, "bay": 5,
+                "2": 0, "3": 1, "4": 2, "5": 3, "6": 4, "7": 5}
+_EN_WEEKDAYS = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+                "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+_NUM = r"(\d{1,3}|" + "|".join(sorted(_NUMBER_WORDS, key=len, reverse=True)) + r")"
+_B = r"(?<![\w])"   # Đầu từ
+_E = r"(?![\w])"    # Cuối từ
+_PERIOD = r"(sang|trua|chieu|toi|dem|am|pm|a\.m\.|p\.m\.)"
+
+
+class _FoldTable(dict):
+    """Bảng str.translate bỏ dấu, mỗi ký tự chỉ được tính một lần"""
+
+    def __missing__(self, code):
+        ch = chr(code)
+        folded = "d" if ch == "đ" else unicodedata.normalize("NFD", ch)[0]
+        self[code] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt; độ dài và vị trí ký tự được giữ nguyên"""
+    return unicodedata.normalize("NFC", text).lower().translate(_FOLD_TABLE)
+
+
+def add_months(day, months):
+    """Cộng tháng theo lịch (ngày 31 cộng 1 tháng thành ngày cuối tháng sau)"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _number(token):
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+
+def _shift(today, amount, unit):
+    if unit.startswith(("ngay", "day")):
+        return today + datetime.timedelta(days=amount)
+    if unit.startswith(("tuan", "week")):
+        return today + datetime.timedelta(weeks=amount)
+    if unit.startswith(("thang", "month")):
+        return add_months(today, amount)
+    return add_months(today, 12 * amount)
+
+
+def _week_offset(modifier):
+    """Số tuần so với tuần hiện tại theo từ bổ nghĩa ("tuần sau" = 1, "tuần trước" = -1)"""
+    if not modifier:
+        return None
+    modifier = modifier.strip()
+    if re.search(r"sau nua", modifier):
+        return 2
+    if re.search(r"(sau|toi|next)", modifier):
+        return 1
+    if re.search(r"(truoc|last)", modifier):
+        return -1
+    return 0
+
+
+def _weekday_date(today, weekday, week_offset):
+    if week_offset is None:
+        # Lần tới của thứ đó, không tính hôm nay
+        return today + datetime.timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    monday = today - datetime.timedelta(days=today.weekday())
+    return monday + datetime.timedelta(weeks=week_offset, days=weekday)
+
+
+def _future_day_month(today, day, month, year=None):
+    if year is not None:
+        year = year + 2000 if year < 100 else year
+        return datetime.date(year, month, day)
+    candidate = datetime.date(today.year, month, day)
+    return candidate if candidate >= today else datetime.date(today.year + 1, month, day)
+
+
+def _month_anchor(today, which, month_offset):
+    first = add_months(today.replace(day=1), month_offset)
+    if which in ("cuoi", "end"):
+        return first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    if which in ("giua", "middle"):
+        return first.replace(day=15)
+    return first
+
+
+def _month_offset(modifier):
+    if not modifier:
+        return 0
+    return _week_offset(modifier) or 0
+
+
+# Mỗi luật: (biểu thức trên văn bản đã bỏ dấu, hàm (match, today, original) -> date hoặc None)
+def _rule_iso(m, today, original):
+    return datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+
+def _rule_dmy(m, today, original):
+    year = int(m.group(3)) if m.group(3) else None
+    return _future_day_month(today, int(m.group(1)), int(m.group(2)), year)
+
+
+def _rule_day_of_month(m, today, original):
+    day = int(m.group(1))
+    if m.group(2):
+        return _future_day_month(today, day, int(m.group(2)), int(m.group(3)) if m.group(3) else None)
+    # Chỉ có ngày: ngày đó trong tháng này, hoặc tháng sau nếu đã qua
+    candidate = today.replace(day=min(day, calendar.monthrange(today.year, today.month)[1]))
+    if candidate < today:
+        candidate = add_months(today.replace(day=1), 1)
+        candidate = candidate.replace(day=min(day, calendar.monthrange(candidate.year, candidate.month)[1]))
+    return candidate
+
+
+def _rule_relative_day(m, today, original):
+    word = m.group(0)
+    if re.match(r"(ngay kia|ngay mot|day after tomorrow)", word):
+        return today + datetime.timedelta(days=2)
+    if word == "mot":
+        # "mốt" (ngày kia), không phải "một"
+        return today + datetime.timedelta(days=2) if original[m.start():m.end()].lower() == "mốt" else None
+    if re.match(r"(ngay mai|tomorrow|mai)", word):
+        return today + datetime.timedelta(days=1)
+    if re.match(r"(hom kia)", word):
+        return today - datetime.timedelta(days=2)
+    if re.match(r"(hom qua|yesterday)", word):
+        return today - datetime.timedelta(days=1)
+    return today
+
+
+def _rule_bare_mai(m, today, original):
+    # "Mai" viết hoa giữa câu thường là tên người
+    if original[m.start(1)] == "M" and m.start(1) > 0:
+        return None
+    return today + datetime.timedelta(days=1)
+
+
+def _rule_in_n(m, today, original):
+    return _shift(today, _number(m.group(1)), m.group(2))
+
+
+def _rule_n_ago(m, today, original):
+    return _shift(today, -_number(m.group(1)), m.group(2))
+
+
+def _rule_vi_weekday(m, today, original):
+    if m.group(1) in ("chu nhat", "cn"):
+        weekday = 6
+    else:
+        weekday = _VI_WEEKDAYS[m.group(2) or m.group(3)]
+    return _weekday_date(today, weekday, _week_offset(m.group(4)))
+
+
+def _rule_en_weekday(m, today, original):
+    offset = _week_offset(m.group(3)) if m.group(3) else _week_offset(m.group(1))
+    return _weekday_date(today, _EN_WEEKDAYS[m.group(2)], offset)
+
+
+def _weekend(today, offset):
+    # Chủ nhật vẫn đang là cuối tuần này
+    if offset == 0 and today.weekday() == 6:
+        return today
+    return _weekday_date(today, 5, offset)
+
+
+def _rule_weekend(m, today, original):
+    return _weekend(today, _week_offset(m.group(1)) or 0)
+
+
+def _rule_en_weekend(m, today, original):
+    return _weekend(today, 1 if m.group(1) else 0)
+
+
+def _rule_month_anchor(m, today, original):
+    modifier = m.group(2)
+    if modifier and modifier.strip().isdigit():
+        month = int(modifier)
+        first = _future_day_month(today.replace(day=1), 1, month)
+        return _month_anchor(first, m.group(1), 0)
+    return _month_anchor(today, m.group(1), _month_offset(modifier))
+
+
+def _rule_en_month_anchor(m, today, original):
+    which = {"beginning": "dau", "start": "dau", "end": "cuoi", "middle": "giua"}[m.group(1)]
+    return _month_anchor(today, which, 1 if m.group(2) and "next" in m.group(2) else 0)
+
+
+def _rule_year_end(m, today, original):
+    return datetime.date(today.year, 12, 31)
+
+
+def _rule_relative_period(m, today, original):
+    unit, modifier = m.group(1) or m.group(4), m.group(2) or m.group(3)
+    offset = _week_offset(modifier)
+    if unit in ("tuan", "week"):
+        return today + datetime.timedelta(weeks=offset)
+    if unit in ("thang", "month"):
+        return add_months(today, offset)
+    return add_months(today, 12 * offset)
+
+
+_DATE_RULES = [
+    (re.compile(_B + r"(\d{4})-(\d{1,2})-(\d{1,2})" + _E), _rule_iso),
+    (re.compile(_B + r"(?:ngay\s+)?(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})" + _E), _rule_dmy),
+    (re.compile(_B + r"(?:ngay\s+)?(\d{1,2})/(\d{1,2})()" + _E), _rule_dmy),
+    (re.compile(_B + r"(?:ngay|mung|mong)\s+(\d{1,2})(?:\s+thang\s+(\d{1,2})(?:\s+nam\s+(\d{4}))?)?" + _E),
+     _rule_day_of_month),
+    (re.compile(_B + r"(?:hom nay|bua nay|today|tonight|(?:sang|trua|chieu|toi|dem) nay|"
+                r"ngay kia|ngay mot|mot|day after tomorrow|ngay mai|tomorrow|hom kia|hom qua|yesterday)" + _E),
+     _rule_relative_day),
+    (re.compile(r"(?:(?<=\d)(?:h|gio)\s*|(?:sang|trua|chieu|toi|dem)\s+|^\s*)(mai)" + _E), _rule_bare_mai),
+    (re.compile(_B + _NUM + r"\s+(ngay|tuan|thang|nam)\s+(?:nua|toi)" + _E), _rule_in_n),
+    (re.compile(_B + r"sau\s+" + _NUM + r"\s+(ngay|tuan|thang|nam)" + _E), _rule_in_n),
+    (re.compile(_B + r"in\s+" + _NUM + r"\s+(days?|weeks?|months?|years?)" + _E), _rule_in_n),
+    (re.compile(_B + _NUM + r"\s+(days?|weeks?|months?|years?)\s+(?:from now|later)" + _E), _rule_in_n),
+    (re.compile(_B + _NUM + r"\s+(ngay|tuan|thang|nam)\s+truoc" + _E), _rule_n_ago),
+    (re.compile(_B + _NUM + r"\s+(days?|weeks?|months?|years?)\s+ago" + _E), _rule_n_ago),
+    (re.compile(_B + r"(thu\s*(hai|ba|tu|nam|sau|bay|[2-7])|t([2-7])|chu nhat|cn)"
+                r"(\s+(?:tuan\s+(?:sau nua|sau|toi|nay|truoc)|nay|toi|sau|truoc))?" + _E), _rule_vi_weekday),
+    (re.compile(_B + r"(?:(next|this|last)\s+)?(" + "|".join(_EN_WEEKDAYS) + r")(\s+(?:next|this|last) week)?" + _E),
+     _rule_en_weekday),
+    (re.compile(_B + r"cuoi\s+tuan(\s+(?:sau|toi|nay|truoc))?" + _E), _rule_weekend),
+    (re.compile(_B + r"(?:this\s+|(next)\s+)?weekend" + _E), _rule_en_weekend),
+    (re.compile(_B + r"(cuoi|dau|giua)\s+thang(\s+(?:sau|toi|nay|truoc|\d{1,2}))?" + _E), _rule_month_anchor),
+    (re.compile(_B + r"(beginning|start|end|middle) of (the month|this month|next month|month)" + _E),
+     _rule_en_month_anchor),
+    (re.compile(_B + r"(?:cuoi nam|end of (?:the |this )?year)" + _E), _rule_year_end),
+    (re.compile(_B + r"(?:(tuan|thang|nam)\s+(sau|toi|truoc|nay)|(next|last|this)\s+(week|month|year))" + _E),
+     _rule_relative_period),
+]
+
+
+def find_date(text, today=None):
+    """
+    Tìm biểu thức ngày dài nhất trong văn bản
+
+    Biểu thức khớp nhưng là ngày không tồn tại ("ngày 30/2") không được dùng, và các
+    biểu thức ngắn hơn nằm trong nó ("ngày 30") cũng bị bỏ qua.
+
+    Returns:
+        tuple: (datetime.date, (vị trí đầu, vị trí cuối)) hoặc None
+    """
+    today = today or datetime.date.today()
+    original = unicodedata.normalize("NFC", text)
+    folded = fold(text)
+    found, invalid = [], []
+    for pattern, rule in _DATE_RULES:
+        for m in pattern.finditer(folded):
+            try:
+                value = rule(m, today, original)
+            except (ValueError, KeyError, OverflowError):
+                invalid.append(m.span())
+                continue
+            if value is not None:
+                found.append((value, m.span()))
+    best = None
+    for value, span in found:
+        if any(start < span[1] and span[0] < end and end - start >= span[1] - span[0] for start, end in invalid):
+            continue
+        if best is None or span[1] - span[0] > best[1][1] - best[1][0]:
+            best = (value, span)
+    return best
+
+
+_TIME_PATTERN = re.compile(
+    _B + r"(\d{1,2})\s*(?:(?:h|gio)(?![a-z])|:)\s*(?:(\d{1,2})(?:\s*(?:phut|p)(?![a-z]))?|(ruoi)(?![a-z]))?"
+    r"(?:\s*kem\s*(\d{1,2})(?:\s*(?:phut|p)(?![a-z]))?)?"
+    r"(?:\s*(?:buoi\s+)?" + _PERIOD + r"(?![a-z]))?")
+_EN_TIME_PATTERN = re.compile(_B + r"(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)")
+_NAMED_TIME_PATTERN = re.compile(_B + r"(noon|midnight|giua trua|nua dem)" + _E)
+_PERIOD_WORD_PATTERN = re.compile(r"(?<![\w])(sáng|trưa|chiều|tối|đêm)(?![\w])")
+
+
+def _apply_period(hour, period):
+    period = (period or "").replace(".", "")
+    if period in ("chieu", "toi", "pm", "chiều", "tối") and hour < 12:
+        return hour + 12
+    if period in ("trua", "trưa") and 1 <= hour <= 4:
+        return hour + 12
+    if period in ("dem", "đêm"):
+        return 0 if hour == 12 else (hour + 12 if 7 <= hour < 12 else hour)
+    if period in ("sang", "am", "sáng") and hour == 12:
+        return 0
+    return hour
+
+
+def find_time(text):
+    """
+    Tìm biểu thức giờ trong văn bản
+
+    Returns:
+        tuple: ("HH:MM", (vị trí đầu, vị trí cuối)) hoặc None
+    """
+    original = unicodedata.normalize("NFC", text).lower()
+    folded = fold(text)
+
+    m = _EN_TIME_PATTERN.search(folded)
+    if m:
+        hour, minute = int(m.group(1)), int(m.group(2) or 0)
+        if hour <= 12 and minute < 60:
+            return f"{_apply_period(hour, m.group(3)):02d}:{minute:02d}", m.span()
+
+    for m in _TIME_PATTERN.finditer(folded):
+        # "3 giờ nữa" là khoảng thời gian, không phải giờ
+        if re.match(r"\s*nua", folded[m.end():]):
+            continue
+        # "9.5" hay "3 ngày" không có h/giờ/: thì không phải giờ
+        hour = int(m.group(1))
+        minute = 30 if m.group(3) else int(m.group(2) or 0)
+        if m.group(4):
+            hour, minute = hour - 1, 60 - int(m.group(4))
+        period = m.group(5)
+        if period is None:
+            # Buổi trong ngày có thể đứng ở chỗ khác ("tối nay lúc 8 giờ"); cần có dấu để tránh nhầm "tới"/"tôi"
+            period_match = _PERIOD_WORD_PATTERN.search(original)
+            period = period_match.group(1) if period_match else None
+        hour = _apply_period(hour, period)
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            return f"{hour:02d}:{minute:02d}", m.span()
+
+    m = _NAMED_TIME_PATTERN.search(folded)
+    if m:
+        return ("00:00" if m.group(1) in ("midnight", "nua dem") else "12:00"), m.span()
+    return None
+
+
+def parse_date(text, today=None):
+    """Ngày (datetime.date) trong văn bản, hoặc None"""
+    found = find_date(text, today)
+    return found[0] if found else None
+
+
+def parse_time(text):
+    """Giờ dạng "HH:MM" trong văn bản, hoặc None"""
+    found = find_time(text)
+    return found[0] if found else None
+
+
+def is_iso_date(value):
+    return bool(re.fullmatch(r"\d{4}-\d{2}-\d{2}", value or ""))
+
+
+def is_hhmm(value):
+    return bool(re.fullmatch(r"\d{2}:\d{2}", value or ""))
+
+
+def format_date(day):
+    """Ngày dạng "Thứ Hai, 06/05/2024" để hiển thị"""
+    return f"{WEEKDAY_NAMES[day.weekday()]}, {day.strftime('%d/%m/%Y')}"
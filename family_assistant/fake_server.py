@@ -0,0 +1,419 @@
+"""
+Server giả lập cục bộ cho các API bên ngoài, dùng để kiểm thử và đo độ trễ
+đầu-cuối không cần mạng.
+
+Hỗ trợ phần API mà ứng dụng sử dụng:
+    POST /v1/chat/completions      (stream SSE, response_format json_object, usage)
+    POST /v1/audio/transcriptions  (Whisper)
+    POST /v1/audio/speech          (TTS)
+    POST /search, /extract         (Tavily)
+
+Chạy:
+    python -m family_assistant.fake_server --port 8765 \\
+        --latency chat=lognormal:-1.5,0.4 --latency search=uniform:0.3,0.8 \\
+        --tokens-per-second 60 --error-rate search=0.05 --seed 42
+
+Sau đó trỏ ứng dụng tới server:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+    TAVILY_BASE_URL=http://127.0.0.1:8765
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('family_assistant.fake_server')
+
+# Khung MP3 im lặng (MPEG-1 Layer III, 128kbps, 44.1kHz): header + dữ liệu rỗng
+_SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+_MP3_FRAME_SECONDS = 1152 / 44100
+
+# Các nhóm endpoint có thể cấu hình độ trễ và tỉ lệ lỗi riêng
+ENDPOINT_GROUPS = ["chat", "transcription", "speech", "search", "extract"]
+
+# Từ khóa để giả lập phân loại ý định tìm kiếm (detect_search_intent)
+SEARCH_KEYWORDS = ["tin", "giá", "kết quả", "thời tiết", "bxh", "lịch thi đấu", "mới nhất",
+                   "hôm nay", "tối qua", "news", "weather", "score", "price"]
+
+REPLY_WORDS = ("Dạ , mình đã xem thông tin của gia đình bạn . Cuối tuần này cả nhà có thể "
+               "cùng nhau đi dã ngoại , nhớ chuẩn bị đồ ăn nhẹ và nước uống nhé . "
+               "Nếu cần mình có thể thêm sự kiện vào lịch để không ai quên . "
+               "Chúc cả nhà một ngày vui vẻ !").split()
+
+BOILERPLATE = ("Trang chủ | Tin tức | Thể thao | Giải trí | Đăng nhập | Đăng ký\n"
+               "Chúng tôi sử dụng cookie để cải thiện trải nghiệm của bạn. Đồng ý\n"
+               "Bài viết liên quan: Xem thêm | Chia sẻ Facebook | Twitter\n")
+
+
+class LatencyModel:
+    """
+    Phân phối độ trễ (giây), khai báo dạng chuỗi:
+        "0.2" hoặc "fixed:0.2", "uniform:0.1,0.5",
+        "normal:0.3,0.05", "lognormal:-1.5,0.4"
+    """
+
+    def __init__(self, spec="fixed:0"):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value.strip()]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Phân phối độ trễ không hợp lệ: {spec}")
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "normal":
+            value = rng.gauss(self.params[0], self.params[1])
+        else:
+            value = rng.lognormvariate(self.params[0], self.params[1])
+        return max(0.0, value)
+
+
+class FakeServerConfig:
+    """Cấu hình độ trễ, tốc độ sinh token và lỗi giả lập cho từng nhóm endpoint"""
+
+    def __init__(self, latency=None, error_rate=None, error_status=500,
+                 tokens_per_second=50.0, reply_tokens=80, extract_chars=12000,
+                 transcript_text="Thêm sự kiện đi khám răng lúc 9 giờ sáng mai", seed=None):
+        self.latency = {group: LatencyModel() for group in ENDPOINT_GROUPS}
+        for group, spec in (latency or {}).items():
+            self.latency[group] = spec if isinstance(spec, LatencyModel) else LatencyModel(spec)
+        self.error_rate = {group: 0.0 for group in ENDPOINT_GROUPS}
+        self.error_rate.update(error_rate or {})
+        self.error_status = error_status
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.extract_chars = extract_chars
+        self.transcript_text = transcript_text
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.request_counts = {group: 0 for group in ENDPOINT_GROUPS}
+
+    def delay(self, group):
+        with self._rng_lock:
+            self.request_counts[group] += 1
+            return self.latency[group].sample(self._rng)
+
+    def should_fail(self, group):
+        rate = self.error_rate.get(group, 0.0)
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+
+def silent_wav(seconds, sample_rate=16000):
+    """Tạo file WAV PCM 16-bit mono im lặng"""
+    num_samples = int(seconds * sample_rate)
+    data_size = num_samples * 2
+    header = b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    header += b"data" + struct.pack("<I", data_size)
+    return header + b"\x00" * data_size
+
+
+def silent_mp3(seconds):
+    """Tạo chuỗi khung MP3 im lặng có độ dài xấp xỉ ``seconds``"""
+    return _SILENT_MP3_FRAME * max(1, int(seconds / _MP3_FRAME_SECONDS))
+
+
+def speech_duration(text, chars_per_second=15.0):
+    """Ước lượng thời lượng đọc một câu"""
+    return max(0.3, len(text) / chars_per_second)
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (khoảng 4 ký tự mỗi token)"""
+    return max(1, len(text) // 4)
+
+
+def _message_text(message):
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content or ""
+
+
+def _last_user_text(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return _message_text(message)
+    return ""
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "ket-qua"
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    """Xử lý các endpoint giả lập"""
+
+    server_version = "FamilyAssistantFake/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self):
+        try:
+            return json.loads(self._read_body() or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_bytes(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client đã hủy yêu cầu (ví dụ bản gửi lặp thua cuộc)
+            logger.debug("Client đã ngắt kết nối trước khi nhận phản hồi")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send_bytes(status, body, "application/json")
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": {"message": message, "type": "fake_error", "code": status}})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        routes = [
+            ("/chat/completions", "chat", self._handle_chat),
+            ("/audio/transcriptions", "transcription", self._handle_transcription),
+            ("/audio/speech", "speech", self._handle_speech),
+            ("/search", "search", self._handle_search),
+            ("/extract", "extract", self._handle_extract),
+        ]
+        for suffix, group, handler in routes:
+            if path.endswith(suffix):
+                delay = self.config.delay(group)
+                if self.config.should_fail(group):
+                    self._read_body()
+                    time.sleep(delay)
+                    return self._send_error(self.config.error_status, f"Lỗi giả lập cho {group}")
+                return handler(delay)
+        self._read_body()
+        self._send_error(404, f"Không hỗ trợ endpoint {path}")
+
+    # ------ OpenAI ------
+    def _handle_chat(self, delay):
+        payload = self._read_json()
+        messages = payload.get("messages", [])
+        model = payload.get("model", "gpt-4o-mini")
+        prompt_tokens = sum(estimate_tokens(_message_text(message)) for message in messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            tokens = [self._json_reply(messages)]
+        else:
+            max_tokens = payload.get("max_tokens") or self.config.reply_tokens
+            count = min(self.config.reply_tokens, max_tokens)
+            tokens = [REPLY_WORDS[idx % len(REPLY_WORDS)] + " " for idx in range(count)]
+        completion_tokens = sum(estimate_tokens(token) for token in tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+        # delay đóng vai trò thời gian tới token đầu tiên
+        time.sleep(delay)
+        per_token = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+        if not payload.get("stream"):
+            time.sleep(per_token * len(tokens))
+            return self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_chunk(choices, chunk_usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+            }
+            if include_usage:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            send_chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for idx, token in enumerate(tokens):
+                if idx:
+                    time.sleep(per_token)
+                send_chunk([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                send_chunk([], usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client đã ngắt kết nối khi đang stream")
+
+    def _json_reply(self, messages):
+        """Trả lời JSON giả lập cho các lời gọi phân loại (ví dụ detect_search_intent)"""
+        query = _last_user_text(messages)
+        match = re.search(r'"(.*)"', query, re.DOTALL)
+        if match:
+            query = match.group(1)
+        need_search = any(keyword in query.lower() for keyword in SEARCH_KEYWORDS)
+        return json.dumps({"need_search": need_search, "search_query": query if need_search else ""},
+                          ensure_ascii=False)
+
+    def _handle_transcription(self, delay):
+        self._read_body()
+        time.sleep(delay)
+        self._send_json(200, {"text": self.config.transcript_text})
+
+    def _handle_speech(self, delay):
+        payload = self._read_json()
+        text = payload.get("input", "")
+        audio_format = payload.get("response_format", "mp3")
+        time.sleep(delay)
+
+        seconds = speech_duration(text)
+        if audio_format == "wav":
+            self._send_bytes(200, silent_wav(seconds), "audio/wav")
+        else:
+            self._send_bytes(200, silent_mp3(seconds), "audio/mpeg")
+
+    # ------ Tavily ------
+    def _handle_search(self, delay):
+        payload = self._read_json()
+        query = payload.get("query", "")
+        max_results = int(payload.get("max_results") or 5)
+        time.sleep(delay)
+        slug = _slug(query)
+        results = [{
+            "title": f"{query} - nguồn {idx + 1}",
+            "url": f"https://news{idx + 1}.example.local/{slug}",
+            "content": f"Tóm tắt kết quả {idx + 1} cho truy vấn '{query}'.",
+            "score": round(1.0 - idx * 0.1, 2),
+        } for idx in range(max_results)]
+        self._send_json(200, {"query": query, "results": results, "response_time": round(delay, 3)})
+
+    def _handle_extract(self, delay):
+        payload = self._read_json()
+        urls = payload.get("urls", [])
+        if isinstance(urls, str):
+            urls = [urls]
+        time.sleep(delay)
+        results = [{"url": url, "raw_content": self._page_content(url)} for url in urls]
+        self._send_json(200, {"results": results, "failed_results": []})
+
+    def _page_content(self, url):
+        paragraph = (f"Nội dung chi tiết từ {url}. " + " ".join(REPLY_WORDS) + "\n")
+        body = BOILERPLATE
+        while len(body) < self.config.extract_chars:
+            body += paragraph
+        return (body + BOILERPLATE)[:self.config.extract_chars]
+
+
+def create_server(host="127.0.0.1", port=8765, config=None):
+    """Tạo server giả lập (chưa chạy); port=0 để hệ điều hành tự chọn cổng"""
+    server = ThreadingHTTPServer((host, port), FakeAPIHandler)
+    server.daemon_threads = True
+    server.config = config or FakeServerConfig()
+    return server
+
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """Chạy server trong một luồng nền, trả về (server, base_url của OpenAI, base_url của Tavily)"""
+    server = create_server(host, port, config)
+    threading.Thread(target=server.serve_forever, name="fake-api", daemon=True).start()
+    root = f"http://{host}:{server.server_port}"
+    return server, f"{root}/v1", root
+
+
+def parse_group_options(values, cast):
+    options = {}
+    for value in values or []:
+        group, _, spec = value.partition("=")
+        if group not in ENDPOINT_GROUPS or not spec:
+            raise argparse.ArgumentTypeError(f"Cần dạng <nhóm>=<giá trị> với nhóm thuộc {ENDPOINT_GROUPS}: {value}")
+        options[group] = cast(spec)
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập OpenAI và Tavily cục bộ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", metavar="GROUP=SPEC",
+                        help="Phân phối độ trễ, ví dụ chat=lognormal:-1.5,0.4 (lặp lại được)")
+    parser.add_argument("--error-rate", action="append", metavar="GROUP=RATE",
+                        help="Tỉ lệ lỗi giả lập 0..1, ví dụ search=0.1 (lặp lại được)")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=80)
+    parser.add_argument("--extract-chars", type=int, default=12000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeServerConfig(
+        latency=parse_group_options(args.latency, LatencyModel),
+        error_rate=parse_group_options(args.error_rate, float),
+        error_status=args.error_status,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        extract_chars=args.extract_chars,
+        seed=args.seed,
+    )
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.host, args.port, config)
+    logger.info(f"Server giả lập đang chạy: OPENAI_BASE_URL=http://{args.host}:{server.server_port}/v1 "
+                f"TAVILY_BASE_URL=http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
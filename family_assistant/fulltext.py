@@ -0,0 +1,281 @@
+"""
+Tìm kiếm toàn văn trong ghi chú, sự kiện và lịch sử trò chuyện.
+
+Mỗi kho dữ liệu có một chỉ mục đảo (từ -> tài liệu chứa từ đó) được dựng ở lần
+tìm đầu tiên và cập nhật dần: kho báo các bản ghi bị đổi qua
+``HouseholdStore.add_listener``, chỉ mục chỉ ghi nhận ID rồi đánh chỉ mục lại
+đúng các bản ghi đó ở lần tìm kế tiếp (không làm việc khi kho đang giữ khóa ghi).
+
+- Từ được bỏ dấu và viết thường ("bánh" khớp "banh", "Bánh")
+- Mỗi từ của câu tìm khớp đúng từ đó hoặc các từ bắt đầu bằng nó ("sinh nh" khớp "sinh nhật")
+- Xếp hạng BM25; khớp đúng được điểm cao hơn khớp tiền tố, tiêu đề được tính gấp đôi,
+  tài liệu chứa đủ mọi từ của câu tìm được xếp trước
+
+Tài liệu: mỗi sự kiện, mỗi ghi chú và mỗi cuộc trò chuyện đã lưu (tóm tắt và nội dung
+tin nhắn, đọc từ kho lưu trữ một lần khi đánh chỉ mục). Cuộc trò chuyện chỉ hiện trong
+kết quả tìm của chính thành viên đó.
+"""
+import bisect
+import collections
+import logging
+import math
+import re
+import threading
+import weakref
+
+from family_assistant import dates
+from family_assistant.passages import STOPWORDS
+
+logger = logging.getLogger('family_assistant.fulltext')
+
+KINDS = ("event", "note", "chat")
+_COLLECTION_KINDS = {"events": "event", "notes": "note", "chat_history": "chat"}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.6
+MAX_PREFIX_TERMS = 50
+# Phần văn bản giữ lại để trích đoạn hiển thị (toàn bộ văn bản vẫn được đánh chỉ mục)
+MAX_STORED_TEXT = 20000
+SNIPPET_CHARS = 160
+
+_WORD = re.compile(r"\w+")
+
+
+def tokens(text):
+    """Các từ đã bỏ dấu, viết thường của một đoạn văn bản"""
+    return _WORD.findall(dates.fold(text))
+
+
+def _message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts += [part.get("text", "") for part in content if part.get("type") == "text"]
+        elif isinstance(content, str):
+            parts.append(content)
+    return "\n".join(parts)
+
+
+class SearchIndex:
+    """Chỉ mục đảo của một kho dữ liệu, cập nhật theo các thay đổi của kho"""
+
+    def __init__(self, store):
+        self._store = weakref.ref(store)
+        self._lock = threading.Lock()  # Đánh chỉ mục/tìm kiếm
+        self._pending_lock = threading.Lock()  # Chỉ giữ rất ngắn, kể cả khi kho đang giữ khóa ghi
+        self._pending = {}
+        self._built = False
+        self._postings = {}  # từ -> {khóa tài liệu: số lần xuất hiện}
+        self._vocabulary = []  # các từ đã sắp xếp, để tìm theo tiền tố
+        self._docs = {}  # khóa tài liệu -> thông tin tài liệu
+        self._records = {}  # (tập dữ liệu, ID bản ghi) -> khóa các tài liệu của bản ghi
+        self._total_length = 0
+        store.add_listener(self._on_change)
+
+    def _on_change(self, store, collection, ids):
+        # Gọi khi kho đang giữ khóa ghi: chỉ ghi nhận
+        if collection not in _COLLECTION_KINDS:
+            return
+        with self._pending_lock:
+            if ids is None or (collection in self._pending and self._pending[collection] is None):
+                self._pending[collection] = None
+            else:
+                self._pending.setdefault(collection, set()).update(ids)
+
+    # ------ Đánh chỉ mục ------
+    def _add_doc(self, key, record, doc):
+        terms = collections.Counter(tokens(doc["text"]))
+        terms.update(tokens(doc["title"]) * 2)  # Tiêu đề được tính gấp đôi
+        if not terms:
+            return
+        for term, count in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[key] = count
+        doc["terms"] = list(terms)
+        doc["length"] = sum(terms.values())
+        doc["text"] = doc["text"][:MAX_STORED_TEXT]
+        self._docs[key] = doc
+        self._records.setdefault(record, []).append(key)
+        self._total_length += doc["length"]
+
+    def _remove_doc(self, key):
+        doc = self._docs.pop(key)
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def _remove_record(self, record):
+        for key in self._records.pop(record, ()):
+            self._remove_doc(key)
+
+    def _index_record(self, store, collection, record_id, value):
+        record = (collection, record_id)
+        if collection == "chat_history":
+            self._index_chats(store, record_id, value if isinstance(value, list) else [])
+            return
+        self._remove_record(record)
+        if not isinstance(value, dict):
+            return
+        if collection == "events":
+            text = "\n".join([value.get("description", ""), " ".join(map(str, value.get("participants", [])))])
+            date = value.get("date", "")
+        else:
+            text = "\n".join([value.get("content", ""), " ".join(map(str, value.get("tags", [])))])
+            date = value.get("created_on", "")
+        self._add_doc((_COLLECTION_KINDS[collection], record_id), record, {
+            "kind": _COLLECTION_KINDS[collection], "id": record_id, "member_id": value.get("created_by", ""),
+            "title": str(value.get("title", "")), "text": str(text), "date": date})
+
+    def _index_chats(self, store, member_id, entries):
+        """Đánh chỉ mục các cuộc trò chuyện của một thành viên; cuộc trò chuyện đã có không đọc lại"""
+        record = ("chat_history", member_id)
+        current = {}
+        for entry in entries:
+            if isinstance(entry, dict):
+                current[entry.get("id") or f"{member_id}:{entry.get('timestamp', '')}"] = entry
+        kept = []
+        for key in self._records.pop(record, ()):
+            if key[1] in current:
+                kept.append(key)
+            else:
+                self._remove_doc(key)
+        if kept:
+            self._records[record] = kept
+        for conversation_id, entry in current.items():
+            if ("chat", conversation_id) in self._docs:
+                continue
+            try:
+                text = _message_text(store.load_conversation(entry) or [])
+            except Exception as e:
+                logger.warning(f"Không đọc được cuộc trò chuyện {conversation_id} để đánh chỉ mục: {e}")
+                text = ""
+            self._add_doc(("chat", conversation_id), record, {
+                "kind": "chat", "id": conversation_id, "member_id": member_id,
+                "title": entry.get("summary", ""), "text": text, "date": entry.get("timestamp", "")})
+
+    def refresh(self):
+        """Áp dụng các thay đổi đã ghi nhận (hoặc dựng chỉ mục lần đầu)"""
+        store = self._store()
+        if store is None:
+            return
+        with self._lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                if not self._built:
+                    pending = dict.fromkeys(_COLLECTION_KINDS)
+                    self._built = True
+            if not pending:
+                return
+            with store.read():
+                snapshots = {collection: store.collection(collection) for collection in pending}
+            for collection, ids in pending.items():
+                data = snapshots[collection]
+                if ids is None:
+                    for record in [record for record in self._records if record[0] == collection]:
+                        if record[1] not in data:
+                            self._remove_record(record)
+                    ids = data.keys()
+                for record_id in ids:
+                    self._index_record(store, collection, record_id, data.get(record_id))
+
+    # ------ Tìm kiếm ------
+    def _expand(self, token):
+        """Các từ khớp với một từ của câu tìm: (từ, trọng số)"""
+        expansions = [(token, 1.0)] if token in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, token)
+        for term in self._vocabulary[start:start + MAX_PREFIX_TERMS + 1]:
+            if not term.startswith(token):
+                break
+            if term != token:
+                expansions.append((term, PREFIX_WEIGHT))
+        return expansions
+
+    def _snippet(self, doc, terms):
+        text = doc["text"] or doc["title"]
+        folded = dates.fold(text)
+        m = re.search(r"(?<!\w)(" + "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + ")",
+                      folded) if terms else None
+        start = max(0, m.start() - SNIPPET_CHARS // 4) if m else 0
+        snippet = " ".join(text[start:start + SNIPPET_CHARS].split())
+        return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+    def search(self, query, member_id=None, kinds=KINDS, limit=10):
+        """
+        Tìm các tài liệu khớp với câu tìm
+
+        Returns:
+            list: ``{"kind", "id", "title", "snippet", "date", "member_id", "score"}``, điểm giảm dần
+        """
+        self.refresh()
+        query_tokens = list(dict.fromkeys(tokens(query)))
+        query_tokens = [token for token in query_tokens if token not in STOPWORDS] or query_tokens
+        if not query_tokens:
+            return []
+
+        def allowed(doc):
+            if doc["kind"] not in kinds:
+                return False
+            return doc["kind"] != "chat" or (member_id is not None and doc["member_id"] == member_id)
+
+        with self._lock:
+            if not self._docs:
+                return []
+            average_length = self._total_length / len(self._docs)
+            norms = {}
+            scores = collections.defaultdict(float)
+            matched = collections.defaultdict(int)
+            matched_terms = collections.defaultdict(set)
+            for token in query_tokens:
+                expansions = self._expand(token)
+                # Các từ khớp tiền tố được coi như một từ chung (idf theo tổng số tài liệu chứa
+                # chúng), để một từ hiếm bắt đầu bằng từ cần tìm không vượt lên trên từ khớp đúng
+                prefix_frequency = sum(len(self._postings[term]) for term, _ in expansions)
+                best = {}
+                for term, weight in expansions:
+                    postings = self._postings[term]
+                    frequency = len(postings) if weight == 1.0 else prefix_frequency
+                    idf = weight * math.log(1 + (len(self._docs) - frequency + 0.5) / (frequency + 0.5))
+                    for key, count in postings.items():
+                        norm = norms.get(key)
+                        if norm is None:
+                            norm = norms[key] = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[key]["length"] / average_length)
+                        score = idf * count * (BM25_K1 + 1) / (count + norm)
+                        if score > best.get(key, (0, None))[0]:
+                            best[key] = (score, term)
+                for key, (score, term) in best.items():
+                    scores[key] += score
+                    matched[key] += 1
+                    matched_terms[key].add(term)
+            ranked = sorted((key for key in scores if allowed(self._docs[key])),
+                            key=lambda key: (-matched[key], -scores[key]))[:limit]
+            return [{"kind": self._docs[key]["kind"], "id": self._docs[key]["id"],
+                     "title": self._docs[key]["title"], "snippet": self._snippet(self._docs[key], matched_terms[key]),
+                     "date": self._docs[key]["date"], "member_id": self._docs[key]["member_id"],
+                     "score": round(scores[key], 3)}
+                    for key in ranked]
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def index_for(store):
+    """Chỉ mục tìm kiếm của một kho dữ liệu (tạo và đăng ký theo dõi thay đổi khi cần)"""
+    with _indexes_lock:
+        index = _indexes.get(store)
+        if index is None:
+            index = _indexes[store] = SearchIndex(store)
+        return index
+
+
+def search(store, query, member_id=None, kinds=KINDS, limit=10):
+    """Tìm trong ghi chú, sự kiện và lịch sử trò chuyện (của ``member_id``) của một kho dữ liệu"""
+    return index_for(store).search(query, member_id, kinds, limit)
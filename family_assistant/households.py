@@ -0,0 +1,146 @@
+"""
+Nhiều hộ gia đình trên một tiến trình.
+
+Mỗi hộ gia đình có thư mục dữ liệu riêng (``HOUSEHOLDS_DIR/<household_id>``) và
+một ``HouseholdStore`` riêng, nên dữ liệu của gia đình này không bao giờ lọt vào
+prompt của gia đình khác. Kho dữ liệu chỉ được tải khi có truy cập lần đầu và
+được giữ trong một LRU có giới hạn; khi bị loại khỏi LRU, các thay đổi chưa ghi
+được ghi ra file. Bộ nhớ vì vậy tỉ lệ với số hộ gia đình đang hoạt động.
+Việc ghi file của mọi hộ do luồng ghi nền dùng chung đảm nhận (xem store).
+"""
+import logging
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+from family_assistant import reminders
+from family_assistant.store import DEFAULT_HOUSEHOLD, HouseholdStore, get_writer
+
+logger = logging.getLogger('family_assistant.households')
+
+HOUSEHOLDS_DIR = os.getenv("HOUSEHOLDS_DIR", "households")
+# Hộ gia đình mặc định dùng thư mục dữ liệu cũ để không phải di chuyển dữ liệu
+DEFAULT_HOUSEHOLD_DIR = os.getenv("FAMILY_DATA_DIR", ".")
+MAX_LOADED_HOUSEHOLDS = int(os.getenv("MAX_LOADED_HOUSEHOLDS", "64"))
+# Thời gian tối đa (giây) chờ ghi dữ liệu của một hộ bị loại khỏi bộ nhớ
+EVICTION_FLUSH_TIMEOUT = 10.0
+
+_HOUSEHOLD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def normalize_household_id(household_id):
+    """Kiểm tra ID hộ gia đình (dùng làm tên thư mục nên chỉ cho phép chữ, số, '-' và '_')"""
+    household_id = (household_id or DEFAULT_HOUSEHOLD).strip()
+    if not _HOUSEHOLD_ID_PATTERN.match(household_id):
+        raise ValueError(f"ID hộ gia đình không hợp lệ: {household_id!r}")
+    return household_id
+
+
+class HouseholdRegistry:
+    """LRU các kho dữ liệu hộ gia đình đã tải, an toàn đa luồng"""
+
+    def __init__(self, base_dir=HOUSEHOLDS_DIR, max_loaded=MAX_LOADED_HOUSEHOLDS,
+                 default_dir=DEFAULT_HOUSEHOLD_DIR):
+        self.base_dir = base_dir
+        self.max_loaded = max(1, max_loaded)
+        self.default_dir = default_dir
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()
+        # Kho đã bị loại khỏi LRU nhưng vẫn đang được dùng (ví dụ một lượt trò
+        # chuyện chưa xong) được dùng lại thay vì tải bản thứ hai từ file
+        self._live = weakref.WeakValueDictionary()
+        # Khóa tải của các hộ gia đình đang được tải (ID -> threading.Lock)
+        self._loading = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def data_dir(self, household_id):
+        if household_id == DEFAULT_HOUSEHOLD:
+            return self.default_dir
+        return os.path.join(self.base_dir, household_id)
+
+    def get(self, household_id=None):
+        """
+        Kho dữ liệu của một hộ gia đình (tải khi cần lần đầu)
+
+        Việc tải (đọc file, kiểm tra dữ liệu) chạy ngoài khóa chung của registry, dưới khóa
+        riêng của hộ gia đình đó: tải một hộ lớn không chặn các hộ khác, và các yêu cầu đồng
+        thời cho cùng một hộ chờ một lần tải duy nhất.
+        """
+        household_id = normalize_household_id(household_id)
+        with self._lock:
+            store = self._loaded.get(household_id)
+            if store is not None:
+                self._loaded.move_to_end(household_id)
+                return store
+            store = self._live.get(household_id)
+            if store is None:
+                loading = self._loading.get(household_id)
+                if loading is None:
+                    loading = self._loading[household_id] = threading.Lock()
+            else:
+                evicted = self._publish(household_id, store)
+
+        if store is None:
+            with loading:
+                with self._lock:
+                    # Yêu cầu khác có thể đã tải xong trong lúc chờ
+                    store = self._loaded.get(household_id) or self._live.get(household_id)
+                if store is None:
+                    store = self._load(household_id)
+                with self._lock:
+                    evicted = self._publish(household_id, store)
+                    if self._loading.get(household_id) is loading:
+                        del self._loading[household_id]
+
+        # Ghi các thay đổi của kho bị loại bên ngoài khóa để không chặn hộ gia đình khác.
+        # Thay đổi muộn (từ lượt trò chuyện còn dang dở) vẫn được luồng ghi nền ghi tiếp
+        for evicted_id, evicted_store in evicted:
+            if not evicted_store.flush(EVICTION_FLUSH_TIMEOUT):
+                logger.error(f"Không thể ghi dữ liệu của hộ gia đình {evicted_id} khi loại khỏi bộ nhớ")
+        return store
+
+    def _load(self, household_id):
+        """Tải kho dữ liệu của một hộ gia đình; chạy ngoài khóa chung"""
+        store = HouseholdStore(self.data_dir(household_id), household_id)
+        store.verify_data_structure()
+        logger.info(f"Đã tải hộ gia đình {household_id} từ {store.data_dir}")
+        if reminders.REMINDERS_ENABLED:
+            reminders.get_scheduler().watch(store)
+        return store
+
+    def _publish(self, household_id, store):
+        """Đưa kho vào LRU, trả về các kho bị loại; cần giữ ``_lock``"""
+        if self._live.get(household_id) is not store:
+            self._live[household_id] = store
+            self.loads += 1
+        self._loaded[household_id] = store
+        self._loaded.move_to_end(household_id)
+        evicted = []
+        while len(self._loaded) > self.max_loaded:
+            evicted.append(self._loaded.popitem(last=False))
+            self.evictions += 1
+        return evicted
+
+    def loaded_ids(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def flush_all(self, timeout=None):
+        """Ghi mọi thay đổi chưa ghi của các kho còn trong bộ nhớ"""
+        return get_writer().flush(timeout=timeout)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Registry dùng chung của tiến trình (giữ nguyên qua các lần Streamlit chạy lại script)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = HouseholdRegistry()
+        return _registry
@@ -0,0 +1,467 @@
+"""
+Nhập/xuất lịch iCalendar (.ics, RFC 5545).
+
+Nhập: file được đọc từng dòng (gộp các dòng bị gập), mỗi VEVENT được chuyển
+thành một sự kiện ngay khi đọc xong nên không cần giữ cả tài liệu trong bộ nhớ.
+Người tham dự (ATTENDEE/ORGANIZER) được ghép với thành viên gia đình theo tên
+hiển thị (CN) hoặc phần tên của email. Toàn bộ sự kiện được thêm bằng một lần
+cập nhật và một lần ghi file (``HouseholdStore.add_events``). Sự kiện có UID đã
+nhập trước đó được bỏ qua, nên nhập lại cùng một file không tạo bản trùng; UID do chính
+bản xuất sinh ra (``<ID>-<hộ gia đình>@family-assistant``, xem ``event_uid``) cũng được nhận
+ra, nên nhập lại file đã xuất vào cùng hộ gia đình không thêm lại sự kiện nào.
+
+Hỗ trợ: SUMMARY, DESCRIPTION, LOCATION, DTSTART/DTEND/DURATION (ngày hoặc ngày giờ,
+UTC hoặc TZID được đổi sang giờ máy), RRULE (FREQ/INTERVAL/COUNT/UNTIL/BYDAY),
+EXDATE và VALARM (TRIGGER trước giờ bắt đầu -> ``reminders``).
+
+Xuất: ``iter_ics`` sinh lần lượt từng dòng (đã gập ở 75 byte, kết thúc CRLF) từ
+bản chụp ``events_data``; ``export_ics`` ghi thẳng ra file.
+
+Chạy:
+    python -m family_assistant.ical import lich.ics --data-dir .
+    python -m family_assistant.ical export lich.ics --data-dir . --member-id 1
+"""
+import argparse
+import datetime
+import logging
+import re
+import unicodedata
+
+from family_assistant import dates, records, recurrence
+
+logger = logging.getLogger('family_assistant.ical')
+
+PRODID = "-//Tro ly Gia dinh//family_assistant//VI"
+ICAL_CONTENT_TYPE = "text/calendar; charset=utf-8"
+_WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+_FREQUENCIES = {"DAILY": "daily", "WEEKLY": "weekly", "MONTHLY": "monthly", "YEARLY": "yearly"}
+_DURATION_PATTERN = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_ESCAPES = {"n": "\n", "N": "\n", ",": ",", ";": ";", "\\": "\\"}
+
+
+def unfold_lines(stream):
+    """Các dòng nội dung đã gộp dòng gập (dòng bắt đầu bằng khoảng trắng/tab nối vào dòng trước)"""
+    current = None
+    for raw in stream:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _split_unquoted(text, separator, maxsplit=-1):
+    parts, start, quoted = [], 0, False
+    for index, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif char == separator and not quoted and maxsplit != 0:
+            parts.append(text[start:index])
+            start = index + 1
+            maxsplit -= 1
+    parts.append(text[start:])
+    return parts
+
+
+def parse_line(line):
+    """
+    Tách một dòng nội dung "NAME;PARAM=VALUE:giá trị"
+
+    Returns:
+        tuple: (tên viết hoa, dict tham số viết hoa, giá trị) hoặc None nếu không hợp lệ
+    """
+    parts = _split_unquoted(line, ":", maxsplit=1)
+    if len(parts) != 2:
+        return None
+    head, value = parts
+    name, *raw_params = _split_unquoted(head, ";")
+    params = {}
+    for raw in raw_params:
+        key, _, param_value = raw.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def unescape(value):
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def escape(value):
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def parse_datetime(value, params=None):
+    """
+    Giá trị DTSTART/DTEND/EXDATE
+
+    Returns:
+        tuple: (datetime.date, "HH:MM" hoặc "" nếu cả ngày) hoặc None
+    """
+    params = params or {}
+    value = value.strip()
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.datetime.strptime(value[:8], "%Y%m%d").date(), ""
+        moment = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    except ValueError:
+        return None
+    if value.endswith("Z"):
+        moment = moment.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    elif params.get("TZID"):
+        try:
+            from zoneinfo import ZoneInfo
+
+            moment = moment.replace(tzinfo=ZoneInfo(params["TZID"])).astimezone().replace(tzinfo=None)
+        except Exception:
+            pass  # Múi giờ không nhận ra: giữ nguyên giờ ghi trên lịch
+    return moment.date(), moment.strftime("%H:%M")
+
+
+def parse_duration(value):
+    """Số phút của một DURATION ("PT1H30M", "-P1D"); âm nếu trước mốc, None nếu không hợp lệ"""
+    m = _DURATION_PATTERN.match(value.strip().upper())
+    if not m or not any(m.groups()[1:]):
+        return None
+    weeks, days, hours, minutes, seconds = (int(group or 0) for group in m.groups()[1:])
+    total = ((weeks * 7 + days) * 24 + hours) * 60 + minutes + seconds // 60
+    return -total if m.group(1) == "-" else total
+
+
+def parse_rrule(value):
+    """Quy tắc RRULE -> quy tắc lặp của recurrence (đã chuẩn hóa) hoặc None"""
+    parts = dict(part.partition("=")[::2] for part in value.upper().split(";") if "=" in part)
+    freq = _FREQUENCIES.get(parts.get("FREQ"))
+    if freq is None:
+        return None
+    rule = {"freq": freq, "interval": parts.get("INTERVAL") or 1}
+    if parts.get("COUNT"):
+        rule["count"] = parts["COUNT"]
+    if parts.get("UNTIL"):
+        until = parse_datetime(parts["UNTIL"])
+        if until:
+            rule["until"] = until[0].isoformat()
+    if freq == "weekly" and parts.get("BYDAY"):
+        # Bỏ tiền tố số thứ tự ("1MO") vốn chỉ có nghĩa với lịch hằng tháng/năm
+        codes = [code.lstrip("+-0123456789") for code in parts["BYDAY"].split(",")]
+        rule["byweekday"] = [_WEEKDAY_CODES.index(code) for code in codes if code in _WEEKDAY_CODES]
+    return recurrence.normalize_rule(rule)
+
+
+def _name_key(name):
+    return unicodedata.normalize("NFC", str(name)).strip().lower()
+
+
+class MemberMatcher:
+    """Ghép người tham dự trong lịch với thành viên gia đình"""
+
+    def __init__(self, family_data):
+        self._by_name = {}
+        self._by_folded = {}
+        for member_id, member in family_data.items():
+            if isinstance(member, dict) and member.get("name"):
+                self._by_name[_name_key(member["name"])] = (member_id, member["name"])
+                self._by_folded.setdefault(re.sub(r"[\W_]", "", dates.fold(member["name"])), (member_id, member["name"]))
+
+    def match(self, params, value):
+        """(ID thành viên, tên thành viên) của một ATTENDEE/ORGANIZER, hoặc None"""
+        if params.get("CN"):
+            found = self._by_name.get(_name_key(params["CN"]))
+            if found:
+                return found
+            found = self._by_folded.get(re.sub(r"[\W_]", "", dates.fold(params["CN"])))
+            if found:
+                return found
+        address = value.split(":", 1)[-1] if value.lower().startswith("mailto:") else ""
+        if address:
+            return self._by_folded.get(re.sub(r"[\W_]", "", dates.fold(address.split("@")[0])))
+        return None
+
+    @staticmethod
+    def display_name(params, value):
+        if params.get("CN"):
+            return params["CN"]
+        return value.split(":", 1)[-1] if value.lower().startswith("mailto:") else value
+
+
+def _event_details(properties, alarms, matcher, created_by):
+    """Thông tin sự kiện (cho ``HouseholdStore.add_events``) từ các thuộc tính của một VEVENT"""
+    start = None
+    participants, others = [], []
+    details = {"created_by": created_by or ""}
+    exceptions = []
+    description = ""
+    location = ""
+    end = duration = None
+    for name, params, value in properties:
+        if name == "SUMMARY":
+            details["title"] = unescape(value)
+        elif name == "DESCRIPTION":
+            description = unescape(value)
+        elif name == "LOCATION":
+            location = unescape(value)
+        elif name == "UID":
+            details["uid"] = value
+        elif name == "DTSTART":
+            start = parse_datetime(value, params)
+        elif name == "DTEND":
+            end = parse_datetime(value, params)
+        elif name == "DURATION":
+            duration = parse_duration(value)
+        elif name == "RRULE":
+            details["recurrence"] = parse_rrule(value)
+        elif name == "EXDATE":
+            exceptions += [day for day in (parse_datetime(item, params) for item in value.split(",")) if day]
+        elif name == "ATTENDEE":
+            member = matcher.match(params, value)
+            if member:
+                if member[1] not in participants:
+                    participants.append(member[1])
+            else:
+                others.append(matcher.display_name(params, value))
+        elif name == "ORGANIZER":
+            member = matcher.match(params, value)
+            if member:
+                details["created_by"] = member[0]
+    if start is None:
+        return None
+
+    day, time_text = start
+    details["date"], details["time"] = day.isoformat(), time_text
+    details.setdefault("title", "Sự kiện")
+    details["participants"] = participants
+    if time_text:
+        if duration is None and end is not None and end[1]:
+            moment = datetime.datetime.combine(day, datetime.time.fromisoformat(time_text))
+            duration = int((datetime.datetime.combine(end[0], datetime.time.fromisoformat(end[1]))
+                            - moment).total_seconds() // 60)
+        if duration and duration > 0:
+            details["duration"] = duration
+    if details.get("recurrence") and exceptions:
+        details["recurrence"]["exceptions"] = sorted({exception[0].isoformat() for exception in exceptions})
+    if alarms:
+        details["reminders"] = sorted(set(alarms))
+    lines = [description] if description else []
+    if location:
+        lines.append(f"Địa điểm: {location}")
+    if others:
+        lines.append(f"Người tham dự khác: {', '.join(others)}")
+    details["description"] = "\n".join(lines)
+    return details
+
+
+def iter_events(stream, family_data=None, created_by=None):
+    """
+    Đọc dần các VEVENT trong một luồng văn bản .ics
+
+    Yields:
+        dict: Thông tin sự kiện theo định dạng của ``HouseholdStore.add_event``, hoặc None
+        với sự kiện không đọc được (thiếu/sai DTSTART)
+    """
+    matcher = MemberMatcher(family_data or {})
+    stack = []
+    properties, alarms, trigger = [], [], None
+    for line in unfold_lines(stream):
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        name, params, value = parsed
+        if name == "BEGIN":
+            stack.append(value.upper())
+            if stack[-1] == "VEVENT":
+                properties, alarms = [], []
+            elif stack[-1] == "VALARM":
+                trigger = None
+        elif name == "END":
+            component = stack.pop() if stack else None
+            if component == "VALARM" and trigger is not None:
+                alarms.append(trigger)
+            elif component == "VEVENT":
+                try:
+                    details = _event_details(properties, alarms, matcher, created_by)
+                except Exception as e:
+                    logger.warning(f"Bỏ qua sự kiện không đọc được trong file lịch: {e}")
+                    details = None
+                yield details
+        elif stack and stack[-1] == "VEVENT":
+            properties.append((name, params, value))
+        elif stack and stack[-1] == "VALARM" and len(stack) > 1 and stack[-2] == "VEVENT" and name == "TRIGGER":
+            # Chỉ nhận nhắc trước giờ bắt đầu ("-PT15M"), bỏ qua mốc tuyệt đối / tính từ giờ kết thúc
+            minutes = parse_duration(value) if params.get("VALUE") != "DATE-TIME" else None
+            if minutes is not None and minutes <= 0 and params.get("RELATED", "START") == "START":
+                trigger = -minutes
+
+
+def import_ics(store, stream, created_by=None):
+    """
+    Nhập các sự kiện từ một luồng văn bản .ics vào kho dữ liệu
+
+    Returns:
+        dict: {"added": số sự kiện mới, "skipped": đã có (cùng UID), "invalid": không đọc được}
+    """
+    with store.read():
+        known_uids = {event_uid(event_id, event, store.household_id)
+                      for event_id, event in store.events_data.items() if isinstance(event, dict)}
+        family_data = store.family_data
+    batch, skipped, invalid = [], 0, 0
+    for details in iter_events(stream, family_data, created_by):
+        if details is not None:
+            try:
+                records.validate("events", details)
+            except records.ValidationError as e:
+                logger.warning(f"Bỏ qua sự kiện không hợp lệ trong file lịch: {e}")
+                details = None
+        if details is None:
+            invalid += 1
+        elif details.get("uid") in known_uids:
+            skipped += 1
+        else:
+            if details.get("uid"):
+                known_uids.add(details["uid"])
+            batch.append(details)
+    store.add_events(batch)
+    logger.info(f"Đã nhập lịch cho hộ gia đình {store.household_id}: thêm {len(batch)}, "
+                f"bỏ qua {skipped} sự kiện đã có, {invalid} sự kiện lỗi")
+    return {"added": len(batch), "skipped": skipped, "invalid": invalid}
+
+
+def fold_line(line):
+    """Gập một dòng nội dung dài hơn 75 byte (RFC 5545 3.1), không cắt giữa ký tự UTF-8"""
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = "", 0, 74  # Dòng tiếp theo bắt đầu bằng một khoảng trắng
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_rrule(rule, timed):
+    parts = [f"FREQ={rule['freq'].upper()}"]
+    if rule.get("interval", 1) != 1:
+        parts.append(f"INTERVAL={rule['interval']}")
+    if rule.get("count"):
+        parts.append(f"COUNT={rule['count']}")
+    if rule.get("until"):
+        # UNTIL cùng kiểu giá trị với DTSTART (ngày, hoặc ngày giờ tới hết ngày)
+        parts.append(f"UNTIL={rule['until'].replace('-', '')}" + ("T235959" if timed else ""))
+    if rule.get("byweekday"):
+        parts.append("BYDAY=" + ",".join(_WEEKDAY_CODES[day] for day in rule["byweekday"]))
+    return ";".join(parts)
+
+
+def _address(name):
+    return f"CN=\"{str(name).replace(chr(34), '')}\":mailto:{re.sub(r'[^a-z0-9]', '', dates.fold(str(name)))}@family.local"
+
+
+def event_uid(event_id, event, household_id):
+    """UID của sự kiện khi xuất: UID gốc (nếu được nhập từ lịch khác) hoặc sinh từ ID và hộ gia đình"""
+    return event.get("uid") or f"{event_id}-{household_id}@family-assistant"
+
+
+def event_lines(event_id, event, household_id, family_data=None, stamp=None):
+    """Các dòng nội dung (chưa gập) của một VEVENT"""
+    start = recurrence.event_start(event)
+    if start is None:
+        return []
+    stamp = stamp or datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = ["BEGIN:VEVENT",
+             f"UID:{event_uid(event_id, event, household_id)}",
+             f"DTSTAMP:{stamp}",
+             f"SUMMARY:{escape(event.get('title', ''))}"]
+    time_text = event.get("time") if dates.is_hhmm(event.get("time")) else ""
+    if time_text:
+        moment = datetime.datetime.combine(start, datetime.time.fromisoformat(time_text))
+        lines.append(f"DTSTART:{moment.strftime('%Y%m%dT%H%M%S')}")
+        if event.get("duration"):
+            end = moment + datetime.timedelta(minutes=int(event["duration"]))
+            lines.append(f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}")
+    else:
+        lines.append(f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}")
+    rule = event.get("recurrence")
+    if rule:
+        lines.append(f"RRULE:{_format_rrule(rule, bool(time_text))}")
+        for exception in rule.get("exceptions", ()):
+            value = exception.replace("-", "")
+            lines.append(f"EXDATE:{value}T{time_text.replace(':', '')}00" if time_text else f"EXDATE;VALUE=DATE:{value}")
+    if event.get("description"):
+        lines.append(f"DESCRIPTION:{escape(event['description'])}")
+    creator = (family_data or {}).get(event.get("created_by"))
+    if isinstance(creator, dict) and creator.get("name"):
+        lines.append(f"ORGANIZER;{_address(creator['name'])}")
+    for name in event.get("participants", []):
+        lines.append(f"ATTENDEE;{_address(name)}")
+    for lead in event.get("reminders", ()):
+        lines += ["BEGIN:VALARM", "ACTION:DISPLAY", f"DESCRIPTION:{escape(event.get('title', ''))}",
+                  f"TRIGGER:-PT{int(lead)}M", "END:VALARM"]
+    lines.append("END:VEVENT")
+    return lines
+
+
+def iter_ics(events_data, household_id="", family_data=None):
+    """
+    Sinh lần lượt các dòng (đã gập, kết thúc CRLF) của tài liệu .ics cho ``events_data``
+
+    ``events_data`` nên là một bản chụp (copy-on-write) để không đổi giữa chừng;
+    ``family_data`` dùng để ghi người tạo sự kiện thành ORGANIZER.
+    """
+    yield fold_line("BEGIN:VCALENDAR")
+    yield fold_line("VERSION:2.0")
+    yield fold_line(f"PRODID:{PRODID}")
+    yield fold_line("CALSCALE:GREGORIAN")
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    for event_id, event in events_data.items():
+        if not isinstance(event, dict):
+            continue
+        for line in event_lines(event_id, event, household_id, family_data, stamp):
+            yield fold_line(line)
+    yield fold_line("END:VCALENDAR")
+
+
+def export_ics(store, stream, member_id=None):
+    """Ghi lịch (của một thành viên, hoặc cả nhà) ra luồng văn bản, trả về số sự kiện đã ghi"""
+    events_data = store.filter_events_by_member(member_id)
+    for line in iter_ics(events_data, store.household_id, store.family_data):
+        stream.write(line)
+    return len(events_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nhập/xuất lịch iCalendar (.ics) cho Trợ lý Gia đình")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="File .ics cần nhập hoặc nơi ghi file xuất")
+    parser.add_argument("--data-dir", default=".", help="Thư mục dữ liệu của hộ gia đình")
+    parser.add_argument("--member-id", default=None,
+                        help="Khi nhập: người tạo sự kiện; khi xuất: chỉ xuất sự kiện của thành viên này")
+    args = parser.parse_args(argv)
+
+    from family_assistant.store import HouseholdStore
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = HouseholdStore(args.data_dir)
+    store.verify_data_structure()
+    if args.action == "import":
+        with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+            result = import_ics(store, f, args.member_id)
+        print(f"Đã thêm {result['added']} sự kiện, bỏ qua {result['skipped']} sự kiện đã có, "
+              f"{result['invalid']} sự kiện lỗi")
+    else:
+        with open(args.path, "w", encoding="utf-8", newline="") as f:
+            count = export_ics(store, f, args.member_id)
+        print(f"Đã xuất {count} sự kiện ra {args.path}")
+    if not store.flush():
+        parser.exit(1, "Không thể ghi dữ liệu\n")
+
+
+if __name__ == "__main__":
+    main()
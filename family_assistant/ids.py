@@ -0,0 +1,219 @@
+"""
+Cấp ID không trùng cho thành viên, sự kiện và ghi chú, và công cụ sửa dữ liệu đã bị trùng ID.
+
+Trước đây ID mới là ``len(tập dữ liệu) + 1``: sau một lần xóa, bản ghi mới ghi đè lên
+một bản ghi đang có. ID giờ được cấp từ bộ đếm tăng dần của từng tập dữ liệu, lưu
+trong ``ids.json`` của thư mục dữ liệu hộ gia đình:
+
+- ID mới luôn lớn hơn mọi ID số đang có trong dữ liệu và mọi ID đã cấp trước đó, kể
+  cả của bản ghi đã bị xóa: ID không bao giờ được dùng lại, nên cache và chỉ mục có
+  thể dùng ID làm khóa.
+- Bộ đếm được đọc và tăng dưới khóa file, nên mọi ``HouseholdStore`` mở cùng thư mục
+  (trong một tiến trình hay ở nhiều tiến trình) dùng chung một dãy ID và không cấp trùng nhau.
+- ID vẫn là số dạng chuỗi ("12") để trợ lý dễ nhắc lại trong lệnh (UPDATE_EVENT, DELETE_EVENT).
+
+Bản ghi bị ghi đè trước khi có bộ đếm được thêm lại bằng
+``python -m family_assistant.ids repair --data-dir .`` (``check`` để chỉ xem). Chỉ khôi phục
+được các lần ghi đè còn trong nhật ký thay đổi (bản ghi mới tạo đè lên bản ghi khác có thời
+điểm tạo khác): file dữ liệu chỉ giữ bản ghi sau cùng của mỗi ID, nên lần ghi đè xảy ra
+trước khi có nhật ký (hoặc đã bị nén khỏi nhật ký) không còn dấu vết để tìm lại.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+from family_assistant.replication import JOURNAL_FILE, file_lock, next_free_id
+
+logger = logging.getLogger('family_assistant.ids')
+
+ID_FILE = "ids.json"
+# Tập dữ liệu có ID do bộ đếm cấp, và trường thời điểm tạo dùng để nhận ra bản ghi bị ghi đè
+STAMP_FIELDS = {"family": "added_on", "events": "created_on", "notes": "created_on"}
+
+
+class IdAllocator:
+    """Bộ đếm ID của một thư mục dữ liệu, an toàn đa luồng và giữa các tiến trình"""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, ID_FILE)
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            # Bộ đếm hỏng vẫn an toàn: ID mới luôn lớn hơn mọi ID đang có trong dữ liệu
+            logger.warning(f"Không đọc được {self.path}, bắt đầu lại từ ID lớn nhất trong dữ liệu: {e}")
+            return {}
+
+    def _write(self, state):
+        # Không cần fsync: mất bộ đếm (mất điện) chỉ làm ID tiếp tục từ ID lớn nhất trong dữ liệu
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def allocate(self, collection, taken=(), count=1):
+        """
+        ``count`` ID mới của một tập dữ liệu
+
+        Args:
+            taken: Các ID đang được dùng (ID mới luôn lớn hơn chúng)
+
+        Returns:
+            list: Các ID (chuỗi số) theo thứ tự tăng dần
+        """
+        with self._lock, file_lock(self.path + ".lock"):
+            state = self._read()
+            counters = state.setdefault("counters", {})
+            last = max(int(counters.get(collection, 0)), int(next_free_id(taken)) - 1)
+            counters[collection] = last + count
+            self._write(state)
+        return [str(last + offset) for offset in range(1, count + 1)]
+
+    def mark_repaired(self, markers):
+        """Ghi nhận các bản ghi đã được khôi phục để lần sửa sau không thêm lại"""
+        with self._lock, file_lock(self.path + ".lock"):
+            state = self._read()
+            state["repaired"] = sorted(set(state.get("repaired", [])) | set(markers))
+            self._write(state)
+
+    def repaired(self):
+        with self._lock:
+            return set(self._read().get("repaired", []))
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(data_dir):
+    """Bộ đếm dùng chung của một thư mục dữ liệu trong tiến trình"""
+    key = os.path.realpath(data_dir)
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = _allocators[key] = IdAllocator(data_dir)
+        return allocator
+
+
+def _reset_after_fork():
+    # Khóa luồng có thể đang bị giữ tại thời điểm fork
+    global _allocators, _allocators_lock
+    _allocators = {}
+    _allocators_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ------ Sửa dữ liệu đã bị trùng ID ------
+def _stamp(record, collection):
+    return record.get(STAMP_FIELDS[collection]) if isinstance(record, dict) else None
+
+
+def find_collisions(data_dir):
+    """
+    Các bản ghi bị mất vì bản ghi khác được tạo với cùng ID: theo nhật ký thay đổi, bản ghi
+    bị một bản ghi mới tạo (``put`` có thời điểm tạo khác) ghi đè
+
+    Returns:
+        list: (tập dữ liệu, ID, bản ghi bị mất, nguồn) — nguồn là "journal:<epoch>:<phiên bản>"
+    """
+    path = os.path.join(data_dir, JOURNAL_FILE)
+    try:
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            lines = f.read().splitlines()
+    except (OSError, ValueError):
+        return []
+    state = {collection: {} for collection in STAMP_FIELDS}
+    lost = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        records = state.get(entry.get("c"))
+        if records is None:
+            continue
+        collection, record_id = entry["c"], entry["id"]
+        if entry["op"] == "put":
+            previous = records.get(record_id)
+            new_stamp, old_stamp = _stamp(entry.get("value"), collection), _stamp(previous, collection)
+            if old_stamp and new_stamp and old_stamp != new_stamp:
+                lost.append((collection, record_id, previous, f"journal:{header.get('epoch')}:{entry['v']}"))
+            records[record_id] = entry.get("value")
+        elif entry["op"] == "patch" and isinstance(records.get(record_id), dict):
+            record = {**records[record_id], **entry.get("fields", {})}
+            for key, values in entry.get("merge", {}).items():
+                record[key] = {**(record.get(key) or {}), **values}
+            records[record_id] = record
+        elif entry["op"] == "del":
+            records.pop(record_id, None)
+    return lost
+
+
+def repair(store, collisions=None, dry_run=False):
+    """
+    Thêm lại các bản ghi bị ghi đè với ID mới (mỗi bản ghi chỉ được khôi phục một lần)
+
+    ``collisions`` mặc định là ``find_collisions`` của thư mục dữ liệu của ``store``.
+
+    Returns:
+        list: (tập dữ liệu, ID cũ, ID mới hoặc None nếu ``dry_run``, tiêu đề/tên)
+    """
+    if collisions is None:
+        collisions = find_collisions(store.data_dir)
+    allocator = get_allocator(store.data_dir)
+    done = allocator.repaired()
+    pending = {}
+    for collection, record_id, value, source in collisions:
+        marker = f"{collection}:{record_id}:{source}"
+        # Bản sao y hệt bản ghi đang có thì không có gì bị mất
+        if marker in done or value in store.collection(collection).values():
+            continue
+        pending.setdefault(collection, []).append((record_id, value, marker))
+
+    report = []
+    for collection, items in pending.items():
+        new_ids = [None] * len(items) if dry_run else store.insert_records(collection, [value for _, value, _ in items])
+        for (record_id, value, _), new_id in zip(items, new_ids):
+            report.append((collection, record_id, new_id, value.get("title") or value.get("name") or ""))
+        if not dry_run:
+            allocator.mark_repaired(marker for _, _, marker in items)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra và sửa các bản ghi bị ghi đè do trùng ID")
+    parser.add_argument("action", choices=["check", "repair"], help="check: chỉ liệt kê; repair: thêm lại với ID mới")
+    parser.add_argument("--data-dir", default=".", help="Thư mục dữ liệu của hộ gia đình")
+    args = parser.parse_args(argv)
+
+    from family_assistant.store import HouseholdStore
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = HouseholdStore(args.data_dir)
+    report = repair(store, dry_run=args.action == "check")
+    for collection, old_id, new_id, label in report:
+        target = f" -> ID {new_id}" if new_id else ""
+        print(f"{collection}: bản ghi ID {old_id} bị ghi đè ({label}){target}")
+    if not report:
+        print("Không có bản ghi nào bị trùng ID")
+    elif args.action == "check":
+        print(f"Có {len(report)} bản ghi bị ghi đè; chạy lại với 'repair' để khôi phục")
+    if not store.flush():
+        parser.exit(1, "Không thể ghi dữ liệu\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Lời gọi mô hình ngôn ngữ (bất đồng bộ) kèm ghi nhận độ trễ, token và chi phí.
+
+Mọi vị trí gọi mô hình đi qua ``complete``/``stream_text`` để số liệu được ghi
+nhận thống nhất (xem telemetry và usage_ledger). Mô hình và nhà cung cấp của mỗi
+lời gọi do ``router`` chọn; khi một lựa chọn gặp sự cố (xem ``resilience.is_outage``), lời
+gọi chuyển sang lựa chọn kế tiếp (với stream: chỉ khi chưa nhận được đoạn văn bản nào).
+Lỗi do chính yêu cầu (HTTP 400, 401...) được ném ra ngay, không làm lựa chọn bị tạm ngưng.
+"""
+import asyncio
+import logging
+import os
+import time
+import weakref
+
+from family_assistant import admission, resilience, telemetry
+from family_assistant.router import OPENAI_MODEL, router
+from family_assistant.usage_ledger import UsageLedger
+
+logger = logging.getLogger('family_assistant.llm')
+
+# Endpoint OpenAI (có thể trỏ tới server giả lập cục bộ, xem fake_server.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+USAGE_LEDGER_FILE = os.getenv("USAGE_LEDGER_FILE", "usage_ledger.json")
+
+# Client theo từng event loop (pool kết nối của httpx gắn với loop tạo ra nó)
+_clients = weakref.WeakKeyDictionary()
+_usage_ledger = None
+
+
+def get_usage_ledger():
+    """Sổ ghi nhận token dùng chung của tiến trình (tạo khi cần lần đầu)"""
+    global _usage_ledger
+    if _usage_ledger is None:
+        _usage_ledger = UsageLedger(USAGE_LEDGER_FILE)
+    return _usage_ledger
+
+
+def get_async_client(api_key, base_url=OPENAI_BASE_URL):
+    """AsyncOpenAI client dùng lại theo (API key, endpoint) để tận dụng pool kết nối"""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((api_key, base_url))
+    if client is None:
+        from openai import AsyncOpenAI
+        client = clients[(api_key, base_url)] = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    return client
+
+
+def _route_client(api_key, provider, has_fallback):
+    client = get_async_client(api_key, provider.base_url)
+    # Còn lựa chọn dự phòng thì chuyển ngay thay vì để client tự thử lại với cùng endpoint
+    return client.with_options(max_retries=0) if has_fallback else client
+
+
+def _usage_tokens(usage, default):
+    """Tổng số token thực tế của một lời gọi (``default`` nếu endpoint không trả usage)"""
+    if usage is None:
+        return default
+    return (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_llm_usage(call_site, usage, started, member_id=None, model=OPENAI_MODEL, household_id=None):
+    """Ghi nhận token của một lời gọi mô hình vào số liệu và sổ chi phí"""
+    telemetry.record_usage(call_site, usage)
+    get_usage_ledger().record(call_site, model, usage, time.perf_counter() - started, member_id,
+                              household_id=household_id)
+
+
+async def complete(api_key, call_site, messages, member_id=None, model=None, household_id=None, **kwargs):
+    """
+    Gọi chat completion (không stream) và ghi nhận độ trễ, token
+
+    ``member_id``/``household_id`` mặc định lấy từ lượt trò chuyện hiện tại (nếu có).
+    ``model`` chỉ định sẵn thì bỏ qua router.
+
+    Returns:
+        str: Nội dung phản hồi của mô hình
+    """
+    estimated = admission.estimate_tokens(messages, kwargs.get("max_tokens"))
+    async with admission.slot(call_site, member_id, household_id, estimated) as admitted:
+        last_error = None
+        routes = router.plan(call_site, api_key, model)
+        for index, (provider, route_model, route_key) in enumerate(routes):
+            circuit = resilience.breaker(f"llm:{provider.name}")
+            if not circuit.allow():
+                last_error = resilience.CircuitOpenError(f"llm:{provider.name} đang tạm ngưng")
+                continue
+            client = _route_client(route_key, provider, index < len(routes) - 1)
+            started = time.perf_counter()
+            try:
+                with telemetry.span(call_site, model=f"{provider.name}:{route_model}"):
+                    response = await client.chat.completions.create(model=route_model, messages=messages, **kwargs)
+            except Exception as e:
+                circuit.record_failure(e)
+                if not resilience.is_outage(e):
+                    # Lỗi do chính yêu cầu (400, 401...): không tạm ngưng lựa chọn đang hoạt động tốt
+                    raise
+                router.record_failure(call_site, provider, route_model, e)
+                last_error = e
+                continue
+            circuit.record_success()
+            router.record_success(call_site, provider, route_model, time.perf_counter() - started)
+            record_llm_usage(call_site, response.usage, started, member_id, route_model, household_id)
+            admitted.settle(_usage_tokens(response.usage, estimated))
+            return response.choices[0].message.content
+        raise last_error
+
+
+async def stream_text(api_key, call_site, messages, member_id=None, model=None, household_id=None, **kwargs):
+    """
+    Stream phản hồi của mô hình thành từng đoạn văn bản
+
+    ``member_id``/``household_id`` mặc định lấy từ lượt trò chuyện hiện tại (nếu có), như ``complete``.
+
+    Ghi nhận thời gian tới token đầu tiên (của lời gọi và của cả lượt trò chuyện)
+    cùng số token ở chunk cuối (stream_options.include_usage). Router đo độ trễ
+    theo thời gian tới token đầu tiên.
+    """
+    trace = telemetry.current_turn()
+    stream_start = time.perf_counter()
+    first_token_at = None
+    completion_chunks = 0
+    stream_usage = None
+    last_error = None
+
+    estimated = admission.estimate_tokens(messages, kwargs.get("max_tokens"))
+    # Chỗ trong semaphore chung được giữ suốt thời gian stream
+    async with admission.slot(call_site, member_id, household_id, estimated) as admitted:
+        routes = router.plan(call_site, api_key, model)
+        for index, (provider, route_model, route_key) in enumerate(routes):
+            circuit = resilience.breaker(f"llm:{provider.name}")
+            if not circuit.allow():
+                last_error = resilience.CircuitOpenError(f"llm:{provider.name} đang tạm ngưng")
+                continue
+            client = _route_client(route_key, provider, index < len(routes) - 1)
+            attempt_start = time.perf_counter()
+            try:
+                stream = await client.chat.completions.create(
+                    model=route_model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        # Chunk cuối chỉ chứa thống kê token
+                        stream_usage = chunk.usage
+                        continue
+                    chunk_text = chunk.choices[0].delta.content or ""
+                    if not chunk_text:
+                        continue
+                    completion_chunks += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        circuit.record_success()
+                        router.record_success(call_site, provider, route_model, first_token_at - attempt_start)
+                        telemetry.record_stage("main_stream_ttft", first_token_at - stream_start, stream_start,
+                                               model=f"{provider.name}:{route_model}")
+                        if trace is not None:
+                            telemetry.record_stage("turn_ttft", trace.elapsed(), trace.start)
+                    yield chunk_text
+            except Exception as e:
+                circuit.record_failure(e)
+                if not resilience.is_outage(e):
+                    # Lỗi do chính yêu cầu (400, 401...): không tạm ngưng lựa chọn đang hoạt động tốt
+                    raise
+                router.record_failure(call_site, provider, route_model, e)
+                if first_token_at is not None:
+                    # Đã gửi một phần phản hồi: không thể chuyển sang lựa chọn khác
+                    raise
+                last_error = e
+                continue
+            if first_token_at is None:
+                circuit.record_success()
+                router.record_success(call_site, provider, route_model, time.perf_counter() - attempt_start)
+            break
+        else:
+            raise last_error
+
+        telemetry.record_stage("main_stream", time.perf_counter() - stream_start, stream_start)
+        if stream_usage is not None:
+            record_llm_usage(call_site, stream_usage, stream_start, member_id, route_model, household_id)
+            admitted.settle(_usage_tokens(stream_usage, estimated))
+        else:
+            # Endpoint không trả usage: mỗi chunk nội dung xấp xỉ một token
+            telemetry.record_tokens(call_site, completion=completion_chunks)
+
+
+async def transcribe(api_key, audio_bytes, filename="audio.wav"):
+    """Chuyển giọng nói thành văn bản bằng Whisper"""
+    client = get_async_client(api_key)
+    with telemetry.span("transcribe"):
+        transcript = await client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio_bytes),
+        )
+    return transcript.text
@@ -0,0 +1,213 @@
+"""
+Rút gọn nội dung trang web trước khi gửi cho mô hình tổng hợp.
+
+Nội dung trích xuất (``raw_content`` của Tavily) thường lẫn nhiều phần thừa:
+menu, thông báo cookie, nút chia sẻ, "bài viết liên quan". Thay vì cắt mù
+8000 ký tự đầu mỗi trang, nội dung được:
+
+1. làm sạch: bỏ cú pháp ảnh/liên kết markdown, các dòng điều hướng/cookie/chia sẻ,
+   các dòng lặp lại ở nhiều trang (khung trang chung) và dòng gần như không có chữ
+2. chia thành các đoạn (passage) khoảng ``PASSAGE_WORDS`` từ
+3. xếp hạng theo câu truy vấn bằng BM25 (từ đã bỏ dấu, kèm cặp từ liền nhau vì
+   từ tiếng Việt thường gồm hai âm tiết)
+4. chọn các đoạn tốt nhất trong giới hạn ``SEARCH_CONTEXT_TOKENS`` token, mỗi nguồn
+   có ít nhất đoạn tốt nhất của nó, và giữ thứ tự xuất hiện trong trang
+
+Mọi bước chạy cục bộ, không gọi mô hình.
+"""
+import collections
+import math
+import os
+import re
+
+from family_assistant import dates
+
+# Tổng số token (ước lượng) của các đoạn được gửi cho mô hình tổng hợp
+SEARCH_CONTEXT_TOKENS = int(os.getenv("SEARCH_CONTEXT_TOKENS", "2000"))
+PASSAGE_WORDS = 120
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_URL = re.compile(r"https?://\S+")
+_WORD = re.compile(r"\w+")
+_NON_ALNUM = re.compile(r"[\W_]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+# Dòng điều hướng/cookie/chia sẻ (so khớp trên chữ đã bỏ dấu, chữ thường)
+_BOILERPLATE = re.compile(
+    r"\b(cookie|dang nhap|dang ky|dang xuat|trang chu|chia se|xem them|bai viet lien quan|tin lien quan"
+    r"|quang cao|ban quyen|all rights reserved|copyright|privacy policy|terms of (use|service)|sign in"
+    r"|sign up|log in|subscribe|newsletter|share on|follow us|read more|related (posts|articles)"
+    r"|advertisement|skip to content|theo doi chung toi|tai ung dung)\b")
+STOPWORDS = set(
+    "va la cua cho co khong nhung cac mot nay do thi de duoc trong voi nhu tai tu khi se da dang ve ra len"
+    " bi ma cung nen vi hay hoac gi nao nhe a o"
+    " the a an and or of to in on for is are was were be by with at from as it this that what which how".split())
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (khoảng 4 ký tự một token)"""
+    return max(1, len(text) // 4)
+
+
+def terms(text):
+    """Các từ (đã bỏ dấu, bỏ từ dừng) và cặp từ liền nhau của một đoạn văn bản"""
+    words = [word for word in _WORD.findall(dates.fold(text)) if word not in STOPWORDS]
+    return words + [f"{first}_{second}" for first, second in zip(words, words[1:])]
+
+
+def _normalize_line(line):
+    """(dòng đã bỏ cú pháp markdown và khoảng trắng thừa, có phải tiêu đề không)"""
+    line = _URL.sub("", _MARKDOWN_LINK.sub(r"\1", _MARKDOWN_IMAGE.sub("", line)))
+    line = " ".join(line.replace("*", " ").split())
+    return line.lstrip("#> -").strip(), line.startswith("#")
+
+
+def _is_boilerplate(line, folded):
+    if _BOILERPLATE.search(folded) and len(line) < 200:
+        return True
+    # Dòng menu ("Trang chủ | Tin tức | ..."): nhiều dấu phân cách, ít từ mỗi mục.
+    # Dòng bảng markdown ("| SJC | 85.500 |") thì giữ lại
+    separators = line.count("|") + line.count("•") + line.count("»")
+    if not line.startswith("|") and separators >= 2 and len(line.split()) <= 4 * (separators + 1):
+        return True
+    # Dòng gần như chỉ có ký hiệu (đường kẻ, dấu phân cách)
+    return len(_NON_ALNUM.sub("", line)) < max(2, len(line) * 0.3)
+
+
+def clean_text(raw, shared_lines=frozenset()):
+    """
+    Bỏ phần thừa của một trang, trả về các đoạn văn (list str)
+
+    ``shared_lines`` là các dòng (đã chuẩn hóa) xuất hiện ở nhiều trang, bị coi là khung trang.
+    """
+    paragraphs, current = [], []
+    for line in raw.splitlines():
+        line, heading = _normalize_line(line)
+        if not line:
+            if current:
+                paragraphs.append("\n".join(current))
+                current = []
+            continue
+        folded = dates.fold(line)
+        if folded in shared_lines or _is_boilerplate(line, folded):
+            continue
+        if heading and current:
+            # Tiêu đề mở đầu một đoạn mới
+            paragraphs.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        paragraphs.append("\n".join(current))
+    return paragraphs
+
+
+def split_passages(paragraphs, target_words=PASSAGE_WORDS):
+    """Gộp các đoạn văn ngắn và tách đoạn dài (theo câu) thành các đoạn khoảng ``target_words`` từ"""
+    passages, current, size = [], [], 0
+    for paragraph in paragraphs:
+        pieces = [paragraph]
+        if len(paragraph.split()) > target_words:
+            pieces = _SENTENCE_END.split(paragraph)
+        for piece in pieces:
+            words = len(piece.split())
+            if current and size + words > target_words:
+                passages.append("\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += words
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def _shared_lines(pages, max_chars=160):
+    """Các dòng ngắn (đã chuẩn hóa) xuất hiện ở từ hai trang trở lên"""
+    if len(pages) < 2:
+        return frozenset()
+    counts = collections.Counter()
+    for page in pages:
+        lines = (_normalize_line(line)[0] for line in page.splitlines())
+        counts.update({dates.fold(line) for line in lines if line and len(line) <= max_chars})
+    return frozenset(line for line, count in counts.items() if count >= 2)
+
+
+def bm25_scores(query_terms, documents):
+    """Điểm BM25 của từng tài liệu (danh sách các từ) đối với câu truy vấn"""
+    if not documents:
+        return []
+    average_length = sum(len(document) for document in documents) / len(documents) or 1
+    document_frequency = collections.Counter()
+    for document in documents:
+        document_frequency.update(set(document))
+    query_terms = set(query_terms)
+    scores = []
+    for document in documents:
+        counts = collections.Counter(document)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(document) / average_length)
+        score = 0.0
+        for term in query_terms:
+            frequency = counts.get(term)
+            if frequency:
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores.append(score)
+    return scores
+
+
+def select_passages(query, pages, token_budget=SEARCH_CONTEXT_TOKENS):
+    """
+    Chọn các đoạn liên quan nhất tới câu truy vấn trong giới hạn token
+
+    Args:
+        query (str): Câu truy vấn tìm kiếm
+        pages (list): Các trang ``{"url": ..., "content": nội dung thô}``
+        token_budget (int): Tổng số token tối đa của các đoạn được chọn
+
+    Returns:
+        list: ``{"url": ..., "content": các đoạn được chọn}`` theo thứ tự các trang,
+        bỏ qua trang không còn đoạn nào
+    """
+    shared = _shared_lines([page["content"] for page in pages])
+    candidates, seen = [], set()
+    for page_index, page in enumerate(pages):
+        for position, passage in enumerate(split_passages(clean_text(page["content"], shared))):
+            key = dates.fold(passage)
+            if key in seen:
+                continue  # Đoạn trùng lặp (cùng trang hoặc trang khác)
+            seen.add(key)
+            candidates.append((page_index, position, passage))
+    if not candidates:
+        return []
+
+    scores = bm25_scores(terms(query), [terms(passage) for _, _, passage in candidates])
+    if not any(scores):
+        # Không đoạn nào chứa từ của câu truy vấn: ưu tiên các đoạn đầu trang
+        scores = [1.0 / (1 + position) for _, position, _ in candidates]
+    ranked = sorted(range(len(candidates)), key=lambda index: -scores[index])
+
+    # Mỗi trang giữ đoạn tốt nhất của nó trước, phần còn lại theo điểm
+    best_per_page = {}
+    for index in ranked:
+        best_per_page.setdefault(candidates[index][0], index)
+    order = list(best_per_page.values()) + [index for index in ranked if index not in best_per_page.values()]
+
+    chosen, used = set(), 0
+    for index in order:
+        cost = estimate_tokens(candidates[index][2])
+        if used + cost > token_budget:
+            if chosen:
+                continue
+            # Đoạn đầu tiên quá dài: cắt theo ngân sách thay vì bỏ hết
+            page_index, position, passage = candidates[index]
+            candidates[index] = (page_index, position, passage[:token_budget * 4] + "...")
+            cost = token_budget
+        chosen.add(index)
+        used += cost
+
+    selected = collections.defaultdict(list)
+    for index in sorted(chosen, key=lambda index: candidates[index][:2]):
+        selected[candidates[index][0]].append(candidates[index][2])
+    return [{"url": pages[page_index]["url"], "content": "\n...\n".join(selected[page_index])}
+            for page_index in sorted(selected)]
@@ -0,0 +1,452 @@
+"""
+Bản ghi có kiểu của thành viên, sự kiện và ghi chú: kiểm tra dữ liệu khi ghi và nâng cấp phiên bản.
+
+Dữ liệu vẫn được lưu (file JSON, nhật ký đồng bộ) dưới dạng từ điển; module này
+thêm hai lớp quanh chúng:
+
+- Kiểm tra ở đầu vào: ``validate`` nhận dữ liệu từ form hoặc lệnh JSON của trợ lý,
+  ném ``ValidationError`` (thông báo tiếng Việt, hiển thị được cho người dùng) nếu
+  sai kiểu / sai định dạng, và trả về từ điển đã chuẩn hóa để lưu.
+- Bản xem có kiểu: ``EventRecord``, ``NoteRecord``, ``MemberRecord`` là dataclass
+  ``slots`` (dùng chung giữa các luồng, không sửa tại chỗ), ngày giờ đã đọc sẵn thành số nguyên (``day``: số thứ tự ngày
+  ``date.toordinal()``, ``minute``: phút trong ngày, -1 với sự kiện cả ngày,
+  ``created_on``/``added_on``: giây Unix, 0 nếu không có), nên sắp xếp và so sánh
+  không phải đọc lại chuỗi. ``build_view`` dựng bản xem của một bản chụp tập dữ liệu
+  (xem ``HouseholdStore.records``), dùng lại bản ghi của bản xem trước cho các bản ghi
+  không đổi.
+
+Mỗi bản ghi mang ``schema_version``. Bản ghi của phiên bản cũ hơn ``SCHEMA_VERSION``
+được ``migrate`` nâng lần lượt qua các bước trong ``MIGRATIONS`` khi tải dữ liệu
+(xem ``HouseholdStore.verify_data_structure``); bản ghi chưa có trường này là phiên bản 1.
+"""
+import dataclasses
+import datetime
+import logging
+
+from family_assistant import dates
+from family_assistant.recurrence import normalize_rule
+
+logger = logging.getLogger('family_assistant.records')
+
+SCHEMA_VERSION = 2
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MAX_TITLE_LENGTH = 300
+MAX_TEXT_LENGTH = 50000
+MAX_NAME_LENGTH = 100
+MAX_AGE_LENGTH = 30
+MAX_AGE = 150
+MAX_DURATION_MINUTES = 366 * 1440
+
+
+class ValidationError(ValueError):
+    """Dữ liệu không hợp lệ; thông báo dùng được để hiển thị cho người dùng"""
+
+
+# ------ Đọc ngày giờ ------
+def parse_day(value):
+    """Số thứ tự ngày (``date.toordinal()``) của chuỗi YYYY-MM-DD, hoặc None"""
+    if not isinstance(value, str) or len(value) != 10:
+        return None
+    try:
+        return datetime.date.fromisoformat(value).toordinal()
+    except ValueError:
+        return None
+
+
+def parse_minute(value):
+    """Phút trong ngày của chuỗi HH:MM, hoặc None"""
+    if (not isinstance(value, str) or len(value) != 5 or value[2] != ":" or not value.isascii()
+            or not value[:2].isdigit() or not value[3:].isdigit()):
+        return None
+    hours, minutes = int(value[:2]), int(value[3:])
+    return hours * 60 + minutes if hours <= 23 and minutes <= 59 else None
+
+
+def parse_timestamp(value):
+    """Giây Unix của mốc thời gian "YYYY-MM-DD HH:MM:SS" (giờ địa phương), hoặc None"""
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+def format_day(day):
+    return datetime.date.fromordinal(day).isoformat() if day is not None else ""
+
+
+def format_minute(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}" if minute >= 0 else ""
+
+
+def format_timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds).strftime(TIMESTAMP_FORMAT) if seconds else ""
+
+
+# ------ Kiểm tra từng trường ------
+def _text(data, key, label, limit=MAX_TEXT_LENGTH, required=False, strip=False):
+    value = data.get(key)
+    if value is None:
+        value = ""
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    elif not isinstance(value, str):
+        raise ValidationError(f"{label} phải là chuỗi ký tự")
+    if required and not value.strip():
+        raise ValidationError(f"{label} không được để trống")
+    if len(value) > limit:
+        raise ValidationError(f"{label} dài quá {limit} ký tự")
+    return value.strip() if strip else value
+
+
+def _names(data, key, label):
+    value = data.get(key)
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ValidationError(f"{label} phải là danh sách tên")
+    names = []
+    for item in value:
+        item = item.strip()
+        if len(item) > MAX_NAME_LENGTH:
+            raise ValidationError(f"{label}: \"{item[:20]}...\" dài quá {MAX_NAME_LENGTH} ký tự")
+        if item and item not in names:
+            names.append(item)
+    return tuple(names)
+
+
+def _int(value, label, low, high):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValidationError(f"{label} phải là số nguyên")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{label} phải là số nguyên") from None
+    if not low <= number <= high:
+        raise ValidationError(f"{label} phải trong khoảng {low}-{high}")
+    return number
+
+
+def _stamp(data, key):
+    value = data.get(key)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    return parse_timestamp(value) or 0
+
+
+# ------ Bản ghi ------
+@dataclasses.dataclass(slots=True)
+class EventRecord:
+    """Một sự kiện; ``day`` là None nếu sự kiện chưa có ngày"""
+
+    title: str
+    day: int | None
+    minute: int
+    description: str = ""
+    participants: tuple = ()
+    created_by: str = ""
+    created_on: int = 0
+    duration: int | None = None
+    reminders: tuple | None = None
+    recurrence: dict | None = None
+    uid: str = ""
+    schema_version: int = SCHEMA_VERSION
+
+    @property
+    def date(self):
+        return datetime.date.fromordinal(self.day) if self.day is not None else None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Kiểm tra dữ liệu vào, ném ``ValidationError`` nếu không hợp lệ"""
+        date_text = _text(data, "date", "Ngày", MAX_TITLE_LENGTH, strip=True)
+        day = parse_day(date_text)
+        if date_text and day is None:
+            raise ValidationError(f"Ngày \"{date_text}\" không đúng định dạng YYYY-MM-DD")
+        time_text = _text(data, "time", "Giờ", MAX_TITLE_LENGTH, strip=True)
+        minute = parse_minute(time_text)
+        if time_text and minute is None:
+            raise ValidationError(f"Giờ \"{time_text}\" không đúng định dạng HH:MM")
+        duration = data.get("duration")
+        reminders = data.get("reminders")
+        if reminders is not None:
+            if not isinstance(reminders, (list, tuple)):
+                raise ValidationError("Nhắc trước phải là danh sách số phút")
+            reminders = tuple(sorted({_int(lead, "Nhắc trước", 0, MAX_DURATION_MINUTES) for lead in reminders}))
+        return cls(
+            title=_text(data, "title", "Tiêu đề", MAX_TITLE_LENGTH, required=True, strip=True),
+            day=day,
+            minute=-1 if minute is None else minute,
+            description=_text(data, "description", "Mô tả"),
+            participants=_names(data, "participants", "Người tham gia"),
+            created_by=_text(data, "created_by", "Người tạo", MAX_NAME_LENGTH, strip=True),
+            created_on=_stamp(data, "created_on"),
+            duration=_int(duration, "Thời lượng", 1, MAX_DURATION_MINUTES) if duration else None,
+            reminders=reminders,
+            recurrence=normalize_rule(data.get("recurrence")),
+            uid=_text(data, "uid", "UID", MAX_TITLE_LENGTH, strip=True),
+        )
+
+    @classmethod
+    def load(cls, data):
+        """Bản xem của một bản ghi đã lưu: không kiểm tra, trường sai định dạng được coi như trống"""
+        minute = parse_minute(data.get("time"))
+        reminders = data.get("reminders")
+        return cls(
+            title=str(data.get("title") or ""),
+            day=parse_day(data.get("date")),
+            minute=-1 if minute is None else minute,
+            description=str(data.get("description") or ""),
+            participants=tuple(name for name in data.get("participants") or () if isinstance(name, str)),
+            created_by=str(data.get("created_by") or ""),
+            created_on=_stamp(data, "created_on"),
+            duration=data["duration"] if isinstance(data.get("duration"), int) else None,
+            reminders=tuple(reminders) if isinstance(reminders, list) else None,
+            recurrence=data.get("recurrence") or None,
+            uid=str(data.get("uid") or ""),
+            schema_version=data.get("schema_version", 1),
+        )
+
+    def to_dict(self):
+        """Dạng lưu trữ (JSON)"""
+        event = {
+            "title": self.title,
+            "date": format_day(self.day),
+            "time": format_minute(self.minute),
+            "description": self.description,
+            "participants": list(self.participants),
+            "created_by": self.created_by,
+            "created_on": format_timestamp(self.created_on),
+            "schema_version": SCHEMA_VERSION,
+        }
+        if self.recurrence:
+            event["recurrence"] = self.recurrence
+        if self.duration:
+            event["duration"] = self.duration
+        if self.reminders is not None:
+            event["reminders"] = list(self.reminders)
+        if self.uid:
+            event["uid"] = self.uid
+        return event
+
+
+@dataclasses.dataclass(slots=True)
+class NoteRecord:
+    title: str
+    content: str
+    tags: tuple = ()
+    created_by: str = ""
+    created_on: int = 0
+    schema_version: int = SCHEMA_VERSION
+
+    @classmethod
+    def from_dict(cls, data):
+        """Kiểm tra dữ liệu vào, ném ``ValidationError`` nếu không hợp lệ"""
+        note = cls(
+            title=_text(data, "title", "Tiêu đề", MAX_TITLE_LENGTH, strip=True),
+            content=_text(data, "content", "Nội dung"),
+            tags=_names(data, "tags", "Thẻ"),
+            created_by=_text(data, "created_by", "Người tạo", MAX_NAME_LENGTH, strip=True),
+            created_on=_stamp(data, "created_on"),
+        )
+        if not note.title and not note.content.strip():
+            raise ValidationError("Ghi chú cần có tiêu đề hoặc nội dung")
+        return note
+
+    @classmethod
+    def load(cls, data):
+        """Bản xem của một bản ghi đã lưu (xem ``EventRecord.load``)"""
+        return cls(
+            title=str(data.get("title") or ""),
+            content=str(data.get("content") or ""),
+            tags=tuple(tag for tag in data.get("tags") or () if isinstance(tag, str)),
+            created_by=str(data.get("created_by") or ""),
+            created_on=_stamp(data, "created_on"),
+            schema_version=data.get("schema_version", 1),
+        )
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "content": self.content,
+            "tags": list(self.tags),
+            "created_by": self.created_by,
+            "created_on": format_timestamp(self.created_on),
+            "schema_version": SCHEMA_VERSION,
+        }
+
+
+@dataclasses.dataclass(slots=True)
+class MemberRecord:
+    name: str
+    age: str = ""
+    preferences: dict = dataclasses.field(default_factory=dict)
+    added_on: int = 0
+    schema_version: int = SCHEMA_VERSION
+
+    @classmethod
+    def from_dict(cls, data):
+        """Kiểm tra dữ liệu vào, ném ``ValidationError`` nếu không hợp lệ"""
+        age = _text(data, "age", "Tuổi", MAX_AGE_LENGTH, strip=True)
+        if age.isdigit() and int(age) > MAX_AGE:
+            raise ValidationError(f"Tuổi {age} không hợp lệ")
+        preferences = data.get("preferences")
+        if preferences is None:
+            preferences = {}
+        if not isinstance(preferences, dict):
+            raise ValidationError("Sở thích phải là các cặp loại sở thích - giá trị")
+        for key, value in preferences.items():
+            if not isinstance(key, str) or not key.strip():
+                raise ValidationError("Loại sở thích không được để trống")
+            if isinstance(value, dict):
+                raise ValidationError(f"Sở thích \"{key}\" không hợp lệ")
+        return cls(
+            name=_text(data, "name", "Tên", MAX_NAME_LENGTH, required=True, strip=True),
+            age=age,
+            preferences=dict(preferences),
+            added_on=_stamp(data, "added_on"),
+        )
+
+    @classmethod
+    def load(cls, data):
+        """Bản xem của một bản ghi đã lưu (xem ``EventRecord.load``)"""
+        preferences = data.get("preferences")
+        return cls(
+            name=str(data.get("name") or ""),
+            age=str(data.get("age") or ""),
+            preferences=preferences if isinstance(preferences, dict) else {},
+            added_on=_stamp(data, "added_on"),
+            schema_version=data.get("schema_version", 1),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "age": self.age,
+            "preferences": self.preferences,
+            "added_on": format_timestamp(self.added_on),
+            "schema_version": SCHEMA_VERSION,
+        }
+
+
+RECORD_TYPES = {"events": EventRecord, "notes": NoteRecord, "family": MemberRecord}
+
+
+def validate(collection, data):
+    """
+    Kiểm tra dữ liệu vào của một bản ghi (từ form hoặc lệnh của trợ lý)
+
+    Returns:
+        dict: Bản ghi đã chuẩn hóa, dạng lưu trữ; ném ``ValidationError`` nếu không hợp lệ
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Dữ liệu phải là một đối tượng JSON")
+    return RECORD_TYPES[collection].from_dict(data).to_dict()
+
+
+# Giá trị tạm cho trường bắt buộc khi chỉ kiểm tra một phần bản ghi (xem ``validate_fields``)
+_REQUIRED_PLACEHOLDERS = {"events": {"title": "-"}, "notes": {"title": "-"}, "family": {"name": "-"}}
+
+
+def validate_fields(collection, fields):
+    """
+    Kiểm tra riêng các trường được sửa của một bản ghi (không xét các trường còn lại)
+
+    Returns:
+        dict: Các trường trong ``fields`` đã chuẩn hóa; ném ``ValidationError`` nếu không hợp lệ
+    """
+    if not isinstance(fields, dict):
+        raise ValidationError("Dữ liệu phải là một đối tượng JSON")
+    placeholders = {key: value for key, value in _REQUIRED_PLACEHOLDERS[collection].items()
+                    if collection != "notes" or not (fields.get("content") or "").strip()}
+    checked = RECORD_TYPES[collection].from_dict({**placeholders, **fields}).to_dict()
+    return {key: checked.get(key, value) for key, value in fields.items()}
+
+
+def is_valid(collection, data):
+    try:
+        validate(collection, data)
+    except ValidationError:
+        return False
+    return True
+
+
+def build_view(collection, data, previous=None):
+    """
+    Bản xem có kiểu (ID -> bản ghi) của một bản chụp tập dữ liệu; mục không phải từ điển bị bỏ qua
+
+    ``previous`` là (bản chụp, bản xem) trước đó: nhờ copy-on-write, bản ghi không đổi vẫn là
+    cùng một đối tượng từ điển nên bản ghi có kiểu của nó được dùng lại, không phải đọc lại.
+    """
+    load = RECORD_TYPES[collection].load
+    old_data, old_view = previous or ({}, {})
+    view = {}
+    for record_id, value in data.items():
+        if old_data.get(record_id) is value and record_id in old_view:
+            view[record_id] = old_view[record_id]
+        elif isinstance(value, dict):
+            view[record_id] = load(value)
+    return view
+
+
+# ------ Nâng cấp phiên bản ------
+def _v1_to_v2(collection, record):
+    """Bản ghi chưa có schema_version: chuẩn hóa ngày giờ viết tự do, danh sách và mốc thời gian"""
+    record = dict(record)
+    if collection == "events":
+        date_text = record.get("date")
+        if isinstance(date_text, str) and date_text.strip() and parse_day(date_text) is None:
+            parsed = dates.parse_date(date_text)
+            if parsed:
+                record["date"] = parsed.isoformat()
+        time_text = record.get("time")
+        if isinstance(time_text, str) and time_text.strip() and parse_minute(time_text) is None:
+            record["time"] = dates.parse_time(time_text) or time_text
+        if isinstance(record.get("participants"), str):
+            record["participants"] = [record["participants"]]
+        if isinstance(record.get("duration"), str) and record["duration"].isdigit():
+            record["duration"] = int(record["duration"])
+    elif collection == "notes":
+        if isinstance(record.get("tags"), str):
+            record["tags"] = [record["tags"]]
+    elif collection == "family":
+        if isinstance(record.get("age"), int):
+            record["age"] = str(record["age"])
+    stamp_key = "added_on" if collection == "family" else "created_on"
+    seconds = parse_timestamp(record.get(stamp_key))
+    if seconds is not None:
+        record[stamp_key] = format_timestamp(seconds)
+    return record
+
+
+# Phiên bản -> hàm nâng bản ghi (từ điển) của phiên bản đó lên phiên bản kế tiếp
+MIGRATIONS = {
+    1: _v1_to_v2,
+}
+
+
+def record_version(record):
+    version = record.get("schema_version", 1)
+    return version if isinstance(version, int) and not isinstance(version, bool) else 1
+
+
+def migrate(collection, record):
+    """
+    Nâng một bản ghi lên ``SCHEMA_VERSION``
+
+    Returns:
+        dict: Bản ghi mới, hoặc None nếu bản ghi đã ở phiên bản hiện tại (hoặc mới hơn,
+        do tiến trình chạy phiên bản mã mới hơn ghi)
+    """
+    version = record_version(record)
+    if version >= SCHEMA_VERSION:
+        return None
+    while version < SCHEMA_VERSION:
+        record = MIGRATIONS[version](collection, record)
+        version += 1
+    record["schema_version"] = version
+    return record
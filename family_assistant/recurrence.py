@@ -0,0 +1,271 @@
+"""
+Sự kiện lặp lại (sinh nhật, lớp học hằng tuần, hóa đơn hằng tháng).
+
+Sự kiện lặp lại vẫn là một bản ghi duy nhất trong ``events_data``: trường
+``date`` là lần diễn ra đầu tiên, trường ``recurrence`` là quy tắc lặp:
+
+    {"freq": "weekly", "interval": 1, "byweekday": [0, 2],
+     "until": "2024-12-31", "count": 20, "exceptions": ["2024-06-03"]}
+
+- ``freq``: daily / weekly / monthly / yearly (chấp nhận cả "hàng tuần", "tuần"...)
+- ``interval``: mỗi bao nhiêu chu kỳ (mặc định 1)
+- ``byweekday``: các thứ trong tuần (0 = thứ Hai) cho lịch hằng tuần
+- ``until`` / ``count``: kết thúc theo ngày hoặc theo số lần
+- ``exceptions``: các ngày bị bỏ qua (không làm giảm ``count``)
+
+Ngày 31 hằng tháng rơi vào ngày cuối của tháng ngắn hơn; 29/2 hằng năm rơi vào 28/2.
+
+Các lần diễn ra không được tạo sẵn: ``iter_dates`` tính thẳng tới lần đầu tiên
+trong khoảng cần xem rồi sinh dần từng ngày, ``OccurrenceIndex`` trộn các sự
+kiện một lần (đã sắp xếp) với các sự kiện lặp lại theo thứ tự ngày giờ.
+"""
+import bisect
+import datetime
+import heapq
+import logging
+import re
+
+from family_assistant import dates
+
+logger = logging.getLogger('family_assistant.recurrence')
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+_FREQUENCY_ALIASES = {
+    "daily": "daily", "day": "daily", "ngay": "daily", "hang ngay": "daily", "moi ngay": "daily",
+    "weekly": "weekly", "week": "weekly", "tuan": "weekly", "hang tuan": "weekly", "moi tuan": "weekly",
+    "monthly": "monthly", "month": "monthly", "thang": "monthly", "hang thang": "monthly", "moi thang": "monthly",
+    "yearly": "yearly", "annually": "yearly", "year": "yearly", "nam": "yearly", "hang nam": "yearly",
+    "moi nam": "yearly",
+}
+_UNITS = {"daily": "ngày", "weekly": "tuần", "monthly": "tháng", "yearly": "năm"}
+# "hàng tuần", "mỗi tháng", "2 tuần một lần", "every week", "weekly"
+_RECURRENCE_PATTERN = re.compile(
+    r"(?<![\w])(?:(?:hang|moi)\s+(ngay|tuan|thang|nam)|(\d+)\s+(ngay|tuan|thang|nam)\s+(?:mot|1)\s+lan"
+    r"|every\s+(?:(\d+)\s+)?(days?|weeks?|months?|years?)|(daily|weekly|monthly|yearly|annually))(?![\w])")
+
+
+def _to_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    value = str(value or "").strip()
+    if dates.is_iso_date(value):
+        return datetime.date.fromisoformat(value)
+    return dates.parse_date(value)
+
+
+def normalize_rule(rule):
+    """
+    Kiểm tra và chuẩn hóa quy tắc lặp
+
+    Returns:
+        dict: Quy tắc đã chuẩn hóa, hoặc None nếu không lặp / quy tắc không hợp lệ
+    """
+    if not rule:
+        return None
+    if isinstance(rule, str):
+        rule = {"freq": rule}
+    if not isinstance(rule, dict):
+        logger.warning(f"Bỏ qua quy tắc lặp không hợp lệ: {rule!r}")
+        return None
+
+    freq = _FREQUENCY_ALIASES.get(dates.fold(str(rule.get("freq", ""))).strip())
+    if freq is None:
+        logger.warning(f"Bỏ qua quy tắc lặp có tần suất không hợp lệ: {rule.get('freq')!r}")
+        return None
+    try:
+        normalized = {"freq": freq, "interval": max(1, int(rule.get("interval") or 1))}
+        if rule.get("count"):
+            normalized["count"] = max(1, int(rule["count"]))
+    except (TypeError, ValueError):
+        logger.warning(f"Bỏ qua quy tắc lặp có interval/count không hợp lệ: {rule!r}")
+        return None
+
+    if rule.get("until"):
+        until = _to_date(rule["until"])
+        if until is not None:
+            normalized["until"] = until.isoformat()
+    if freq == "weekly" and rule.get("byweekday"):
+        weekdays = rule["byweekday"] if isinstance(rule["byweekday"], list) else [rule["byweekday"]]
+        normalized["byweekday"] = sorted({int(day) for day in weekdays if str(day).isdigit() and int(day) < 7})
+        if not normalized["byweekday"]:
+            del normalized["byweekday"]
+    exceptions = {day.isoformat() for day in map(_to_date, rule.get("exceptions") or []) if day is not None}
+    if exceptions:
+        normalized["exceptions"] = sorted(exceptions)
+    return normalized
+
+
+def find_recurrence(text):
+    """
+    Tìm cụm từ lặp lại trong văn bản ("hàng tuần", "2 tuần một lần", "every month")
+
+    Returns:
+        tuple: (quy tắc, (vị trí đầu, vị trí cuối)) hoặc None
+    """
+    m = _RECURRENCE_PATTERN.search(dates.fold(text))
+    if not m:
+        return None
+    unit = (m.group(1) or m.group(3) or m.group(5) or m.group(6)).rstrip("s")
+    interval = int(m.group(2) or m.group(4) or 1)
+    return {"freq": _FREQUENCY_ALIASES[unit], "interval": interval}, m.span()
+
+
+def describe(rule):
+    """Mô tả quy tắc lặp để hiển thị ("Hàng tuần (thứ Hai, thứ Tư) đến 31/12/2024")"""
+    unit = _UNITS[rule["freq"]]
+    text = f"Hàng {unit}" if rule.get("interval", 1) == 1 else f"{rule['interval']} {unit} một lần"
+    if rule.get("byweekday"):
+        text += " (" + ", ".join(dates.WEEKDAY_NAMES[day].lower() for day in rule["byweekday"]) + ")"
+    if rule.get("until"):
+        text += f" đến {datetime.date.fromisoformat(rule['until']).strftime('%d/%m/%Y')}"
+    if rule.get("count"):
+        text += f", {rule['count']} lần"
+    return text
+
+
+def _nth(start, rule, n):
+    step = rule["interval"] * n
+    if rule["freq"] == "daily":
+        return start + datetime.timedelta(days=step)
+    if rule["freq"] == "weekly":
+        return start + datetime.timedelta(weeks=step)
+    if rule["freq"] == "monthly":
+        return dates.add_months(start, step)
+    return dates.add_months(start, 12 * step)
+
+
+def _first_index(start, rule, from_date):
+    """Chỉ số lần diễn ra không vượt quá lần đầu tiên từ ``from_date`` (tính thẳng, không duyệt)"""
+    if from_date <= start:
+        return 0
+    if rule["freq"] == "daily":
+        return (from_date - start).days // rule["interval"]
+    if rule["freq"] == "weekly":
+        return (from_date - start).days // (7 * rule["interval"])
+    months = (from_date.year - start.year) * 12 + from_date.month - start.month
+    if rule["freq"] == "yearly":
+        months //= 12
+    return max(0, months // rule["interval"])
+
+
+def iter_dates(start, rule, from_date=None):
+    """
+    Sinh lần lượt các ngày diễn ra (datetime.date) từ ``from_date``, không tạo trước danh sách
+
+    Generator không giới hạn nếu quy tắc không có ``until``/``count``: người gọi tự dừng.
+    """
+    until = datetime.date.fromisoformat(rule["until"]) if rule.get("until") else None
+    count = rule.get("count")
+    exceptions = set(rule.get("exceptions", ()))
+
+    if rule["freq"] == "weekly" and rule.get("byweekday"):
+        weekdays = rule["byweekday"]
+        first_monday = start - datetime.timedelta(days=start.weekday())
+        first_week = sum(1 for day in weekdays if first_monday + datetime.timedelta(days=day) >= start)
+        week = 0
+        if from_date is not None and from_date > start:
+            week = (from_date - first_monday).days // (7 * rule["interval"])
+        index = 0 if week == 0 else first_week + (week - 1) * len(weekdays)
+        while True:
+            monday = first_monday + datetime.timedelta(weeks=rule["interval"] * week)
+            for weekday in weekdays:
+                day = monday + datetime.timedelta(days=weekday)
+                if day < start:
+                    continue
+                if (count and index >= count) or (until and day > until):
+                    return
+                index += 1
+                if (from_date is None or day >= from_date) and day.isoformat() not in exceptions:
+                    yield day
+            week += 1
+
+    n = 0 if from_date is None else _first_index(start, rule, from_date)
+    while True:
+        if count and n >= count:
+            return
+        day = _nth(start, rule, n)
+        if until and day > until:
+            return
+        n += 1
+        if (from_date is None or day >= from_date) and day.isoformat() not in exceptions:
+            yield day
+
+
+def event_start(event):
+    """Ngày của sự kiện (lần đầu tiên nếu lặp lại), hoặc None nếu không đọc được"""
+    try:
+        return datetime.date.fromisoformat(event.get("date", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def next_occurrence(event, from_date=None):
+    """Lần diễn ra kế tiếp (từ ``from_date``, mặc định hôm nay) của một sự kiện, hoặc None"""
+    from_date = from_date or datetime.date.today()
+    start = event_start(event)
+    if start is None:
+        return None
+    rule = event.get("recurrence")
+    if not rule:
+        return start if start >= from_date else None
+    return next(iter_dates(start, rule, from_date), None)
+
+
+def occurrence(event, day):
+    """Bản sao của sự kiện lặp lại cho một ngày cụ thể"""
+    return {**event, "date": day.isoformat(), "start_date": event.get("date", "")}
+
+
+class OccurrenceIndex:
+    """
+    Chỉ mục các lần diễn ra của một bản chụp ``events_data``
+
+    Sự kiện một lần được sắp theo (ngày, phút trong ngày) dạng số nguyên, lấy từ bản
+    xem có kiểu của cùng bản chụp (``records.build_view``), để tìm khoảng bằng bisect;
+    sự kiện lặp lại được sinh dần bằng ``iter_dates``. Bản chụp không đổi (copy-on-write)
+    nên chỉ mục dùng lại được cho tới khi ``events_data`` được thay.
+    """
+
+    def __init__(self, events_data, records):
+        self.events = events_data
+        self._single = []
+        self._recurring = []
+        for event_id, record in records.items():
+            if record.day is None:
+                continue
+            if record.recurrence:
+                self._recurring.append((record, event_id, events_data[event_id]))
+            else:
+                self._single.append((record.day, record.minute, event_id))
+        self._single.sort()
+
+    def _single_stream(self, start, end):
+        end = end.toordinal()
+        for index in range(bisect.bisect_left(self._single, (start.toordinal(),)), len(self._single)):
+            day, minute, event_id = self._single[index]
+            if day > end:
+                return
+            yield day, minute, event_id, self.events[event_id]
+
+    @staticmethod
+    def _recurring_stream(record, event_id, event, start, end):
+        for day in iter_dates(record.date, event["recurrence"], start):
+            if day > end:
+                return
+            yield day.toordinal(), record.minute, event_id, occurrence(event, day)
+
+    def window(self, start, end, predicate=None):
+        """
+        Các lần diễn ra trong [start, end] theo thứ tự ngày giờ
+
+        Yields:
+            tuple: (ID sự kiện, sự kiện với ``date`` là ngày diễn ra)
+        """
+        last = end.toordinal()
+        streams = [self._single_stream(start, end)]
+        streams += [self._recurring_stream(record, event_id, event, start, end)
+                    for record, event_id, event in self._recurring
+                    if record.day <= last and (predicate is None or predicate(event))]
+        for _, _, event_id, event in heapq.merge(*streams, key=lambda item: item[:3]):
+            if predicate is None or predicate(event):
+                yield event_id, event
@@ -0,0 +1,428 @@
+"""
+Nhắc lịch chạy nền cho các sự kiện sắp tới.
+
+``ReminderScheduler`` giữ một min-heap các thời điểm nhắc: mỗi sự kiện chỉ có một
+mục là lần nhắc kế tiếp của nó (sự kiện lặp lại: của lần diễn ra kế tiếp, xem
+recurrence). Luồng nền ngủ tới mục đầu heap, nên dù có hàng nghìn sự kiện mỗi
+lần thức chỉ xử lý các lần nhắc đã tới hạn, không duyệt lại toàn bộ sự kiện.
+
+Heap được dựng từ kho dữ liệu khi bắt đầu theo dõi một hộ gia đình và được cập
+nhật theo từng thay đổi (``HouseholdStore.add_listener``): sự kiện bị sửa/xóa
+được tính lại, mục cũ trong heap bị bỏ qua nhờ số phiên bản (lazy invalidation).
+
+Thời điểm nhắc: ``REMINDER_LEAD_MINUTES`` phút trước giờ bắt đầu (mặc định 1 ngày
+và 1 giờ), hoặc theo trường ``reminders`` (danh sách số phút) của từng sự kiện.
+Sự kiện cả ngày được tính từ ``REMINDER_ALL_DAY_TIME``. Lần nhắc bị lỡ khi tiến
+trình không chạy không được gửi bù.
+
+Nơi nhận (sink):
+- ``InAppSink``: hộp thông báo trong tiến trình, giao diện đọc bằng ``recent()``
+- ``WebhookSink``: POST JSON tới ``REMINDER_WEBHOOK_URL``
+- ``FileSink``: ghi cùng nội dung đó vào file JSON Lines, dùng thay webhook khi chạy
+  cục bộ (``REMINDER_WEBHOOK_URL=file:///đường/dẫn/reminders.jsonl``)
+
+Khi nhiều tiến trình dùng chung thư mục dữ liệu, chỉ tiến trình giữ khóa
+``reminders.lock`` của hộ gia đình gửi ra ngoài (webhook/file); thông báo trong
+ứng dụng được gửi ở mọi tiến trình.
+
+Chỉ hộ gia đình đang được tải trong tiến trình (``watch``) mới được nhắc lịch: hộ bị loại
+khỏi bộ nhớ (LRU của ``HouseholdRegistry``) không được nhắc cho tới khi được tải lại. Trạng
+thái theo dõi và khóa ``reminders.lock`` gắn với (thư mục dữ liệu, hộ gia đình), không gắn
+với đối tượng kho, nên được dùng lại khi hộ được tải lại, và được giải phóng ngay khi kho bị
+thu gom.
+"""
+import collections
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+from family_assistant import dates, recurrence
+
+logger = logging.getLogger('family_assistant.reminders')
+
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "1") != "0"
+REMINDER_LEAD_MINUTES = [int(value) for value in os.getenv("REMINDER_LEAD_MINUTES", "1440,60").split(",")
+                         if value.strip()]
+REMINDER_ALL_DAY_TIME = os.getenv("REMINDER_ALL_DAY_TIME", "08:00")
+REMINDER_WEBHOOK_URL = os.getenv("REMINDER_WEBHOOK_URL", "")
+WEBHOOK_TIMEOUT = 5.0
+LEASE_FILE = "reminders.lock"
+# Số lần diễn ra tối đa được xét khi tìm lần nhắc kế tiếp của một sự kiện lặp lại
+MAX_OCCURRENCES_CHECKED = 1000
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def occurrence_start(event, day):
+    """Thời điểm bắt đầu của lần diễn ra ``day``; sự kiện cả ngày tính từ REMINDER_ALL_DAY_TIME"""
+    time_text = event.get("time") if dates.is_hhmm(event.get("time")) else REMINDER_ALL_DAY_TIME
+    return datetime.datetime.combine(day, datetime.time.fromisoformat(time_text))
+
+
+def lead_times(event, default=None):
+    """Số phút nhắc trước của sự kiện (trường ``reminders`` hoặc mặc định)"""
+    leads = event.get("reminders")
+    if not isinstance(leads, list):
+        leads = REMINDER_LEAD_MINUTES if default is None else default
+    return sorted({int(lead) for lead in leads if str(lead).isdigit()})
+
+
+def next_reminder(event, after, default_leads=None):
+    """
+    Lần nhắc kế tiếp sau thời điểm ``after`` (datetime)
+
+    Returns:
+        tuple: (thời điểm nhắc, ngày diễn ra, số phút trước) hoặc None
+    """
+    leads = lead_times(event, default_leads)
+    first = recurrence.event_start(event)
+    if not leads or first is None:
+        return None
+    max_lead = datetime.timedelta(minutes=leads[-1])
+    rule = event.get("recurrence")
+    from_date = after.date()
+    days = recurrence.iter_dates(first, rule, from_date) if rule else iter([first] if first >= from_date else [])
+
+    best = None
+    for day in itertools.islice(days, MAX_OCCURRENCES_CHECKED):
+        start = occurrence_start(event, day)
+        # Lần diễn ra sau không thể có lần nhắc sớm hơn lần tốt nhất đã tìm được
+        if best is not None and start - max_lead > best[0]:
+            break
+        for lead in leads:
+            fire_at = start - datetime.timedelta(minutes=lead)
+            if fire_at > after and (best is None or fire_at < best[0]):
+                best = (fire_at, day, lead)
+    return best
+
+
+def _lead_text(minutes):
+    if minutes % 1440 == 0 and minutes:
+        return f"{minutes // 1440} ngày"
+    if minutes % 60 == 0 and minutes:
+        return f"{minutes // 60} giờ"
+    return f"{minutes} phút"
+
+
+def build_notification(store, event_id, event, day, lead):
+    start = occurrence_start(event, day)
+    when = dates.format_date(day) + (f" lúc {event['time']}" if dates.is_hhmm(event.get("time")) else "")
+    message = f"⏰ Nhắc lịch: {event.get('title', 'Sự kiện')} - {when}"
+    if lead:
+        message += f" (còn {_lead_text(lead)})"
+    return {
+        "household_id": store.household_id,
+        "event_id": event_id,
+        "title": event.get("title", ""),
+        "date": day.isoformat(),
+        "time": event.get("time", ""),
+        "starts_at": start.isoformat(timespec="minutes"),
+        "lead_minutes": lead,
+        "participants": event.get("participants", []),
+        "created_by": event.get("created_by", ""),
+        "message": message,
+    }
+
+
+class InAppSink:
+    """Hộp thông báo nhắc lịch trong tiến trình, giữ ``max_items`` thông báo gần nhất của mỗi hộ"""
+
+    external = False
+
+    def __init__(self, max_items=100):
+        self._items = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self.max_items = max_items
+
+    def deliver(self, notification):
+        with self._lock:
+            items = self._items.setdefault(notification["household_id"], collections.deque(maxlen=self.max_items))
+            items.append({**notification, "id": next(self._sequence)})
+
+    def recent(self, household_id, since=0, member=None):
+        """
+        Các thông báo có ``id`` lớn hơn ``since``
+
+        Nếu truyền ``member`` (dict thành viên có ``id``/``name``), chỉ lấy nhắc lịch của
+        sự kiện thành viên đó tạo, tham gia, hoặc sự kiện chung không ghi người tham gia.
+        """
+        with self._lock:
+            items = [item for item in self._items.get(household_id, ()) if item["id"] > since]
+        if member is None:
+            return items
+        return [item for item in items
+                if not item["participants"] or member.get("name") in item["participants"]
+                or item["created_by"] == member.get("id")]
+
+
+class WebhookSink:
+    """Gửi nhắc lịch tới một webhook (POST JSON), thử lại một lần khi lỗi"""
+
+    external = True
+
+    def __init__(self, url, timeout=WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, notification):
+        import httpx
+
+        for attempt in range(2):
+            try:
+                response = httpx.post(self.url, json=notification, timeout=self.timeout)
+                response.raise_for_status()
+                return
+            except Exception as e:
+                logger.warning(f"Lỗi khi gửi nhắc lịch tới webhook (lần {attempt + 1}): {e}")
+        logger.error(f"Không gửi được nhắc lịch sự kiện {notification['event_id']} tới webhook")
+
+
+class FileSink:
+    """Ghi nhắc lịch vào file JSON Lines (thay cho webhook khi chạy cục bộ)"""
+
+    external = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, notification):
+        line = json.dumps(notification, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def sinks_from_url(url=REMINDER_WEBHOOK_URL):
+    """Các nơi nhận bên ngoài theo cấu hình: http(s):// là webhook, file:// là file cục bộ"""
+    if not url:
+        return []
+    if url.startswith("file://"):
+        return [FileSink(url[len("file://"):])]
+    return [WebhookSink(url)]
+
+
+class _Lease:
+    """Khóa file không chờ: tiến trình giữ khóa của hộ gia đình là nơi gửi nhắc lịch ra ngoài"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        f = None
+        try:
+            f = open(self.path, "a+b")
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if f is not None:
+                f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _watch_key(store):
+    return os.path.realpath(store.data_dir), store.household_id
+
+
+class _Watched:
+    """Trạng thái theo dõi của một hộ gia đình (dùng lại khi hộ được tải lại thành kho mới)"""
+
+    def __init__(self, store):
+        self.ref = weakref.ref(store)
+        self.household_id = store.household_id
+        self.generation = 0
+        self.versions = {}
+        self.lease = _Lease(os.path.join(store.data_dir, LEASE_FILE))
+
+    def bind(self, store):
+        """Chuyển sang kho mới của cùng hộ gia đình: mục cũ trong heap bị bỏ qua nhờ ``generation``"""
+        self.ref = weakref.ref(store)
+        self.generation += 1
+        self.versions = {}
+
+
+class ReminderScheduler:
+    """Luồng nền gửi nhắc lịch theo min-heap các thời điểm nhắc"""
+
+    def __init__(self, sinks=None, lead_minutes=None, clock=time.time):
+        self.inbox = InAppSink()
+        self.sinks = [self.inbox] + list(sinks if sinks is not None else sinks_from_url())
+        self.lead_minutes = lead_minutes
+        self.clock = clock
+        self.fired = 0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._watched = {}
+        self._changes = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def watch(self, store):
+        """Bắt đầu nhắc lịch cho một hộ gia đình (gọi lại nhiều lần, hoặc với kho tải lại, không sao)"""
+        key = _watch_key(store)
+        with self._cond:
+            watched = self._watched.get(key)
+            if watched is not None and watched.ref() is store:
+                return
+            if watched is None:
+                watched = self._watched[key] = _Watched(store)
+            else:
+                watched.bind(store)
+            self._changes[key] = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        weakref.finalize(store, self._forget, key, watched.ref)
+        store.add_listener(self._on_change)
+
+    def _forget(self, key, ref):
+        """Kho đã bị thu gom: bỏ theo dõi và trả khóa gửi ra ngoài (trừ khi hộ đã được tải lại)"""
+        with self._cond:
+            watched = self._watched.get(key)
+            if watched is None or watched.ref is not ref:
+                return
+            del self._watched[key]
+            self._changes.pop(key, None)
+            watched.lease.release()
+
+    def pending(self):
+        """Số mục trong heap (kể cả mục đã lỗi thời chưa bị bỏ)"""
+        with self._cond:
+            return len(self._heap)
+
+    def _on_change(self, store, collection, ids):
+        # Gọi khi kho đang giữ khóa ghi: chỉ ghi nhận, luồng nền sẽ tính lại
+        if collection != "events":
+            return
+        with self._cond:
+            key = _watch_key(store)
+            watched = self._watched.get(key)
+            if watched is None or watched.ref() is not store:
+                return
+            if ids is None or self._changes.get(key, set()) is None:
+                self._changes[key] = None
+            else:
+                self._changes.setdefault(key, set()).update(ids)
+            self._cond.notify()
+
+    def _schedule(self, watched, event_id, events_data, after):
+        """Tính lại lần nhắc kế tiếp của một sự kiện; cần giữ ``_cond``"""
+        version = watched.versions.get(event_id, 0) + 1
+        watched.versions[event_id] = version
+        event = events_data.get(event_id)
+        if not isinstance(event, dict):
+            return
+        try:
+            reminder = next_reminder(event, after, self.lead_minutes)
+        except Exception as e:
+            logger.error(f"Lỗi khi tính lần nhắc của sự kiện {event_id}: {e}")
+            return
+        if reminder is not None:
+            fire_at, day, lead = reminder
+            heapq.heappush(self._heap, (fire_at.timestamp(), next(self._sequence), watched, event_id,
+                                        watched.generation, version, day, lead))
+
+    def _apply_changes(self):
+        """Cập nhật heap theo các thay đổi đã ghi nhận; cần giữ ``_cond``"""
+        changes, self._changes = self._changes, {}
+        after = datetime.datetime.fromtimestamp(self.clock())
+        for key, ids in changes.items():
+            watched = self._watched.get(key)
+            store = watched.ref() if watched else None
+            if store is None:
+                continue
+            events_data = store.events_data
+            if ids is None:
+                watched.generation += 1
+                watched.versions = {}
+                ids = list(events_data)
+            for event_id in ids:
+                self._schedule(watched, event_id, events_data, after)
+
+    def _next_due(self):
+        """Chờ và lấy lần nhắc tới hạn còn hiệu lực"""
+        with self._cond:
+            while True:
+                if self._changes:
+                    self._apply_changes()
+                now = self.clock()
+                if self._heap and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    _, _, watched, event_id, generation, version, day, lead = entry
+                    store = watched.ref()
+                    if store is None:
+                        continue  # Kho đã bị thu gom (xem ``_forget``)
+                    if generation != watched.generation or watched.versions.get(event_id) != version:
+                        continue  # Sự kiện đã bị sửa/xóa sau khi mục này được tạo
+                    event = store.events_data.get(event_id)
+                    # Lần nhắc kế tiếp tính từ thời điểm nhắc này
+                    self._schedule(watched, event_id, store.events_data,
+                                   datetime.datetime.fromtimestamp(entry[0]))
+                    if isinstance(event, dict):
+                        return store, watched, event_id, event, day, lead
+                    continue
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _run(self):
+        while True:
+            store, watched, event_id, event, day, lead = self._next_due()
+            notification = build_notification(store, event_id, event, day, lead)
+            self.fired += 1
+            for sink in self.sinks:
+                if sink.external and not watched.lease.acquire():
+                    continue  # Tiến trình khác đang gửi nhắc lịch của hộ này ra ngoài
+                try:
+                    sink.deliver(notification)
+                except Exception as e:
+                    logger.error(f"Lỗi khi gửi nhắc lịch qua {type(sink).__name__}: {e}")
+            logger.info(f"Đã nhắc lịch: {notification['message']} (hộ gia đình {store.household_id})")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Bộ nhắc lịch dùng chung của tiến trình"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReminderScheduler()
+        return _scheduler
+
+
+def _reset_scheduler_after_fork():
+    # Tiến trình con (fork) không có luồng nhắc lịch của tiến trình cha
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_scheduler_after_fork)
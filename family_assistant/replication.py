@@ -0,0 +1,272 @@
+"""
+Lan truyền thay đổi giữa nhiều tiến trình dùng chung một thư mục dữ liệu.
+
+Khi chạy nhiều bản sao Streamlit/dịch vụ sau bộ cân bằng tải, mỗi tiến trình
+giữ dữ liệu trong bộ nhớ. Để thay đổi của tiến trình này đến được tiến trình
+khác mà không ghi đè lẫn nhau:
+
+- Mọi thay đổi được ghi thành một thao tác trên bản ghi (put/patch/del/prepend)
+  vào nhật ký ``changes.jsonl`` của hộ gia đình, mỗi thao tác mang số phiên bản
+  tăng dần (version stamp). Việc ghi nhật ký và file dữ liệu diễn ra dưới khóa
+  file nên các tiến trình lần lượt đồng bộ.
+- Trước khi ghi, tiến trình đọc phần nhật ký mới (chỉ phần đuôi, không đọc lại
+  cả file) và áp dụng vào dữ liệu của mình; thao tác cục bộ được so phiên bản
+  với bản ghi hiện tại (optimistic concurrency) và được rebase khi có xung đột.
+- ``ChangeWatcher`` kiểm tra kích thước/mtime của nhật ký định kỳ và chỉ đọc
+  phần đuôi mới khi file thay đổi.
+- Khi nhật ký quá lớn, nó được nén lại thành một dòng tiêu đề với epoch mới;
+  tiến trình thấy epoch đổi sẽ tải lại các file dữ liệu (luôn được cập nhật
+  cùng lúc với nhật ký).
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger('family_assistant.replication')
+
+JOURNAL_FILE = "changes.jsonl"
+# Nhật ký lớn hơn ngưỡng này (byte) sẽ được nén lại
+JOURNAL_MAX_BYTES = int(os.getenv("STORE_JOURNAL_MAX_BYTES", str(1024 * 1024)))
+# Chu kỳ (giây) kiểm tra thay đổi từ tiến trình khác
+WATCH_INTERVAL = float(os.getenv("STORE_WATCH_INTERVAL", "0.5"))
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Khóa liên tiến trình dựa trên một file khóa"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            # msvcrt không có khóa chia sẻ; LK_LOCK tự thử lại trong ~10 giây
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def apply_ops(data, ops):
+    """
+    Áp dụng các thao tác lên một tập dữ liệu, trả về từ điển mới (copy-on-write)
+
+    Bản ghi cũ không bị sửa tại chỗ nên các bản chụp đang được đọc vẫn nguyên vẹn.
+    """
+    if not ops:
+        return data
+    data = dict(data)
+    for op in ops:
+        record_id = op["id"]
+        if op["op"] == "put":
+            data[record_id] = op["value"]
+        elif op["op"] == "patch":
+            if record_id not in data:
+                continue
+            record = {**data[record_id], **op.get("fields", {})}
+            for key, values in op.get("merge", {}).items():
+                record[key] = {**(record.get(key) or {}), **values}
+            data[record_id] = record
+        elif op["op"] == "del":
+            data.pop(record_id, None)
+        elif op["op"] == "prepend":
+            data[record_id] = retain([op["value"]] + list(data.get(record_id, [])), op["limit"], op.get("max_bytes"))
+    return data
+
+
+def retain(entries, limit, max_bytes=None):
+    """
+    Giữ các mục mới nhất (đầu danh sách) trong giới hạn số lượng và tổng ``size``
+
+    Mục mới nhất luôn được giữ kể cả khi một mình nó đã vượt ``max_bytes``.
+    """
+    kept, total = [], 0
+    for entry in entries[:limit]:
+        total += entry.get("size", 0) if isinstance(entry, dict) else 0
+        if kept and max_bytes is not None and total > max_bytes:
+            break
+        kept.append(entry)
+    return kept
+
+
+def next_free_id(*id_sets):
+    """ID số kế tiếp chưa được dùng trong các tập ID"""
+    numbers = [int(key) for ids in id_sets for key in ids if str(key).isdigit()]
+    return str(max(numbers, default=0) + 1)
+
+
+class ChangeJournal:
+    """Nhật ký thay đổi (JSON Lines) của một hộ gia đình; mọi thao tác cần giữ ``lock()``"""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, JOURNAL_FILE)
+        self.epoch = None
+        self.offset = 0
+        self.version = 0
+        self.last_stat = None
+
+    def lock(self, shared=False):
+        return file_lock(self.path + ".lock", shared)
+
+    def stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def changed(self):
+        """Nhật ký có thay đổi kể từ lần đọc trước không (chỉ gọi os.stat)"""
+        return self.stat() != self.last_stat
+
+    def open(self):
+        """
+        Đọc toàn bộ nhật ký (tạo mới nếu chưa có)
+
+        Returns:
+            dict: Phiên bản của từng bản ghi {tập dữ liệu: {id: phiên bản}}
+        """
+        if not os.path.exists(self.path):
+            self._write_header({})
+        with open(self.path, "rb") as f:
+            header = json.loads(f.readline())
+            self.epoch = header["epoch"]
+            self.version = header["base_version"]
+            self.offset = f.tell()
+            versions = {collection: dict(ids) for collection, ids in header.get("versions", {}).items()}
+        for entry in self.read_new():
+            versions.setdefault(entry["c"], {})[entry["id"]] = entry["v"]
+        return versions
+
+    def read_new(self):
+        """
+        Các thao tác được ghi thêm từ lần đọc trước
+
+        Trả về None nếu nhật ký đã được nén (epoch đổi), khi đó cần ``open()`` lại.
+        """
+        with open(self.path, "rb") as f:
+            header = json.loads(f.readline())
+            if header["epoch"] != self.epoch:
+                return None
+            f.seek(self.offset)
+            data = f.read()
+        # Chỉ nhận các dòng đã ghi trọn vẹn
+        complete = data[:data.rfind(b"\n") + 1]
+        self.offset += len(complete)
+        entries = [json.loads(line) for line in complete.splitlines() if line.strip()]
+        if entries:
+            self.version = max(self.version, entries[-1]["v"])
+        self.last_stat = self.stat()
+        return entries
+
+    def append(self, ops, origin):
+        """Ghi thêm các thao tác, gán số phiên bản; trả về các bản ghi nhật ký"""
+        entries = []
+        for op in ops:
+            self.version += 1
+            entries.append({**{key: value for key, value in op.items() if key not in ("base", "new")},
+                            "v": self.version, "origin": origin})
+        payload = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        self.last_stat = self.stat()
+        return entries
+
+    def size(self):
+        return self.offset
+
+    def compact(self, versions):
+        """Thay nhật ký bằng một dòng tiêu đề (các file dữ liệu phải đã được cập nhật)"""
+        self._write_header(versions)
+        logger.info(f"Đã nén nhật ký thay đổi {self.path} tại phiên bản {self.version}")
+
+    def _write_header(self, versions):
+        header = {"epoch": uuid.uuid4().hex, "base_version": self.version, "versions": versions}
+        line = (json.dumps(header, ensure_ascii=False) + "\n").encode("utf-8")
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.epoch = header["epoch"]
+        self.offset = len(line)
+        self.last_stat = self.stat()
+
+
+class ChangeWatcher:
+    """Luồng nền kiểm tra nhật ký của các kho đang mở và áp dụng thay đổi từ tiến trình khác"""
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+        self._stores = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, store):
+        with self._lock:
+            self._stores.add(store)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="store-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                stores = list(self._stores)
+            for store in stores:
+                try:
+                    if store.journal.changed():
+                        store.sync()
+                except Exception as e:
+                    logger.error(f"Lỗi khi đồng bộ thay đổi của hộ gia đình {store.household_id}: {e}")
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher():
+    """Luồng theo dõi dùng chung của tiến trình"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = ChangeWatcher()
+        return _watcher
+
+
+def _reset_watcher_after_fork():
+    # Tiến trình con (fork) không có luồng theo dõi của tiến trình cha
+    global _watcher, _watcher_lock
+    _watcher = None
+    _watcher_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_watcher_after_fork)
@@ -0,0 +1,231 @@
+"""
+Ngắt mạch theo endpoint và gửi lặp (hedged request) cho các lời gọi API bên ngoài.
+
+Ngắt mạch (circuit breaker): sau ``BREAKER_FAILURE_THRESHOLD`` lần lỗi liên tiếp kiểu
+sự cố (mất kết nối, hết thời gian chờ, HTTP 429/5xx), endpoint bị bỏ qua ngay trong
+``BREAKER_RESET_SECONDS`` giây (lời gọi ném ``CircuitOpenError`` thay vì chờ timeout).
+Hết thời gian đó, một lời gọi thử được cho qua: thành công thì đóng mạch, lỗi thì mở lại.
+Lỗi do chính yêu cầu (HTTP 400, 401...) không tính là sự cố của endpoint.
+
+Gửi lặp: với lời gọi lặp lại được an toàn (phân loại ý định, tìm kiếm, trích xuất), nếu
+lời gọi đầu chưa xong sau p95 độ trễ đã đo của chính loại lời gọi đó, một bản sao được
+gửi song song; kết quả nào về trước (thành công) được dùng, bản còn lại bị hủy. Chỉ gửi
+lặp khi đã có ít nhất ``HEDGE_MIN_SAMPLES`` số đo. Các loại lời gọi được gửi lặp nằm
+trong ``HEDGE_CALLS`` (rỗng để tắt).
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from family_assistant import telemetry
+
+logger = logging.getLogger('family_assistant.resilience')
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+HEDGE_CALLS = {name.strip() for name in os.getenv(
+    "HEDGE_CALLS", "detect_search_intent,tavily_search,tavily_extract").split(",") if name.strip()}
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_QUANTILE = 0.95
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Endpoint đang bị ngắt mạch, lời gọi không được gửi đi"""
+
+
+def is_outage(error):
+    """Lỗi có phải do endpoint gặp sự cố (không phải do yêu cầu sai) không"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 429
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, openai.APIConnectionError)
+
+
+class CircuitBreaker:
+    """Ngắt mạch cho một endpoint, an toàn đa luồng"""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """Mạch đang mở và chưa tới lúc thử lại"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        """Có được gửi lời gọi không (khi mạch nửa mở chỉ cho qua một lời gọi thử)"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_started = now
+                return True
+            if self.state == HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+                # Lời gọi thử trước không báo kết quả (ví dụ bị hủy): cho thử lại
+                self._probe_started = now
+                return True
+            self.rejected += 1
+        telemetry.record_resilience(self.name, "rejected")
+        return False
+
+    def check(self):
+        """Như ``allow`` nhưng ném ``CircuitOpenError`` khi không được gửi"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} đang tạm ngưng sau nhiều lỗi liên tiếp")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Đóng mạch {self.name}: lời gọi thử thành công")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self, error=None):
+        """Ghi nhận một lời gọi lỗi; lỗi không phải sự cố của endpoint được coi như thành công"""
+        if error is not None and not is_outage(error):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            opened = self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold)
+            if opened:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+        if opened:
+            telemetry.record_resilience(self.name, "opened")
+            logger.warning(f"Ngắt mạch {self.name} trong {self.reset_timeout:.0f}s sau {self.failures} lỗi: {error}")
+
+    def snapshot(self):
+        with self._lock:
+            return {"endpoint": self.name, "state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    """Ngắt mạch dùng chung của một endpoint (tạo khi cần lần đầu)"""
+    with _breakers_lock:
+        circuit = _breakers.get(name)
+        if circuit is None:
+            circuit = _breakers[name] = CircuitBreaker(name)
+        return circuit
+
+
+def breaker_summary():
+    """Trạng thái các ngắt mạch, dùng cho bảng điều khiển"""
+    with _breakers_lock:
+        circuits = sorted(_breakers.values(), key=lambda circuit: circuit.name)
+    return [circuit.snapshot() for circuit in circuits]
+
+
+async def guarded(name, factory):
+    """Chạy ``factory()`` qua ngắt mạch của endpoint ``name``"""
+    circuit = breaker(name)
+    circuit.check()
+    try:
+        result = await factory()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        circuit.record_failure(e)
+        raise
+    circuit.record_success()
+    return result
+
+
+# ------ Gửi lặp ------
+_latency = {}
+_latency_lock = threading.Lock()
+
+
+def observe_latency(name, seconds):
+    with _latency_lock:
+        histogram = _latency.get(name)
+        if histogram is None:
+            histogram = _latency[name] = telemetry.Histogram(reservoir_size=200)
+        histogram.observe(seconds)
+
+
+def hedge_delay(name):
+    """Thời gian chờ trước khi gửi bản sao (giây), hoặc None nếu không gửi lặp"""
+    if name not in HEDGE_CALLS:
+        return None
+    with _latency_lock:
+        histogram = _latency.get(name)
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, histogram.quantile(HEDGE_QUANTILE))
+
+
+async def hedged(name, factory):
+    """
+    Chạy ``factory()`` (trả về coroutine, lặp lại được an toàn), gửi thêm một bản sao
+    nếu lời gọi đầu chậm hơn p95 của loại lời gọi ``name``
+
+    Độ trễ được ghi nhận là độ trễ bên gọi thấy (tính từ lần gửi đầu), để p95 không
+    bị kéo xuống chỉ vì các lời gọi chậm đã được bản sao thay thế.
+
+    Returns:
+        Kết quả của bản về trước; nếu cả hai lỗi, ném lỗi của bản về sau
+    """
+    delay = hedge_delay(name)
+    started = time.perf_counter()
+    if delay is None:
+        result = await factory()
+        observe_latency(name, time.perf_counter() - started)
+        return result
+
+    tasks = [asyncio.ensure_future(factory())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            telemetry.record_resilience(name, "hedged")
+            tasks.append(asyncio.ensure_future(factory()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                observe_latency(name, time.perf_counter() - started)
+                if len(tasks) > 1 and task is tasks[1]:
+                    telemetry.record_resilience(name, "hedge_won")
+                return task.result()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
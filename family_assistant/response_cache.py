@@ -0,0 +1,164 @@
+"""
+Cache phản hồi cho các câu hỏi lặp lại nguyên văn.
+
+Câu hỏi gợi ý đến từ cùng một bộ mẫu nên nhiều thành viên thường hỏi đúng một câu
+trong cùng một giờ ("Tin công nghệ?", "Kết quả Champions League?"). Phản hồi của
+lượt đầu tiên được giữ lại và dùng chung cho mọi phiên trong tiến trình.
+
+Khóa cache gồm:
+- câu hỏi đã chuẩn hóa (chữ thường, gộp khoảng trắng, bỏ dấu câu ở hai đầu)
+- dấu vân tay ngữ cảnh thành viên (thông tin hồ sơ của thành viên) và phiên bản dữ liệu
+  của hộ gia đình (``HouseholdStore.data_version``): system prompt luôn chứa dữ liệu gia
+  đình và thành viên, nên phản hồi không bao giờ dùng chung giữa các thành viên hay qua
+  một lần thay đổi dữ liệu
+- khung thời gian theo TTL của loại câu hỏi
+
+Loại câu hỏi (tin tức/thời tiết/giá cả/thể thao hay thông thường) chỉ dùng để chọn TTL;
+mẫu nhận diện cố ý hẹp (cần từ khóa riêng của loại đó, không chỉ "tin", "kết quả"...) để
+câu hỏi cá nhân như "Kết quả khám răng của con?" không bị coi là tin trực tiếp.
+
+Chỉ lượt đầu của một cuộc trò chuyện, không có hình ảnh, mới được tra và lưu cache.
+Phản hồi có lệnh (thêm sự kiện, ghi chú...) không được lưu, để lệnh không bị thực thi
+lại mỗi lần câu hỏi được hỏi lại.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from family_assistant import dates
+
+logger = logging.getLogger('family_assistant.response_cache')
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+
+# TTL (giây) theo loại câu hỏi, ví dụ RESPONSE_CACHE_TTLS="price=300,general=1800"
+DEFAULT_TTLS = {"price": 600, "sports": 900, "weather": 1800, "news": 1800, "general": 3600}
+
+# Loại câu hỏi cần thông tin mới từ web (so khớp trên chữ đã bỏ dấu), theo thứ tự ưu tiên. Chỉ
+# dùng để chọn TTL; không dùng từ chung chung ("kết quả", "lịch thi đấu", "tin") vì câu hỏi
+# cá nhân cũng dùng chúng ("kết quả khám răng của con")
+_SPORTS_TERMS = (r"bong da|champions league|ngoai hang anh|premier league|la liga|v ?league|world cup|sea games"
+                 r"|bxh|bang xep hang|doi tuyen|clb")
+LIVE_CATEGORIES = (
+    ("price", re.compile(r"\b(gia (vang|xang|dau|usd|do|bitcoin|ca phe|lua|heo|thit|nha|dat)|ty gia|bitcoin"
+                         r"|chung khoan|co phieu|vn ?index|lai suat|exchange rate|stock price)\b")),
+    ("sports", re.compile(r"\b(" + _SPORTS_TERMS + r")\b")),
+    ("weather", re.compile(r"\b(thoi tiet|du bao thoi tiet|mua bao|nhiet do ngoai troi|weather|forecast)\b")),
+    ("news", re.compile(r"(?<!thong )\b(tin tuc|ban tin|thoi su|tin (moi nhat|nong|cong nghe|the thao|kinh te"
+                        r"|the gioi|giai tri)|news|headlines)\b")),
+)
+
+_EDGE_PUNCTUATION = " \t\n?!.,;:…\"'“”‘’()[]"
+
+
+def _ttls_from_env(raw):
+    ttls = dict(DEFAULT_TTLS)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, seconds = item.partition("=")
+        try:
+            ttls[name.strip()] = max(1, int(seconds))
+        except ValueError:
+            logger.warning(f"Bỏ qua TTL không hợp lệ trong RESPONSE_CACHE_TTLS: {item}")
+    return ttls
+
+
+TTLS = _ttls_from_env(os.getenv("RESPONSE_CACHE_TTLS", ""))
+
+
+def normalize_question(text):
+    """Chuẩn hóa câu hỏi để so khớp nguyên văn: NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu ở hai đầu"""
+    text = unicodedata.normalize("NFC", text).lower()
+    return " ".join(text.split()).strip(_EDGE_PUNCTUATION)
+
+
+def categorize(question):
+    """Loại câu hỏi: "price", "sports", "weather", "news" hoặc "general" """
+    folded = dates.fold(question)
+    for category, pattern in LIVE_CATEGORIES:
+        if pattern.search(folded):
+            return category
+    return "general"
+
+
+def member_fingerprint(store, member_id):
+    """Dấu vân tay hồ sơ thành viên (đổi khi tên, tuổi hoặc sở thích đổi)"""
+    if not member_id:
+        return ""
+    member = store.family_data.get(member_id) or {}
+    raw = json.dumps([member_id, member.get("name"), member.get("age"), member.get("preferences")],
+                     ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Cache LRU có TTL cho phản hồi của trợ lý, an toàn đa luồng"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttls=TTLS):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self._items = OrderedDict()  # khóa -> (phản hồi, thời điểm hết hạn)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, store, question, member_id=None, search_enabled=True, now=None):
+        """
+        Khóa cache của một câu hỏi, hoặc None nếu câu hỏi không dùng được cache
+
+        Returns:
+            tuple: (khóa, loại câu hỏi)
+        """
+        normalized = normalize_question(question or "")
+        if not normalized:
+            return None, None
+        category = categorize(normalized)
+        ttl = self.ttls.get(category, DEFAULT_TTLS["general"])
+        bucket = int((time.time() if now is None else now) // ttl)
+        return (store.data_dir, category, normalized, member_fingerprint(store, member_id), store.data_version,
+                search_enabled, bucket), category
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, category, response, now=None):
+        if not response:
+            return
+        expires = (time.time() if now is None else now) + self.ttls.get(category, DEFAULT_TTLS["general"])
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (response, expires)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self, store=None):
+        """Xóa cache (của một hộ gia đình hoặc toàn bộ)"""
+        with self._lock:
+            if store is None:
+                self._items.clear()
+                return
+            for key in [key for key in self._items if key[0] == store.data_dir]:
+                del self._items[key]
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Cache dùng chung cho mọi phiên trong tiến trình
+response_cache = ResponseCache()
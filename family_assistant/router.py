@@ -0,0 +1,220 @@
+"""
+Chọn mô hình và nhà cung cấp cho từng loại lời gọi, tự chuyển sang lựa chọn khác khi lỗi.
+
+Mỗi vị trí gọi (phân loại ý định, tóm tắt, câu hỏi gợi ý, tổng hợp tìm kiếm, câu trả
+lời chính, hình ảnh) có một chính sách: danh sách các lựa chọn ``nhà_cung_cấp:mô_hình``
+và tiêu chí xếp hạng:
+
+- ``cost``: rẻ nhất trước (theo bảng giá của usage_ledger)
+- ``latency``: nhanh nhất trước (trung bình trượt độ trễ đo được của chính vị trí gọi đó;
+  lựa chọn chưa có số đo được thử trước để có số liệu)
+- ``order``: giữ thứ tự khai báo (ưu tiên chất lượng)
+
+Nhà cung cấp là các endpoint tương thích OpenAI Chat Completions: ``openai`` (dùng API key
+của người dùng, ``OPENAI_BASE_URL``), ``gemini`` (endpoint tương thích OpenAI của Google,
+bật khi có ``GEMINI_API_KEY``/``GOOGLE_API_KEY``) và các endpoint khai báo thêm qua
+``MODEL_PROVIDERS="tên=url,..."`` với key ``<TÊN>_API_KEY``. Nhà cung cấp chưa có key bị bỏ qua.
+
+Lựa chọn vừa gặp sự cố (mất kết nối, hết thời gian chờ, HTTP 429/5xx; lỗi do chính yêu cầu
+như HTTP 400/401 không tính) bị tạm ngưng (``ROUTER_FAILURE_COOLDOWN`` giây, gấp đôi sau mỗi lần lỗi
+liên tiếp) và được xếp cuối danh sách, cũng như lựa chọn có nhà cung cấp đang bị ngắt mạch
+(xem resilience); nếu mọi lựa chọn đều đang tạm ngưng thì vẫn thử lần lượt, trừ các
+nhà cung cấp đang bị ngắt mạch.
+
+Chính sách đổi được qua biến môi trường ``MODEL_ROUTE_<VỊ_TRÍ_GỌI>``, ví dụ
+``MODEL_ROUTE_DETECT_SEARCH_INTENT="cost:gemini:gemini-1.5-flash,openai:gpt-4o-mini"``.
+"""
+import logging
+import os
+import threading
+import time
+
+from family_assistant import resilience
+from family_assistant.usage_ledger import MODEL_PRICING
+
+logger = logging.getLogger('family_assistant.router')
+
+OPENAI_MODEL = "gpt-4o-mini"
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/")
+ROUTER_FAILURE_COOLDOWN = float(os.getenv("ROUTER_FAILURE_COOLDOWN", "30"))
+ROUTER_MAX_COOLDOWN = 300.0
+# Trọng số của số đo mới trong trung bình trượt độ trễ
+LATENCY_EWMA_ALPHA = 0.3
+
+PREFERENCES = ("cost", "latency", "order")
+
+# Chính sách mặc định: OpenAI đứng đầu nên khi chỉ có OpenAI key, mọi thứ như trước
+DEFAULT_POLICIES = {
+    "detect_search_intent": "cost:openai:gpt-4o-mini,gemini:gemini-1.5-flash",
+    "generate_chat_summary": "cost:openai:gpt-4o-mini,gemini:gemini-1.5-flash",
+    "suggestions": "cost:openai:gpt-4o-mini,gemini:gemini-1.5-flash",
+    "search_summarize": "cost:openai:gpt-4o-mini,gemini:gemini-1.5-flash",
+    "main_answer": "latency:openai:gpt-4o-mini,gemini:gemini-1.5-flash",
+    "vision": "order:openai:gpt-4o-mini,gemini:gemini-1.5-pro",
+}
+
+
+class Provider:
+    """Một endpoint tương thích OpenAI Chat Completions"""
+
+    def __init__(self, name, base_url=None, api_key_env=None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+
+    def api_key(self, user_api_key):
+        """Key dùng cho nhà cung cấp này (None nếu chưa cấu hình)"""
+        if self.api_key_env is None:
+            return user_api_key
+        for name in self.api_key_env:
+            if os.getenv(name):
+                return os.getenv(name)
+        return None
+
+
+def _providers_from_env():
+    providers = {
+        "openai": Provider("openai", os.getenv("OPENAI_BASE_URL") or None),
+        "gemini": Provider("gemini", GEMINI_BASE_URL, ("GEMINI_API_KEY", "GOOGLE_API_KEY")),
+    }
+    for item in filter(None, (part.strip() for part in os.getenv("MODEL_PROVIDERS", "").split(","))):
+        name, _, base_url = item.partition("=")
+        name = name.strip().lower()
+        if not name or not base_url:
+            logger.warning(f"Bỏ qua nhà cung cấp không hợp lệ trong MODEL_PROVIDERS: {item}")
+            continue
+        providers[name] = Provider(name, base_url.strip(), (f"{name.upper()}_API_KEY",))
+    return providers
+
+
+def parse_policy(spec):
+    """``"tiêu_chí:nhà_cung_cấp:mô_hình,..."`` -> (tiêu chí, [(nhà cung cấp, mô hình)])"""
+    preference = "order"
+    head, _, rest = spec.partition(":")
+    if head in PREFERENCES:
+        preference, spec = head, rest
+    candidates = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        provider, _, model = item.partition(":")
+        if not model:
+            provider, model = "openai", provider
+        candidates.append((provider.strip().lower(), model.strip()))
+    return preference, candidates
+
+
+def _blended_price(model):
+    """Giá tương đối của một mô hình (đầu vào thường dài gấp vài lần đầu ra); None nếu không rõ"""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    return 3 * pricing["prompt"] + pricing["completion"]
+
+
+class RouteStats:
+    """Số đo của một lựa chọn (nhà cung cấp, mô hình) tại một vị trí gọi"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # Trung bình trượt (giây)
+        self.unavailable_until = 0.0
+        self.last_error = None
+
+
+class ModelRouter:
+    """Xếp hạng các lựa chọn theo chính sách của từng vị trí gọi và ghi nhận kết quả, an toàn đa luồng"""
+
+    def __init__(self, policies=None, providers=None):
+        self.providers = providers if providers is not None else _providers_from_env()
+        self.policies = {}
+        for call_site, spec in {**DEFAULT_POLICIES, **(policies or {})}.items():
+            spec = os.getenv(f"MODEL_ROUTE_{call_site.upper()}", spec) if policies is None else spec
+            self.policies[call_site] = parse_policy(spec)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, call_site, provider, model):
+        key = (call_site, provider, model)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RouteStats()
+        return stats
+
+    def plan(self, call_site, user_api_key, model=None):
+        """
+        Các lựa chọn cho một lời gọi, theo thứ tự thử
+
+        ``model`` chỉ định sẵn thì chỉ dùng mô hình đó qua OpenAI (không chuyển đổi).
+
+        Returns:
+            list: ``(Provider, mô hình, API key)``
+        """
+        if model is not None:
+            return [(self.providers["openai"], model, user_api_key)]
+        preference, candidates = self.policies.get(call_site, ("order", [("openai", OPENAI_MODEL)]))
+        usable = []
+        for provider_name, candidate_model in candidates:
+            provider = self.providers.get(provider_name)
+            api_key = provider.api_key(user_api_key) if provider is not None else None
+            if api_key:
+                usable.append((provider, candidate_model, api_key))
+        if not usable:
+            return [(self.providers["openai"], OPENAI_MODEL, user_api_key)]
+
+        now = time.monotonic()
+        with self._lock:
+            stats = [self._stats_for(call_site, provider.name, candidate_model)
+                     for provider, candidate_model, _ in usable]
+
+            def rank(index):
+                route_stats = stats[index]
+                cooling_down = (route_stats.unavailable_until > now
+                                or resilience.breaker(f"llm:{usable[index][0].name}").is_open())
+                if preference == "latency":
+                    # Chưa có số đo: thử trước để có số liệu
+                    score = route_stats.latency if route_stats.latency is not None else -1.0
+                elif preference == "cost":
+                    price = _blended_price(usable[index][1])
+                    score = price if price is not None else float("inf")
+                else:
+                    score = 0.0
+                return (cooling_down, score, index)
+
+            order = sorted(range(len(usable)), key=rank)
+        return [usable[index] for index in order]
+
+    def record_success(self, call_site, provider, model, seconds):
+        with self._lock:
+            stats = self._stats_for(call_site, provider.name, model)
+            stats.calls += 1
+            stats.consecutive_failures = 0
+            stats.unavailable_until = 0.0
+            stats.latency = seconds if stats.latency is None else (
+                LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * stats.latency)
+
+    def record_failure(self, call_site, provider, model, error):
+        """Ghi nhận một sự cố của lựa chọn (chỉ gọi khi ``resilience.is_outage(error)``) và tạm ngưng nó"""
+        with self._lock:
+            stats = self._stats_for(call_site, provider.name, model)
+            stats.calls += 1
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.last_error = str(error)[:200]
+            cooldown = min(ROUTER_MAX_COOLDOWN, ROUTER_FAILURE_COOLDOWN * 2 ** (stats.consecutive_failures - 1))
+            stats.unavailable_until = time.monotonic() + cooldown
+        logger.warning(f"Lời gọi {call_site} qua {provider.name}:{model} lỗi ({error}), "
+                       f"tạm ngưng {cooldown:.0f}s")
+
+    def summary(self):
+        """Bảng số đo theo vị trí gọi và lựa chọn, dùng cho bảng điều khiển"""
+        now = time.monotonic()
+        with self._lock:
+            return [{"call_site": call_site, "route": f"{provider}:{model}", "calls": stats.calls,
+                     "failures": stats.failures,
+                     "latency_ms": round(stats.latency * 1000, 1) if stats.latency is not None else None,
+                     "available": stats.unavailable_until <= now, "last_error": stats.last_error}
+                    for (call_site, provider, model), stats in sorted(self._stats.items())]
+
+
+router = ModelRouter()
@@ -0,0 +1,64 @@
+"""
+Cầu nối từ mã đồng bộ (luồng script của Streamlit) sang lõi bất đồng bộ.
+
+Mọi phiên dùng chung một event loop chạy trong luồng nền, nên nhiều cuộc
+trò chuyện đồng thời chỉ tốn các coroutine chứ không tốn thêm luồng.
+"""
+import asyncio
+import logging
+import queue
+import threading
+
+logger = logging.getLogger('family_assistant.runtime')
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Event loop dùng chung của tiến trình (khởi động khi cần lần đầu)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="assistant-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """Chạy một coroutine trên loop dùng chung và chờ kết quả"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def iterate_sync(async_gen):
+    """
+    Duyệt một async generator từ mã đồng bộ.
+
+    Generator được duyệt trọn trong một task (để ContextVar của telemetry giữ
+    nguyên giữa các bước); các phần tử được chuyển sang qua hàng đợi.
+    Khi bên đọc dừng sớm, task bị hủy.
+    """
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in async_gen:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((done, e))
+            raise
+        items.put((done, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None and not isinstance(error, asyncio.CancelledError):
+                    raise error
+                return
+            yield item
+    finally:
+        if not future.done():
+            future.cancel()
@@ -0,0 +1,317 @@
+"""
+Trùng lịch và tìm khung giờ trống chung của các thành viên.
+
+Mỗi lần diễn ra có giờ của sự kiện là một khoảng [bắt đầu, bắt đầu + ``duration``
+phút) (mặc định ``EVENT_DEFAULT_DURATION``); sự kiện cả ngày (không có giờ) không
+chiếm khung giờ. Khoảng được gán cho từng người tham gia (theo tên), hoặc người tạo
+nếu sự kiện không ghi người tham gia, hoặc cả nhà nếu không có cả hai.
+
+``IntervalIndex`` giữ các khoảng của từng người, sắp theo giờ bắt đầu; truy vấn
+chồng lấn dùng bisect trong [bắt đầu - độ dài lớn nhất, kết thúc) nên không phải
+duyệt mọi sự kiện. Chỉ mục của ``SCHEDULE_INDEX_DAYS`` ngày tới được dựng từ các
+lần diễn ra (xem recurrence) và dùng lại cho tới khi dữ liệu đổi.
+
+``answer_free_slot_query`` trả lời câu hỏi kiểu "tối nào tuần này cả nhà rảnh"
+bằng một đoạn văn bản ngắn để đưa vào system prompt, thay vì để mô hình tự dò
+toàn bộ danh sách sự kiện.
+"""
+import bisect
+import datetime
+import os
+import re
+import threading
+import unicodedata
+import weakref
+
+from family_assistant import dates, records, recurrence
+
+DEFAULT_DURATION_MINUTES = int(os.getenv("EVENT_DEFAULT_DURATION", "60"))
+# Khoảng thời gian (ngày) được lập chỉ mục sẵn để kiểm tra trùng lịch
+SCHEDULE_INDEX_DAYS = int(os.getenv("SCHEDULE_INDEX_DAYS", "90"))
+# Số lần diễn ra tối đa của một sự kiện lặp lại được kiểm tra trùng lịch
+MAX_CONFLICT_CHECKS = 100
+EVERYONE = "*"
+
+# Khung giờ trong ngày cho tìm lịch trống
+DAY_PARTS = {
+    "morning": ("07:00", "12:00"),
+    "noon": ("11:00", "14:00"),
+    "afternoon": ("13:00", "18:00"),
+    "evening": ("18:00", "22:00"),
+    "day": ("08:00", "22:00"),
+}
+_DAY_PART_LABELS = {"morning": "buổi sáng", "noon": "buổi trưa", "afternoon": "buổi chiều",
+                    "evening": "buổi tối", "day": "trong ngày"}
+_DAY_PART_PATTERNS = [
+    ("morning", re.compile(r"(?<![\w])(sáng|morning)(?![\w])")),
+    ("noon", re.compile(r"(?<![\w])(trưa|lunch|noon)(?![\w])")),
+    ("afternoon", re.compile(r"(?<![\w])(chiều|afternoon)(?![\w])")),
+    ("evening", re.compile(r"(?<![\w])(tối|evening|night)(?![\w])")),
+]
+_FREE_QUERY_PATTERN = re.compile(r"(?<![\w])(rảnh|trống|ranh|free|available)(?![\w])")
+_EVERYONE_PATTERN = re.compile(r"(?<![\w])(cả nhà|cả gia đình|mọi người|cả hai|whole family|everyone|all of us)(?![\w])")
+_DURATION_PATTERN = re.compile(r"(?<![\w])(\d+(?:[.,]5)?)\s*(tieng|hours?|phut|minutes?|mins?)(?![\w])")
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def _key(name):
+    return unicodedata.normalize("NFC", str(name)).strip().casefold()
+
+
+def event_interval(event):
+    """(bắt đầu, kết thúc) của một lần diễn ra có giờ, hoặc None với sự kiện cả ngày / sai định dạng"""
+    day, minute = records.parse_day(event.get("date")), records.parse_minute(event.get("time"))
+    if day is None or minute is None:
+        return None
+    try:
+        minutes = int(event.get("duration") or DEFAULT_DURATION_MINUTES)
+    except (TypeError, ValueError):
+        return None
+    start = datetime.datetime.fromordinal(day) + datetime.timedelta(minutes=minute)
+    return start, start + datetime.timedelta(minutes=max(1, minutes))
+
+
+def attendee_keys(event, family_data):
+    """Những người bận vì sự kiện (tên đã chuẩn hóa), hoặc {EVERYONE}"""
+    participants = [name for name in event.get("participants") or [] if name]
+    if participants:
+        return {_key(name) for name in participants}
+    creator = family_data.get(event.get("created_by") or "")
+    if isinstance(creator, dict) and creator.get("name"):
+        return {_key(creator["name"])}
+    return {EVERYONE}
+
+
+class IntervalIndex:
+    """Các khoảng bận của từng người trong một khoảng ngày, sắp theo giờ bắt đầu"""
+
+    def __init__(self, occurrences, family_data, start, end):
+        self.start, self.end = start, end
+        self._entries = {}
+        self._max_length = datetime.timedelta(0)
+        for event_id, event in occurrences:
+            interval = event_interval(event)
+            if interval is None:
+                continue
+            self._max_length = max(self._max_length, interval[1] - interval[0])
+            for key in attendee_keys(event, family_data):
+                self._entries.setdefault(key, []).append((interval[0], interval[1], event_id, event))
+        self._starts = {}
+        for key, entries in self._entries.items():
+            entries.sort(key=lambda entry: (entry[0], entry[2]))
+            self._starts[key] = [entry[0] for entry in entries]
+
+    def covers(self, start, end):
+        return self.start <= start and end <= self.end
+
+    def overlapping(self, keys, start, end, exclude_id=None):
+        """Các lần diễn ra chồng lấn [start, end) của những người ``keys`` (kể cả sự kiện của cả nhà)"""
+        keys = set(self._entries) if EVERYONE in keys else set(keys) | {EVERYONE}
+        found = {}
+        for key in keys:
+            entries, starts = self._entries.get(key, ()), self._starts.get(key, ())
+            low = bisect.bisect_left(starts, start - self._max_length)
+            high = bisect.bisect_left(starts, end)
+            for entry_start, entry_end, event_id, event in entries[low:high]:
+                if entry_end > start and event_id != exclude_id:
+                    found[(event_id, entry_start)] = (entry_start, entry_end, event_id, event)
+        return sorted(found.values(), key=lambda entry: (entry[0], entry[2]))
+
+    def busy(self, keys, start, end):
+        """Các khoảng bận đã gộp của những người ``keys`` trong [start, end)"""
+        merged = []
+        for entry_start, entry_end, _, _ in self.overlapping(keys, start, end):
+            entry_start, entry_end = max(entry_start, start), min(entry_end, end)
+            if merged and entry_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], entry_end)
+            else:
+                merged.append([entry_start, entry_end])
+        return merged
+
+
+def _build_index(store, start, end):
+    with store.read():
+        family_data = store.family_data
+    return IntervalIndex(store.occurrences(start, end), family_data, start, end)
+
+
+def index_for(store, start, end):
+    """
+    Chỉ mục khoảng bận phủ [start, end] (ngày)
+
+    Chỉ mục của ``SCHEDULE_INDEX_DAYS`` ngày tới được lưu lại cho tới khi
+    ``events_data``/``family_data`` đổi; khoảng nằm ngoài thì dựng riêng.
+    """
+    today = datetime.date.today()
+    horizon = (today - datetime.timedelta(days=1), today + datetime.timedelta(days=SCHEDULE_INDEX_DAYS))
+    if not (horizon[0] <= start and end <= horizon[1]):
+        return _build_index(store, start, end)
+
+    with store.read():
+        snapshot = (store.events_data, store.family_data)
+    with _indexes_lock:
+        cached = _indexes.get(store)
+    if cached is not None and cached[0][0] is snapshot[0] and cached[0][1] is snapshot[1] \
+            and cached[1].covers(*horizon):
+        return cached[1]
+    index = _build_index(store, *horizon)
+    with _indexes_lock:
+        _indexes[store] = (snapshot, index)
+    return index
+
+
+def find_conflicts(store, details, exclude_id=None):
+    """
+    Các sự kiện trùng giờ với một sự kiện (mới hoặc sau khi sửa)
+
+    Với sự kiện lặp lại, kiểm tra tối đa ``MAX_CONFLICT_CHECKS`` lần diễn ra đầu tiên
+    trong ``SCHEDULE_INDEX_DAYS`` ngày tới.
+
+    Returns:
+        list: Mỗi mục gồm ``event_id``, ``title``, ``date``, ``time``
+    """
+    first = recurrence.event_start(details)
+    if first is None or event_interval(details) is None:
+        return []
+    with store.read():
+        family_data = store.family_data
+    keys = attendee_keys(details, family_data)
+
+    rule = recurrence.normalize_rule(details.get("recurrence"))
+    if rule:
+        today = datetime.date.today()
+        horizon_end = today + datetime.timedelta(days=SCHEDULE_INDEX_DAYS)
+        days = []
+        for day in recurrence.iter_dates(first, rule, max(first, today)):
+            if day > horizon_end or len(days) >= MAX_CONFLICT_CHECKS:
+                break
+            days.append(day)
+    else:
+        days = [first]
+    if not days:
+        return []
+
+    index = index_for(store, days[0] - datetime.timedelta(days=1), days[-1] + datetime.timedelta(days=1))
+    conflicts = {}
+    for day in days:
+        start, end = event_interval({**details, "date": day.isoformat()})
+        for entry_start, _, event_id, event in index.overlapping(keys, start, end, exclude_id):
+            conflicts.setdefault((event_id, entry_start), {
+                "event_id": event_id,
+                "title": event.get("title", ""),
+                "date": event.get("date", ""),
+                "time": event.get("time", ""),
+            })
+    return list(conflicts.values())
+
+
+def describe_conflicts(conflicts, limit=3):
+    """Mô tả ngắn các sự kiện trùng lịch ("Họp phụ huynh 20/10 19:00, ...")"""
+    parts = [f"{conflict['title']} {datetime.date.fromisoformat(conflict['date']).strftime('%d/%m')} {conflict['time']}"
+             for conflict in conflicts[:limit]]
+    if len(conflicts) > limit:
+        parts.append(f"và {len(conflicts) - limit} lần khác")
+    return ", ".join(parts)
+
+
+def free_slots(store, members, start, end, day_part="day", min_minutes=60, now=None):
+    """
+    Khung giờ trống chung của các thành viên từ ngày ``start`` tới ngày ``end``
+
+    Args:
+        members: Tên thành viên; rỗng nghĩa là cả nhà
+        day_part: Khung giờ trong ngày (xem DAY_PARTS)
+        min_minutes: Độ dài tối thiểu của một khung trống
+        now: Thời điểm hiện tại; khung giờ đã qua bị bỏ
+
+    Returns:
+        list: Các cặp (bắt đầu, kết thúc) kiểu datetime
+    """
+    now = now or datetime.datetime.now()
+    keys = {_key(name) for name in members} if members else {EVERYONE}
+    index = index_for(store, start, end)
+    part_start, part_end = (datetime.time.fromisoformat(value) for value in DAY_PARTS[day_part])
+    minimum = datetime.timedelta(minutes=min_minutes)
+
+    slots = []
+    day = start
+    while day <= end:
+        window_start = max(datetime.datetime.combine(day, part_start), now)
+        window_end = datetime.datetime.combine(day, part_end)
+        cursor = window_start
+        for busy_start, busy_end in index.busy(keys, window_start, window_end) if window_start < window_end else ():
+            if busy_start - cursor >= minimum:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if window_end - cursor >= minimum:
+            slots.append((cursor, window_end))
+        day += datetime.timedelta(days=1)
+    return slots
+
+
+def find_window(text, today=None):
+    """Khoảng ngày được hỏi ("tuần này", "tuần sau", "cuối tuần", "tháng này", một ngày cụ thể); mặc định 7 ngày tới"""
+    today = today or datetime.date.today()
+    folded = dates.fold(text)
+    monday = today - datetime.timedelta(days=today.weekday())
+    if re.search(r"(?<![\w])(cuoi tuan (?:sau|toi)|next weekend)(?![\w])", folded):
+        return monday + datetime.timedelta(days=12), monday + datetime.timedelta(days=13)
+    if re.search(r"(?<![\w])(cuoi tuan|weekend)(?![\w])", folded):
+        return max(today, monday + datetime.timedelta(days=5)), monday + datetime.timedelta(days=6)
+    if re.search(r"(?<![\w])(tuan (?:sau|toi)|next week)(?![\w])", folded):
+        return monday + datetime.timedelta(days=7), monday + datetime.timedelta(days=13)
+    if re.search(r"(?<![\w])(tuan nay|this week)(?![\w])", folded):
+        return today, monday + datetime.timedelta(days=6)
+    if re.search(r"(?<![\w])(thang nay|this month)(?![\w])", folded):
+        return today, dates.add_months(today.replace(day=1), 1) - datetime.timedelta(days=1)
+    day = dates.parse_date(text, today)
+    if day is not None and day >= today:
+        return day, day
+    return today, today + datetime.timedelta(days=6)
+
+
+def answer_free_slot_query(store, text, member_id=None, now=None):
+    """
+    Trả lời câu hỏi tìm lịch trống bằng đoạn văn bản ngắn, hoặc None nếu không phải câu hỏi như vậy
+
+    Thành viên được lấy theo tên xuất hiện trong câu hỏi; "cả nhà" hoặc không nêu
+    tên (khi không có người dùng hiện tại) nghĩa là mọi người.
+    """
+    lowered = unicodedata.normalize("NFC", text or "").lower()
+    if not _FREE_QUERY_PATTERN.search(lowered):
+        return None
+    now = now or datetime.datetime.now()
+
+    with store.read():
+        family_data = store.family_data
+    names = [member.get("name") for member in family_data.values() if isinstance(member, dict) and member.get("name")]
+    members = [name for name in names
+               if re.search(r"(?<![\w])" + re.escape(_key(name)) + r"(?![\w])", lowered)]
+    current = family_data.get(member_id) if member_id else None
+    if _EVERYONE_PATTERN.search(lowered):
+        members = []
+    elif not members and isinstance(current, dict) and current.get("name"):
+        members = [current["name"]]
+
+    day_part = next((part for part, pattern in _DAY_PART_PATTERNS if pattern.search(lowered)), "day")
+    min_minutes = 60
+    duration = _DURATION_PATTERN.search(dates.fold(text))
+    if duration:
+        amount = float(duration.group(1).replace(",", "."))
+        min_minutes = int(amount if duration.group(2).startswith(("phut", "min")) else amount * 60)
+
+    start, end = find_window(text, now.date())
+    slots = free_slots(store, members, start, end, day_part, max(15, min_minutes), now)
+    who = ", ".join(members) if members else "cả nhà"
+    part_start, part_end = DAY_PARTS[day_part]
+    header = (f"Khung giờ trống chung của {who} ({_DAY_PART_LABELS[day_part]} {part_start}-{part_end}, "
+              f"tối thiểu {min_minutes} phút) từ {start.strftime('%d/%m')} đến {end.strftime('%d/%m')}:")
+    if not slots:
+        return header + "\n- Không có khung giờ trống nào"
+    by_day = {}
+    for slot_start, slot_end in slots:
+        by_day.setdefault(slot_start.date(), []).append(f"{slot_start:%H:%M}-{slot_end:%H:%M}")
+    lines = [f"- {dates.format_date(day)}: {', '.join(ranges)}" for day, ranges in by_day.items()]
+    return header + "\n" + "\n".join(lines)
@@ -0,0 +1,311 @@
+"""
+Tìm kiếm thông tin thời gian thực qua Tavily và phân loại ý định tìm kiếm.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+
+import httpx
+
+from family_assistant import admission, llm, passages, resilience, singleflight, telemetry
+
+logger = logging.getLogger('family_assistant.search')
+
+# Endpoint Tavily (có thể trỏ tới server giả lập cục bộ, xem fake_server.py)
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com").rstrip("/")
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "60"))
+
+# Số kết quả tìm kiếm được trích xuất nội dung. Nội dung được rút gọn theo câu truy vấn
+# (xem passages); MAX_RAW_CONTENT_CHARS chỉ giới hạn lượng văn bản thô cần xử lý mỗi trang
+EXTRACT_TOP_RESULTS = 3
+MAX_RAW_CONTENT_CHARS = 60000
+
+# "single_pass": các đoạn nguồn được đưa thẳng vào lời gọi trả lời chính (có trích dẫn);
+# "summarize": tóm tắt kết quả bằng một lời gọi riêng trước rồi mới trả lời
+SEARCH_MODE = os.getenv("SEARCH_MODE", "single_pass")
+
+
+async def _tavily_post(endpoint, api_key, data):
+    """
+    Gửi một yêu cầu tới Tavily qua ngắt mạch của endpoint (``tavily:search``, ``tavily:extract``)
+    và giới hạn tốc độ/số lời gọi đồng thời (admission), gửi lặp khi chậm hơn p95.
+    Lỗi 429/5xx được ném ra như lỗi kết nối.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    async def send():
+        async with admission.slot(f"tavily_{endpoint}"), httpx.AsyncClient(timeout=TAVILY_TIMEOUT) as client:
+            response = await client.post(f"{TAVILY_BASE_URL}/{endpoint}", headers=headers, json=data)
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+    return await resilience.hedged(f"tavily_{endpoint}", lambda: resilience.guarded(f"tavily:{endpoint}", send))
+
+
+@singleflight.coalesce("tavily_extract")
+async def tavily_extract(api_key, urls, include_images=False, extract_depth="advanced"):
+    """
+    Trích xuất nội dung từ URL sử dụng Tavily Extract API
+
+    Args:
+        api_key (str): Tavily API Key
+        urls (str/list): URL hoặc danh sách URL cần trích xuất
+        include_images (bool): Có bao gồm hình ảnh hay không
+        extract_depth (str): Độ sâu trích xuất ('basic' hoặc 'advanced')
+
+    Returns:
+        dict: Kết quả trích xuất hoặc None nếu có lỗi
+    """
+    data = {
+        "urls": urls,
+        "include_images": include_images,
+        "extract_depth": extract_depth
+    }
+
+    try:
+        with telemetry.span("tavily_extract"):
+            response = await _tavily_post("extract", api_key, data)
+
+        if response.status_code == 200:
+            return response.json()
+        logger.error(f"Lỗi Tavily Extract: {response.status_code} - {response.text}")
+        return None
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi Tavily API: {e}")
+        return None
+
+
+@singleflight.coalesce("tavily_search")
+async def tavily_search(api_key, query, search_depth="advanced", max_results=5, include_domains=None, exclude_domains=None):
+    """
+    Thực hiện tìm kiếm thời gian thực sử dụng Tavily Search API
+
+    Args:
+        api_key (str): Tavily API Key
+        query (str): Câu truy vấn tìm kiếm
+        search_depth (str): Độ sâu tìm kiếm ('basic' hoặc 'advanced')
+        max_results (int): Số lượng kết quả tối đa
+        include_domains (list): Danh sách domain muốn bao gồm
+        exclude_domains (list): Danh sách domain muốn loại trừ
+
+    Returns:
+        dict: Kết quả tìm kiếm hoặc None nếu có lỗi
+    """
+    data = {
+        "query": query,
+        "search_depth": search_depth,
+        "max_results": max_results
+    }
+
+    if include_domains:
+        data["include_domains"] = include_domains
+
+    if exclude_domains:
+        data["exclude_domains"] = exclude_domains
+
+    try:
+        with telemetry.span("tavily_search"):
+            response = await _tavily_post("search", api_key, data)
+
+        if response.status_code == 200:
+            return response.json()
+        logger.error(f"Lỗi Tavily Search: {response.status_code} - {response.text}")
+        return None
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi Tavily Search API: {e}")
+        return None
+
+
+async def _extract_content(tavily_api_key, url):
+    extract_result = await tavily_extract(tavily_api_key, url)
+    if extract_result and "results" in extract_result and len(extract_result["results"]) > 0:
+        content = extract_result["results"][0].get("raw_content") or ""
+        return {"url": url, "content": content[:MAX_RAW_CONTENT_CHARS]}
+    return None
+
+
+async def search_passages(tavily_api_key, query):
+    """
+    Tìm kiếm, trích xuất nội dung các kết quả đầu và chọn các đoạn liên quan tới câu truy vấn
+
+    Không gọi mô hình. Nếu không trích xuất được trang nào, dùng đoạn tóm tắt có sẵn
+    trong kết quả tìm kiếm.
+
+    Returns:
+        list: Các nguồn ``{"url", "title", "content"}`` (có thể rỗng)
+    """
+    search_results = await tavily_search(tavily_api_key, query)
+    if not search_results or not search_results.get("results"):
+        return []
+
+    # Trích xuất song song nội dung của các kết quả đầu
+    top_results = search_results["results"][:EXTRACT_TOP_RESULTS]
+    extracted = await asyncio.gather(*(_extract_content(tavily_api_key, result["url"])
+                                       for result in top_results))
+    pages = [item for item in extracted if item is not None]
+    if not pages:
+        pages = [{"url": result["url"], "content": result.get("content") or ""} for result in top_results]
+
+    # Chỉ giữ các đoạn liên quan tới câu truy vấn, trong giới hạn token
+    with telemetry.span("rank_passages") as attrs:
+        attrs["chars_in"] = sum(len(page["content"]) for page in pages)
+        sources = await asyncio.to_thread(passages.select_passages, query, pages)
+        attrs["chars_out"] = sum(len(source["content"]) for source in sources)
+
+    titles = {result["url"]: result.get("title", "") for result in top_results}
+    return [{**source, "title": titles.get(source["url"], "")} for source in sources]
+
+
+def format_sources(sources):
+    """Các nguồn được đánh số [1], [2]... để mô hình trích dẫn"""
+    return "\n\n".join(f"[{index}] {source['title'] or source['url']}\nURL: {source['url']}\n{source['content']}"
+                       for index, source in enumerate(sources, 1))
+
+
+async def search_and_summarize(tavily_api_key, query, openai_api_key, household_id=None):
+    """
+    Tìm kiếm và tổng hợp thông tin từ kết quả tìm kiếm
+
+    Args:
+        tavily_api_key (str): Tavily API Key
+        query (str): Câu truy vấn tìm kiếm
+        openai_api_key (str): OpenAI API Key
+        household_id (str): Hộ gia đình được tính chi phí; mặc định lấy từ lượt trò chuyện
+
+    Returns:
+        str: Thông tin đã được tổng hợp
+    """
+    if not tavily_api_key or not openai_api_key or not query:
+        return "Thiếu thông tin để thực hiện tìm kiếm hoặc tổng hợp."
+
+    try:
+        sources = await search_passages(tavily_api_key, query)
+        if not sources:
+            return "Không tìm thấy kết quả nào."
+
+        prompt = f"""
+        Dưới đây là các nội dung trích xuất từ internet liên quan đến câu hỏi: "{query}"
+
+        {json.dumps([{"url": source["url"], "content": source["content"]} for source in sources], ensure_ascii=False)}
+
+        Hãy tổng hợp thông tin từ các nguồn trên để trả lời câu hỏi một cách đầy đủ và chính xác.
+        Hãy trình bày thông tin một cách rõ ràng, có cấu trúc.
+        Nếu thông tin từ các nguồn khác nhau mâu thuẫn, hãy đề cập đến điều đó.
+        Hãy ghi rõ nguồn thông tin (URL) ở cuối mỗi phần thông tin.
+        """
+
+        summarized_info = await llm.complete(
+            openai_api_key,
+            "search_summarize",
+            [
+                {"role": "system", "content": "Bạn là trợ lý tổng hợp thông tin. Nhiệm vụ của bạn là tổng hợp thông tin từ nhiều nguồn để cung cấp câu trả lời đầy đủ, chính xác và có cấu trúc."},
+                {"role": "user", "content": prompt}
+            ],
+            household_id=household_id,
+            temperature=0.3,
+            max_tokens=1500
+        )
+
+        # Thêm thông báo về nguồn
+        sources_info = "\n\n**Nguồn thông tin:**\n" + "\n".join([f"- {source['url']}" for source in sources])
+
+        return f"{summarized_info}\n{sources_info}"
+
+    except Exception as e:
+        logger.error(f"Lỗi trong quá trình tìm kiếm và tổng hợp: {e}")
+        return f"Có lỗi xảy ra trong quá trình tìm kiếm và tổng hợp thông tin: {str(e)}"
+
+
+def _intent_system_prompt(current_date_str):
+    return f"""
+Bạn là một hệ thống phân loại và tinh chỉnh câu hỏi thông minh. Nhiệm vụ của bạn là:
+1. Xác định xem câu hỏi có cần tìm kiếm thông tin thực tế, tin tức mới hoặc dữ liệu cập nhật không.
+2. Nếu cần tìm kiếm, hãy tinh chỉnh câu hỏi thành một truy vấn tìm kiếm tối ưu cho search engine. ĐẶC BIỆT CHÚ Ý đến các yếu tố thời gian (ví dụ: hôm nay, hôm qua, tuần này, tháng trước, năm 2023, tối qua, sáng nay...).
+3. Hãy kết hợp các yếu tố thời gian này vào `search_query` để kết quả tìm kiếm được chính xác hơn về mặt thời gian.
+
+Hôm nay là ngày: {current_date_str}.
+
+Câu hỏi cần search khi:
+- Liên quan đến tin tức, sự kiện hiện tại hoặc gần đây (ví dụ: "tin tức hôm nay", "kết quả bóng đá tối qua").
+- Yêu cầu dữ liệu thực tế, số liệu thống kê cập nhật (ví dụ: "giá vàng tuần này").
+- Hỏi về kết quả thể thao, giải đấu đang diễn ra hoặc vừa kết thúc.
+- Cần thông tin về giá cả, sản phẩm mới ra mắt.
+- Liên quan đến thời tiết, tình hình giao thông hiện tại.
+
+Câu hỏi KHÔNG cần search khi:
+- Liên quan đến quản lý gia đình trong ứng dụng này (thêm thành viên, sự kiện, ghi chú).
+- Hỏi ý kiến, lời khuyên cá nhân không dựa trên dữ liệu thực tế.
+- Yêu cầu công thức nấu ăn phổ biến, kiến thức phổ thông không thay đổi nhanh.
+- Yêu cầu hỗ trợ sử dụng ứng dụng.
+
+Ví dụ tinh chỉnh truy vấn:
+- User: "tin tức covid hôm nay" -> search_query: "tin tức covid mới nhất ngày {current_date_str}" hoặc "tin tức covid hôm nay"
+- User: "kết quả trận MU tối qua" -> search_query: "kết quả trận MU tối qua" hoặc "kết quả Manchester United ngày [ngày hôm qua]"
+- User: "có phim gì hay tuần này?" -> search_query: "phim chiếu rạp hay tuần này"
+- User: "giá bitcoin" -> search_query: "giá bitcoin mới nhất"
+- User: "thủ đô nước Pháp là gì?" -> need_search: false (kiến thức phổ thông)
+
+Trả lời DƯỚI DẠNG JSON với 2 trường:
+- need_search (boolean: true hoặc false)
+- search_query (string: câu truy vấn tìm kiếm đã được tối ưu, bao gồm cả yếu tố thời gian nếu có và cần thiết). Nếu need_search là false, trường này có thể là chuỗi rỗng hoặc câu truy vấn gốc.
+"""
+
+
+@singleflight.coalesce("detect_search_intent")
+async def detect_search_intent(query, api_key):
+    """
+    Phát hiện xem câu hỏi có cần tìm kiếm thông tin thực tế hay không
+    và tinh chỉnh câu truy vấn để bao gồm các yếu tố thời gian.
+
+    Args:
+        query (str): Câu hỏi của người dùng
+        api_key (str): OpenAI API key
+
+    Returns:
+        tuple: (need_search, search_query)
+               need_search: True/False
+               search_query: Câu truy vấn đã được tinh chỉnh (có thể bao gồm yếu tố thời gian)
+    """
+    try:
+        current_date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+        # Phân loại lặp lại được an toàn nên được gửi lặp khi chậm
+        result_str = await resilience.hedged("detect_search_intent", lambda: llm.complete(
+            api_key,
+            "detect_search_intent",
+            [
+                {"role": "system", "content": _intent_system_prompt(current_date_str)},
+                {"role": "user", "content": f"Câu hỏi của người dùng: \"{query}\"\n\nHãy phân tích và trả về JSON theo yêu cầu."}
+            ],
+            temperature=0.1,
+            max_tokens=250,
+            response_format={"type": "json_object"}
+        ))
+        logger.info(f"Kết quả detect_search_intent (raw): {result_str}")
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi OpenAI trong detect_search_intent: {e}")
+        # Nếu có lỗi API, giả sử không cần search
+        return False, query
+
+    try:
+        result = json.loads(result_str)
+        need_search = result.get("need_search", False)
+        # Nếu cần search mà search_query rỗng, dùng query gốc
+        search_query = result.get("search_query", query) if need_search else query
+        if need_search and not search_query:
+            search_query = query
+
+        logger.info(f"Phân tích truy vấn: need_search={need_search}, search_query='{search_query}'")
+        return need_search, search_query
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Lỗi giải mã JSON từ detect_search_intent: {json_err}")
+        logger.error(f"Chuỗi JSON không hợp lệ: {result_str}")
+        return False, query
+    except Exception as e:
+        logger.error(f"Lỗi không xác định trong detect_search_intent: {e}")
+        return False, query
@@ -0,0 +1,356 @@
+"""
+Dịch vụ HTTP (ASGI) của Trợ lý Gia đình, stream phản hồi bằng Server-Sent Events.
+
+Chạy:
+    python -m family_assistant.server --port 8000 --data-dir . --households-dir households
+hoặc:
+    uvicorn family_assistant.server:app --port 8000
+
+Endpoint:
+    POST /v1/chat          {"messages": [...], "member_id": "1"} -> text/event-stream
+    GET  /v1/suggestions   ?member_id=1&max_questions=5
+    GET  /v1/members
+    GET  /v1/events        ?member_id=1
+    GET  /v1/occurrences   ?member_id=1&from=2024-05-01&days=14  (các lần diễn ra, kể cả sự kiện lặp lại)
+    GET  /v1/calendar.ics  ?member_id=1  (xuất lịch iCalendar, stream từng phần)
+    POST /v1/calendar.ics  nội dung file .ics, ?member_id= là người tạo -> {"added", "skipped", "invalid"}
+    GET  /v1/search        ?q=bánh&member_id=1&kinds=note,event&limit=10  (tìm kiếm toàn văn)
+    GET  /v1/reminders     ?member_id=1&since=0  (nhắc lịch đã gửi, lấy tiếp theo trường "id")
+    GET  /healthz
+    GET  /metrics          số liệu Prometheus (xem telemetry)
+
+Hộ gia đình được chọn theo từng request bằng header ``X-Household-Id`` hoặc
+tham số ``?household=`` (mặc định: "default", dùng ``--data-dir``). Dữ liệu các
+hộ khác nằm trong ``--households-dir/<household_id>`` và được tải khi cần.
+
+API key lấy từ biến môi trường OPENAI_API_KEY/TAVILY_API_KEY, có thể ghi đè
+theo từng request bằng header ``Authorization: Bearer ...`` và ``X-Tavily-Key``.
+Mỗi cuộc trò chuyện là một coroutine trên cùng event loop, nên một tiến trình
+phục vụ được nhiều cuộc trò chuyện đồng thời.
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+
+from family_assistant import fulltext, ical, reminders, suggestions, telemetry
+from family_assistant.assistant import Assistant
+from family_assistant.context import text_message
+from family_assistant.households import HouseholdRegistry, get_registry
+
+logger = logging.getLogger('family_assistant.server')
+
+MAX_BODY_BYTES = 20 * 1024 * 1024  # Đủ cho tin nhắn có hình ảnh base64
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def sse_event(event):
+    """Mã hóa một sự kiện của lượt trò chuyện theo định dạng Server-Sent Events"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8")
+
+
+def normalize_messages(messages):
+    """Chấp nhận cả tin nhắn dạng chuỗi ({"role", "content": "..."}) lẫn dạng danh sách phần"""
+    if not isinstance(messages, list) or not messages:
+        raise HTTPError(400, "Trường 'messages' phải là danh sách không rỗng")
+    normalized = []
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in ("user", "assistant"):
+            raise HTTPError(400, "Mỗi tin nhắn cần có 'role' là 'user' hoặc 'assistant'")
+        content = message.get("content")
+        if isinstance(content, str):
+            normalized.append(text_message(message["role"], content))
+        elif isinstance(content, list):
+            normalized.append({"role": message["role"], "content": content})
+        else:
+            raise HTTPError(400, "Nội dung tin nhắn phải là chuỗi hoặc danh sách")
+    return normalized
+
+
+class AssistantService:
+    """Ứng dụng ASGI phục vụ nhiều hộ gia đình"""
+
+    def __init__(self, registry=None, openai_api_key=None, tavily_api_key=None):
+        self._registry = registry
+        self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY", "")
+        self.tavily_api_key = tavily_api_key or os.getenv("TAVILY_API_KEY", "")
+
+    @property
+    def registry(self):
+        # Registry dùng chung được lấy khi có request đầu tiên
+        if self._registry is None:
+            self._registry = get_registry()
+        return self._registry
+
+    def _store(self, scope, query):
+        household_id = _header(scope, b"x-household-id") or query.get("household")
+        try:
+            return self.registry.get(household_id)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        try:
+            await self._route(scope, receive, send)
+        except HTTPError as e:
+            await self._send_json(send, {"error": e.message}, e.status)
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý {scope['method']} {scope['path']}: {e}")
+            await self._send_json(send, {"error": "Lỗi máy chủ"}, 500)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # uvicorn kết thúc bằng tín hiệu nên atexit không chạy; ghi dữ liệu tại đây
+                if self._registry is not None:
+                    self._registry.flush_all()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        query = {key: values[-1] for key, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+
+        if path == "/healthz" and method == "GET":
+            await self._send_json(send, {"status": "ok"})
+        elif path == "/metrics" and method == "GET":
+            body = telemetry.registry.render_prometheus().encode("utf-8")
+            await self._send(send, 200, body, "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/v1/chat" and method == "POST":
+            await self._chat(scope, receive, send, self._store(scope, query))
+        elif path == "/v1/suggestions" and method == "GET":
+            questions = await suggestions.generate_suggested_questions(
+                self._store(scope, query), self._openai_key(scope), query.get("member_id") or None,
+                self._max_questions(query))
+            await self._send_json(send, {"questions": questions})
+        elif path == "/v1/members" and method == "GET":
+            await self._send_json(send, {"members": self._store(scope, query).family_data})
+        elif path == "/v1/events" and method == "GET":
+            store = self._store(scope, query)
+            await self._send_json(send, {"events": store.filter_events_by_member(query.get("member_id"))})
+        elif path == "/v1/occurrences" and method == "GET":
+            await self._send_json(send, {"occurrences": self._occurrences(self._store(scope, query), query)})
+        elif path == "/v1/calendar.ics" and method == "GET":
+            await self._export_calendar(send, self._store(scope, query), query.get("member_id") or None)
+        elif path == "/v1/calendar.ics" and method == "POST":
+            store = self._store(scope, query)
+            body = await _read_body(receive)
+            try:
+                text = body.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise HTTPError(400, "File lịch phải được mã hóa UTF-8")
+            # Đọc và thêm hàng nghìn sự kiện tốn CPU: chạy ngoài event loop
+            result = await asyncio.to_thread(ical.import_ics, store, io.StringIO(text, newline=""),
+                                             query.get("member_id") or None)
+            await self._send_json(send, result)
+        elif path == "/v1/search" and method == "GET":
+            await self._send_json(send, {"results": self._search(self._store(scope, query), query)})
+        elif path == "/v1/reminders" and method == "GET":
+            await self._send_json(send, {"reminders": self._reminders(self._store(scope, query), query)})
+        else:
+            raise HTTPError(404, "Không tìm thấy endpoint")
+
+    @staticmethod
+    def _occurrences(store, query):
+        try:
+            start = datetime.date.fromisoformat(query["from"]) if query.get("from") else datetime.date.today()
+            days = int(query.get("days", 14))
+        except ValueError:
+            raise HTTPError(400, "Tham số from (YYYY-MM-DD) hoặc days không hợp lệ")
+        if not 0 <= days <= 366:
+            raise HTTPError(400, "days phải trong khoảng 0-366")
+        return [{"event_id": event_id, **event} for event_id, event in
+                store.occurrences(start, start + datetime.timedelta(days=days), query.get("member_id") or None)]
+
+    @staticmethod
+    def _max_questions(query):
+        try:
+            max_questions = int(query.get("max_questions", 5))
+        except ValueError:
+            raise HTTPError(400, "Tham số max_questions không hợp lệ")
+        return max(1, min(max_questions, 10))
+
+    @staticmethod
+    def _search(store, query):
+        kinds = tuple(kind for kind in query.get("kinds", ",".join(fulltext.KINDS)).split(",") if kind)
+        if not set(kinds) <= set(fulltext.KINDS):
+            raise HTTPError(400, f"kinds chỉ gồm: {', '.join(fulltext.KINDS)}")
+        try:
+            limit = int(query.get("limit", 10))
+        except ValueError:
+            raise HTTPError(400, "Tham số limit không hợp lệ")
+        return fulltext.search(store, query.get("q", ""), query.get("member_id") or None, kinds, max(1, min(limit, 100)))
+
+    @staticmethod
+    def _reminders(store, query):
+        try:
+            since = int(query.get("since", 0))
+        except ValueError:
+            raise HTTPError(400, "Tham số since không hợp lệ")
+        member_id = query.get("member_id") or None
+        member = store.get_member(member_id) if member_id else None
+        if member_id and member is None:
+            raise HTTPError(404, f"Không tìm thấy thành viên với ID: {member_id}")
+        member_filter = {"id": member_id, **member} if member else None
+        return reminders.get_scheduler().inbox.recent(store.household_id, since, member_filter)
+
+    def _openai_key(self, scope):
+        authorization = _header(scope, b"authorization")
+        if authorization.lower().startswith("bearer "):
+            return authorization[7:].strip()
+        return self.openai_api_key
+
+    async def _chat(self, scope, receive, send, store):
+        payload = await _read_json(receive)
+        chat_messages = normalize_messages(payload.get("messages"))
+        member_id = payload.get("member_id") or None
+        if member_id is not None and store.get_member(member_id) is None:
+            raise HTTPError(404, f"Không tìm thấy thành viên với ID: {member_id}")
+        openai_api_key = self._openai_key(scope)
+        if not openai_api_key:
+            raise HTTPError(401, "Thiếu OpenAI API key")
+
+        assistant = Assistant(store, openai_api_key, _header(scope, b"x-tavily-key") or self.tavily_api_key)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+
+        async def stream():
+            async for event in assistant.stream_reply(chat_messages, member_id):
+                await send({"type": "http.response.body", "body": sse_event(event), "more_body": True})
+
+        # Dừng lượt trò chuyện nếu client ngắt kết nối giữa chừng
+        stream_task = asyncio.create_task(stream())
+        disconnect_task = asyncio.create_task(_wait_disconnect(receive))
+        try:
+            await asyncio.wait({stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect_task.cancel()
+        if not stream_task.done():
+            stream_task.cancel()
+            logger.info("Client ngắt kết nối, hủy lượt trò chuyện")
+            return
+        if stream_task.exception() is not None:
+            # Header đã gửi nên chỉ có thể ghi log và đóng stream
+            logger.error(f"Lỗi khi stream phản hồi: {stream_task.exception()}")
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _export_calendar(self, send, store, member_id, lines_per_chunk=500):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", ical.ICAL_CONTENT_TYPE.encode()),
+                        (b"content-disposition", b'attachment; filename="family.ics"')],
+        })
+        events_data = store.filter_events_by_member(member_id)
+        lines = ical.iter_ics(events_data, store.household_id, store.family_data)
+        while True:
+            chunk = "".join(itertools.islice(lines, lines_per_chunk))
+            if not chunk:
+                break
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _send(self, send, status, body, content_type):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_json(self, send, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        await self._send(send, status, body, "application/json; charset=utf-8")
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client ngắt kết nối")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, "Nội dung request quá lớn")
+        if not message.get("more_body"):
+            return body
+
+
+async def _read_json(receive):
+    body = await _read_body(receive)
+    try:
+        payload = json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        raise HTTPError(400, "Nội dung request không phải JSON hợp lệ")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Nội dung request phải là đối tượng JSON")
+    return payload
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+app = AssistantService()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP/SSE của Trợ lý Gia đình")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-dir", default=os.getenv("FAMILY_DATA_DIR", "."),
+                        help="Thư mục dữ liệu của hộ gia đình mặc định")
+    parser.add_argument("--households-dir", default=os.getenv("HOUSEHOLDS_DIR", "households"),
+                        help="Thư mục chứa dữ liệu các hộ gia đình khác (mỗi hộ một thư mục con)")
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error("Cần cài uvicorn để chạy dịch vụ: pip install uvicorn")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    service = AssistantService(HouseholdRegistry(args.households_dir, default_dir=args.data_dir))
+    uvicorn.run(service, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
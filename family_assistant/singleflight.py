@@ -0,0 +1,86 @@
+"""
+Gộp các lời gọi giống hệt nhau đang chạy đồng thời (single-flight).
+
+Khi nhiều phiên cùng cần một thứ vào cùng một lúc (câu hỏi gợi ý đầu giờ của cùng
+một thành viên, cùng một truy vấn Tavily...), chỉ lời gọi đầu tiên thực sự gửi đi;
+các lời gọi trùng đến trong lúc nó đang chạy chờ và nhận chung kết quả (hoặc lỗi).
+Kết quả không được giữ lại sau khi lời gọi kết thúc: đây không phải là cache.
+
+Lời gọi chung chạy thành một task riêng, nên một phiên bị hủy (người dùng ngắt kết nối)
+không làm hỏng kết quả của các phiên đang chờ cùng nó. Số lời gọi được gộp được ghi vào
+telemetry (``singleflight_calls_total`` với role="shared").
+"""
+import asyncio
+import functools
+import logging
+import threading
+
+from family_assistant import telemetry
+
+logger = logging.getLogger('family_assistant.singleflight')
+
+
+class SingleFlight:
+    """Nhóm các lời gọi đang chạy theo khóa, an toàn khi có nhiều event loop ở các luồng khác nhau"""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # (event loop, khóa) -> task đang chạy
+        self._lock = threading.Lock()
+
+    async def do(self, key, factory):
+        """
+        Chạy ``factory()`` (trả về coroutine) hoặc chờ lời gọi cùng khóa đang chạy
+
+        Returns:
+            Kết quả của lời gọi chung
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        with self._lock:
+            task = self._calls.get(call_key)
+            shared = task is not None
+            if not shared:
+                task = loop.create_task(factory())
+                self._calls[call_key] = task
+                task.add_done_callback(lambda _task: self._forget(call_key, _task))
+        telemetry.record_singleflight(self.name, shared)
+        if shared:
+            logger.debug(f"Gộp lời gọi {self.name} trùng đang chạy")
+        return await asyncio.shield(task)
+
+    def _forget(self, call_key, task):
+        with self._lock:
+            if self._calls.get(call_key) is task:
+                del self._calls[call_key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            # Lỗi đã được chuyển cho các bên đang chờ; đánh dấu đã đọc để asyncio không cảnh báo
+            logger.debug(f"Lời gọi {self.name} kết thúc với lỗi: {task.exception()}")
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def _default_key(*args, **kwargs):
+    return repr((args, sorted(kwargs.items())))
+
+
+def coalesce(name, key=_default_key):
+    """
+    Decorator cho hàm async: các lời gọi cùng khóa đang chạy đồng thời dùng chung một lần gọi
+
+    ``key`` nhận cùng tham số với hàm và trả về khóa (hashable); mặc định là repr của tham số.
+    """
+    def decorator(func):
+        flight = SingleFlight(name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await flight.do(key(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,923 @@
+"""
+Lưu trữ dữ liệu của một hộ gia đình: thành viên, sự kiện, ghi chú và lịch sử trò chuyện.
+
+Không phụ thuộc giao diện: lỗi được ghi log và trả về qua giá trị trả về,
+phần hiển thị thông báo do lớp giao diện (Streamlit, API) đảm nhận.
+
+An toàn đa luồng (Streamlit chạy mỗi phiên trên một luồng riêng):
+- Thay đổi được thực hiện dưới khóa ghi và theo kiểu copy-on-write: mỗi lần
+  sửa tạo từ điển mới rồi gán lại, nên mã chỉ đọc ``store.events_data``...
+  luôn duyệt trên một bản chụp không bị thay đổi giữa chừng.
+- Ghi file do một luồng nền duy nhất đảm nhận (``WriteBehindWriter``): nhiều
+  thay đổi liên tiếp được gộp thành một lần ghi nguyên tử cho mỗi file
+  (file tạm, fsync, rename), luồng xử lý request không phải chờ đĩa.
+- Nhiều tiến trình cùng mở một thư mục dữ liệu đồng bộ với nhau qua nhật ký
+  thay đổi (xem replication).
+"""
+import atexit
+import contextlib
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from family_assistant import ids, records, schedule, telemetry
+from family_assistant.chat_archive import (
+    ARCHIVE_DIR,
+    ChatArchive,
+    compress_messages,
+    decompress_messages,
+    new_conversation_id,
+)
+from family_assistant.recurrence import OccurrenceIndex
+from family_assistant.replication import (
+    JOURNAL_MAX_BYTES,
+    ChangeJournal,
+    apply_ops,
+    get_watcher,
+    retain,
+)
+
+logger = logging.getLogger('family_assistant.store')
+
+# Tên file lưu trữ dữ liệu (trong thư mục dữ liệu của hộ gia đình)
+FAMILY_DATA_FILE = "family_data.json"
+EVENTS_DATA_FILE = "events_data.json"
+NOTES_DATA_FILE = "notes_data.json"
+CHAT_HISTORY_FILE = "chat_history.json"
+
+# Hộ gia đình mặc định (dữ liệu của bản cài đặt một gia đình trước đây)
+DEFAULT_HOUSEHOLD = "default"
+
+# Giới hạn lịch sử trò chuyện của mỗi thành viên: số cuộc trò chuyện gần nhất
+# và tổng dung lượng (đã nén) của chúng
+MAX_CONVERSATIONS_PER_MEMBER = int(os.getenv("CHAT_HISTORY_MAX_CONVERSATIONS", "10"))
+MAX_HISTORY_BYTES_PER_MEMBER = int(os.getenv("CHAT_HISTORY_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Khoảng chờ (giây) để gộp các thay đổi liên tiếp thành một lần ghi
+WRITE_BEHIND_DELAY = float(os.getenv("STORE_WRITE_DELAY", "0.05"))
+# Thời gian chờ trước khi ghi lại một file bị lỗi
+WRITE_RETRY_DELAY = 1.0
+
+
+def load_data(file_path):
+    """Đọc một file JSON, trả về từ điển rỗng nếu file không tồn tại hoặc không hợp lệ"""
+    if os.path.exists(file_path):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                # Đảm bảo dữ liệu là một từ điển
+                if not isinstance(data, dict):
+                    logger.warning(f"Dữ liệu trong {file_path} không phải từ điển. Khởi tạo lại.")
+                    return {}
+                return data
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc {file_path}: {e}")
+            return {}
+    return {}
+
+
+def save_data(file_path, data):
+    """
+    Ghi dữ liệu ra file JSON một cách nguyên tử, trả về False nếu có lỗi
+
+    Dữ liệu được ghi vào file tạm cùng thư mục, fsync rồi đổi tên đè lên file
+    cũ, nên file không bao giờ ở trạng thái ghi dở.
+    """
+    tmp_path = None
+    try:
+        # Đảm bảo thư mục tồn tại
+        directory = os.path.dirname(file_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with telemetry.span("save_data", file=os.path.basename(file_path)):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp tạo file chỉ chủ sở hữu đọc được; giữ quyền như file ghi bằng open()
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o777 if os.path.exists(file_path) else 0o644)
+            os.replace(tmp_path, file_path)
+            tmp_path = None
+        logger.info(f"Đã lưu dữ liệu vào {file_path}: {len(data)} mục")
+        return True
+    except Exception as e:
+        logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {e}")
+        return False
+    finally:
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RWLock:
+    """Khóa đọc-ghi: nhiều luồng đọc cùng lúc, luồng ghi độc quyền (ưu tiên luồng ghi)"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class WriteBehindWriter:
+    """
+    Luồng nền duy nhất ghi các tập dữ liệu đã thay đổi ra file
+
+    ``schedule`` chỉ đánh dấu (kho, tập dữ liệu) cần ghi rồi trả về ngay; các
+    đánh dấu trùng nhau trong khoảng ``delay`` được gộp thành một lần ghi.
+    """
+
+    def __init__(self, delay=WRITE_BEHIND_DELAY):
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._pending = {}      # (id kho, tập dữ liệu) -> kho
+        self._in_flight = set()
+        self._thread = None
+        self.writes = 0
+        self.coalesced = 0
+
+    def schedule(self, store, collection):
+        with self._cond:
+            key = (id(store), collection)
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = store
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="store-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def pending(self, store):
+        with self._cond:
+            return any(key[0] == id(store) for key in list(self._pending) + list(self._in_flight))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Chờ thêm một chút để gộp các thay đổi liên tiếp
+            time.sleep(self.delay)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._in_flight.update(batch)
+            failed = self._write_batch(batch)
+            if failed:
+                time.sleep(WRITE_RETRY_DELAY)
+
+    def _write_batch(self, batch):
+        failed = {}
+        for key, store in batch.items():
+            if not store._write(key[1]):
+                failed[key] = store
+        with self._cond:
+            self._in_flight.difference_update(batch)
+            self.writes += len(batch) - len(failed)
+            # Giữ lại để ghi lần sau, trừ khi đã có thay đổi mới được đánh dấu
+            for key, store in failed.items():
+                self._pending.setdefault(key, store)
+            self._cond.notify_all()
+        return failed
+
+    def flush(self, store=None, timeout=None):
+        """
+        Ghi ngay (trong luồng gọi) các thay đổi đang chờ của ``store`` (hoặc của mọi kho)
+
+        Trả về False nếu còn thay đổi chưa ghi được.
+        """
+        def owned(key):
+            return store is None or key[0] == id(store)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # Chờ luồng nền ghi xong các file đang ghi dở để không ghi đè bản mới bằng bản cũ
+            while any(owned(key) for key in self._in_flight):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            batch = {key: value for key, value in self._pending.items() if owned(key)}
+            for key in batch:
+                del self._pending[key]
+            self._in_flight.update(batch)
+        return not self._write_batch(batch)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Luồng ghi dùng chung của tiến trình"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindWriter()
+            atexit.register(_writer.flush)
+        return _writer
+
+
+def _reset_writer_after_fork():
+    # Tiến trình con (fork) không có luồng ghi của tiến trình cha
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_writer_after_fork)
+
+
+class HouseholdStore:
+    """
+    Dữ liệu của một hộ gia đình, đọc từ và ghi vào các file JSON trong ``data_dir``
+
+    Mỗi thay đổi là một thao tác trên bản ghi (xem ``replication.apply_ops``) được
+    áp dụng ngay vào bộ nhớ; luồng ghi nền ghi thay đổi ra file và ``flush()``
+    chờ tới khi mọi thay đổi của kho đã được ghi. Với ``write_behind=False`` thay
+    đổi được ghi ngay trong luồng gọi (dùng cho script, công cụ dòng lệnh).
+
+    Với ``replicated=True`` (mặc định) thay đổi còn được ghi vào nhật ký dùng
+    chung để các tiến trình khác mở cùng thư mục nhận được (xem replication).
+    """
+
+    COLLECTIONS = {
+        "family": FAMILY_DATA_FILE,
+        "events": EVENTS_DATA_FILE,
+        "notes": NOTES_DATA_FILE,
+        "chat_history": CHAT_HISTORY_FILE,
+    }
+    ATTRIBUTES = {
+        "family": "family_data",
+        "events": "events_data",
+        "notes": "notes_data",
+        "chat_history": "chat_history",
+    }
+
+    def __init__(self, data_dir=".", household_id=DEFAULT_HOUSEHOLD, write_behind=True, replicated=True):
+        self.data_dir = data_dir
+        self.household_id = household_id
+        self.write_behind = write_behind
+        self.replicated = replicated
+        self.last_error = None
+        self.conflicts = 0  # Số thao tác cục bộ phải rebase vì tiến trình khác đã sửa cùng bản ghi
+        self._lock = RWLock()
+        self._sync_lock = threading.Lock()
+        self._pending_ops = []
+        self._unsaved = set()
+        self._origin = uuid.uuid4().hex[:12]
+        # Bộ đếm ID dùng chung của thư mục dữ liệu (xem ids)
+        self.ids = ids.get_allocator(data_dir)
+        # Nội dung cuộc trò chuyện chờ luồng ghi nền ghi ra / xóa khỏi kho lưu trữ
+        self.archive = ChatArchive(os.path.join(data_dir, ARCHIVE_DIR))
+        self._pending_bodies = {}
+        self._pending_deletes = set()
+        # Chỉ mục lần diễn ra của bản chụp events_data hiện tại, tạo lại khi events_data đổi
+        self._occurrence_index = None
+        # Bản xem có kiểu (xem records) của bản chụp hiện tại của từng tập dữ liệu
+        self._record_views = {}
+        self._listeners = []
+        # Tăng sau mỗi thay đổi thành viên, sự kiện hoặc ghi chú (không tính lịch sử trò chuyện)
+        self.data_version = 0
+        if not replicated:
+            for collection in self.COLLECTIONS:
+                self._set(collection, load_data(self.path(collection)))
+            return
+
+        self.journal = ChangeJournal(data_dir)
+        with self.journal.lock():
+            self._reload()
+        get_watcher().watch(self)
+
+    def path(self, collection):
+        return os.path.join(self.data_dir, self.COLLECTIONS[collection])
+
+    def collection(self, collection):
+        return getattr(self, self.ATTRIBUTES[collection])
+
+    def _set(self, collection, data):
+        setattr(self, self.ATTRIBUTES[collection], data)
+
+    def read(self):
+        """Khóa đọc, dùng khi cần đọc nhất quán nhiều tập dữ liệu cùng lúc"""
+        return self._lock.read()
+
+    def records(self, collection):
+        """
+        Bản xem có kiểu (ID -> ``records.EventRecord``...) của tập dữ liệu "events", "notes" hoặc "family"
+
+        Được dựng một lần cho mỗi bản chụp (copy-on-write) và dùng lại cho tới khi tập dữ liệu đổi.
+        """
+        with self._lock.read():
+            data = self.collection(collection)
+        return self._record_view(collection, data)
+
+    def _record_view(self, collection, data):
+        """Bản xem có kiểu của bản chụp ``data`` (lấy từ bộ nhớ đệm nếu bản chụp không đổi)"""
+        cached = self._record_views.get(collection)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        view = records.build_view(collection, data, cached)
+        self._record_views[collection] = (data, view)
+        return view
+
+    def add_listener(self, callback):
+        """
+        Đăng ký ``callback(store, collection, ids)`` được gọi sau mỗi thay đổi dữ liệu
+
+        ``ids`` là tập ID bản ghi bị đổi, hoặc None khi cả tập dữ liệu có thể đã đổi.
+        Hàm được gọi khi đang giữ khóa ghi: chỉ nên ghi nhận thay đổi rồi xử lý ở nơi khác.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, collection, ids):
+        if collection != "chat_history":
+            self.data_version += 1
+        for callback in self._listeners:
+            try:
+                callback(self, collection, ids)
+            except Exception as e:
+                logger.error(f"Lỗi khi báo thay đổi {collection} của hộ gia đình {self.household_id}: {e}")
+
+    def _apply(self, op, new=False):
+        """Áp dụng một thao tác cục bộ; cần giữ khóa ghi"""
+        self._apply_batch([op], new)
+
+    def _apply_batch(self, ops, new=False):
+        """Áp dụng nhiều thao tác trên cùng một tập dữ liệu bằng một lần sao chép; cần giữ khóa ghi"""
+        collection = ops[0]["c"]
+        self._set(collection, apply_ops(self.collection(collection), ops))
+        self._notify(collection, {op["id"] for op in ops})
+        if self.replicated:
+            versions = self._versions.get(collection, {})
+            for op in ops:
+                # Phiên bản của bản ghi mà thao tác dựa trên, để phát hiện xung đột khi đồng bộ
+                op["base"] = versions.get(op["id"], 0)
+                op["new"] = new
+                self._pending_ops.append(op)
+
+    def save(self, collection):
+        """Đánh dấu một tập dữ liệu cần ghi (hoặc ghi ngay nếu không dùng luồng ghi nền)"""
+        with self._lock.write():
+            self._unsaved.add(collection)
+        if not self.write_behind:
+            return self._write(collection)
+        get_writer().schedule(self, collection)
+        return True
+
+    def _write(self, collection):
+        # Nội dung cuộc trò chuyện được ghi trước chỉ mục (để chỉ mục không trỏ tới
+        # file chưa có) và chỉ bị xóa sau khi chỉ mục mới đã được ghi
+        if not self._write_archive():
+            return False
+        with self._lock.write():
+            deletes, self._pending_deletes = self._pending_deletes, set()
+        if self.replicated:
+            ok = self.sync()
+        else:
+            # Nhờ copy-on-write, bản chụp lấy dưới khóa đọc không bị thay đổi khi đang ghi
+            with self._lock.write():
+                self._unsaved.discard(collection)
+                data = self.collection(collection)
+            ok = save_data(self.path(collection), data)
+            if not ok:
+                self.last_error = f"Không thể lưu dữ liệu: {self.path(collection)}"
+        if not ok:
+            with self._lock.write():
+                self._pending_deletes |= deletes
+            return False
+        for conversation_id in deletes:
+            self.archive.delete(conversation_id)
+        return True
+
+    def _write_archive(self):
+        # Nội dung chỉ rời bộ nhớ sau khi đã ghi xong, để load_conversation luôn đọc được
+        with self._lock.read():
+            bodies = dict(self._pending_bodies)
+        failed = {conversation_id for conversation_id, body in bodies.items()
+                  if not self.archive.write(conversation_id, body)}
+        with self._lock.write():
+            for conversation_id, body in bodies.items():
+                if conversation_id not in failed and self._pending_bodies.get(conversation_id) is body:
+                    del self._pending_bodies[conversation_id]
+        if failed:
+            self.last_error = "Không thể lưu nội dung cuộc trò chuyện"
+            return False
+        return True
+
+    @property
+    def dirty(self):
+        return (bool(self._pending_ops or self._unsaved or self._pending_bodies or self._pending_deletes) or
+                (self.write_behind and get_writer().pending(self)))
+
+    def flush(self, timeout=None):
+        """Ghi ngay các thay đổi chưa ghi, trả về False nếu có lỗi"""
+        if not self.write_behind:
+            return True
+        return get_writer().flush(self, timeout)
+
+    # ------ Đồng bộ giữa các tiến trình ------
+    def _reload(self):
+        """Tải lại toàn bộ từ file dữ liệu và nhật ký; cần giữ khóa nhật ký"""
+        versions = self.journal.open()
+        base = {collection: load_data(self.path(collection)) for collection in self.COLLECTIONS}
+        with self._lock.write():
+            self._base, self._versions = base, versions
+            self._last_writer = {}
+            self._rebuild(self.COLLECTIONS)
+            for collection in self.COLLECTIONS:
+                self._notify(collection, None)
+
+    def _rebuild(self, collections):
+        """Dữ liệu hiển thị = dữ liệu đã đồng bộ + thao tác cục bộ chưa gửi; cần giữ khóa ghi"""
+        for collection in collections:
+            self._set(collection, apply_ops(self._base[collection],
+                                            [op for op in self._pending_ops if op["c"] == collection]))
+
+    def _catch_up(self):
+        """Áp dụng các thao tác mới của tiến trình khác; cần giữ khóa nhật ký"""
+        entries = self.journal.read_new()
+        if entries is None:
+            logger.info(f"Nhật ký của hộ gia đình {self.household_id} đã được nén, tải lại dữ liệu")
+            self._reload()
+            return
+        if not entries:
+            return
+        touched = {entry["c"] for entry in entries}
+        with self._lock.write():
+            base = dict(self._base)
+            for collection in touched:
+                base[collection] = apply_ops(base[collection], [e for e in entries if e["c"] == collection])
+            for entry in entries:
+                self._versions.setdefault(entry["c"], {})[entry["id"]] = entry["v"]
+                self._last_writer[(entry["c"], entry["id"])] = entry["origin"]
+            self._base = base
+            self._rebuild(touched)
+            for collection in touched:
+                self._notify(collection, {entry["id"] for entry in entries if entry["c"] == collection})
+        logger.info(f"Đã áp dụng {len(entries)} thay đổi từ tiến trình khác cho hộ gia đình {self.household_id}")
+
+    def _rebase(self, ops):
+        """
+        So phiên bản của từng thao tác cục bộ với bản ghi hiện tại
+
+        Nếu tiến trình khác đã sửa bản ghi kể từ khi thao tác được tạo: bản ghi mới
+        trùng ID được cấp ID khác, patch được áp lên phiên bản mới nhất (hoặc bỏ
+        nếu bản ghi đã bị xóa). Trả về (thao tác sau rebase, các tập dữ liệu bị đổi).
+        """
+        rebased, changed, renamed = [], set(), {}
+        for op in ops:
+            collection, record_id = op["c"], op["id"]
+            key = (collection, record_id)
+            if key in renamed:
+                op = {**op, "id": renamed[key]}
+            elif (op["base"] != self._versions.get(collection, {}).get(record_id, 0) and
+                  (op["new"] or self._last_writer.get(key) != self._origin)):
+                # Bản ghi đã bị sửa sau phiên bản mà thao tác dựa trên (thay đổi chỉ do
+                # chính tiến trình này thực hiện thì không tính là xung đột, trừ khi tạo mới)
+                self.conflicts += 1
+                changed.add(collection)
+                if op["new"]:
+                    # Chỉ xảy ra khi bộ đếm ID dùng chung bị mất (ids.json bị xóa) hoặc tiến trình
+                    # khác chạy phiên bản cũ còn cấp ID theo số bản ghi
+                    new_id = self.ids.allocate(collection, [*self._base[collection], *renamed.values(),
+                                                            *(o["id"] for o in ops if o["c"] == collection)])[0]
+                    renamed[key] = new_id
+                    logger.warning(f"ID {record_id} ({collection}) đã được tiến trình khác dùng, đổi thành {new_id}")
+                    op = {**op, "id": new_id}
+                elif op["op"] == "patch" and record_id not in self._base[collection]:
+                    logger.warning(f"Bỏ thay đổi trên bản ghi {record_id} ({collection}) đã bị xóa ở tiến trình khác")
+                    continue
+            rebased.append(op)
+        return rebased, changed
+
+    def sync(self):
+        """Đồng bộ với nhật ký dùng chung: nhận thay đổi từ xa rồi gửi thay đổi cục bộ"""
+        if not self.replicated:
+            return self.flush()
+        with self._sync_lock:
+            try:
+                with self.journal.lock():
+                    self._catch_up()
+                    with self._lock.write():
+                        ops, self._pending_ops = self._pending_ops, []
+                        unsaved, self._unsaved = self._unsaved, set()
+                    try:
+                        ops, changed = self._rebase(ops)
+                        entries = self.journal.append(ops, self._origin) if ops else []
+                    except Exception:
+                        with self._lock.write():
+                            self._pending_ops = ops + self._pending_ops
+                            self._unsaved |= unsaved
+                        raise
+
+                    base = dict(self._base)
+                    for collection in {entry["c"] for entry in entries}:
+                        base[collection] = apply_ops(base[collection], [e for e in entries if e["c"] == collection])
+                    with self._lock.write():
+                        for entry in entries:
+                            self._versions.setdefault(entry["c"], {})[entry["id"]] = entry["v"]
+                            self._last_writer[(entry["c"], entry["id"])] = self._origin
+                        self._base = base
+                        # Thao tác bị đổi khi rebase: dựng lại dữ liệu hiển thị
+                        self._rebuild(changed)
+                        for collection in changed:
+                            self._notify(collection, None)
+
+                    # File dữ liệu luôn được cập nhật cùng nhật ký để tiến trình mới tải đúng
+                    failed = {collection for collection in unsaved | {entry["c"] for entry in entries}
+                              if not save_data(self.path(collection), base[collection])}
+                    if failed:
+                        with self._lock.write():
+                            self._unsaved |= failed
+                        self.last_error = f"Không thể lưu dữ liệu: {', '.join(sorted(failed))}"
+                        return False
+                    if self.journal.size() > JOURNAL_MAX_BYTES:
+                        self.journal.compact(self._versions)
+                return True
+            except Exception as e:
+                logger.error(f"Lỗi khi đồng bộ dữ liệu hộ gia đình {self.household_id}: {e}")
+                self.last_error = f"Không thể đồng bộ dữ liệu: {e}"
+                return False
+
+    def verify_data_structure(self):
+        """Kiểm tra và đảm bảo cấu trúc dữ liệu đúng, rồi lưu lại dữ liệu đã sửa"""
+        with self._lock.write():
+            # Đảm bảo tất cả dữ liệu là từ điển
+            for collection in self.COLLECTIONS:
+                if not isinstance(self.collection(collection), dict):
+                    logger.warning(f"{self.ATTRIBUTES[collection]} không phải từ điển. Khởi tạo lại.")
+                    self._set(collection, {})
+
+            # Xóa các thành viên không hợp lệ
+            for member_id, member in list(self.family_data.items()):
+                if not isinstance(member, dict):
+                    self._apply({"c": "family", "op": "del", "id": member_id})
+
+            for collection in records.RECORD_TYPES:
+                self._migrate_records(collection)
+            self._migrate_chat_history()
+
+        for collection in self.COLLECTIONS:
+            self.save(collection)
+
+    def _migrate_records(self, collection):
+        """Nâng các bản ghi của phiên bản cũ lên ``records.SCHEMA_VERSION``; cần giữ khóa ghi"""
+        ops = []
+        for record_id, value in self.collection(collection).items():
+            if not isinstance(value, dict):
+                continue
+            migrated = records.migrate(collection, value)
+            if migrated is not None:
+                ops.append({"c": collection, "op": "put", "id": record_id, "value": migrated})
+        if ops:
+            self._apply_batch(ops)
+            logger.info(f"Đã nâng {len(ops)} bản ghi {collection} lên phiên bản {records.SCHEMA_VERSION}")
+
+    def _migrate_chat_history(self):
+        """Chuyển lịch sử dạng cũ (tin nhắn nằm trong chat_history.json) sang kho lưu trữ; cần giữ khóa ghi"""
+        for member_id, conversations in list(self.chat_history.items()):
+            if not isinstance(conversations, list):
+                self._apply({"c": "chat_history", "op": "del", "id": member_id})
+                continue
+            if not any(isinstance(entry, dict) and "messages" in entry for entry in conversations):
+                continue
+            index = []
+            for entry in conversations:
+                if not isinstance(entry, dict):
+                    continue
+                if "messages" in entry:
+                    entry = self._archive_entry(entry.get("messages", []), entry.get("summary", ""),
+                                                entry.get("timestamp", _now()))
+                index.append(entry)
+            self._apply({"c": "chat_history", "op": "put", "id": member_id, "value": index})
+            logger.info(f"Đã chuyển {len(index)} cuộc trò chuyện của thành viên {member_id} sang kho lưu trữ nén")
+
+    def _archive_entry(self, messages, summary, timestamp):
+        """Nén nội dung (chờ ghi) và trả về mục chỉ mục tương ứng; cần giữ khóa ghi"""
+        conversation_id = new_conversation_id()
+        body = compress_messages(messages)
+        self._pending_bodies[conversation_id] = body
+        return {
+            "id": conversation_id,
+            "timestamp": timestamp,
+            "summary": summary or "",
+            "size": len(body),
+            "message_count": len(messages),
+        }
+
+    # ------ Thành viên ------
+    def get_member(self, member_id):
+        member = self.family_data.get(member_id) if member_id else None
+        return member if isinstance(member, dict) else None
+
+    def add_family_member(self, details):
+        """
+        Thêm thành viên, trả về ID của thành viên mới; ném ``records.ValidationError`` nếu dữ liệu không hợp lệ
+
+        ID luôn do bộ đếm cấp: ``details["id"]`` (ví dụ trong lệnh ADD_FAMILY_MEMBER của trợ lý)
+        bị bỏ qua để không ghi đè thành viên đang có.
+        """
+        member = records.validate("family", {"name": details.get("name", ""), "age": details.get("age", ""),
+                                             "preferences": details.get("preferences", {}), "added_on": _now()})
+        member_id = self._new_ids("family")[0]
+        with self._lock.write():
+            self._apply({"c": "family", "op": "put", "id": member_id, "value": member}, new=True)
+        self.save("family")
+        return member_id
+
+    def _new_ids(self, collection, count=1):
+        """ID mới cho ``count`` bản ghi (xem ids), lấy trước khi giữ khóa ghi"""
+        return self.ids.allocate(collection, self.collection(collection), count)
+
+    def insert_records(self, collection, values):
+        """
+        Thêm các bản ghi đã ở dạng lưu trữ (khôi phục, xem ``ids.repair``) với ID mới
+
+        Returns:
+            list: ID mới, theo thứ tự
+        """
+        if not values:
+            return []
+        new_ids = self._new_ids(collection, len(values))
+        with self._lock.write():
+            self._apply_batch([{"c": collection, "op": "put", "id": record_id, "value": value}
+                               for record_id, value in zip(new_ids, values)], new=True)
+        self.save(collection)
+        return new_ids
+
+    def _validated_patch(self, collection, record_id, fields):
+        """
+        Các trường sửa đổi đã chuẩn hóa, sau khi kiểm tra cả bản ghi sau khi sửa; cần giữ khóa ghi
+
+        Bản ghi cũ đã sai từ trước (``migrate`` không sửa được) chỉ được kiểm tra các trường
+        được sửa, để vẫn sửa được, kể cả chính trường sai.
+        """
+        current = self.collection(collection)[record_id]
+        try:
+            updated = records.validate(collection, {**current, **fields})
+        except records.ValidationError:
+            if records.is_valid(collection, current):
+                raise
+            return records.validate_fields(collection, fields)
+        return {key: updated.get(key, value) for key, value in fields.items()}
+
+    def update_family_member(self, member_id, name, age, preferences):
+        """Cập nhật tên, tuổi và sở thích của một thành viên (``records.ValidationError`` nếu không hợp lệ)"""
+        with self._lock.write():
+            if self.get_member(member_id) is None:
+                return False
+            fields = self._validated_patch("family", member_id,
+                                           {"name": name, "age": age, "preferences": preferences})
+            self._apply({"c": "family", "op": "patch", "id": member_id, "fields": fields})
+        return self.save("family")
+
+    def update_preference(self, details):
+        member_id = details.get("id")
+        preference_key = details.get("key")
+        preference_value = details.get("value")
+
+        with self._lock.write():
+            if self.get_member(member_id) is None or not preference_key:
+                return False
+            # Kiểm tra hồ sơ sau khi sửa (ném records.ValidationError nếu không hợp lệ)
+            preferences = self.family_data[member_id].get("preferences")
+            preferences = preferences if isinstance(preferences, dict) else {}
+            self._validated_patch("family", member_id,
+                                  {"preferences": {**preferences, preference_key: preference_value}})
+            # Chỉ gộp khóa sở thích thay đổi để không ghi đè sở thích khác do tiến trình khác thêm
+            self._apply({"c": "family", "op": "patch", "id": member_id,
+                         "merge": {"preferences": {preference_key: preference_value}}})
+        return self.save("family")
+
+    # ------ Sự kiện ------
+    @staticmethod
+    def _new_event(details):
+        """
+        Bản ghi sự kiện mới từ thông tin được cung cấp, ném ``records.ValidationError`` nếu không hợp lệ
+
+        Ngoài các trường cơ bản: ``recurrence`` (quy tắc lặp, xem recurrence), ``duration``
+        (số phút, mặc định xem schedule), ``reminders`` (nhắc trước bao nhiêu phút, mặc
+        định xem reminders), ``uid`` (ID của sự kiện trong lịch bên ngoài, xem ical).
+        """
+        return records.validate("events", {**details, "created_on": details.get("created_on") or _now()})
+
+    def add_event(self, details, conflicts=None):
+        """
+        Thêm một sự kiện mới, trả về ID sự kiện hoặc None nếu có lỗi
+
+        Nếu truyền danh sách ``conflicts``, các sự kiện trùng giờ với sự kiện mới
+        (cùng người tham gia, xem schedule) được thêm vào danh sách đó. Dữ liệu không
+        hợp lệ không được lưu: ném ``records.ValidationError``.
+        """
+        event = self._new_event(details)
+        try:
+            if conflicts is not None:
+                conflicts.extend(schedule.find_conflicts(self, event))
+            event_id = self._new_ids("events")[0]
+            with self._lock.write():
+                self._apply({"c": "events", "op": "put", "id": event_id, "value": event}, new=True)
+            self.save("events")
+            logger.info(f"Đã thêm sự kiện: {details.get('title', '')}, tổng số sự kiện: {len(self.events_data)}")
+            return event_id
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm sự kiện: {e}")
+            return None
+
+    def add_events(self, details_list):
+        """
+        Thêm nhiều sự kiện trong một lần cập nhật và một lần ghi file (dùng khi nhập lịch)
+
+        Nếu có sự kiện không hợp lệ, không sự kiện nào được thêm (``records.ValidationError``).
+
+        Returns:
+            list: ID của các sự kiện mới, theo thứ tự
+        """
+        events = [self._new_event(details) for details in details_list]
+        if not events:
+            return []
+        ops = [{"c": "events", "op": "put", "id": event_id, "value": event}
+               for event_id, event in zip(self._new_ids("events", len(events)), events)]
+        with self._lock.write():
+            self._apply_batch(ops, new=True)
+        self.save("events")
+        logger.info(f"Đã thêm {len(ops)} sự kiện, tổng số sự kiện: {len(self.events_data)}")
+        return [op["id"] for op in ops]
+
+    def update_event(self, details, conflicts=None):
+        """Cập nhật các trường được cung cấp của một sự kiện (``conflicts``: xem add_event)"""
+        try:
+            event_id = details.get("id")
+            with self._lock.write():
+                if event_id not in self.events_data:
+                    logger.warning(f"Không tìm thấy sự kiện ID={event_id}")
+                    return False
+                fields = {key: value for key, value in details.items() if key != "id" and value is not None}
+                if "recurrence" in details:
+                    # Quy tắc rỗng/không hợp lệ nghĩa là bỏ lặp lại
+                    fields["recurrence"] = details["recurrence"]
+                # Đảm bảo trường created_on được giữ nguyên
+                if "created_on" not in self.events_data[event_id]:
+                    fields["created_on"] = _now()
+                fields = self._validated_patch("events", event_id, fields)
+                updated = {**self.events_data[event_id], **fields}
+                self._apply({"c": "events", "op": "patch", "id": event_id, "fields": fields})
+            if conflicts is not None:
+                conflicts.extend(schedule.find_conflicts(self, updated, exclude_id=event_id))
+
+            self.save("events")
+            logger.info(f"Đã cập nhật sự kiện ID={event_id}: {details}")
+            return True
+        except records.ValidationError:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi cập nhật sự kiện: {e}")
+            return False
+
+    def delete_event(self, event_id):
+        with self._lock.write():
+            if event_id not in self.events_data:
+                return False
+            self._apply({"c": "events", "op": "del", "id": event_id})
+        return self.save("events")
+
+    def skip_occurrence(self, event_id, day):
+        """Bỏ qua một lần diễn ra (ngày YYYY-MM-DD) của sự kiện lặp lại"""
+        with self._lock.write():
+            event = self.events_data.get(event_id)
+            if not isinstance(event, dict) or not event.get("recurrence"):
+                return False
+            rule = dict(event["recurrence"])
+            rule["exceptions"] = sorted(set(rule.get("exceptions", [])) | {day})
+            self._apply({"c": "events", "op": "patch", "id": event_id, "fields": {"recurrence": rule}})
+        return self.save("events")
+
+    @staticmethod
+    def _involves(event, member_id, member_name):
+        return (event.get("created_by") == member_id or
+                (member_name is not None and member_name in event.get("participants", [])))
+
+    def filter_events_by_member(self, member_id=None):
+        """Lọc những sự kiện mà thành viên tạo hoặc tham gia"""
+        with self._lock.read():
+            events_data = self.events_data
+            member = self.get_member(member_id)
+        if not member_id:
+            return events_data  # Trả về tất cả sự kiện nếu không có ID
+
+        member_name = member.get("name") if member else None
+        filtered_events = {}
+        for event_id, event in events_data.items():
+            if self._involves(event, member_id, member_name):
+                filtered_events[event_id] = event
+
+        return filtered_events
+
+    def occurrences(self, start, end, member_id=None):
+        """
+        Các lần diễn ra sự kiện trong khoảng ngày [start, end], theo thứ tự ngày giờ
+
+        Sự kiện lặp lại được sinh dần từ quy tắc, không tạo trước các lần trong tương lai.
+
+        Returns:
+            iterator: Các cặp (ID sự kiện, sự kiện với ``date`` là ngày diễn ra)
+        """
+        with self._lock.read():
+            events_data = self.events_data
+            member = self.get_member(member_id) if member_id else None
+        index = self._occurrence_index
+        if index is None or index.events is not events_data:
+            index = self._occurrence_index = OccurrenceIndex(events_data, self._record_view("events", events_data))
+
+        if not member_id:
+            return index.window(start, end)
+        member_name = member.get("name") if member else None
+
+        def involves_member(event):
+            return self._involves(event, member_id, member_name)
+        return index.window(start, end, involves_member)
+
+    # ------ Ghi chú ------
+    def add_note(self, details):
+        """Thêm ghi chú, trả về ID ghi chú; ném ``records.ValidationError`` nếu dữ liệu không hợp lệ"""
+        note = records.validate("notes", {"title": details.get("title", ""), "content": details.get("content", ""),
+                                          "tags": details.get("tags", []), "created_by": details.get("created_by", ""),
+                                          "created_on": _now()})
+        note_id = self._new_ids("notes")[0]
+        with self._lock.write():
+            self._apply({"c": "notes", "op": "put", "id": note_id, "value": note}, new=True)
+        self.save("notes")
+        return note_id
+
+    def delete_note(self, note_id):
+        with self._lock.write():
+            if note_id not in self.notes_data:
+                return False
+            self._apply({"c": "notes", "op": "del", "id": note_id})
+        return self.save("notes")
+
+    # ------ Lịch sử trò chuyện ------
+    def save_chat_history(self, member_id, messages, summary=None):
+        """Lưu một cuộc trò chuyện vào đầu lịch sử của thành viên"""
+        with self._lock.write():
+            history_entry = self._archive_entry(list(messages), summary, _now())
+            # Giới hạn số lượng và dung lượng; nội dung của các cuộc trò chuyện bị bỏ được xóa
+            previous = self.chat_history.get(member_id, [])
+            kept = retain([history_entry] + previous, MAX_CONVERSATIONS_PER_MEMBER, MAX_HISTORY_BYTES_PER_MEMBER)
+            kept_ids = {entry.get("id") for entry in kept}
+            for entry in previous:
+                if entry.get("id") and entry["id"] not in kept_ids:
+                    self._pending_bodies.pop(entry["id"], None)
+                    self._pending_deletes.add(entry["id"])
+            self._apply({"c": "chat_history", "op": "prepend", "id": member_id, "value": history_entry,
+                         "limit": MAX_CONVERSATIONS_PER_MEMBER, "max_bytes": MAX_HISTORY_BYTES_PER_MEMBER})
+
+        return self.save("chat_history")
+
+    def load_conversation(self, entry):
+        """Tin nhắn của một cuộc trò chuyện trong chỉ mục lịch sử (đọc từ kho lưu trữ khi cần)"""
+        if "messages" in entry:  # Dạng cũ chưa được chuyển đổi
+            return entry["messages"]
+        with self._lock.read():
+            body = self._pending_bodies.get(entry.get("id"))
+        if body is not None:
+            return decompress_messages(body)
+        return self.archive.read(entry.get("id"))
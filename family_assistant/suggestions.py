@@ -0,0 +1,399 @@
+"""
+Câu hỏi gợi ý cá nhân hóa theo thành viên, sự kiện sắp tới và thời điểm hiện tại.
+
+Kết quả được cache theo (hộ gia đình, thành viên, giờ) và dùng chung cho mọi
+phiên trò chuyện trong tiến trình.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import random
+import threading
+
+from family_assistant import llm, singleflight, telemetry
+
+logger = logging.getLogger('family_assistant.suggestions')
+
+_question_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_key(store, member_id):
+    return (store.data_dir, member_id, datetime.datetime.now().strftime('%Y-%m-%d_%H'))
+
+
+def clear_cache(store=None):
+    """Xóa cache câu hỏi gợi ý (của một hộ gia đình hoặc toàn bộ)"""
+    with _cache_lock:
+        if store is None:
+            _question_cache.clear()
+            return
+        for key in [key for key in _question_cache if key[0] == store.data_dir]:
+            del _question_cache[key]
+
+
+def collect_upcoming_events(store, days=14):
+    """Các sự kiện trong ``days`` ngày tới (tiêu đề, ngày, số ngày còn lại); sự kiện lặp lại lấy lần gần nhất"""
+    upcoming_events = []
+    seen = set()
+    today = datetime.datetime.now().date()
+
+    for event_id, event in store.occurrences(today, today + datetime.timedelta(days=days)):
+        if event_id in seen:
+            continue
+        seen.add(event_id)
+        upcoming_events.append({
+            "title": event.get("title", ""),
+            "date": event.get("date", ""),
+            "days_away": (datetime.date.fromisoformat(event["date"]) - today).days
+        })
+    return upcoming_events
+
+
+def _member_info(store, member_id):
+    member = store.get_member(member_id)
+    if member is None:
+        return {}
+    return {
+        "name": member.get("name", ""),
+        "age": member.get("age", ""),
+        "preferences": member.get("preferences", {})
+    }
+
+
+def _prompt(member_info, max_questions):
+    return f"""
+            Hãy tạo {max_questions} câu gợi ý đa dạng và cá nhân hóa cho người dùng trợ lý gia đình dựa trên thông tin sau:
+
+            Thông tin người dùng: {json.dumps(member_info, ensure_ascii=False)}
+
+
+            Yêu cầu:
+            1. Mỗi câu gợi ý nên tập trung vào MỘT sở thích cụ thể, không kết hợp nhiều sở thích
+            2. KHÔNG kết thúc câu gợi ý bằng bất kỳ cụm từ nào như "bạn có biết không?", "bạn có muốn không?", v.v.
+            3. Đưa ra thông tin cụ thể, chi tiết và chính xác như thể bạn đang viết một bài đăng trên mạng xã hội
+            4. Mục đích là cung cấp thông tin hữu ích, không phải bắt đầu cuộc trò chuyện
+            5. Chỉ trả về danh sách các câu gợi ý, mỗi câu trên một dòng
+            6. Không thêm đánh số hoặc dấu gạch đầu dòng
+
+            Ví dụ tốt:
+            - "Top 5 phim hành động hay nhất 2023?"
+            - "Công thức bánh mì nguyên cám giảm cân?"
+            - "Kết quả Champions League?"
+            - "5 bài tập cardio giảm mỡ bụng hiệu quả?"
+
+            Ví dụ không tốt:
+            - "Bạn đã biết bộ phim 'The Goal' vừa được phát hành và nhận nhiều phản hồi tích cực từ khán giả chưa?" (Kết hợp phim + bóng đá)
+            - "Kết quả trận đấu Champions League: Man City 3-1 Real Madrid, bạn có theo dõi không?" (Kết thúc bằng câu hỏi)
+            - "Bạn có muốn xem những phát hiện mới về dinh dưỡng không?" (Không cung cấp thông tin cụ thể)
+
+            Trả về chính xác {max_questions} câu gợi ý.
+            """
+
+
+@singleflight.coalesce("suggestions", key=lambda store, api_key, member_id=None, max_questions=5: (
+    store.data_dir, api_key, member_id, max_questions))
+async def _generate_questions(store, api_key, member_id=None, max_questions=5):
+    """Tạo câu hỏi bằng mô hình (hoặc từ mẫu câu), không qua cache"""
+    questions = []
+    if api_key and api_key.startswith("sk-"):
+        try:
+            generated_content = await llm.complete(
+                api_key,
+                "suggestions",
+                [
+                    {"role": "system", "content": "Bạn là trợ lý tạo câu hỏi gợi ý cá nhân hóa."},
+                    {"role": "user", "content": _prompt(_member_info(store, member_id), max_questions)}
+                ],
+                member_id=member_id,
+                household_id=store.household_id,
+                temperature=0.8,
+                max_tokens=300
+            )
+            questions = [q.strip() for q in generated_content.strip().split('\n') if q.strip()]
+            questions = questions[:max_questions]
+            logger.info(f"Đã tạo {len(questions)} câu hỏi gợi ý bằng OpenAI API")
+        except Exception as e:
+            logger.error(f"Lỗi khi tạo câu hỏi với OpenAI: {e}")
+
+    if not questions:
+        questions = generate_fallback_questions(store, member_id, max_questions)
+    return questions
+
+
+async def generate_suggested_questions(store, api_key, member_id=None, max_questions=5):
+    """
+    Tạo câu hỏi gợi ý cá nhân hóa: dùng mô hình nếu có API key,
+    nếu không (hoặc khi lỗi) thì sinh từ mẫu câu
+    """
+    cache_key = _cache_key(store, member_id)
+    with _cache_lock:
+        cached = _question_cache.get(cache_key)
+    if cached is not None:
+        telemetry.record_cache("suggested_questions", True)
+        return cached
+    telemetry.record_cache("suggested_questions", False)
+
+    # Các phiên hỏi cùng thành viên cùng lúc (ví dụ đầu giờ) dùng chung một lần tạo
+    questions = await _generate_questions(store, api_key, member_id, max_questions)
+
+    with _cache_lock:
+        # Bỏ các mục của giờ trước để bộ nhớ chỉ tỉ lệ với số hộ gia đình đang hoạt động
+        for key in [key for key in _question_cache if key[2] != cache_key[2]]:
+            del _question_cache[key]
+        _question_cache[cache_key] = questions
+    return questions
+
+
+def generate_fallback_questions(store, member_id=None, max_questions=5, upcoming_events=None):
+    """Sinh câu hỏi gợi ý từ mẫu câu kết hợp thông tin cá nhân (không gọi mô hình)"""
+    if upcoming_events is None:
+        upcoming_events = collect_upcoming_events(store)
+    questions = []
+
+    # Tạo seed dựa trên ngày và ID thành viên để tạo sự đa dạng
+    random_seed = int(hashlib.md5(f"{datetime.datetime.now().strftime('%Y-%m-%d_%H')}_{member_id or 'guest'}".encode()).hexdigest(), 16) % 10000
+    rng = random.Random(random_seed)
+
+    # Mẫu câu thông tin cụ thể theo nhiều chủ đề khác nhau (không có câu hỏi cuối câu)
+    question_templates = {
+        "food": [
+            "Top 10 món {food} ngon nhất Việt Nam?",
+            "Công thức làm món {food} ngon tại nhà?",
+            "5 biến tấu món {food} cho bữa {meal}?",
+            "Bí quyết làm món {food} ngon như nhà hàng 5 sao?",
+            "Cách làm món {food} chuẩn vị {season}?",
+            "3 cách chế biến món {food} giảm 50% calo?"
+        ],
+        "movies": [
+            "Top 5 phim chiếu rạp tuần này: {movie1}, {movie2}, {movie3} - Đặt vé ngay để nhận ưu đãi.",
+            "Phim mới ra mắt {movie1}?",
+            "Đánh giá phim {movie1}?",
+            "{actor} vừa giành giải Oscar cho vai diễn trong phim {movie1}, đánh bại 4 đối thủ nặng ký khác.",
+            "5 bộ phim kinh điển mọi thời đại?",
+            "Lịch chiếu phim {movie1} cuối tuần này?"
+        ],
+        "football": [
+            "Kết quả Champions League?",
+            "BXH Ngoại hạng Anh sau vòng 30?",
+            "Chuyển nhượng bóng đá?",
+            "Lịch thi đấu vòng tứ kết World Cup?",
+            "Tổng hợp bàn thắng đẹp nhất tuần?",
+            "Thống kê {player1} mùa này?"
+        ],
+        "technology": [
+            "So sánh iPhone 16 Pro và Samsung S24 Ultra?",
+            "5 tính năng AI mới trên smartphone 2024?",
+            "Đánh giá laptop gaming {laptop_model}?",
+            "Cách tối ưu hóa pin điện thoại tăng 30% thời lượng?",
+            "3 ứng dụng quản lý công việc tốt nhất 2024?",
+            "Tin công nghệ?"
+        ],
+        "health": [
+            "5 loại thực phẩm tăng cường miễn dịch mùa {season}?",
+            "Chế độ ăn Địa Trung Hải giúp giảm 30% nguy cơ bệnh tim mạch?",
+            "3 bài tập cardio đốt mỡ bụng hiệu quả trong 15 phút?",
+            "Nghiên cứu mới?",
+            "Cách phòng tránh cảm cúm mùa {season}?",
+            "Thực đơn 7 ngày giàu protein?"
+        ],
+        "family": [
+            "10 hoạt động cuối tuần gắn kết gia đình?",
+            "5 trò chơi phát triển IQ cho trẻ 3-6 tuổi?.",
+            "Bí quyết dạy trẻ quản lý tài chính?",
+            "Lịch trình khoa học cho trẻ?",
+            "Cách giải quyết mâu thuẫn anh chị em?",
+            "5 dấu hiệu trẻ gặp khó khăn tâm lý cần hỗ trợ?"
+        ],
+        "travel": [
+            "Top 5 điểm du lịch Việt Nam mùa {season}?",
+            "Kinh nghiệm du lịch tiết kiệm?",
+            "Lịch trình du lịch Đà Nẵng 3 ngày?",
+            "5 món đặc sản không thể bỏ qua khi đến Huế?",
+            "Cách chuẩn bị hành lý cho chuyến du lịch 5 ngày?",
+            "Kinh nghiệm đặt phòng khách sạn?"
+        ],
+        "news": [
+            "Tin kinh tế?",
+            "Tin thời tiết?",
+            "Tin giáo dục?",
+            "Tin giao thông?",
+            "Tin y tế?",
+            "Tin văn hóa?"
+        ]
+    }
+
+    # Các biến thay thế trong mẫu câu
+    replacements = {
+        "food": ["phở", "bánh mì", "cơm rang", "gỏi cuốn", "bún chả", "bánh xèo", "mì Ý", "sushi", "pizza", "món Hàn Quốc"],
+        "meal": ["sáng", "trưa", "tối", "xế"],
+        "event": ["sinh nhật", "họp gia đình", "dã ngoại", "tiệc", "kỳ nghỉ"],
+        "days": ["vài", "2", "3", "7", "10"],
+        "hobby": ["đọc sách", "nấu ăn", "thể thao", "làm vườn", "vẽ", "âm nhạc", "nhiếp ảnh"],
+        "time_of_day": ["sáng", "trưa", "chiều", "tối"],
+        "day": ["thứ Hai", "thứ Ba", "thứ Tư", "thứ Năm", "thứ Sáu", "thứ Bảy", "Chủ Nhật", "cuối tuần"],
+        "season": ["xuân", "hạ", "thu", "đông"],
+        "weather": ["nóng", "lạnh", "mưa", "nắng", "gió"],
+        "music_artist": ["Sơn Tùng M-TP", "Mỹ Tâm", "BTS", "Taylor Swift", "Adele", "Coldplay", "BlackPink"],
+        "actor": ["Ngô Thanh Vân", "Trấn Thành", "Tom Cruise", "Song Joong Ki", "Scarlett Johansson", "Leonardo DiCaprio"],
+        "movie1": ["The Beekeeper", "Dune 2", "Godzilla x Kong", "Deadpool 3", "Inside Out 2", "Twisters", "Bad Boys 4"],
+        "movie2": ["The Fall Guy", "Kingdom of the Planet of the Apes", "Furiosa", "Borderlands", "Alien: Romulus"],
+        "movie3": ["Gladiator 2", "Wicked", "Sonic the Hedgehog 3", "Mufasa", "Moana 2", "Venom 3"],
+        "team1": ["Manchester City", "Arsenal", "Liverpool", "Real Madrid", "Barcelona", "Bayern Munich", "PSG", "Việt Nam"],
+        "team2": ["Chelsea", "Tottenham", "Inter Milan", "Juventus", "Atletico Madrid", "Dortmund", "Thái Lan"],
+        "team3": ["Manchester United", "Newcastle", "AC Milan", "Napoli", "Porto", "Ajax", "Indonesia"],
+        "team4": ["West Ham", "Aston Villa", "Roma", "Lazio", "Sevilla", "Leipzig", "Malaysia"],
+        "player1": ["Haaland", "Salah", "Saka", "Bellingham", "Mbappe", "Martinez", "Quang Hải", "Tiến Linh"],
+        "player2": ["De Bruyne", "Odegaard", "Kane", "Vinicius", "Lewandowski", "Griezmann", "Công Phượng"],
+        "player3": ["Rodri", "Rice", "Son", "Kroos", "Pedri", "Messi", "Văn Hậu", "Văn Lâm"],
+        "score1": ["1", "2", "3", "4", "5"],
+        "score2": ["0", "1", "2", "3"],
+        "minute1": ["12", "23", "45+2", "56", "67", "78", "89+1"],
+        "minute2": ["34", "45", "59", "69", "80", "90+3"],
+        "gameday": ["thứ Bảy", "Chủ nhật", "20/4", "27/4", "4/5", "11/5", "18/5"],
+        "laptop_model": ["Asus ROG Zephyrus G14", "Lenovo Legion Pro 7", "MSI Titan GT77", "Acer Predator Helios", "Alienware m18"]
+    }
+
+    # Thay thế các biến bằng thông tin cá nhân nếu có
+    if member_id and member_id in store.family_data:
+        preferences = store.family_data[member_id].get("preferences", {})
+
+        if preferences.get("food"):
+            replacements["food"].insert(0, preferences["food"])
+
+        if preferences.get("hobby"):
+            replacements["hobby"].insert(0, preferences["hobby"])
+
+    # Thêm thông tin từ sự kiện sắp tới
+    if upcoming_events:
+        for event in upcoming_events:
+            replacements["event"].insert(0, event["title"])
+            replacements["days"].insert(0, str(event["days_away"]))
+
+    # Xác định mùa hiện tại (đơn giản hóa)
+    current_month = datetime.datetime.now().month
+    if 3 <= current_month <= 5:
+        current_season = "xuân"
+    elif 6 <= current_month <= 8:
+        current_season = "hạ"
+    elif 9 <= current_month <= 11:
+        current_season = "thu"
+    else:
+        current_season = "đông"
+
+    replacements["season"].insert(0, current_season)
+
+    # Thêm ngày hiện tại
+    current_day_name = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"][datetime.datetime.now().weekday()]
+    replacements["day"].insert(0, current_day_name)
+
+    # Thêm bữa ăn phù hợp với thời điểm hiện tại
+    current_hour = datetime.datetime.now().hour
+    if 5 <= current_hour < 10:
+        current_meal = "sáng"
+    elif 10 <= current_hour < 14:
+        current_meal = "trưa"
+    elif 14 <= current_hour < 17:
+        current_meal = "xế"
+    else:
+        current_meal = "tối"
+
+    replacements["meal"].insert(0, current_meal)
+    replacements["time_of_day"].insert(0, current_meal)
+
+    # Tạo danh sách các chủ đề ưu tiên theo sở thích người dùng
+    priority_categories = []
+    user_preferences = {}
+
+    # Phân tích sở thích người dùng
+    if member_id and member_id in store.family_data:
+        preferences = store.family_data[member_id].get("preferences", {})
+        user_preferences = preferences
+
+        # Ưu tiên các chủ đề dựa trên sở thích
+        if preferences.get("food"):
+            priority_categories.append("food")
+
+        if preferences.get("hobby"):
+            hobby = preferences["hobby"].lower()
+            if any(keyword in hobby for keyword in ["đọc", "sách", "học", "nghiên cứu"]):
+                priority_categories.append("education")
+            elif any(keyword in hobby for keyword in ["du lịch", "đi", "khám phá", "phiêu lưu"]):
+                priority_categories.append("travel")
+            elif any(keyword in hobby for keyword in ["âm nhạc", "nghe", "hát", "nhạc"]):
+                priority_categories.append("entertainment")
+            elif any(keyword in hobby for keyword in ["phim", "xem", "điện ảnh", "movie"]):
+                priority_categories.append("movies")
+            elif any(keyword in hobby for keyword in ["bóng đá", "thể thao", "bóng rổ", "thể hình", "gym", "bóng", "đá", "tennis"]):
+                priority_categories.append("football")
+            elif any(keyword in hobby for keyword in ["công nghệ", "máy tính", "điện thoại", "game", "tech"]):
+                priority_categories.append("technology")
+
+    # Luôn đảm bảo có tin tức trong các gợi ý
+    priority_categories.append("news")
+
+    # Thêm các chủ đề còn lại
+    remaining_categories = [cat for cat in question_templates.keys() if cat not in priority_categories]
+
+    # Đảm bảo tách riêng phim và bóng đá nếu người dùng thích cả hai
+    if "movies" not in priority_categories and "football" not in priority_categories:
+        # Nếu cả hai chưa được thêm, thêm cả hai
+        remaining_categories = ["movies", "football"] + [cat for cat in remaining_categories if cat not in ["movies", "football"]]
+
+    # Kết hợp để có tất cả chủ đề
+    all_categories = priority_categories + remaining_categories
+
+    # Chọn tối đa max_questions chủ đề, đảm bảo ưu tiên các sở thích
+    selected_categories = all_categories[:max_questions]
+
+    # Tạo câu gợi ý cho mỗi chủ đề
+    for category in selected_categories:
+        if len(questions) >= max_questions:
+            break
+
+        # Chọn một mẫu câu ngẫu nhiên từ chủ đề
+        template = rng.choice(question_templates[category])
+
+        # Điều chỉnh mẫu câu dựa trên sở thích người dùng
+        if category == "food" and user_preferences.get("food"):
+            # Nếu người dùng có món ăn yêu thích, thay thế biến {food} bằng sở thích
+            template = template.replace("{food}", user_preferences["food"])
+        elif category == "football" and "hobby" in user_preferences and any(keyword in user_preferences["hobby"].lower() for keyword in ["bóng đá", "thể thao"]):
+            # Nếu người dùng thích bóng đá, ưu tiên thông tin cụ thể hơn
+            pass  # Giữ nguyên template vì đã đủ cụ thể
+
+        # Thay thế các biến còn lại trong mẫu câu
+        question = template
+        for key in replacements:
+            if "{" + key + "}" in question:
+                replacement = rng.choice(replacements[key])
+                question = question.replace("{" + key + "}", replacement)
+
+        questions.append(question)
+
+    # Đảm bảo đủ số lượng câu hỏi
+    if len(questions) < max_questions:
+        # Ưu tiên thêm từ tin tức và thông tin giải trí
+        more_templates = []
+        more_templates.extend(question_templates["news"])
+        more_templates.extend(question_templates["movies"])
+        more_templates.extend(question_templates["football"])
+
+        rng.shuffle(more_templates)
+
+        while len(questions) < max_questions and more_templates:
+            template = more_templates.pop(0)
+
+            # Thay thế các biến trong mẫu câu
+            question = template
+            for key in replacements:
+                if "{" + key + "}" in question:
+                    replacement = rng.choice(replacements[key])
+                    question = question.replace("{" + key + "}", replacement)
+
+            # Tránh trùng lặp
+            if question not in questions:
+                questions.append(question)
+
+    return questions
@@ -0,0 +1,337 @@
+"""
+Đo độ trễ theo từng giai đoạn của một lượt trò chuyện.
+
+    with telemetry.span("tavily_search"):
+        ...
+
+Mỗi span được ghi vào:
+    - lượt trò chuyện hiện tại (nếu có, xem ``start_turn``/``finish_turn``) để
+      hiển thị bảng phân tích độ trễ trong giao diện;
+    - histogram tổng hợp theo giai đoạn (p50/p95/p99), số token và cache hit,
+      xuất ra định dạng Prometheus qua ``start_metrics_server``.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('family_assistant.telemetry')
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRIC_PREFIX = "family_assistant"
+
+# Biên của các bucket histogram (giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Histogram theo bucket cố định, kèm mẫu gần nhất để tính phân vị"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, reservoir_size=1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=reservoir_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self._recent.append(value)
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[idx] += 1
+
+    def quantile(self, q):
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TurnTrace:
+    """Các span của một lượt trò chuyện"""
+
+    def __init__(self, member_id=None, household_id=None):
+        self.member_id = member_id
+        self.household_id = household_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.tokens = {}
+        self.cache = {}
+        self.total_ms = None
+
+    def add_span(self, name, start, duration, attrs):
+        self.spans.append({
+            "stage": name,
+            "offset_ms": round((start - self.start) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            **attrs,
+        })
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+class MetricsRegistry:
+    """Số liệu tổng hợp của cả tiến trình, an toàn đa luồng"""
+
+    def __init__(self, recent_turns=20):
+        self._lock = threading.Lock()
+        self.stage_latency = {}
+        self.tokens = {}
+        self.cache = {}
+        self.singleflight = {}  # (tên lời gọi, "leader"/"shared") -> số lần
+        self.resilience = {}  # (endpoint/lời gọi, sự kiện ngắt mạch hoặc gửi lặp) -> số lần
+        self.turns = 0
+        self.recent_turns = deque(maxlen=recent_turns)
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self.stage_latency.get(stage)
+            if histogram is None:
+                histogram = self.stage_latency[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def add_tokens(self, stage, kind, count):
+        with self._lock:
+            key = (stage, kind)
+            self.tokens[key] = self.tokens.get(key, 0) + count
+
+    def add_cache_event(self, cache_name, hit):
+        with self._lock:
+            key = (cache_name, "hit" if hit else "miss")
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def add_singleflight_event(self, call_name, shared):
+        with self._lock:
+            key = (call_name, "shared" if shared else "leader")
+            self.singleflight[key] = self.singleflight.get(key, 0) + 1
+
+    def singleflight_summary(self):
+        """Số lời gọi thực sự gửi đi và số lời gọi được gộp theo từng loại"""
+        with self._lock:
+            names = sorted({call_name for call_name, _ in self.singleflight})
+            return [{"call": call_name,
+                     "sent": self.singleflight.get((call_name, "leader"), 0),
+                     "deduplicated": self.singleflight.get((call_name, "shared"), 0)}
+                    for call_name in names]
+
+    def add_resilience_event(self, name, event):
+        with self._lock:
+            key = (name, event)
+            self.resilience[key] = self.resilience.get(key, 0) + 1
+
+    def add_turn(self, trace):
+        with self._lock:
+            self.turns += 1
+            self.recent_turns.appendleft(trace)
+
+    def stage_summary(self):
+        """Bảng tóm tắt p50/p95/p99 (ms) theo giai đoạn"""
+        with self._lock:
+            rows = []
+            for stage, histogram in sorted(self.stage_latency.items()):
+                row = {"stage": stage, "count": histogram.count}
+                for q in QUANTILES:
+                    value = histogram.quantile(q)
+                    row[f"p{int(q * 100)}_ms"] = round(value * 1000, 1) if value is not None else None
+                rows.append(row)
+            return rows
+
+    def render_prometheus(self):
+        """Xuất số liệu theo định dạng văn bản của Prometheus"""
+        with self._lock:
+            lines = []
+            name = f"{METRIC_PREFIX}_stage_duration_seconds"
+            lines.append(f"# HELP {name} Độ trễ theo giai đoạn của lượt trò chuyện")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self.stage_latency.items()):
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            name = f"{METRIC_PREFIX}_stage_duration_quantile_seconds"
+            lines.append(f"# HELP {name} Phân vị độ trễ trên các mẫu gần nhất")
+            lines.append(f"# TYPE {name} gauge")
+            for stage, histogram in sorted(self.stage_latency.items()):
+                for q in QUANTILES:
+                    value = histogram.quantile(q)
+                    if value is not None:
+                        lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+
+            name = f"{METRIC_PREFIX}_tokens_total"
+            lines.append(f"# HELP {name} Số token theo giai đoạn và loại")
+            lines.append(f"# TYPE {name} counter")
+            for (stage, kind), count in sorted(self.tokens.items()):
+                lines.append(f'{name}{{stage="{stage}",kind="{kind}"}} {count}')
+
+            name = f"{METRIC_PREFIX}_cache_events_total"
+            lines.append(f"# HELP {name} Số lần truy cập cache theo kết quả")
+            lines.append(f"# TYPE {name} counter")
+            for (cache_name, result), count in sorted(self.cache.items()):
+                lines.append(f'{name}{{cache="{cache_name}",result="{result}"}} {count}')
+
+            name = f"{METRIC_PREFIX}_singleflight_calls_total"
+            lines.append(f"# HELP {name} Số lời gọi gửi đi (leader) và số lời gọi trùng được gộp (shared)")
+            lines.append(f"# TYPE {name} counter")
+            for (call_name, role), count in sorted(self.singleflight.items()):
+                lines.append(f'{name}{{call="{call_name}",role="{role}"}} {count}')
+
+            name = f"{METRIC_PREFIX}_resilience_events_total"
+            lines.append(f"# HELP {name} Sự kiện ngắt mạch, gửi lặp, giới hạn tốc độ và giảm tải")
+            lines.append(f"# TYPE {name} counter")
+            for (call_name, event), count in sorted(self.resilience.items()):
+                lines.append(f'{name}{{call="{call_name}",event="{event}"}} {count}')
+
+            name = f"{METRIC_PREFIX}_turns_total"
+            lines.append(f"# HELP {name} Số lượt trò chuyện đã xử lý")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {self.turns}")
+            return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+_current_turn = contextvars.ContextVar("family_assistant_turn", default=None)
+
+
+def start_turn(member_id=None, household_id=None):
+    """Bắt đầu ghi nhận một lượt trò chuyện mới trong ngữ cảnh hiện tại"""
+    trace = TurnTrace(member_id, household_id)
+    token = _current_turn.set(trace)
+    return trace, token
+
+
+def finish_turn(trace, token):
+    """Kết thúc lượt trò chuyện và đưa vào số liệu tổng hợp"""
+    trace.total_ms = round(trace.elapsed() * 1000, 1)
+    registry.observe_stage("turn_total", trace.total_ms / 1000)
+    registry.add_turn(trace)
+    try:
+        _current_turn.reset(token)
+    except ValueError:
+        # Generator được đóng ở một ngữ cảnh khác (ví dụ khi bị thu gom rác)
+        _current_turn.set(None)
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+def record_stage(name, seconds, start=None, **attrs):
+    """Ghi nhận một giai đoạn đã đo sẵn (ví dụ thời gian tới token đầu tiên)"""
+    registry.observe_stage(name, seconds)
+    trace = _current_turn.get()
+    if trace is not None:
+        trace.add_span(name, start if start is not None else time.perf_counter() - seconds, seconds, attrs)
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Đo thời gian một khối lệnh và ghi nhận như một giai đoạn"""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record_stage(name, time.perf_counter() - start, start, **attrs)
+
+
+def record_tokens(stage, prompt=0, completion=0, cached=0):
+    """Ghi nhận số token của một lời gọi mô hình"""
+    trace = _current_turn.get()
+    for kind, count in (("prompt", prompt), ("completion", completion), ("cached", cached)):
+        if not count:
+            continue
+        registry.add_tokens(stage, kind, count)
+        if trace is not None:
+            trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+
+def record_usage(stage, usage):
+    """Ghi nhận token từ đối tượng ``usage`` trong phản hồi của OpenAI"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    record_tokens(stage, getattr(usage, "prompt_tokens", 0) or 0,
+                  getattr(usage, "completion_tokens", 0) or 0, cached or 0)
+
+
+def record_cache(cache_name, hit):
+    """Ghi nhận một lần truy cập cache"""
+    registry.add_cache_event(cache_name, hit)
+    trace = _current_turn.get()
+    if trace is not None:
+        key = f"{cache_name}_{'hit' if hit else 'miss'}"
+        trace.cache[key] = trace.cache.get(key, 0) + 1
+
+
+def record_singleflight(call_name, shared):
+    """Ghi nhận một lời gọi qua lớp single-flight (``shared``: được gộp vào lời gọi đang chạy)"""
+    registry.add_singleflight_event(call_name, shared)
+    trace = _current_turn.get()
+    if trace is not None and shared:
+        key = f"{call_name}_deduplicated"
+        trace.cache[key] = trace.cache.get(key, 0) + 1
+
+
+def record_resilience(name, event):
+    """Ghi nhận một sự kiện ngắt mạch hoặc gửi lặp của endpoint/lời gọi ``name``"""
+    registry.add_resilience_event(name, event)
+    trace = _current_turn.get()
+    if trace is not None:
+        key = f"{name}_{event}"
+        trace.cache[key] = trace.cache.get(key, 0) + 1
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics_server = None
+_metrics_started = False
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """
+    Khởi động endpoint /metrics trong luồng nền (chỉ một lần cho mỗi tiến trình).
+    Đặt METRICS_PORT=0 để tắt.
+    """
+    global _metrics_server, _metrics_started
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_started:
+            return _metrics_server
+        _metrics_started = True
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Không thể mở cổng metrics {port}: {e}")
+            return None
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Endpoint metrics đang chạy tại http://{host}:{port}/metrics")
+        return _metrics_server
@@ -0,0 +1,240 @@
+"""
+Chuyển văn bản thành giọng nói theo từng câu khi phản hồi đang được stream.
+
+Luồng xử lý:
+    stream văn bản -> SentenceSplitter (tách câu ngay khi câu kết thúc)
+                   -> StreamingSpeaker (tổng hợp song song từng câu)
+                   -> callback phát âm thanh theo đúng thứ tự câu
+
+Âm thanh đã tổng hợp được cache theo (model, giọng đọc, văn bản) nên các câu
+lặp lại (lời chào, câu xác nhận...) không phải gọi API lần nữa.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from family_assistant import telemetry
+
+logger = logging.getLogger('family_assistant.tts')
+
+# Cấu hình TTS (có thể trỏ tới endpoint giả lập cục bộ qua TTS_BASE_URL)
+TTS_BASE_URL = os.getenv("TTS_BASE_URL") or os.getenv("OPENAI_BASE_URL") or None
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+TTS_FORMAT = os.getenv("TTS_FORMAT", "mp3")
+DEFAULT_VOICE = "alloy"
+AVAILABLE_VOICES = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
+
+AUDIO_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+}
+
+# Lệnh đặc biệt của trợ lý (##ADD_EVENT:{...}##) không được đọc thành tiếng
+_COMMAND_PATTERN = re.compile(r"##[A-Z_]+:.*?##", re.DOTALL)
+# Phần mở đầu của một lệnh chưa đóng (có thể bị cắt ngang giữa hai đoạn stream)
+_OPEN_COMMAND = re.compile(r"##[A-Z_]+:|#{1,2}[A-Z_]*$")
+# Ranh giới câu: dấu kết thúc câu theo sau bởi khoảng trắng, hoặc xuống dòng
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])[\"')\]]*\s+|\n+")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_BARE_URL = re.compile(r"https?://\S+")
+_MARKDOWN_SYMBOLS = re.compile(r"[*_`#>|]+")
+
+
+def clean_text_for_speech(text):
+    """Loại bỏ lệnh, markdown và URL để chỉ giữ lại phần cần đọc"""
+    text = _COMMAND_PATTERN.sub(" ", text)
+    text = _MARKDOWN_LINK.sub(r"\1", text)
+    text = _BARE_URL.sub(" ", text)
+    text = _MARKDOWN_SYMBOLS.sub(" ", text)
+    text = re.sub(r"^\s*[-+]\s+", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class SentenceSplitter:
+    """
+    Tách luồng văn bản thành các câu hoàn chỉnh ngay khi chúng kết thúc.
+
+    Phần văn bản nằm trong một lệnh đặc biệt chưa đóng (``##CMD: ...``) được
+    giữ lại cho tới khi lệnh đóng, để không đọc nửa chừng chuỗi JSON.
+    """
+
+    def __init__(self, min_chars=8):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Thêm một đoạn văn bản, trả về danh sách câu đã hoàn chỉnh"""
+        if not chunk:
+            return []
+        self._buffer += chunk
+        self._buffer = _COMMAND_PATTERN.sub(" ", self._buffer)
+
+        # Không xử lý phần sau một lệnh chưa đóng
+        open_cmd = _OPEN_COMMAND.search(self._buffer)
+        scan_limit = open_cmd.start() if open_cmd else len(self._buffer)
+
+        sentences = []
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(self._buffer, 0, scan_limit):
+            candidate = clean_text_for_speech(self._buffer[start:match.end()])
+            if len(candidate) < self.min_chars:
+                continue  # Câu quá ngắn, gộp với câu tiếp theo
+            sentences.append(candidate)
+            start = match.end()
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Trả về phần văn bản còn lại khi stream kết thúc"""
+        remaining = clean_text_for_speech(self._buffer)
+        self._buffer = ""
+        return [remaining] if remaining else []
+
+
+class AudioCache:
+    """Cache LRU giới hạn theo dung lượng cho âm thanh đã tổng hợp, an toàn đa luồng"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, voice, model=TTS_MODEL, audio_format=TTS_FORMAT):
+        raw = f"{model}|{voice}|{audio_format}|{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        if not audio or len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = audio
+            self._size += len(audio)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+# Cache và thread pool dùng chung cho mọi phiên trong tiến trình
+audio_cache = AudioCache()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts")
+
+
+def synthesize_speech(api_key, text, voice=DEFAULT_VOICE, base_url=None, cache=audio_cache):
+    """
+    Tổng hợp giọng nói cho một câu, dùng cache nếu đã có
+
+    Args:
+        api_key (str): OpenAI API Key
+        text (str): Câu cần đọc
+        voice (str): Giọng đọc
+        base_url (str): Endpoint thay thế (ví dụ endpoint giả lập cục bộ)
+        cache (AudioCache): Cache âm thanh
+
+    Returns:
+        bytes: Dữ liệu âm thanh hoặc None nếu có lỗi
+    """
+    key = cache.make_key(text, voice)
+    audio = cache.get(key)
+    telemetry.record_cache("tts_audio", audio is not None)
+    if audio is not None:
+        return audio
+
+    try:
+        from openai import OpenAI
+
+        client = OpenAI(api_key=api_key, base_url=base_url or TTS_BASE_URL)
+        with telemetry.span("tts_synthesize"):
+            response = client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=TTS_FORMAT,
+            )
+        audio = response.content
+        cache.put(key, audio)
+        return audio
+    except Exception as e:
+        logger.error(f"Lỗi khi tổng hợp giọng nói: {e}")
+        return None
+
+
+class StreamingSpeaker:
+    """
+    Nhận văn bản theo từng đoạn, tổng hợp song song từng câu và trả âm thanh
+    theo đúng thứ tự câu, ngay khi câu đầu tiên sẵn sàng.
+    """
+
+    def __init__(self, api_key, voice=DEFAULT_VOICE, base_url=None,
+                 synthesize=synthesize_speech, executor=None):
+        self.api_key = api_key
+        self.voice = voice
+        self.base_url = base_url
+        self._synthesize = synthesize
+        self._executor = executor or _executor
+        self._splitter = SentenceSplitter()
+        self._pending = []
+
+    def _submit(self, sentences):
+        for sentence in sentences:
+            future = self._executor.submit(
+                self._synthesize, self.api_key, sentence, self.voice, self.base_url
+            )
+            self._pending.append(future)
+
+    def feed(self, chunk):
+        """Đưa thêm văn bản vào, các câu hoàn chỉnh được gửi đi tổng hợp ngay"""
+        self._submit(self._splitter.feed(chunk))
+
+    def ready(self):
+        """Trả về (không chặn) âm thanh của các câu đầu hàng đã tổng hợp xong"""
+        while self._pending and self._pending[0].done():
+            audio = self._pending.pop(0).result()
+            if audio:
+                yield audio
+
+    def finish(self):
+        """Gửi phần văn bản còn lại và chờ tất cả câu tổng hợp xong"""
+        self._submit(self._splitter.flush())
+        while self._pending:
+            audio = self._pending.pop(0).result()
+            if audio:
+                yield audio
+
+
+def speak_along(chunks, speaker, on_audio):
+    """
+    Bọc một generator văn bản: chuyển tiếp nguyên vẹn từng đoạn, đồng thời
+    gọi ``on_audio(bytes)`` cho từng câu ngay khi âm thanh của câu đó sẵn sàng.
+    """
+    for chunk in chunks:
+        yield chunk
+        speaker.feed(chunk)
+        for audio in speaker.ready():
+            on_audio(audio)
+
+    for audio in speaker.finish():
+        on_audio(audio)
@@ -0,0 +1,204 @@
+"""
+Sổ ghi nhận token và chi phí của các lời gọi mô hình.
+
+Mỗi bản ghi được cộng dồn theo khóa (ngày, hộ gia đình, thành viên, vị trí gọi,
+model) và
+lưu bền vững vào file JSON, dùng để biết vị trí gọi nào tốn nhiều token nhất.
+"""
+import atexit
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from family_assistant import telemetry
+from family_assistant.store import DEFAULT_HOUSEHOLD
+
+logger = logging.getLogger('family_assistant.usage_ledger')
+
+# Giá (USD cho 1 triệu token): đầu vào, đầu vào đã cache, đầu ra
+MODEL_PRICING = {
+    "gpt-4o-mini": {"prompt": 0.15, "cached": 0.075, "completion": 0.60},
+    "gpt-4o": {"prompt": 2.50, "cached": 1.25, "completion": 10.00},
+    "gemini-1.5-flash": {"prompt": 0.075, "cached": 0.01875, "completion": 0.30},
+    "gemini-1.5-pro": {"prompt": 1.25, "cached": 0.3125, "completion": 5.00},
+}
+
+# Các vị trí gọi mô hình trong ứng dụng
+CALL_SITES = {
+    "detect_search_intent": "Phân loại ý định tìm kiếm",
+    "search_summarize": "Tổng hợp kết quả tìm kiếm",
+    "suggestions": "Câu hỏi gợi ý",
+    "generate_chat_summary": "Tóm tắt cuộc trò chuyện",
+    "main_answer": "Câu trả lời chính",
+    "vision": "Phân tích hình ảnh",
+}
+
+GENERAL_MEMBER = "chung"
+CSV_FIELDS = ["day", "household_id", "member_id", "call_site", "model", "calls", "prompt_tokens",
+              "cached_tokens", "completion_tokens", "latency_ms_total", "cost_usd"]
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    """Ước tính chi phí (USD); token đã cache được tính theo giá riêng"""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return 0.0
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * pricing["prompt"] + cached_tokens * pricing["cached"]
+            + completion_tokens * pricing["completion"]) / 1_000_000
+
+
+def _usage_value(usage, name):
+    if isinstance(usage, dict):
+        return usage.get(name) or 0
+    return getattr(usage, name, 0) or 0
+
+
+def _cached_tokens(usage):
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    if not details:
+        return 0
+    return _usage_value(details, "cached_tokens")
+
+
+class UsageLedger:
+    """Sổ ghi nhận token, an toàn đa luồng, ghi file theo lô để không chặn lượt trò chuyện"""
+
+    def __init__(self, file_path, flush_interval=5.0):
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc sổ ghi nhận token {self.file_path}: {e}")
+            return {}
+
+    def record(self, call_site, model, usage, latency_seconds=0.0, member_id=None, day=None, household_id=None):
+        """
+        Cộng dồn một lời gọi mô hình vào sổ
+
+        Args:
+            call_site (str): Vị trí gọi (xem CALL_SITES)
+            model (str): Tên model
+            usage: Đối tượng hoặc dict ``usage`` trong phản hồi của OpenAI
+            latency_seconds (float): Thời gian của lời gọi
+            member_id (str): Thành viên; mặc định lấy từ lượt trò chuyện hiện tại
+            day (str): Ngày "%Y-%m-%d"; mặc định hôm nay
+            household_id (str): Hộ gia đình; mặc định lấy từ lượt trò chuyện hiện tại
+        """
+        if usage is None:
+            return
+        trace = telemetry.current_turn()
+        if member_id is None and trace is not None:
+            member_id = trace.member_id
+        if household_id is None and trace is not None:
+            household_id = trace.household_id
+        member_id = member_id or GENERAL_MEMBER
+        household_id = household_id or DEFAULT_HOUSEHOLD
+        day = day or datetime.date.today().strftime("%Y-%m-%d")
+
+        prompt_tokens = _usage_value(usage, "prompt_tokens")
+        completion_tokens = _usage_value(usage, "completion_tokens")
+        cached_tokens = _cached_tokens(usage)
+        key = f"{day}|{household_id}|{member_id}|{call_site}|{model}"
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "day": day, "household_id": household_id, "member_id": member_id,
+                    "call_site": call_site, "model": model,
+                    "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                    "latency_ms_total": 0.0, "cost_usd": 0.0,
+                }
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["cached_tokens"] += cached_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["latency_ms_total"] = round(entry["latency_ms_total"] + latency_seconds * 1000, 1)
+            entry["cost_usd"] = round(entry["cost_usd"] + estimate_cost(
+                model, prompt_tokens, cached_tokens, completion_tokens), 8)
+            self._dirty = True
+            should_flush = time.monotonic() - self._last_flush >= self.flush_interval
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Ghi sổ ra file nếu có thay đổi"""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = json.dumps(self._entries, indent=4, ensure_ascii=False)
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        try:
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.file_path)
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu sổ ghi nhận token: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def entries(self, since_day=None, household_id=None):
+        """Danh sách bản ghi (bản sao), lọc từ ngày ``since_day`` và theo hộ gia đình nếu có"""
+        with self._lock:
+            rows = []
+            for entry in self._entries.values():
+                row = dict(entry)
+                # Bản ghi cũ (trước khi có nhiều hộ gia đình) thuộc hộ mặc định
+                row.setdefault("household_id", DEFAULT_HOUSEHOLD)
+                if since_day is not None and row["day"] < since_day:
+                    continue
+                if household_id is not None and row["household_id"] != household_id:
+                    continue
+                rows.append(row)
+        return sorted(rows, key=lambda row: (row["day"], row["member_id"], row["call_site"]), reverse=True)
+
+    def summarize(self, group_by=("call_site",), since_day=None, household_id=None):
+        """Tổng hợp token, chi phí và độ trễ trung bình theo các trường trong ``group_by``"""
+        groups = {}
+        for entry in self.entries(since_day, household_id):
+            key = tuple(entry[field] for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {field: entry[field] for field in group_by}
+                group.update({"calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                              "completion_tokens": 0, "latency_ms_total": 0.0, "cost_usd": 0.0})
+            for field in ("calls", "prompt_tokens", "cached_tokens", "completion_tokens",
+                          "latency_ms_total", "cost_usd"):
+                group[field] += entry[field]
+
+        rows = []
+        for group in groups.values():
+            group["avg_latency_ms"] = round(group.pop("latency_ms_total") / group["calls"], 1) if group["calls"] else 0.0
+            group["cost_usd"] = round(group["cost_usd"], 6)
+            rows.append(group)
+        return sorted(rows, key=lambda row: row["prompt_tokens"] + row["completion_tokens"], reverse=True)
+
+    def to_csv(self, since_day=None, household_id=None):
+        """Xuất sổ ra chuỗi CSV"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for entry in self.entries(since_day, household_id):
+            writer.writerow({field: entry.get(field, "") for field in CSV_FIELDS})
+        return buffer.getvalue()
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from family_assistant import admission
+
+
+def test_shed_calls_give_back_requests_and_tokens(monkeypatch):
+    limiter = admission.RateLimiter()
+    monkeypatch.setattr(admission, "_limiter", limiter)
+    controller = admission.AdmissionController(max_concurrent=1)
+
+    async def shed(priority=admission.INTERACTIVE):
+        raise admission.Overloaded()
+
+    async def call():
+        async with admission.slot("main_answer", "1", "nha", tokens=1000):
+            pass
+
+    monkeypatch.setattr(admission, "_controller", controller)
+    monkeypatch.setattr(controller, "acquire", shed)
+    for _ in range(admission.RATE_LIMIT_MEMBER_RPM + 5):
+        with pytest.raises(admission.Overloaded) as error:
+            asyncio.run(call())
+        assert not isinstance(error.value, admission.RateLimited)
+
+    buckets = limiter._buckets_for("nha", "1")
+    assert all(bucket.tokens == pytest.approx(bucket.capacity) for bucket, _, _ in buckets)
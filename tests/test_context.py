@@ -0,0 +1,25 @@
+import datetime
+
+from family_assistant import context, schedule
+from family_assistant.store import HouseholdStore
+
+
+def test_free_slot_prompt_replaces_full_event_list(tmp_path):
+    store = HouseholdStore(str(tmp_path))
+    store.verify_data_structure()
+    store.add_family_member({"name": "An"})
+    today = datetime.date.today()
+    store.add_event({"title": "Tập bơi", "date": today.isoformat(), "time": "19:00"})
+    store.add_event({"title": "Du lịch Đà Lạt", "date": (today + datetime.timedelta(days=60)).isoformat()})
+
+    query = "tối nào tuần này cả nhà rảnh?"
+    answer = schedule.answer_free_slot_query(store, query)
+    assert answer
+    prompt = context.build_system_prompt(store, None, query, answer)
+    assert answer in prompt
+    assert "Tập bơi" in prompt
+    assert "Du lịch Đà Lạt" not in prompt
+
+    full = context.build_system_prompt(store, None, "hôm nay có gì?")
+    assert "Du lịch Đà Lạt" in full
+    assert store.flush()
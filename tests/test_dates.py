@@ -0,0 +1,18 @@
+import datetime
+
+from family_assistant.dates import find_date
+
+TODAY = datetime.date(2026, 10, 19)
+
+
+def test_day_month():
+    assert find_date("ngày 25/12", TODAY) == (datetime.date(2026, 12, 25), (0, 10))
+
+
+def test_invalid_day_month_does_not_fall_back_to_day_of_month():
+    assert find_date("ngày 30/2", TODAY) is None
+    assert find_date("2026-02-30", TODAY) is None
+
+
+def test_invalid_date_does_not_hide_other_dates():
+    assert find_date("họp ngày 30/2 hoặc thứ bảy", TODAY)[0] == datetime.date(2026, 10, 24)
@@ -0,0 +1,34 @@
+import threading
+
+from family_assistant.households import HouseholdRegistry
+
+
+def test_slow_load_does_not_block_other_households(tmp_path):
+    registry = HouseholdRegistry(str(tmp_path), default_dir=str(tmp_path / "default"))
+    fast = registry.get("nhanh")
+    started, release = threading.Event(), threading.Event()
+    load = registry._load
+    calls = []
+
+    def slow_load(household_id):
+        calls.append(household_id)
+        started.set()
+        release.wait(5)
+        return load(household_id)
+
+    registry._load = slow_load
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("cham"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+
+    # Hộ khác vẫn lấy được trong lúc "cham" đang tải
+    assert registry.get("nhanh") is fast
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["cham"]
+    assert len(results) == 3 and all(store is results[0] for store in results)
+    assert registry.loads == 2
+    registry.flush_all()
@@ -0,0 +1,25 @@
+import io
+
+from family_assistant import ical
+from family_assistant.store import HouseholdStore
+
+
+def test_export_then_import_into_same_household_adds_nothing(tmp_path):
+    store = HouseholdStore(str(tmp_path))
+    store.verify_data_structure()
+    store.add_event({"title": "Họp phụ huynh", "date": "2026-11-02", "time": "19:30"})
+    store.add_event({"title": "Sinh nhật", "date": "2026-12-05",
+                     "recurrence": {"freq": "yearly", "interval": 1}})
+    exported = io.StringIO()
+    assert ical.export_ics(store, exported) == 2
+
+    result = ical.import_ics(store, io.StringIO(exported.getvalue()))
+    assert result == {"added": 0, "skipped": 2, "invalid": 0}
+    assert len(store.events_data) == 2
+
+    # Hộ gia đình khác: thêm mới, giữ UID để lần nhập sau được nhận ra
+    other = HouseholdStore(str(tmp_path / "khac"), household_id="khac")
+    other.verify_data_structure()
+    assert ical.import_ics(other, io.StringIO(exported.getvalue()))["added"] == 2
+    assert ical.import_ics(other, io.StringIO(exported.getvalue()))["added"] == 0
+    assert store.flush() and other.flush()
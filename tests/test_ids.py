@@ -0,0 +1,62 @@
+import json
+import os
+
+from family_assistant import ids
+from family_assistant.commands import process_assistant_response
+from family_assistant.store import HouseholdStore
+
+
+def _open(data_dir):
+    store = HouseholdStore(str(data_dir))
+    store.verify_data_structure()
+    return store
+
+
+def test_ids_are_not_reused_after_delete(tmp_path):
+    store = _open(tmp_path)
+    first = [store.add_event({"title": f"e{i}", "date": "2025-01-01"}) for i in range(3)]
+    store.delete_event(first[-1])
+    assert store.add_event({"title": "sau khi xóa", "date": "2025-01-02"}) == "4"
+    assert store.flush()
+
+
+def test_baseline_overwrite_in_journal_is_repaired(tmp_path):
+    store = _open(tmp_path)
+    for i in range(3):
+        store.add_event({"title": f"e{i}", "date": "2025-01-01"})
+    store.delete_event("1")
+    # Cách cấp ID cũ: len(events) + 1 = "3" đè lên sự kiện 3 đang có
+    with store._lock.write():
+        store._apply({"c": "events", "op": "put", "id": str(len(store.events_data) + 1),
+                      "value": {"title": "mới", "date": "2025-02-01", "created_on": "2030-01-01 00:00:00"}})
+    store.save("events")
+    assert store.flush()
+
+    collisions = ids.find_collisions(str(tmp_path))
+    assert [(collection, record_id, value["title"]) for collection, record_id, value, _ in collisions] == \
+        [("events", "3", "e2")]
+    report = ids.repair(store)
+    assert [(collection, old_id, label) for collection, old_id, _, label in report] == [("events", "3", "e2")]
+    new_id = report[0][2]
+    assert store.events_data[new_id]["title"] == "e2"
+    assert store.events_data["3"]["title"] == "mới"
+    assert ids.repair(store) == []
+    assert store.flush()
+
+
+def test_overwrite_before_journal_is_not_recoverable(tmp_path):
+    # File dữ liệu chỉ giữ bản ghi sau cùng của mỗi ID: không còn dấu vết của bản ghi bị đè
+    with open(os.path.join(tmp_path, "events_data.json"), "w", encoding="utf-8") as f:
+        json.dump({"1": {"title": "mới", "date": "2025-02-01", "created_on": "2030-01-01 00:00:00"}}, f)
+    assert ids.find_collisions(str(tmp_path)) == []
+
+
+def test_add_family_member_ignores_given_id(tmp_path):
+    store = _open(tmp_path)
+    assert store.add_family_member({"name": "An"}) == "1"
+    response = '##ADD_FAMILY_MEMBER:{"id": "1", "name": "Bình", "age": "8"}##'
+    actions = process_assistant_response(store, response)
+    assert [action["ok"] for action in actions] == [True]
+    assert store.family_data["1"]["name"] == "An"
+    assert [member["name"] for member in store.family_data.values()] == ["An", "Bình"]
+    assert store.flush()
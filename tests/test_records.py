@@ -0,0 +1,29 @@
+import json
+import os
+
+import pytest
+
+from family_assistant import records
+from family_assistant.store import HouseholdStore
+
+
+def test_validate_rejects_bad_time():
+    with pytest.raises(records.ValidationError):
+        records.validate("events", {"title": "Họp", "date": "2026-11-02", "time": "25h"})
+
+
+def test_legacy_invalid_event_can_be_fixed(tmp_path):
+    # Bản ghi cũ mà migrate không đọc được giờ: vẫn sửa được, kể cả chính trường giờ
+    with open(os.path.join(tmp_path, "events_data.json"), "w", encoding="utf-8") as f:
+        json.dump({"1": {"title": "Đá bóng", "date": "2026-11-02", "time": "lúc nào rảnh"}}, f)
+    store = HouseholdStore(str(tmp_path))
+    store.verify_data_structure()
+    assert not records.is_valid("events", store.events_data["1"])
+
+    assert store.update_event({"id": "1", "description": "Sân trường"})
+    assert store.update_event({"id": "1", "time": "17:00"})
+    assert store.events_data["1"]["time"] == "17:00"
+    assert records.is_valid("events", store.events_data["1"])
+    with pytest.raises(records.ValidationError):
+        store.update_event({"id": "1", "time": "25:00"})
+    assert store.flush()
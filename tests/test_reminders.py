@@ -0,0 +1,44 @@
+import datetime
+import gc
+import os
+import time
+
+from family_assistant import reminders
+from family_assistant.households import HouseholdRegistry
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_external_reminders_fire_after_evict_and_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(reminders, "REMINDERS_ENABLED", True)
+    now = [time.time()]
+    path = os.path.join(tmp_path, "reminders.jsonl")
+    scheduler = reminders.ReminderScheduler(sinks=[reminders.FileSink(path)], clock=lambda: now[0])
+    monkeypatch.setattr(reminders, "_scheduler", scheduler)
+    registry = HouseholdRegistry(str(tmp_path / "households"), max_loaded=1, default_dir=str(tmp_path / "default"))
+
+    start = datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(days=1)
+    registry.get("nha-a").add_event({"title": "Khám răng", "date": start.date().isoformat(),
+                                     "time": start.strftime("%H:%M"), "reminders": [30]})
+    # Loại hộ nha-a khỏi LRU rồi tải lại
+    registry.get("nha-b")
+    gc.collect()
+    store = registry.get("nha-a")
+    assert store.events_data
+
+    # Chờ luồng nền dựng lại heap của kho mới trước khi cho đồng hồ chạy tới giờ nhắc
+    assert _wait_for(lambda: scheduler.pending() and not scheduler._changes)
+    now[0] = (start - datetime.timedelta(minutes=30)).timestamp() + 1
+    with scheduler._cond:
+        scheduler._cond.notify()
+    assert _wait_for(lambda: scheduler.fired == 1)
+    assert _wait_for(lambda: os.path.exists(path))
+    with open(path, encoding="utf-8") as f:
+        assert [line for line in f if line.strip()]
+    assert scheduler._watched[reminders._watch_key(store)].ref() is store
+    registry.flush_all()
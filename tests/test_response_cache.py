@@ -0,0 +1,73 @@
+import pytest
+
+from family_assistant.response_cache import ResponseCache, categorize, normalize_question
+from family_assistant.store import HouseholdStore
+
+
+@pytest.mark.parametrize("question", [
+    "Thông tin về lớp học bơi của con?",
+    "Hôm nay có gì trong lịch của tôi?",
+    "Kết quả khám răng của con thế nào?",
+    "Lịch thi đấu của con tuần này?",
+])
+def test_personal_questions_are_general(question):
+    assert categorize(normalize_question(question)) == "general"
+
+
+@pytest.mark.parametrize("question, category", [
+    ("Giá vàng hôm nay?", "price"),
+    ("Kết quả Champions League?", "sports"),
+    ("Thời tiết Hà Nội ngày mai?", "weather"),
+    ("Tin công nghệ?", "news"),
+])
+def test_live_questions(question, category):
+    assert categorize(normalize_question(question)) == category
+
+
+def test_key_depends_on_member_and_data_version(tmp_path):
+    store = HouseholdStore(str(tmp_path))
+    store.verify_data_structure()
+    first, second = store.add_family_member({"name": "An"}), store.add_family_member({"name": "Bình"})
+    cache = ResponseCache()
+    question = "Giá vàng hôm nay?"
+    key, category = cache.make_key(store, question, first, now=0)
+    assert category == "price"
+    assert cache.make_key(store, question, second, now=0)[0] != key
+    store.add_note({"title": "Mua sữa"})
+    assert cache.make_key(store, question, first, now=0)[0] != key
+    assert store.flush()
+
+
+
+def test_reply_with_commands_is_not_cached_or_replayed(tmp_path, monkeypatch):
+    import asyncio
+
+    from family_assistant import assistant, context, llm, response_cache
+
+    reply = 'Đã ghi lại. ##ADD_NOTE:{"title": "Giá vàng", "content": "Theo dõi giá vàng"}##'
+
+    async def fake_stream(*args, **kwargs):
+        yield reply
+
+    monkeypatch.setattr(llm, "stream_text", fake_stream)
+    cache = ResponseCache()
+    monkeypatch.setattr(response_cache, "response_cache", cache)
+    store = HouseholdStore(str(tmp_path))
+    store.verify_data_structure()
+    bot = assistant.Assistant(store, "")
+    question = "Giá vàng hôm nay?"
+
+    async def turn():
+        return [event async for event in bot.stream_reply([context.text_message("user", question)])]
+
+    asyncio.run(turn())
+    assert len(store.notes_data) == 1
+    assert len(cache) == 0
+
+    # Phản hồi (có lệnh) lấy từ cache không thực thi lệnh lần nữa
+    key, category = cache.make_key(store, question, None, False)
+    cache.put(key, category, reply)
+    events = asyncio.run(turn())
+    assert [event["type"] for event in events] == ["token", "done"]
+    assert len(store.notes_data) == 1
+    assert store.flush()
@@ -0,0 +1,30 @@
+import asyncio
+import json
+
+from family_assistant.households import HouseholdRegistry
+from family_assistant.server import AssistantService
+
+
+def _get(app, path, query):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": []}
+    asyncio.run(app(scope, receive, send))
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return sent[0]["status"], json.loads(body)
+
+
+def test_suggestions_rejects_bad_max_questions(tmp_path):
+    app = AssistantService(HouseholdRegistry(str(tmp_path), default_dir=str(tmp_path)), openai_api_key="")
+    status, payload = _get(app, "/v1/suggestions", "max_questions=abc")
+    assert status == 400
+    assert "max_questions" in payload["error"]
+    status, payload = _get(app, "/v1/suggestions", "max_questions=500")
+    assert status == 200
+    assert len(payload["questions"]) <= 10